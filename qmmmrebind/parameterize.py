@@ -1,19 +1,25 @@
 from openff.toolkit.typing.engines.smirnoff import ForceField
 from openff.toolkit.topology import Molecule, Topology
-from biopandas.pdb import PandasPdb
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
 import matplotlib.pyplot as plt
 from operator import itemgetter
 from mendeleev import element
 from simtk.openmm import app
 from scipy import optimize
+from scipy.spatial import cKDTree
 import subprocess as sp
 from sys import stdout
 import pandas as pd
 import numpy as np
 import statistics
 import itertools
+import asyncio
+import hashlib
 import parmed
 import pickle
+import mmap
 import shutil
 import simtk
 import scipy
@@ -438,6 +444,19 @@ element_list = [
 ]
 
 
+# Radii (in Angstrom) of the Merz-Kollman ESP fitting scheme
+merz_kollman_radii = {
+    "H": 1.20,
+    "C": 1.50,
+    "N": 1.50,
+    "O": 1.40,
+    "F": 1.35,
+    "P": 1.80,
+    "S": 1.75,
+    "Cl": 1.70,
+}
+
+
 def get_vibrational_scaling(functional, basis_set):
 
     """
@@ -501,42 +520,28 @@ def unit_vector_N(u_BC, u_AB):
 
 def delete_guest_angle_params(guest_qm_params_file="guest_qm_params.txt"):
     """
-    
+    Removes the angle parameters from a QM parameter file.
     """
-    f_params = open(guest_qm_params_file, "r")
-    lines_params = f_params.readlines()
-    for i in range(len(lines_params)):
-        if "Begin writing the Angle Parameters" in lines_params[i]:
-            to_begin = int(i)
-        if "Finish writing the Angle Parameters" in lines_params[i]:
-            to_end = int(i)
-    lines_selected = lines_params[:to_begin] + lines_params[to_end + 1 :]
-    with open(guest_qm_params_file, "w") as f_:
-        f_.write("".join(lines_selected))
+    qm_params = QMParameterSet.load(guest_qm_params_file)
+    QMParameterSet(
+        bonds=qm_params.bonds,
+        torsions=qm_params.torsions,
+        charges=qm_params.charges,
+    ).save(guest_qm_params_file)
     return
 
 
 def remove_bad_angle_params(
         guest_qm_params_file="guest_qm_params.txt", angle=1.00, k_angle=500):
-    with open(guest_qm_params_file, "r") as f_params:
-        lines_params = f_params.readlines()
-    for i in range(len(lines_params)):
-        if "Begin writing the Angle Parameters" in lines_params[i]:
-            to_begin = int(i)
-        if "Finish writing the Angle Parameters" in lines_params[i]:
-            to_end = int(i)
-    angle_params = lines_params[to_begin + 1 : to_end]
-    lines_to_omit = []
-    for i in angle_params:
-        if float(re.findall(r"[-+]?\d+[.]?\d*", i)[0]) < float(angle) or float(
-            re.findall(r"[-+]?\d+[.]?\d*", i)[1]
-        ) > float(k_angle):
-            lines_to_omit.append(i)
-    for b in lines_to_omit:
-        lines_params.remove(b)
-    with open(guest_qm_params_file, "w") as file:
-        for j in lines_params:
-            file.write(j)
+    qm_params = QMParameterSet.load(guest_qm_params_file)
+    angles = qm_params.angles
+    to_keep = (angles["a"] >= float(angle)) & (angles["k"] <= float(k_angle))
+    QMParameterSet(
+        bonds=qm_params.bonds,
+        angles=angles[to_keep],
+        torsions=qm_params.torsions,
+        charges=qm_params.charges,
+    ).save(guest_qm_params_file)
 
 
 def get_num_host_atoms(host_pdb):
@@ -546,9 +551,7 @@ def get_num_host_atoms(host_pdb):
     total number of atoms.
     """
 
-    ppdb = PandasPdb()
-    ppdb.read_pdb(host_pdb)
-    no_host_atoms = ppdb.df["ATOM"].shape[0]
+    no_host_atoms = len(PdbFile.load(host_pdb).records("ATOM"))
     return no_host_atoms
 
 
@@ -561,6 +564,18 @@ def change_names(inpcrd_file, prmtop_file, pdb_file):
     os.system(command)
 
 
+def get_num_cores():
+
+    """
+    Returns the number of cores the current process may run on, which
+    can be less than the number of cores of the machine (e.g. under a
+    batch scheduler or taskset).
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
 def copy_file(source, destination):
 
     """
@@ -850,6 +865,8 @@ def force_angle_constant_special_case(
     coords,
     scaling_1,
     scaling_2,
+    sampling="grid",
+    n_samples=360,
 ):
 
     """
@@ -894,6 +911,12 @@ def force_angle_constant_special_case(
     scaling_2 : float
         Factor to scale the projections of eigenvalues for BC.
 
+    sampling : {"grid", "analytic"}, optional
+        Sampling of u_N (see sphere_sampled_angle_constant).
+
+    n_samples : int, optional
+        Number of samples for the "analytic" sampling.
+
     Returns
     -------
     k_theta : float
@@ -917,48 +940,137 @@ def force_angle_constant_special_case(
     bond_length_BC = bond_lengths[atom_B, atom_C]
     eigenvalues_CB = eigenvalues[atom_C, atom_B, :]
     eigenvectors_CB = eigenvectors[0:3, 0:3, atom_C, atom_B]
-    k_theta_array = np.zeros((180, 360))
-    # Find force constant with varying u_N (with vector uniformly
-    # sampled across a sphere)
-    for theta in range(0, 180):
-        for phi in range(0, 360):
-            r = 1
-            u_N = [
-                r
-                * math.sin(math.radians(theta))
-                * math.cos(math.radians(theta)),
-                r
-                * math.sin(math.radians(theta))
-                * math.sin(math.radians(theta)),
-                r * math.cos(math.radians(theta)),
-            ]
-            u_PA = np.cross(u_N, u_AB)
-            u_PA = u_PA / np.linalg.norm(u_PA)
-            u_PC = np.cross(u_CB, u_N)
-            u_PC = u_PC / np.linalg.norm(u_PC)
-            sum_first = 0
-            sum_second = 0
-            # Projections of eigenvalues
-            for i in range(0, 3):
-                eig_AB_i = eigenvectors_AB[:, i]
-                eig_BC_i = eigenvectors_CB[:, i]
-                sum_first = sum_first + (
-                    eigenvalues_AB[i] * abs(dot_product(u_PA, eig_AB_i))
-                )
-                sum_second = sum_second + (
-                    eigenvalues_CB[i] * abs(dot_product(u_PC, eig_BC_i))
-                )
-            # Added as two springs in series
-            k_theta_ij = (1 / ((bond_length_AB ** 2) * sum_first)) + (
-                1 / ((bond_length_BC ** 2) * sum_second)
-            )
-            k_theta_ij = 1 / k_theta_ij
-            k_theta_ij = -k_theta_ij  # Change to OPLS form
-            k_theta_ij = abs(k_theta_ij * 0.5)  # Change to OPLS form
-            k_theta_array[theta, phi] = k_theta_ij
-    # Removes cases where u_N was linearly dependent of u_CB or u_AB.
+    k_theta, theta_0 = sphere_sampled_angle_constant(
+        u_AB,
+        u_CB,
+        bond_length_AB,
+        bond_length_BC,
+        eigenvalues_AB,
+        eigenvectors_AB,
+        eigenvalues_CB,
+        eigenvectors_CB,
+        sampling=sampling,
+        n_samples=n_samples,
+    )
+    return k_theta, theta_0
+
+
+def sphere_sampled_angle_constant(
+    u_AB,
+    u_CB,
+    bond_length_AB,
+    bond_length_BC,
+    eigenvalues_AB,
+    eigenvectors_AB,
+    eigenvalues_CB,
+    eigenvectors_CB,
+    sampling="grid",
+    n_samples=360,
+):
+
+    """
+    Calculates the force angle constant for an angle whose bond
+    vectors u_AB and u_CB are linearly dependent by averaging
+    Equation 14 of the Seminario paper over samples of u_N
+    across a unit sphere. All the samples are evaluated in a
+    single vectorized pass.
+
+    Parameters
+    ----------
+    u_AB : (3,) array
+        Unit vector from atom A to atom B.
+
+    u_CB : (3,) array
+        Unit vector from atom C to atom B.
+
+    bond_length_AB : float
+        Bond length between atoms A and B.
+
+    bond_length_BC : float
+        Bond length between atoms B and C.
+
+    eigenvalues_AB : (3,) array
+        Eigenvalues of the partial hessian of atoms A and B.
+
+    eigenvectors_AB : (3, 3) array
+        Eigenvectors (as columns) of the partial hessian of
+        atoms A and B.
+
+    eigenvalues_CB : (3,) array
+        Eigenvalues of the partial hessian of atoms C and B.
+
+    eigenvectors_CB : (3, 3) array
+        Eigenvectors (as columns) of the partial hessian of
+        atoms C and B.
+
+    sampling : {"grid", "analytic"}, optional
+        "grid" evaluates the 180 * 360 (theta, phi) grid used by
+        QMMMReBind so far. "analytic" uses the fact that u_PA and
+        u_PC only depend on the component of u_N perpendicular to
+        the bond, so that the average over the sphere reduces to an
+        average over a circle around the bond, which is evaluated
+        with n_samples equally spaced points.
+
+    n_samples : int, optional
+        Number of points on the circle for the "analytic" sampling.
+
+    Returns
+    -------
+    k_theta : float
+        Force angle constant averaged over the sampled u_N.
+
+    theta_0 : float
+        Equilibrium angle between AB and BC.
+
+    """
+    assert sampling in ("grid", "analytic"), (
+        "sampling must be either 'grid' or 'analytic', not " + str(sampling)
+    )
+    u_AB = np.asarray(u_AB, dtype=float)
+    u_CB = np.asarray(u_CB, dtype=float)
+    if sampling == "grid":
+        # u_N on the (theta, phi) grid, which only varies with theta
+        theta = np.radians(np.arange(0, 180, dtype=float))
+        theta = np.repeat(theta, 360)
+        u_N = np.stack(
+            (
+                np.sin(theta) * np.cos(theta),
+                np.sin(theta) * np.sin(theta),
+                np.cos(theta),
+            ),
+            axis=1,
+        )
+    else:
+        # Orthonormal basis of the plane perpendicular to the bond
+        reference = np.eye(3)[np.argmin(np.abs(u_AB))]
+        e_1 = np.cross(u_AB, reference)
+        e_1 = e_1 / np.linalg.norm(e_1)
+        e_2 = np.cross(u_AB, e_1)
+        e_2 = e_2 / np.linalg.norm(e_2)
+        psi = 2 * np.pi * np.arange(n_samples) / n_samples
+        u_N = (
+            np.cos(psi)[:, np.newaxis] * e_1
+            + np.sin(psi)[:, np.newaxis] * e_2
+        )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        u_PA = np.cross(u_N, u_AB)
+        u_PA = u_PA / np.linalg.norm(u_PA, axis=1)[:, np.newaxis]
+        u_PC = np.cross(u_CB, u_N)
+        u_PC = u_PC / np.linalg.norm(u_PC, axis=1)[:, np.newaxis]
+        # Projections of eigenvalues
+        sum_first = projected_eigenvalue_sum(
+            u_PA, eigenvalues_AB, eigenvectors_AB
+        )
+        sum_second = projected_eigenvalue_sum(
+            u_PC, eigenvalues_CB, eigenvectors_CB
+        )
+        # Added as two springs in series
+        k_theta_array = (1 / ((bond_length_AB ** 2) * sum_first)) + (
+            1 / ((bond_length_BC ** 2) * sum_second)
+        )
+        k_theta_array = np.abs(-(1 / k_theta_array) * 0.5)  # OPLS form
     # Force constant used is taken as the mean.
-    k_theta = np.mean(np.mean(k_theta_array))
+    k_theta = np.mean(k_theta_array)
     # Equilibrium Angle independent of u_N
     theta_0 = math.degrees(math.cos(np.dot(u_AB, u_CB)))
     return k_theta, theta_0
@@ -1015,6 +1127,408 @@ def force_constant_bond(atom_A, atom_B, eigenvalues, eigenvectors, coords):
     return k_AB
 
 
+def partial_hessian_eigen(hessian, pairs):
+
+    """
+    Diagonalizes the 3 * 3 partial hessians of the given atom
+    pairs in a single batched call.
+
+    Parameters
+    ----------
+    hessian : (3N, 3N) array
+        Hessian matrix of the N atoms.
+
+    pairs : (P, 2) array
+        Atom index pairs (starting from 0) whose partial
+        hessians are required.
+
+    Returns
+    -------
+    eigenvalues : (P, 3) array
+        Eigenvalues of the partial hessian of each pair.
+
+    eigenvectors : (P, 3, 3) array
+        Eigenvectors of the partial hessian of each pair, where
+        eigenvectors[p, :, i] corresponds to eigenvalues[p, i].
+
+    """
+    N = hessian.shape[0] // 3
+    # (N, N, 3, 3) view of the hessian, indexed by atom pairs
+    hessian_blocks = hessian.reshape(N, 3, N, 3).transpose(0, 2, 1, 3)
+    partial_hessians = hessian_blocks[pairs[:, 0], pairs[:, 1]]
+    # The off-diagonal blocks are not symmetric, so eig is used
+    # rather than eigh
+    eigenvalues, eigenvectors = np.linalg.eig(partial_hessians)
+    return eigenvalues.astype(complex), eigenvectors.astype(complex)
+
+
+def projected_eigenvalue_sum(unit_vectors, eigenvalues, eigenvectors):
+
+    """
+    Returns the sum of the eigenvalues of each partial hessian
+    weighted by the projection of its eigenvectors onto the
+    corresponding unit vector (Equations 10 and 14 of the
+    Seminario paper).
+
+    Parameters
+    ----------
+    unit_vectors : (M, 3) array
+        Unit vectors to project the eigenvectors onto.
+
+    eigenvalues : (M, 3) array
+        Eigenvalues of the partial hessians.
+
+    eigenvectors : (M, 3, 3) array
+        Eigenvectors of the partial hessians.
+
+    Returns
+    -------
+    projected_sum : (M, ) array
+        Sum of the projected eigenvalues for each unit vector.
+
+    """
+    projections = np.abs(
+        (unit_vectors[:, :, np.newaxis] * eigenvectors).sum(axis=1)
+    )
+    projected_sum = (eigenvalues * projections).sum(axis=1)
+    return projected_sum
+
+
+def force_angle_constant_array(
+    u_AB,
+    u_CB,
+    bond_length_AB,
+    bond_length_BC,
+    eigenvalues_AB,
+    eigenvectors_AB,
+    eigenvalues_CB,
+    eigenvectors_CB,
+    scaling_1,
+    scaling_2,
+):
+
+    """
+    Vectorized form of force_angle_constant for M angles; returns
+    the force angle constants (in kcal/mol/rad^2) and equilibrium
+    angles (in degrees). Angles with linearly dependent u_AB and
+    u_CB are not treated here (see angle_is_linear).
+
+    Parameters
+    ----------
+    u_AB : (M, 3) array
+        Unit vectors from atom A to atom B.
+
+    u_CB : (M, 3) array
+        Unit vectors from atom C to atom B.
+
+    bond_length_AB : (M, ) array
+        Bond lengths between atoms A and B.
+
+    bond_length_BC : (M, ) array
+        Bond lengths between atoms B and C.
+
+    eigenvalues_AB, eigenvalues_CB : (M, 3) array
+        Eigenvalues of the partial hessians for AB and CB.
+
+    eigenvectors_AB, eigenvectors_CB : (M, 3, 3) array
+        Eigenvectors of the partial hessians for AB and CB.
+
+    scaling_1 : (M, ) array
+        Factors to scale the projections of eigenvalues for AB.
+
+    scaling_2 : (M, ) array
+        Factors to scale the projections of eigenvalues for BC.
+
+    Returns
+    -------
+    k_theta : (M, ) array
+        Force angle constants calculated using modified
+        seminario method.
+
+    theta_0 : (M, ) array
+        Equilibrium angles between AB and BC.
+
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Normal vector to angle plane found
+        u_N = np.cross(u_CB, u_AB)
+        u_N = u_N / np.linalg.norm(u_N, axis=1)[:, np.newaxis]
+        u_PA = np.cross(u_N, u_AB)
+        u_PA = u_PA / np.linalg.norm(u_PA, axis=1)[:, np.newaxis]
+        u_PC = np.cross(u_CB, u_N)
+        u_PC = u_PC / np.linalg.norm(u_PC, axis=1)[:, np.newaxis]
+        # Projections of eigenvalues with the Modified Seminario scaling
+        sum_first = (
+            projected_eigenvalue_sum(u_PA, eigenvalues_AB, eigenvectors_AB)
+            / scaling_1
+        )
+        sum_second = (
+            projected_eigenvalue_sum(u_PC, eigenvalues_CB, eigenvectors_CB)
+            / scaling_2
+        )
+        # Added as two springs in series
+        k_theta = (1 / ((bond_length_AB ** 2) * sum_first)) + (
+            1 / ((bond_length_BC ** 2) * sum_second)
+        )
+        k_theta = np.abs(-(1 / k_theta) * 0.5)  # Change to OPLS form
+    # Equilibrium Angle
+    theta_0 = np.degrees(
+        np.arccos(np.clip((u_AB * u_CB).sum(axis=1), -1.0, 1.0))
+    )
+    return k_theta, theta_0
+
+
+def angle_is_linear(u_AB, u_CB):
+
+    """
+    Returns a boolean mask of the angles for which u_AB and u_CB
+    are linearly dependent and u_N cannot be defined.
+
+    Parameters
+    ----------
+    u_AB : (M, 3) array
+        Unit vectors from atom A to atom B.
+
+    u_CB : (M, 3) array
+        Unit vectors from atom C to atom B.
+
+    """
+    diff_sum = np.abs((u_CB - u_AB).sum(axis=1))
+    return (diff_sum < 0.01) | ((diff_sum > 1.99) & (diff_sum < 2.01))
+
+
+def angle_scaling_factors(angle_list, coords):
+
+    """
+    Returns the Modified Seminario scaling factors of both bonds of
+    every angle, which account for the other angles sharing the
+    same central atom and bond.
+
+    Parameters
+    ----------
+    angle_list : (M, 3) array
+        Atom indices (starting from 0) of the angles.
+
+    coords : (N, 3) array
+        A numpy array of shape (N, 3) having the X, Y and Z
+        coordinates of all N atoms.
+
+    Returns
+    -------
+    scaling_1 : (M, ) array
+        Scaling factors passed as scaling_1 for each angle ABC.
+
+    scaling_2 : (M, ) array
+        Scaling factors passed as scaling_2 for each angle ABC.
+
+    """
+    n_angles = len(angle_list)
+    # Every angle ABC is considered both as ABC and as CBA
+    first = np.concatenate((angle_list[:, 0], angle_list[:, 2]))
+    central = np.concatenate((angle_list[:, 1], angle_list[:, 1]))
+    last = np.concatenate((angle_list[:, 2], angle_list[:, 0]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        u_AB = coords[central] - coords[first]
+        u_AB = u_AB / np.linalg.norm(u_AB, axis=1)[:, np.newaxis]
+        u_CB = coords[central] - coords[last]
+        u_CB = u_CB / np.linalg.norm(u_CB, axis=1)[:, np.newaxis]
+        u_N = np.cross(u_CB, u_AB)
+        u_N = u_N / np.linalg.norm(u_N, axis=1)[:, np.newaxis]
+        u_PA = np.cross(u_N, u_AB)
+        u_PA = u_PA / np.linalg.norm(u_PA, axis=1)[:, np.newaxis]
+    # Angles sharing the central atom and the first bond contribute
+    # sum_k (u_PA . u_PA_k) ** 2 = u_PA^T (sum_k u_PA_k u_PA_k^T) u_PA
+    _, group = np.unique(
+        np.stack((central, first), axis=1), axis=0, return_inverse=True
+    )
+    group = group.ravel()
+    outer_products = u_PA[:, :, np.newaxis] * u_PA[:, np.newaxis, :]
+    group_outer_products = np.zeros((group.max() + 1, 3, 3))
+    np.add.at(group_outer_products, group, outer_products)
+    additional_contributions = np.einsum(
+        "mi,mij,mj->m", u_PA, group_outer_products[group], u_PA
+    ) - ((u_PA * u_PA).sum(axis=1) ** 2)
+    angles_around = np.bincount(group)[group] - 1
+    scaling_factors = np.ones(2 * n_angles)
+    around = angles_around > 0
+    scaling_factors[around] = 1 + (
+        additional_contributions[around] / angles_around[around]
+    )
+    # The two factors of an angle are ordered by the index of their
+    # first atom, as in the original per-angle implementation
+    a_first = angle_list[:, 0] < angle_list[:, 2]
+    scaling_1 = np.where(
+        a_first, scaling_factors[:n_angles], scaling_factors[n_angles:]
+    )
+    scaling_2 = np.where(
+        a_first, scaling_factors[n_angles:], scaling_factors[:n_angles]
+    )
+    return scaling_1, scaling_2
+
+
+def modified_seminario_method(
+    coords,
+    hessian,
+    bond_list,
+    angle_list,
+    vibrational_scaling,
+    linear_angle_sampling="grid",
+    linear_angle_samples=360,
+):
+
+    """
+    Calculates the bond and angle parameters of a molecule with
+    the Modified Seminario method. The partial hessians needed by
+    the bonds and angles are diagonalized in one batched call and
+    all force constants are evaluated as array operations.
+
+    Parameters
+    ----------
+    coords : (N, 3) array
+        A numpy array of shape (N, 3) having the X, Y and Z
+        coordinates of all N atoms.
+
+    hessian : (3N, 3N) array
+        Hessian matrix in kcal/mol/Angstrom^2.
+
+    bond_list : (B, 2) array
+        Atom indices (starting from 0) of the bonds.
+
+    angle_list : (M, 3) array
+        Atom indices (starting from 0) of the angles.
+
+    vibrational_scaling : float
+        Vibrational scaling factor for the QM method.
+
+    linear_angle_sampling : {"grid", "analytic"}, optional
+        Sampling of u_N for the linear angles (see
+        sphere_sampled_angle_constant).
+
+    linear_angle_samples : int, optional
+        Number of samples for the "analytic" linear angle sampling.
+
+    Returns
+    -------
+    k_b : (B, ) array
+        Bond force constants.
+
+    bond_length_list : (B, ) array
+        Equilibrium bond lengths.
+
+    k_theta : (M, ) array
+        Angle force constants.
+
+    theta_0 : (M, ) array
+        Equilibrium angles in degrees.
+
+    """
+    coords = np.asarray(coords, dtype=float)
+    bond_list = np.asarray(bond_list, dtype=int).reshape(-1, 2)
+    angle_list = np.asarray(angle_list, dtype=int).reshape(-1, 3)
+    N = len(coords)
+    vibrational_scaling_squared = vibrational_scaling ** 2
+    # Only the partial hessians used by the bonds and angles are
+    # diagonalized
+    pairs = np.unique(
+        np.concatenate(
+            (
+                bond_list,
+                bond_list[:, ::-1],
+                angle_list[:, [0, 1]],
+                angle_list[:, [2, 1]],
+            )
+        ),
+        axis=0,
+    )
+    pair_index = np.full((N, N), -1, dtype=int)
+    pair_index[pairs[:, 0], pairs[:, 1]] = np.arange(len(pairs))
+    eigenvalues, eigenvectors = partial_hessian_eigen(hessian, pairs)
+    # Bond parameters, the order of bonds sometimes causes slight
+    # differences, so the mean of AB and BA is taken
+    atom_A, atom_B = bond_list.T
+    diff_AB = coords[atom_B] - coords[atom_A]
+    bond_length_list = np.linalg.norm(diff_AB, axis=1)
+    u_AB = diff_AB / bond_length_list[:, np.newaxis]
+    AB = pair_index[atom_A, atom_B]
+    BA = pair_index[atom_B, atom_A]
+    k_AB = projected_eigenvalue_sum(u_AB, eigenvalues[AB], eigenvectors[AB])
+    k_BA = projected_eigenvalue_sum(-u_AB, eigenvalues[BA], eigenvectors[BA])
+    # Convert to OPLS form
+    k_AB = -k_AB * 0.5
+    k_BA = -k_BA * 0.5
+    k_b = np.real((k_AB + k_BA) / 2)
+    k_b = k_b * vibrational_scaling_squared
+    # Angle parameters
+    atom_A, atom_B, atom_C = angle_list.T
+    diff_AB = coords[atom_B] - coords[atom_A]
+    bond_length_AB = np.linalg.norm(diff_AB, axis=1)
+    u_AB = diff_AB / bond_length_AB[:, np.newaxis]
+    diff_CB = coords[atom_B] - coords[atom_C]
+    bond_length_BC = np.linalg.norm(diff_CB, axis=1)
+    u_CB = diff_CB / bond_length_BC[:, np.newaxis]
+    AB = pair_index[atom_A, atom_B]
+    CB = pair_index[atom_C, atom_B]
+    scaling_1, scaling_2 = angle_scaling_factors(angle_list, coords)
+    # Ensures that there is no difference when the ordering is changed
+    AB_k_theta, AB_theta_0 = force_angle_constant_array(
+        u_AB,
+        u_CB,
+        bond_length_AB,
+        bond_length_BC,
+        eigenvalues[AB],
+        eigenvectors[AB],
+        eigenvalues[CB],
+        eigenvectors[CB],
+        scaling_1,
+        scaling_2,
+    )
+    BA_k_theta, BA_theta_0 = force_angle_constant_array(
+        u_CB,
+        u_AB,
+        bond_length_BC,
+        bond_length_AB,
+        eigenvalues[CB],
+        eigenvectors[CB],
+        eigenvalues[AB],
+        eigenvectors[AB],
+        scaling_2,
+        scaling_1,
+    )
+    # If the vectors u_CB and u_AB are linearly dependent u_N cannot
+    # be defined, so u_N is sampled across a unit sphere instead
+    for i in np.flatnonzero(angle_is_linear(u_AB, u_CB)):
+        AB_k_theta[i], AB_theta_0[i] = sphere_sampled_angle_constant(
+            u_AB[i],
+            u_CB[i],
+            bond_length_AB[i],
+            bond_length_BC[i],
+            eigenvalues[AB[i]],
+            eigenvectors[AB[i]],
+            eigenvalues[CB[i]],
+            eigenvectors[CB[i]],
+            sampling=linear_angle_sampling,
+            n_samples=linear_angle_samples,
+        )
+        BA_k_theta[i], BA_theta_0[i] = sphere_sampled_angle_constant(
+            u_CB[i],
+            u_AB[i],
+            bond_length_BC[i],
+            bond_length_AB[i],
+            eigenvalues[CB[i]],
+            eigenvectors[CB[i]],
+            eigenvalues[AB[i]],
+            eigenvectors[AB[i]],
+            sampling=linear_angle_sampling,
+            n_samples=linear_angle_samples,
+        )
+    k_theta = (AB_k_theta + BA_k_theta) / 2
+    theta_0 = (AB_theta_0 + BA_theta_0) / 2
+    # Vibrational_scaling takes into account DFT deficities /
+    # anharmonicity
+    k_theta = k_theta * vibrational_scaling_squared
+    return k_b, bond_length_list, k_theta, theta_0
+
+
 def u_PA_from_angles(atom_A, atom_B, atom_C, coords):
 
     """
@@ -1140,6 +1654,309 @@ def search_in_file(file: str, word: str) -> list:
     return list_of_results
 
 
+def parameter_key(name, atoms):
+
+    """
+    Returns the key identifying a bond, angle or torsion from its atom
+    indices, or None if the number of indices does not match.
+
+    The key does not depend on the direction in which the atoms are
+    listed: bonds are keyed by their sorted atom indices, angles by
+    their sorted end atoms around the central atom and torsions by
+    the lower of their forward and reversed atom tuples, followed by
+    their periodicity.
+
+    Parameters
+    ----------
+    name : {"Bond", "Angle", "Torsion"}
+        Type of parameter.
+
+    atoms : tuple
+        Atom indices, followed by the periodicity for torsions.
+
+    Returns
+    -------
+    key : tuple or None
+        ("Bond", (p1, p2)), ("Angle", (p1, p2, p3)) or
+        ("Torsion", (p1, p2, p3, p4, periodicity)).
+
+    Examples
+    --------
+    >>> parameter_key("Torsion", (4, 3, 2, 1, 2))
+    ('Torsion', (1, 2, 3, 4, 2))
+
+    """
+    atoms = tuple(int(i) for i in atoms)
+    if name == "Bond" and len(atoms) == 2:
+        return (name, tuple(sorted(atoms)))
+    if name == "Angle" and len(atoms) == 3:
+        return (name, min(atoms, atoms[::-1]))
+    if name == "Torsion" and len(atoms) == 5:
+        return (name, min(atoms[:4], atoms[3::-1]) + atoms[4:])
+    return None
+
+
+def xml_parameter_key(line):
+
+    """
+    Returns the key identifying the atoms of a bond, angle or torsion
+    line of a serialized OpenMM System (see parameter_key), or None
+    for any other line.
+
+    Parameters
+    ----------
+    line : str
+        Line of the serialized System (or of a QM parameter file).
+
+    Returns
+    -------
+    key : tuple or None
+        ("Bond", (p1, p2)), ("Angle", (p1, p2, p3)) or
+        ("Torsion", (p1, p2, p3, p4, periodicity)).
+
+    Examples
+    --------
+    >>> xml_parameter_key('<Angle a="1.9" k="400" p1="7" p2="2" p3="5"/>')
+    ('Angle', (5, 2, 7))
+
+    """
+    tag = line.lstrip()[:9]
+    if not tag.startswith(("<Bond ", "<Angle ", "<Torsion ")):
+        return None
+    match = re.match(
+        r'\s*<(Bond|Angle|Torsion) (?:\w+="[^"]*" )*?'
+        r'p1="(\d+)" p2="(\d+)"(?: p3="(\d+)")?(?: p4="(\d+)")?'
+        r'(?: periodicity="(\d+)" phase="[^"]*")?/>',
+        line,
+    )
+    if match is None:
+        return None
+    atoms = [i for i in match.groups()[1:] if i is not None]
+    return parameter_key(match.group(1), atoms)
+
+
+def shift_atom_indices(line, shift):
+
+    """
+    Returns an XML parameter line with all of its atom indices
+    (p1, p2, ...) shifted by the given number.
+    """
+    return re.sub(
+        r'(p\d)="(\d+)"',
+        lambda match: match.group(1)
+        + '="'
+        + str(int(match.group(2)) + shift)
+        + '"',
+        line,
+    )
+
+
+def patch_system_xml(
+    system_xml,
+    patched_system_xml,
+    parameter_lines=(),
+    charges=None,
+    non_bonded_file=None,
+    non_bonded_reparams_file=None,
+):
+
+    """
+    Writes a copy of a serialized OpenMM System in which the bond,
+    angle and torsion lines are replaced by the given parameter lines
+    and the charges of the NonbondedForce particles by the given
+    charges.
+
+    The parameter lines are indexed by xml_parameter_key and the
+    System is streamed once, every line being looked up in that
+    index, instead of searching the whole file for each parameter.
+
+    Parameters
+    ----------
+    system_xml : str
+        Serialized System to patch.
+
+    patched_system_xml : str
+        Patched serialized System to write.
+
+    parameter_lines : list, optional
+        XML lines of the bond, angle and torsion parameters replacing
+        those of the System acting on the same atoms. When several
+        lines share the same atoms, the last one is used.
+
+    charges : numpy.ndarray, optional
+        Structured array with the index (atom) and the new charge (q)
+        of the NonbondedForce particles to patch, e.g.
+        QMParameterSet.charges. Their eps and sig are kept.
+
+    non_bonded_file : str, optional
+        If given, the NonbondedForce particle lines of the System are
+        also written to this file.
+
+    non_bonded_reparams_file : str, optional
+        If given, the patched NonbondedForce particle lines are also
+        written to this file.
+
+    Returns
+    -------
+    n_patched : int
+        Number of lines of the System that were replaced.
+
+    """
+    replacements = {}
+    for line in parameter_lines:
+        key = xml_parameter_key(line)
+        if key is None:
+            raise ValueError("Not a bond, angle or torsion line: " + line)
+        if not line.endswith("\n"):
+            line = line + "\n"
+        replacements[key] = line
+    charge_for_index = {}
+    if charges is not None:
+        charge_for_index = dict(
+            zip(charges["atom"].tolist(), charges["q"].tolist())
+        )
+    particle = re.compile(
+        r'\s*<Particle eps="([^"]*)" q="[^"]*" sig="([^"]*)"/>'
+    )
+    non_bonded_lines = []
+    non_bonded_reparams_lines = []
+    n_particles = 0
+    n_patched = 0
+    with open(system_xml, "r") as f_in, open(
+        patched_system_xml, "w"
+    ) as f_out:
+        for line in f_in:
+            key = xml_parameter_key(line)
+            if key is not None:
+                if key in replacements:
+                    line = replacements[key]
+                    n_patched = n_patched + 1
+            elif line.lstrip().startswith("<Particle eps="):
+                match = particle.match(line)
+                non_bonded_lines.append(line)
+                if match is not None and n_particles in charge_for_index:
+                    line = (
+                        "                                "
+                        + "<Particle "
+                        + "eps="
+                        + '"'
+                        + str(float(match.group(1)))
+                        + '"'
+                        + " "
+                        + "q="
+                        + '"'
+                        + str(charge_for_index[n_particles])
+                        + '"'
+                        + " "
+                        + "sig="
+                        + '"'
+                        + str(float(match.group(2)))
+                        + '"'
+                        + "/>"
+                        + "\n"
+                    )
+                    n_patched = n_patched + 1
+                non_bonded_reparams_lines.append(line)
+                n_particles = n_particles + 1
+            f_out.write(line)
+    if non_bonded_file is not None:
+        with open(non_bonded_file, "w") as f:
+            f.writelines(non_bonded_lines)
+    if non_bonded_reparams_file is not None:
+        with open(non_bonded_reparams_file, "w") as f:
+            f.writelines(non_bonded_reparams_lines)
+    return n_patched
+
+
+def patch_system(system, qm_params, charges=True):
+
+    """
+    Applies QM parameters to the forces of an OpenMM System in place.
+
+    This is the equivalent of patch_system_xml working directly on the
+    System: the parameters are indexed by parameter_key and every
+    bond, angle and torsion of the HarmonicBondForce,
+    HarmonicAngleForce and PeriodicTorsionForce of the System is looked
+    up in that index and replaced with setBondParameters,
+    setAngleParameters and setTorsionParameters. The charges of the
+    NonbondedForce particles are replaced with setParticleParameters,
+    keeping their sigma and epsilon.
+
+    Parameters
+    ----------
+    system : simtk.openmm.System
+        System to patch.
+
+    qm_params : QMParameterSet
+        Bond, angle, torsion and charge parameters to apply.
+
+    charges : bool, optional
+        Whether to apply the charges as well.
+
+    Returns
+    -------
+    n_patched : int
+        Number of parameters of the System that were replaced.
+
+    """
+    bonds = {
+        parameter_key("Bond", (p1, p2)): (float(d), float(k))
+        for p1, p2, d, k in qm_params.bonds
+    }
+    angles = {
+        parameter_key("Angle", (p1, p2, p3)): (float(a), float(k))
+        for p1, p2, p3, a, k in qm_params.angles
+    }
+    torsions = {
+        parameter_key("Torsion", (p1, p2, p3, p4, periodicity)): (
+            float(phase),
+            float(k),
+        )
+        for p1, p2, p3, p4, periodicity, phase, k in qm_params.torsions
+    }
+    charge_for_index = {}
+    if charges:
+        charge_for_index = dict(
+            zip(
+                qm_params.charges["atom"].tolist(),
+                qm_params.charges["q"].tolist(),
+            )
+        )
+    n_patched = 0
+    for force in system.getForces():
+        if isinstance(force, simtk.openmm.HarmonicBondForce):
+            for i in range(force.getNumBonds()):
+                p1, p2, d, k = force.getBondParameters(i)
+                key = parameter_key("Bond", (p1, p2))
+                if key in bonds:
+                    force.setBondParameters(i, p1, p2, *bonds[key])
+                    n_patched = n_patched + 1
+        elif isinstance(force, simtk.openmm.HarmonicAngleForce):
+            for i in range(force.getNumAngles()):
+                p1, p2, p3, a, k = force.getAngleParameters(i)
+                key = parameter_key("Angle", (p1, p2, p3))
+                if key in angles:
+                    force.setAngleParameters(i, p1, p2, p3, *angles[key])
+                    n_patched = n_patched + 1
+        elif isinstance(force, simtk.openmm.PeriodicTorsionForce):
+            for i in range(force.getNumTorsions()):
+                p1, p2, p3, p4, periodicity, phase, k = (
+                    force.getTorsionParameters(i)
+                )
+                key = parameter_key("Torsion", (p1, p2, p3, p4, periodicity))
+                if key in torsions:
+                    force.setTorsionParameters(
+                        i, p1, p2, p3, p4, periodicity, *torsions[key]
+                    )
+                    n_patched = n_patched + 1
+        elif isinstance(force, simtk.openmm.NonbondedForce):
+            for i in charge_for_index:
+                q, sig, eps = force.getParticleParameters(i)
+                force.setParticleParameters(i, charge_for_index[i], sig, eps)
+                n_patched = n_patched + 1
+    return n_patched
+
+
 def list_to_dict(lst):
 
     """
@@ -1307,14 +2124,11 @@ def xyz_to_pdb(xyz_file, coords_file, template_pdb, system_pdb):
     with open(coords_file, "w") as f:
         for i in needed_lines:
             f.write(i)
-    df = pd.read_csv(coords_file, header=None, delimiter=r"\s+")
-    df.columns = ["atom", "x", "y", "z"]
-    ppdb = PandasPdb()
-    ppdb.read_pdb(template_pdb)
-    ppdb.df["ATOM"]["x_coord"] = df["x"]
-    ppdb.df["ATOM"]["y_coord"] = df["y"]
-    ppdb.df["ATOM"]["z_coord"] = df["z"]
-    ppdb.to_pdb(system_pdb)
+    coordinates = np.loadtxt(coords_file, usecols=(1, 2, 3), ndmin=2)
+    pdb = PdbFile.load(template_pdb)
+    atoms = pdb.atoms.copy()
+    atoms["xyz"][atoms["record_name"] == "ATOM"] = coordinates
+    pdb.write(system_pdb, atoms)
 
 
 def generate_xml_from_pdb_sdf(system_pdb, system_sdf, system_xml):
@@ -1491,50 +2305,19 @@ def generate_mm_pdbs(qm_scan_file, template_pdb):
     based on a template PDB.
 
     """
-    with open(qm_scan_file, "r") as f:
-        lines = f.readlines()
-    energy_dihedral_lines = []
-    for i in range(len(lines)):
-        if "Dihedral" in lines[i]:
-            energy_dihedral_lines.append(lines[i])
-    dihedrals = []
-    for i in energy_dihedral_lines:
-        energy_dihedral = i
-        energy_dihedral = re.findall(r"[-+]?\d+[.]?\d*", energy_dihedral)
-        dihedral = float(energy_dihedral[0])
-        dihedrals.append(dihedral)
-    lines_markers = []
-    for i in range(len(lines)):
-        if "Dihedral" in lines[i]:
-            lines_markers.append(i)
-    lines_markers.append(len(lines) + 1)
-    for i in range(len(lines_markers) - 1):
+    dihedrals = get_dihedrals(qm_scan_file)
+    scan_coordinates = get_scan_coordinates(qm_scan_file)
+    pdb = PdbFile.load(template_pdb)
+    atoms = pdb.atoms.copy()
+    atom_mask = atoms["record_name"] == "ATOM"
+    for i in range(len(dihedrals)):
         # pdb_file_to_write = str(dihedrals[i]) + ".pdb"
         if dihedrals[i] > 0:
             pdb_file_to_write = "plus_" + str(abs(dihedrals[i])) + ".pdb"
         if dihedrals[i] < 0:
             pdb_file_to_write = "minus_" + str(abs(dihedrals[i])) + ".pdb"
-        to_begin = lines_markers[i]
-        to_end = lines_markers[i + 1]
-        lines_to_write = lines[to_begin + 1 : to_end - 1]
-        x_coords = []
-        y_coords = []
-        z_coords = []
-        for i in lines_to_write:
-            coordinates = i
-            coordinates = re.findall(r"[-+]?\d+[.]?\d*", coordinates)
-            x = float(coordinates[0])
-            y = float(coordinates[1])
-            z = float(coordinates[2])
-            x_coords.append(x)
-            y_coords.append(y)
-            z_coords.append(z)
-        ppdb = PandasPdb()
-        ppdb.read_pdb(template_pdb)
-        ppdb.df["ATOM"]["x_coord"] = x_coords
-        ppdb.df["ATOM"]["y_coord"] = y_coords
-        ppdb.df["ATOM"]["z_coord"] = z_coords
-        ppdb.to_pdb(pdb_file_to_write)
+        atoms["xyz"][atom_mask] = scan_coordinates[i]
+        pdb.write(pdb_file_to_write, atoms)
 
 
 def remove_mm_files(qm_scan_file):
@@ -1685,15 +2468,162 @@ def get_mm_potential_energies(qm_scan_file, load_topology, system_xml):
     return mm_potential_energies
 
 
-def list_diff(list_1, list_2):
+def get_scan_coordinates(qm_scan_file):
 
     """
-    Returns the difference between two lists as a list.
+    Returns the coordinates of every geometry in the torsiondrive
+    scan file.
 
     Parameters
     ----------
-    list_1 : list
-        First list
+    qm_scan_file : str
+        Output scan file containing torsiondrive scans.
+
+    Returns
+    -------
+    scan_coordinates : numpy.ndarray
+        Array of shape (number of scan points, number of atoms, 3)
+        with the coordinates (in angstrom) of each scan geometry,
+        in the same order as the dihedrals of the scan file.
+
+    """
+    with open(qm_scan_file, "r") as f:
+        lines = f.readlines()
+    lines_markers = []
+    for i in range(len(lines)):
+        if "Dihedral" in lines[i]:
+            lines_markers.append(i)
+    lines_markers.append(len(lines) + 1)
+    scan_coordinates = []
+    for i in range(len(lines_markers) - 1):
+        to_begin = lines_markers[i]
+        to_end = lines_markers[i + 1]
+        coordinates = [
+            [float(j) for j in line.split()[1:4]]
+            for line in lines[to_begin + 1 : to_end - 1]
+        ]
+        scan_coordinates.append(coordinates)
+    return np.array(scan_coordinates)
+
+
+def get_dihedral_angles(coordinates, dihedrals):
+
+    """
+    Returns the dihedral angles of a set of torsions in every
+    geometry of a torsion scan.
+
+    Parameters
+    ----------
+    coordinates : numpy.ndarray
+        Array of shape (number of scan points, number of atoms, 3)
+        with the coordinates of the scan geometries.
+
+    dihedrals : numpy.ndarray
+        Array of shape (number of torsions, 4) with the atom
+        indices (starting from 0) of the torsions.
+
+    Returns
+    -------
+    dihedral_angles : numpy.ndarray
+        Array of shape (number of scan points, number of torsions)
+        with the dihedral angles in degrees.
+
+    """
+    positions = np.asarray(coordinates)[:, np.asarray(dihedrals)]
+    b_0 = positions[..., 0, :] - positions[..., 1, :]
+    b_1 = positions[..., 2, :] - positions[..., 1, :]
+    b_2 = positions[..., 3, :] - positions[..., 2, :]
+    b_1 = b_1 / np.linalg.norm(b_1, axis=-1, keepdims=True)
+    v = b_0 - np.sum(b_0 * b_1, axis=-1, keepdims=True) * b_1
+    w = b_2 - np.sum(b_2 * b_1, axis=-1, keepdims=True) * b_1
+    x = np.sum(v * w, axis=-1)
+    y = np.sum(np.cross(b_1, v) * w, axis=-1)
+    dihedral_angles = np.degrees(np.arctan2(y, x))
+    return dihedral_angles
+
+
+def get_non_torsion_mm_energies(
+    qm_scan_file, template_pdb, load_topology, system_xml
+):
+
+    """
+    Returns the non-torsional energies (HarmonicBondForce,
+    HarmonicAngleForce and NonbondedForce) of every geometry
+    in the torsiondrive scan file.
+
+    The openmm system and its context are built only once from
+    the template PDB file and the forcefield file. Each scan
+    geometry is then set as the positions of the context and
+    the energies of the non-torsional force groups are summed,
+    so that no intermediate PDB, prmtop or inpcrd files are
+    written.
+
+    Parameters
+    ----------
+    qm_scan_file : str
+        Output scan file containing torsiondrive scans.
+
+    template_pdb : str
+        PDB file to load the openmm system topology.
+
+    load_topology : {"openmm", "parmed"}
+        Argument to specify how to load the topology.
+
+    system_xml : str
+        XML force field file for the openmm system.
+
+    Returns
+    -------
+    mm_potential_energies : list
+        List of the non-torsional mm energies (in kcal/mol) of
+        the scan geometries, in the same order as the dihedrals
+        of the scan file.
+
+    """
+    if load_topology == "parmed":
+        topology = parmed.load_file(template_pdb, structure=True).topology
+    if load_topology == "openmm":
+        topology = simtk.openmm.app.PDBFile(template_pdb).topology
+    openmm_system = parmed.openmm.load_topology(
+        topology, parmed.load_file(system_xml)
+    )
+    parm = parmed.amber.AmberParm.from_structure(openmm_system)
+    system = parm.createSystem()
+    non_torsion_forces = [
+        "HarmonicBondForce",
+        "HarmonicAngleForce",
+        "NonbondedForce",
+    ]
+    non_torsion_groups = []
+    for i, force in enumerate(system.getForces()):
+        force.setForceGroup(i)
+        if type(force).__name__ in non_torsion_forces:
+            non_torsion_groups.append(i)
+    context = simtk.openmm.Context(
+        system, simtk.openmm.VerletIntegrator(0.001)
+    )
+    mm_potential_energies = []
+    for coordinates in get_scan_coordinates(qm_scan_file):
+        context.setPositions(coordinates * simtk.unit.angstrom)
+        mm_energy = 0.0
+        for i in non_torsion_groups:
+            state = context.getState(getEnergy=True, groups=1 << i)
+            mm_energy += state.getPotentialEnergy().value_in_unit(
+                simtk.unit.kilocalories_per_mole
+            )
+        mm_potential_energies.append(mm_energy)
+    return mm_potential_energies
+
+
+def list_diff(list_1, list_2):
+
+    """
+    Returns the difference between two lists as a list.
+
+    Parameters
+    ----------
+    list_1 : list
+        First list
 
     list_2 : list
         Second list.
@@ -1730,6 +2660,39 @@ def dihedral_energy(x, k1, k2, k3, k4=0):
     return dihedral_energy
 
 
+def dihedral_design_matrix(x):
+
+    """
+    Returns the design matrix of the dihedral energy expression.
+
+    dihedral_energy is linear in k1, k2, k3 and k4, so the
+    dihedral energies of all the scan points are given by the
+    product of this matrix with the array of the force constants.
+
+    Parameters
+    ----------
+    x : list
+        Dihedral angles (in degrees) of the scan points.
+
+    Returns
+    -------
+    design_matrix : numpy.ndarray
+        Array of shape (number of scan points, 4) whose columns
+        are the cosine terms of periodicity 1 to 4.
+
+    """
+    x = np.asarray(x, dtype=float) * 0.01745
+    design_matrix = np.column_stack(
+        [
+            1 + np.cos(1 * x),
+            1 - np.cos(2 * x),
+            1 + np.cos(3 * x),
+            1 - np.cos(4 * x),
+        ]
+    )
+    return design_matrix
+
+
 def error_function(delta_qm, delta_mm):
     """
     Root Mean Squared Error.
@@ -1740,22 +2703,176 @@ def error_function(delta_qm, delta_mm):
     return root_mean_squared_error
 
 
+def boltzmann_weights(delta_qm, T):
+    """
+    Boltzmann weights of the relative QM energies (in kcal/mol)
+    at the temperature T (in K).
+    """
+    kb = 0.0019872041  # in kcal/(mol K)
+    return np.exp(-np.asarray(delta_qm, dtype=float) / (kb * T))
+
+
 def error_function_boltzmann(delta_qm, delta_mm, T):
     """
     Boltzmann Root Mean Squared Error.
     """
-    kb = 3.297623483 * 10 ** (-24)  # in cal/K
-    delta_qm_boltzmann_weighted = [np.exp(-i / (kb * T)) for i in delta_qm]
-    squared_error = (
-        np.square(np.subtract(delta_qm, delta_mm))
-        * delta_qm_boltzmann_weighted
-    )
+    squared_error = np.square(
+        np.subtract(delta_qm, delta_mm)
+    ) * boltzmann_weights(delta_qm, T)
     mean_squared_error = squared_error.mean()
     root_mean_squared_error = math.sqrt(mean_squared_error)
     return root_mean_squared_error
 
 
-def gen_init_guess(qm_scan_file, load_topology, system_xml):
+def fit_dihedral_params(x, delta_qm, delta_mm=None, T=None, method="nnls"):
+
+    """
+    Returns the non-negative torsional force constants that
+    best fit the relative QM energies of a torsion scan.
+
+    The dihedral energy is linear in the force constants, so the
+    bounded least squares problem is solved exactly on the
+    design matrix of the scan, without any initial guess.
+
+    Parameters
+    ----------
+    x : list
+        Dihedral angles (in degrees) of the scan points.
+
+    delta_qm : list
+        Relative QM energies (in kcal/mol) of the scan points.
+
+    delta_mm : list, optional
+        Relative non-torsional MM energies (in kcal/mol) of the
+        scan points. If given, the torsional terms are fitted to
+        the residual delta_qm - delta_mm.
+
+    T : float, optional
+        Temperature (in K) of the Boltzmann weights of the scan
+        points. If None, all the points have the same weight.
+
+    method : {"nnls", "lsq_linear"}
+        Solver for the bounded linear least squares problem. Any
+        other method raises a ValueError.
+
+    Returns
+    -------
+    k_array : numpy.ndarray
+        Fitted force constants k1, k2, k3 and k4.
+
+    """
+    if method not in ["nnls", "lsq_linear"]:
+        raise ValueError(
+            "Unsupported method for fitting of torsional parameters: "
+            + str(method)
+        )
+    design_matrix = dihedral_design_matrix(x)
+    target = np.asarray(delta_qm, dtype=float)
+    if delta_mm is not None:
+        target = target - np.asarray(delta_mm, dtype=float)
+    if T is not None:
+        sqrt_weights = np.sqrt(boltzmann_weights(delta_qm, T))
+        design_matrix = design_matrix * sqrt_weights[:, np.newaxis]
+        target = target * sqrt_weights
+    if method == "lsq_linear":
+        k_array = scipy.optimize.lsq_linear(
+            design_matrix, target, bounds=(0.0, np.inf)
+        ).x
+    else:
+        k_array = scipy.optimize.nnls(design_matrix, target)[0]
+    return k_array
+
+
+def fit_global_dihedral_params(scans, T=None):
+
+    """
+    Returns the non-negative torsional force constants of all the
+    scanned dihedral angles, fitted simultaneously to all the
+    torsion scans.
+
+    Each scan point contributes one row to a single sparse design
+    matrix, with the cosine terms of every fitted torsion that
+    shares atoms with the scanned dihedral angle, evaluated at
+    the geometry of the point. The bounded linear problem over
+    all the scans is then solved at once, so that coupled
+    torsions are fitted consistently. The problem is always solved
+    with scipy.optimize.lsq_linear, since scipy.optimize.nnls does
+    not accept sparse matrices.
+
+    Parameters
+    ----------
+    scans : list
+        Scans of the torsiondrive directories, as returned by
+        get_torsion_drive_dir_scan.
+
+    T : float, optional
+        Temperature (in K) of the Boltzmann weights of the scan
+        points. If None, all the points have the same weight.
+
+    Returns
+    -------
+    dihedrals : numpy.ndarray
+        Array of shape (number of torsions, 4) with the atom
+        indices of the fitted torsions, in the order of the scans.
+
+    k_array : numpy.ndarray
+        Array of shape (number of torsions, 4) with the fitted
+        force constants k1, k2, k3 and k4 of each torsion.
+
+    """
+    dihedrals = np.array(
+        list(OrderedDict.fromkeys(tuple(i["atom_index"]) for i in scans)),
+        dtype=int,
+    ).reshape(-1, 4)
+    rows = []
+    columns = []
+    values = []
+    targets = []
+    n_rows = 0
+    for scan in scans:
+        scanned = np.asarray(scan["atom_index"])
+        coupled = np.flatnonzero(np.isin(dihedrals, scanned).any(axis=1))
+        dihedral_angles = get_dihedral_angles(
+            scan["coordinates"], dihedrals[coupled]
+        )
+        n_points = dihedral_angles.shape[0]
+        block = dihedral_design_matrix(dihedral_angles.ravel()).reshape(
+            n_points, len(coupled) * 4
+        )
+        target = np.subtract(scan["delta_qm"], scan["delta_mm"])
+        if T is not None:
+            sqrt_weights = np.sqrt(boltzmann_weights(scan["delta_qm"], T))
+            block = block * sqrt_weights[:, np.newaxis]
+            target = target * sqrt_weights
+        block_columns = (
+            4 * coupled[:, np.newaxis] + np.arange(4)
+        ).ravel()
+        rows.append(
+            np.repeat(np.arange(n_rows, n_rows + n_points), 4 * len(coupled))
+        )
+        columns.append(np.tile(block_columns, n_points))
+        values.append(block.ravel())
+        targets.append(target)
+        n_rows += n_points
+    design_matrix = scipy.sparse.csr_matrix(
+        (
+            np.concatenate(values),
+            (np.concatenate(rows), np.concatenate(columns)),
+        ),
+        shape=(n_rows, 4 * len(dihedrals)),
+    )
+    k_array = scipy.optimize.lsq_linear(
+        design_matrix,
+        np.concatenate(targets),
+        bounds=(0.0, np.inf),
+        lsmr_tol="auto",
+    ).x
+    return dihedrals, k_array.reshape(-1, 4)
+
+
+def gen_init_guess(
+    qm_scan_file, load_topology, system_xml, mm_potential_energies=None
+):
 
     """
     Initial guess for the torsional parameter.
@@ -1771,27 +2888,27 @@ def gen_init_guess(qm_scan_file, load_topology, system_xml):
     system_xml : str
         XML force field file for the system.
 
+    mm_potential_energies : list, optional
+        Precomputed non-torsional mm energies of the scan
+        geometries. If None, they are computed from the PDB
+        files generated by generate_mm_pdbs.
+
     Returns
     -------
-    k_init_guess : list
-        Initial guess for the torsional parameters.
+    k_init_guess : numpy.ndarray
+        Non-negative torsional parameters fitted to the
+        relative mm energies.
 
     """
     x = get_dihedrals(qm_scan_file)
-    y = scale_list(
-        list_=get_mm_potential_energies(
+    if mm_potential_energies is None:
+        mm_potential_energies = get_mm_potential_energies(
             qm_scan_file=qm_scan_file,
             load_topology=load_topology,
             system_xml=system_xml,
         )
-    )
-    init_vals = [0.0, 0.0, 0.0, 0.0]
-    k_init_guess, covar = scipy.optimize.curve_fit(
-        dihedral_energy, x, y, p0=init_vals
-    )
-    for i in range(len(k_init_guess)):
-        if k_init_guess[i] < 0:
-            k_init_guess[i] = 0
+    y = scale_list(list_=mm_potential_energies)
+    k_init_guess = fit_dihedral_params(x, y)
     return k_init_guess
 
 
@@ -1806,82 +2923,95 @@ def objective_function(k_array, x, delta_qm):
     return loss_function
 
 
-def fit_params(qm_scan_file, load_topology, system_xml, method):
+def fit_params(
+    qm_scan_file,
+    load_topology,
+    system_xml,
+    method,
+    mm_potential_energies=None,
+    T=None,
+):
     """
-    Optimization of the objective function.
+    Fits the torsional parameters to the QM energies of the scan
+    minus its non-torsional mm energies. If mm_potential_energies
+    is None, they are computed from the PDB files generated by
+    generate_mm_pdbs.
     """
-    k_guess = gen_init_guess(
-        qm_scan_file=qm_scan_file,
-        load_topology=load_topology,
-        system_xml=system_xml,
+    x_data = get_dihedrals(qm_scan_file)
+    delta_qm = scale_list(
+        list_hartree_kcal(list_=get_qm_energies(qm_scan_file))
     )
-    x_data = np.array(get_dihedrals(qm_scan_file))
-    delta_qm = np.array(
-        scale_list(list_hartree_kcal(list_=get_qm_energies(qm_scan_file)))
-    )
-    optimise = scipy.optimize.minimize(
-        objective_function,
-        k_guess,
-        args=(x_data, delta_qm),
-        method=method,
-        bounds=[(0.00, None), (0.00, None), (0.00, None), (0.00, None),],
+    if mm_potential_energies is None:
+        mm_potential_energies = get_mm_potential_energies(
+            qm_scan_file=qm_scan_file,
+            load_topology=load_topology,
+            system_xml=system_xml,
+        )
+    delta_mm = scale_list(mm_potential_energies)
+    return fit_dihedral_params(
+        x_data, delta_qm, delta_mm=delta_mm, T=T, method=method
     )
-    return optimise.x
 
 
 def get_tor_params(
-    qm_scan_file, template_pdb, load_topology, system_xml, method
+    qm_scan_file, template_pdb, load_topology, system_xml, method, T=None
 ):
     """
     Returns the fitted torsional parameters.
     """
-    qm_e = get_qm_energies(qm_scan_file=qm_scan_file)
-    qm_e_kcal = list_hartree_kcal(qm_e)
-    delta_qm = scale_list(qm_e_kcal)
-    generate_mm_pdbs(qm_scan_file=qm_scan_file, template_pdb=template_pdb)
-    mm_pe_no_torsion_kcal = get_mm_potential_energies(
+    mm_pe_no_torsion_kcal = get_non_torsion_mm_energies(
         qm_scan_file=qm_scan_file,
+        template_pdb=template_pdb,
         load_topology=load_topology,
         system_xml=system_xml,
     )
-    delta_mm = scale_list(mm_pe_no_torsion_kcal)
     opt_param = fit_params(
         qm_scan_file=qm_scan_file,
         load_topology=load_topology,
         system_xml=system_xml,
         method=method,
+        mm_potential_energies=mm_pe_no_torsion_kcal,
+        T=T,
     )
     return opt_param
 
 
-def get_torsional_lines(
-    template_pdb,
-    system_xml,
-    qm_scan_file,
-    load_topology,
-    method,
-    dihedral_text_file,
-):
+def get_dihedral_atom_index(dihedral_text_file):
     """
-    Returns the torsional lines for the XML forcefield file.
+    Returns the atom indices (starting from 0) of the dihedral
+    angle scanned in a torsiondrive directory.
+    """
+    with open(dihedral_text_file, "r") as f:
+        atom_numbers = f.readlines()[-1]
+    atom_index = [int(i) - 1 for i in re.findall(r"\d+", atom_numbers)[:4]]
+    return atom_index
+
+
+def write_dihedral_text_file(dihedral_text_file, dihedrals):
+    """
+    Writes the dihedral information file of torsiondrive for
+    dihedral angles given as atom numbers starting from 1.
+    """
+    with open(dihedral_text_file, "w") as f:
+        f.write("# dihedral definition by atom indices starting from 1" + "\n")
+        f.write("# i     j     k     l" + "\n")
+        for dihedral in np.asarray(dihedrals).reshape(-1, 4):
+            i_, j_, k_, l_ = dihedral.tolist()
+            f.write(
+                " "
+                + "{:< 6d}".format(i_)
+                + "{:< 6d}".format(j_)
+                + "{:< 6d}".format(k_)
+                + "{:< 6d}".format(l_)
+                + "\n"
+            )
+
+
+def get_torsion_xml_lines(atom_index, opt_param):
+    """
+    Returns the torsional lines for the XML forcefield file
+    of the dihedral angle defined by atom_index.
     """
-    opt_param = get_tor_params(
-        qm_scan_file=qm_scan_file,
-        template_pdb=template_pdb,
-        load_topology=load_topology,
-        system_xml=system_xml,
-        method=method,
-    )
-    dihedral_text = open(dihedral_text_file, "r")
-    dihedral_text_lines = dihedral_text.readlines()
-    atom_numbers = dihedral_text_lines[-1]
-    atom_index_from_1 = [
-        int(re.findall(r"\d+", atom_numbers)[0]),
-        int(re.findall(r"\d+", atom_numbers)[1]),
-        int(re.findall(r"\d+", atom_numbers)[2]),
-        int(re.findall(r"\d+", atom_numbers)[3]),
-    ]
-    atom_index = [i - 1 for i in atom_index_from_1]
     atom_index_lines = (
         " "
         + "p1="
@@ -1926,84 +3056,536 @@ def get_torsional_lines(
             + '"'
             + "/>"
         )
-        # print(line_to_append)
         tor_lines.append(line_to_append)
     return tor_lines
 
 
-def singular_resid(pdbfile, qmmmrebind_init_file):
+def get_torsional_lines(
+    template_pdb,
+    system_xml,
+    qm_scan_file,
+    load_topology,
+    method,
+    dihedral_text_file,
+    T=None,
+):
+    """
+    Returns the torsional lines for the XML forcefield file.
+    """
+    opt_param = get_tor_params(
+        qm_scan_file=qm_scan_file,
+        template_pdb=template_pdb,
+        load_topology=load_topology,
+        system_xml=system_xml,
+        method=method,
+        T=T,
+    )
+    atom_index = get_dihedral_atom_index(dihedral_text_file)
+    return get_torsion_xml_lines(atom_index, opt_param)
+
+
+def get_symmetry_classes(molecule):
 
     """
-    Returns a PDB file with chain ID = A
+    Returns the topological symmetry class of every atom of a
+    molecule.
+
+    The classes are obtained by color refinement of the bonded
+    graph: the atoms are first colored by their atomic number, and
+    each color is then refined by the sorted colors and bond orders
+    of the neighbors of the atom, until the number of classes no
+    longer changes. Aromatic bonds are given an order of 1.5, since
+    the Kekulé orders stored by OpenFF would otherwise tell apart
+    equivalent atoms of an aromatic ring. Atoms in the same class are topologically
+    equivalent (for example, the ortho carbon atoms of a phenyl
+    ring).
 
     Parameters
     ----------
-    pdbfile: str
-        Input PDB file
+    molecule : openff.toolkit.topology.Molecule
+        Molecule whose atoms are classified.
 
-    qmmmrebind_init_file: str
-        Output PDB file
+    Returns
+    -------
+    symmetry_classes : numpy.ndarray
+        Symmetry class of each atom (indexed from 0).
+
+    """
+    neighbors = [[] for i in range(molecule.n_atoms)]
+    for bond in molecule.bonds:
+        bond_order = 1.5 if bond.is_aromatic else bond.bond_order
+        neighbors[bond.atom1_index].append((bond.atom2_index, bond_order))
+        neighbors[bond.atom2_index].append((bond.atom1_index, bond_order))
+    colors = [atom.atomic_number for atom in molecule.atoms]
+    n_classes = len(set(colors))
+    while True:
+        signatures = [
+            (
+                colors[i],
+                tuple(sorted((colors[j], order) for j, order in neighbors[i])),
+            )
+            for i in range(molecule.n_atoms)
+        ]
+        ranks = {j: i for i, j in enumerate(sorted(set(signatures)))}
+        colors = [ranks[i] for i in signatures]
+        if len(ranks) == n_classes:
+            break
+        n_classes = len(ranks)
+    symmetry_classes = np.array(colors, dtype=np.int64)
+    return symmetry_classes
+
+
+def group_equivalent_dihedrals(dihedrals, symmetry_classes=None):
 
     """
+    Groups the dihedral angles whose torsiondrive scans are
+    equivalent, so that a single scan is run for each group.
 
-    ppdb = PandasPdb().read_pdb(pdbfile)
-    ppdb.df["HETATM"]["chain_id"] = "A"
-    ppdb.df["ATOM"]["chain_id"] = "A"
-    ppdb.to_pdb(
-        path=qmmmrebind_init_file, records=None, gz=False, append_newline=True
-    )
+    The dihedral angles are first grouped by their central bond,
+    since scanning any of them rotates the same bond. If the
+    symmetry classes of the atoms are given, the groups of
+    topologically equivalent central bonds are then merged, keeping
+    for each bond the dihedral angle equivalent to the scanned one.
 
+    The other dihedral angles around a scanned bond are deliberately
+    left out of the groups, and so keep their OpenFF parameters: the
+    scan of the bond gives a single torsional profile, which would
+    be counted several times if the fitted parameters were applied
+    to every dihedral angle around the bond.
 
-def relax_init_structure(
-    pdbfile,
-    prmtopfile,
-    qmmmrebindpdb,
-    sim_output="output.pdb",
-    sim_steps=100000,
+    Parameters
+    ----------
+    dihedrals : (D, 4) numpy.ndarray
+        Atom numbers (starting from 1) of the dihedral angles.
+
+    symmetry_classes : numpy.ndarray, optional
+        Symmetry class of each atom (indexed from 0), as returned by
+        get_symmetry_classes.
+
+    Returns
+    -------
+    groups : list
+        List of (M, 4) arrays with the atom numbers of the dihedral
+        angles of each group, the first one being the dihedral angle
+        to scan. Only the dihedral angles to which the fitted
+        parameters apply are kept in each group.
+
+    """
+    dihedrals = np.asarray(dihedrals, dtype=np.int64).reshape(-1, 4)
+    # First dihedral angle around each central bond
+    bond_dihedrals = OrderedDict()
+    for dihedral in dihedrals:
+        bond = tuple(sorted(dihedral[1:3].tolist()))
+        bond_dihedrals.setdefault(bond, []).append(dihedral)
+    if symmetry_classes is None:
+        return [i[0][np.newaxis] for i in bond_dihedrals.values()]
+
+    def class_key(dihedral):
+        key = tuple(symmetry_classes[dihedral - 1].tolist())
+        return min(key, key[::-1])
+
+    groups = OrderedDict()
+    for bond, bond_group in bond_dihedrals.items():
+        bond_class = tuple(sorted(symmetry_classes[np.array(bond) - 1]))
+        for (key_class, key), group in groups.items():
+            if key_class != bond_class:
+                continue
+            equivalent = [i for i in bond_group if class_key(i) == key]
+            if equivalent:
+                group.append(equivalent[0])
+                break
+        else:
+            representative = bond_group[0]
+            groups[(bond_class, class_key(representative))] = [
+                representative
+            ]
+    return [np.array(i) for i in groups.values()]
+
+
+def get_equivalent_atom_indices(
+    equivalent_dihedral_text_file, dihedral_text_file
 ):
+    """
+    Returns the atom indices (starting from 0) of the dihedral
+    angles sharing the parameters fitted in a torsiondrive
+    directory, falling back to the scanned dihedral angle if the
+    directory has no file of equivalent dihedral angles.
+    """
+    if not os.path.isfile(equivalent_dihedral_text_file):
+        return [get_dihedral_atom_index(dihedral_text_file)]
+    atom_numbers = np.loadtxt(
+        equivalent_dihedral_text_file, dtype=int, ndmin=2
+    )
+    return (atom_numbers - 1).tolist()
+
 
+def get_torsion_drive_dirs(tor_dir):
     """
-    Minimizing the initial PDB file with the given topology
-    file
+    Returns the torsiondrive directories inside tor_dir in the
+    natural order of their names (torsion_drive_0, torsion_drive_1,
+    ..., torsion_drive_10), ignoring the files in tor_dir.
 
     Parameters
     ----------
-    pdbfile: str
-        Input PDB file.
+    tor_dir : str
+        Torsiondrive directory containing separate torsiondrive
+        folders.
 
-    prmtopfile : str
-        Input prmtop file.
+    Returns
+    -------
+    torsion_drive_dirs : list
+        Names of the torsiondrive directories.
+
+    """
+    torsion_drive_dirs = sorted(
+        [
+            i
+            for i in os.listdir(tor_dir)
+            if os.path.isdir(os.path.join(tor_dir, i))
+        ],
+        key=lambda i: [
+            int(j) if j.isdigit() else j for j in re.split(r"(\d+)", i)
+        ],
+    )
+    return torsion_drive_dirs
 
-    qmmmrebind_init_file: str
-        Output PDB file.
 
-    sim_output: str
-        Simulation output trajectory file.
+def run_torsion_drive_dir(
+    torsion_drive_dir,
+    torsion_drive_run_file,
+    torsion_drive_log_file,
+    n_threads,
+):
+    """
+    Runs the torsiondrive bash file of a torsiondrive directory
+    and returns its exit status.
 
-    sim_steps: int
-        MD simulation steps.
+    The job runs with torsion_drive_dir as its working directory,
+    with its output written to torsion_drive_log_file and with
+    the OpenMP thread count of the QM engine set to n_threads.
 
-    """
+    Parameters
+    ----------
+    torsion_drive_dir : str
+        Torsiondrive directory for a single dihedral angle.
 
-    prmtop = simtk.openmm.app.AmberPrmtopFile(prmtopfile)
-    pdb = simtk.openmm.app.PDBFile(pdbfile)
-    system = prmtop.createSystem(
-        nonbondedMethod=simtk.openmm.app.PME,
-        nonbondedCutoff=1 * simtk.unit.nanometer,
-        constraints=simtk.openmm.app.HBonds,
-    )
-    integrator = simtk.openmm.LangevinIntegrator(
-        300 * simtk.unit.kelvin,
-        1 / simtk.unit.picosecond,
-        0.002 * simtk.unit.picoseconds,
-    )
-    simulation = simtk.openmm.app.Simulation(
-        prmtop.topology, system, integrator
-    )
-    simulation.context.setPositions(pdb.positions)
-    print(simulation.context.getState(getEnergy=True).getPotentialEnergy())
-    simulation.minimizeEnergy(maxIterations=10000000)
-    print(simulation.context.getState(getEnergy=True).getPotentialEnergy())
+    torsion_drive_run_file : str
+        bash file for torsiondrive calculations.
+
+    torsion_drive_log_file : str
+        Log file for the output of the torsiondrive calculations.
+
+    n_threads : int
+        Number of threads to be used by the job.
+
+    Returns
+    -------
+    returncode : int
+        Exit status of the torsiondrive calculations.
+
+    """
+    env = dict(os.environ)
+    env["OMP_NUM_THREADS"] = str(n_threads)
+    env["MKL_NUM_THREADS"] = str(n_threads)
+    execute_command = "bash" + " " + torsion_drive_run_file
+    with open(
+        os.path.join(torsion_drive_dir, torsion_drive_log_file), "w+"
+    ) as f:
+        returncode = sp.run(
+            execute_command,
+            shell=True,
+            cwd=torsion_drive_dir,
+            env=env,
+            stdout=f,
+            stderr=sp.STDOUT,
+        ).returncode
+    return returncode
+
+
+def prepare_torsion_drive_dir(
+    torsion_drive_dir,
+    psi_input_file,
+    xyz_file,
+    coords_file,
+    template_pdb,
+    system_pdb,
+    system_init_sdf,
+    system_sdf,
+    num_charge_atoms,
+    index_charge_atom_1,
+    charge_atom_1,
+    system_xml,
+):
+    """
+    Generates the PDB and XML force field files of the ligand in
+    a torsiondrive directory from its psi4 input file. All the
+    files are resolved relative to torsion_drive_dir.
+    """
+    psi_input_file = os.path.join(torsion_drive_dir, psi_input_file)
+    xyz_file = os.path.join(torsion_drive_dir, xyz_file)
+    coords_file = os.path.join(torsion_drive_dir, coords_file)
+    template_pdb = os.path.join(torsion_drive_dir, template_pdb)
+    system_pdb = os.path.join(torsion_drive_dir, system_pdb)
+    system_init_sdf = os.path.join(torsion_drive_dir, system_init_sdf)
+    system_sdf = os.path.join(torsion_drive_dir, system_sdf)
+    system_xml = os.path.join(torsion_drive_dir, system_xml)
+    torsiondrive_input_to_xyz(
+        psi_input_file=psi_input_file, xyz_file=xyz_file,
+    )
+    xyz_to_pdb(
+        xyz_file=xyz_file,
+        coords_file=coords_file,
+        template_pdb=template_pdb,
+        system_pdb=system_pdb,
+    )
+    generate_xml_from_charged_pdb_sdf(
+        system_pdb=system_pdb,
+        system_init_sdf=system_init_sdf,
+        system_sdf=system_sdf,
+        num_charge_atoms=num_charge_atoms,
+        index_charge_atom_1=index_charge_atom_1,
+        charge_atom_1=charge_atom_1,
+        system_xml=system_xml,
+    )
+
+
+def get_torsion_drive_dir_lines(
+    torsion_drive_dir,
+    psi_input_file,
+    xyz_file,
+    coords_file,
+    template_pdb,
+    system_pdb,
+    system_init_sdf,
+    system_sdf,
+    num_charge_atoms,
+    index_charge_atom_1,
+    charge_atom_1,
+    system_xml,
+    qm_scan_file,
+    load_topology,
+    method,
+    dihedral_text_file,
+    T=None,
+    equivalent_dihedral_text_file="equivalent_dihedrals.txt",
+):
+    """
+    Returns the fitted torsional lines for a single torsiondrive
+    directory.
+
+    All the files are resolved relative to torsion_drive_dir, so
+    that the working directory of the process is never changed
+    and several directories can be fitted concurrently.
+
+    Parameters
+    ----------
+    torsion_drive_dir : str
+        Torsiondrive directory containing the files for the
+        torsiondrive calculation of a single dihedral angle.
+
+    The remaining parameters are the file names and options
+    described in TorsionDriveParams.
+
+    Returns
+    -------
+    tor_lines : list or None
+        List of the torsional lines for the XML forcefield file,
+        or None if the scan file is not found in the directory.
+
+    """
+    print("Entering directory" + " : " + torsion_drive_dir)
+    if not os.path.isfile(os.path.join(torsion_drive_dir, qm_scan_file)):
+        print(
+            "Torsional Scan file not found, optimization may not \
+             be complete. Existing!!"
+        )
+        return None
+    prepare_torsion_drive_dir(
+        torsion_drive_dir=torsion_drive_dir,
+        psi_input_file=psi_input_file,
+        xyz_file=xyz_file,
+        coords_file=coords_file,
+        template_pdb=template_pdb,
+        system_pdb=system_pdb,
+        system_init_sdf=system_init_sdf,
+        system_sdf=system_sdf,
+        num_charge_atoms=num_charge_atoms,
+        index_charge_atom_1=index_charge_atom_1,
+        charge_atom_1=charge_atom_1,
+        system_xml=system_xml,
+    )
+    opt_param = get_tor_params(
+        qm_scan_file=os.path.join(torsion_drive_dir, qm_scan_file),
+        template_pdb=os.path.join(torsion_drive_dir, template_pdb),
+        load_topology=load_topology,
+        system_xml=os.path.join(torsion_drive_dir, system_xml),
+        method=method,
+        T=T,
+    )
+    atom_indices = get_equivalent_atom_indices(
+        os.path.join(torsion_drive_dir, equivalent_dihedral_text_file),
+        os.path.join(torsion_drive_dir, dihedral_text_file),
+    )
+    tor_lines = [
+        item
+        for atom_index in atom_indices
+        for item in get_torsion_xml_lines(atom_index, opt_param)
+    ]
+    return tor_lines
+
+
+def get_torsion_drive_dir_scan(
+    torsion_drive_dir,
+    psi_input_file,
+    xyz_file,
+    coords_file,
+    template_pdb,
+    system_pdb,
+    system_init_sdf,
+    system_sdf,
+    num_charge_atoms,
+    index_charge_atom_1,
+    charge_atom_1,
+    system_xml,
+    qm_scan_file,
+    load_topology,
+    dihedral_text_file,
+    equivalent_dihedral_text_file="equivalent_dihedrals.txt",
+):
+    """
+    Returns the scan of a single torsiondrive directory for the
+    global fitting of the torsional parameters.
+
+    The parameters are the same as for get_torsion_drive_dir_lines.
+
+    Returns
+    -------
+    scan : dict or None
+        Dictionary with the atom indices of the scanned dihedral
+        angle ("atom_index"), the coordinates of the scan geometries
+        ("coordinates"), their relative QM ("delta_qm") and
+        non-torsional MM ("delta_mm") energies, and the atom indices
+        of the dihedral angles sharing its parameters
+        ("equivalent_atom_indices"), or None if the scan file is not
+        found in the directory.
+
+    """
+    print("Entering directory" + " : " + torsion_drive_dir)
+    if not os.path.isfile(os.path.join(torsion_drive_dir, qm_scan_file)):
+        print(
+            "Torsional Scan file not found, optimization may not \
+             be complete. Existing!!"
+        )
+        return None
+    prepare_torsion_drive_dir(
+        torsion_drive_dir=torsion_drive_dir,
+        psi_input_file=psi_input_file,
+        xyz_file=xyz_file,
+        coords_file=coords_file,
+        template_pdb=template_pdb,
+        system_pdb=system_pdb,
+        system_init_sdf=system_init_sdf,
+        system_sdf=system_sdf,
+        num_charge_atoms=num_charge_atoms,
+        index_charge_atom_1=index_charge_atom_1,
+        charge_atom_1=charge_atom_1,
+        system_xml=system_xml,
+    )
+    qm_scan_file = os.path.join(torsion_drive_dir, qm_scan_file)
+    mm_potential_energies = get_non_torsion_mm_energies(
+        qm_scan_file=qm_scan_file,
+        template_pdb=os.path.join(torsion_drive_dir, template_pdb),
+        load_topology=load_topology,
+        system_xml=os.path.join(torsion_drive_dir, system_xml),
+    )
+    scan = {
+        "atom_index": get_dihedral_atom_index(
+            os.path.join(torsion_drive_dir, dihedral_text_file)
+        ),
+        "coordinates": get_scan_coordinates(qm_scan_file),
+        "delta_qm": scale_list(
+            list_hartree_kcal(list_=get_qm_energies(qm_scan_file))
+        ),
+        "delta_mm": scale_list(mm_potential_energies),
+        "equivalent_atom_indices": get_equivalent_atom_indices(
+            os.path.join(torsion_drive_dir, equivalent_dihedral_text_file),
+            os.path.join(torsion_drive_dir, dihedral_text_file),
+        ),
+    }
+    return scan
+
+
+def singular_resid(pdbfile, qmmmrebind_init_file):
+
+    """
+    Returns a PDB file with chain ID = A
+
+    Parameters
+    ----------
+    pdbfile: str
+        Input PDB file
+
+    qmmmrebind_init_file: str
+        Output PDB file
+
+    """
+
+    pdb = PdbFile.load(pdbfile)
+    atoms = pdb.atoms.copy()
+    atoms["chain_id"] = "A"
+    pdb.write(qmmmrebind_init_file, atoms)
+
+
+def relax_init_structure(
+    pdbfile,
+    prmtopfile,
+    qmmmrebindpdb,
+    sim_output="output.pdb",
+    sim_steps=100000,
+):
+
+    """
+    Minimizing the initial PDB file with the given topology
+    file
+
+    Parameters
+    ----------
+    pdbfile: str
+        Input PDB file.
+
+    prmtopfile : str
+        Input prmtop file.
+
+    qmmmrebind_init_file: str
+        Output PDB file.
+
+    sim_output: str
+        Simulation output trajectory file.
+
+    sim_steps: int
+        MD simulation steps.
+
+    """
+
+    prmtop = simtk.openmm.app.AmberPrmtopFile(prmtopfile)
+    pdb = simtk.openmm.app.PDBFile(pdbfile)
+    system = prmtop.createSystem(
+        nonbondedMethod=simtk.openmm.app.PME,
+        nonbondedCutoff=1 * simtk.unit.nanometer,
+        constraints=simtk.openmm.app.HBonds,
+    )
+    integrator = simtk.openmm.LangevinIntegrator(
+        300 * simtk.unit.kelvin,
+        1 / simtk.unit.picosecond,
+        0.002 * simtk.unit.picoseconds,
+    )
+    simulation = simtk.openmm.app.Simulation(
+        prmtop.topology, system, integrator
+    )
+    simulation.context.setPositions(pdb.positions)
+    print(simulation.context.getState(getEnergy=True).getPotentialEnergy())
+    simulation.minimizeEnergy(maxIterations=10000000)
+    print(simulation.context.getState(getEnergy=True).getPotentialEnergy())
     simulation.reporters.append(
         simtk.openmm.app.PDBReporter(sim_output, int(sim_steps / 10))
     )
@@ -2440,118 +4022,987 @@ def move_qmmmrebind_files():
     os.system(command)
 
 
-class PrepareQMMM:
+class FileCache(OrderedDict):
 
     """
-    A class used to segregate the QM and MM regions.
+    A dictionary used to keep the objects read from files in memory,
+    keyed by the path of the file.
 
-    This class contain methods to remove the solvent, ions and all
-    entities that are exclusive of receptor and the ligand. It also
-    defines the Quantum Mechanical (QM) region and the Molecular
-    Mechanical (MM) region based upon the distance of the ligand
-    from the receptor and the chosen number of receptor residues. It
-    is also assumed that the initial PDB file will have the receptor
-    followed by the ligand.
+    Only the max_size most recently used entries are kept: reading or
+    setting an entry marks it as the most recently used one and the
+    least recently used entry is dropped when a new entry would exceed
+    max_size. The cache of a class can be emptied at any time with
+    clear() (e.g. FchkFile.cache.clear()), its entries are then read
+    again from their files.
 
     ...
 
     Attributes
     ----------
-    init_pdb : str
-        Initial PDB file containing the receptor-ligand complex with
-        solvent, ions, etc.
-
-    cleaned_pdb : str
-        Formatted PDB file containing only the receptor and the ligand.
+    max_size: int, optional
+        Maximum number of entries kept.
 
-    guest_init_pdb : str
-        A separate ligand PDB file with atom numbers not beginning from 1.
+    """
 
-    host_pdb : str
-        A separate receptor PDB file with atom numbers beginning from 1.
+    def __init__(self, max_size=16):
 
-    guest_resname : str
-        Three letter residue ID for the ligand.
+        super().__init__()
+        self.max_size = max_size
 
-    guest_pdb : str, optional
-        Ligand PDB file with atom numbers beginning from 1.
+    def __getitem__(self, key):
 
-    guest_xyz : str, optional
-        A text file of the XYZ coordinates of the ligand.
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
 
-    distance : float, optional
-        The distance required to define the QM region of the receptor.
-        This is the distance between the atoms of the ligand and the
-        atoms of the receptor.
+    def __setitem__(self, key, value):
 
-    residue_list : str, optional
-        A text file of the residue numbers of the receptor within the
-        proximity (as defined by the distance) from the ligand.
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.max_size:
+            self.popitem(last=False)
 
-    host_qm_atoms : str, optional
-        A text file of the atom numbers of the receptors in the QM
-        region.
 
-    host_mm_atoms : str, optional
-        A text file of the atom numbers of the receptors in the MM
-        region (all atoms except atoms in the QM region)
+class PdbFile:
 
-    host_qm_pdb : str, optional
-        PDB file for the receptor's QM region.
+    """
+    A class used to read and write the ATOM and HETATM records of
+    PDB files.
 
-    host_mm_pdb : str, optional
-        PDB file for the receptor's MM region.
+    The fixed-width columns of the ATOM and HETATM records are parsed
+    in one pass into a NumPy structured array (atoms) while the other
+    records are kept as text, so that the file can be written back
+    with a subset of the atoms or with new coordinates. The x, y and
+    z coordinates are stored in a single field, so that coordinates
+    is a zero-copy (N, 3) view of the atoms. Atom records are written
+    in the same format as biopandas.
 
-    qm_pdb : str, optional
-        PDB file for the QM region (receptor's QM region and the
-        ligand).
+    ...
 
-    mm_pdb : str, optional
-        PDB file for the MM region.
+    Attributes
+    ----------
+    pdb_file: str
+        PDB file.
+
+    atoms: numpy.ndarray
+        Structured array (of dtype atom_dtype) of the ATOM and HETATM
+        records, in the order of the file.
+
+    others: list
+        List of (line index, line) tuples of the other records.
+
+    """
+
+    atom_dtype = np.dtype(
+        [
+            ("record_name", "U6"),
+            ("atom_number", "i8"),
+            ("atom_name", "U4"),
+            ("alt_loc", "U1"),
+            ("residue_name", "U3"),
+            ("chain_id", "U1"),
+            ("residue_number", "i8"),
+            ("insertion", "U1"),
+            ("xyz", "f8", (3,)),
+            ("occupancy", "f8"),
+            ("b_factor", "f8"),
+            ("segment_id", "U4"),
+            ("element_symbol", "U2"),
+            ("charge", "U2"),
+            ("line_idx", "i8"),
+        ]
+    )
+    # Column ranges of the fields of the ATOM and HETATM records
+    columns = {
+        "record_name": (0, 6),
+        "atom_number": (6, 11),
+        "atom_name": (12, 16),
+        "alt_loc": (16, 17),
+        "residue_name": (17, 20),
+        "chain_id": (21, 22),
+        "residue_number": (22, 26),
+        "insertion": (26, 27),
+        "x": (30, 38),
+        "y": (38, 46),
+        "z": (46, 54),
+        "occupancy": (54, 60),
+        "b_factor": (60, 66),
+        "segment_id": (72, 76),
+        "element_symbol": (76, 78),
+        "charge": (78, 80),
+    }
+    # Residue names of the solvent molecules and the ions
+    solvent_resnames = ("HOH", "WAT")
+    ion_resnames = (
+        "Na+",
+        "Cs+",
+        "K+",
+        "Li+",
+        "Rb+",
+        "Cl-",
+        "Br-",
+        "F-",
+        "I-",
+        "Ca2",
+    )
+    # PDB files most recently read, keyed by path
+    cache = FileCache()
+
+    def __init__(self, pdb_file):
+
+        self.pdb_file = pdb_file
+        self.others = []
+        atom_lines = []
+        line_idx = []
+        with open(self.pdb_file, "r") as f:
+            for i, line in enumerate(f):
+                if line.startswith(("ATOM", "HETATM")):
+                    atom_lines.append(line.rstrip("\n")[:80].ljust(80))
+                    line_idx.append(i)
+                elif line.strip():
+                    self.others.append((i, line.rstrip()))
+        raw_dtype = np.dtype(
+            {
+                "names": list(self.columns),
+                "formats": [
+                    "S" + str(j - i) for i, j in self.columns.values()
+                ],
+                "offsets": [i for i, j in self.columns.values()],
+                "itemsize": 80,
+            }
+        )
+        raw = np.frombuffer(
+            "".join(atom_lines).encode(),
+            dtype=raw_dtype,
+            count=len(atom_lines),
+        )
+        self.atoms = np.zeros(len(atom_lines), dtype=self.atom_dtype)
+        for name in self.columns:
+            values = np.char.strip(raw[name])
+            if name in ["x", "y", "z"]:
+                self.atoms["xyz"][:, "xyz".index(name)] = values.astype("f8")
+            elif self.atom_dtype[name].kind in "if":
+                values[values == b""] = b"0"
+                self.atoms[name] = values.astype(self.atom_dtype[name])
+            else:
+                self.atoms[name] = np.char.decode(values)
+        self.atoms["line_idx"] = line_idx
 
-    host_mm_region_I_atoms : str, optional
-        A text file of the atom numbers of the receptors in the MM
-        region preceeding the QM region.
+    @classmethod
+    def load(cls, pdb_file):
+        """
+        Returns the PdbFile object for a PDB file, reusing the one
+        already read as long as the file has not been modified since.
+        The cached atoms must not be modified in place; copy them
+        first (e.g. atoms = pdb.atoms.copy()).
+        """
+        path = os.path.abspath(pdb_file)
+        stat = os.stat(path)
+        mtime = (stat.st_mtime_ns, stat.st_size)
+        if path not in cls.cache or cls.cache[path][0] != mtime:
+            cls.cache[path] = (mtime, cls(pdb_file))
+        return cls.cache[path][1]
 
-    host_mm_region_II_atoms : str, optional
-        A text file of the atom numbers of the receptors in the MM
-        region following the QM region.
+    @property
+    def coordinates(self):
+        """
+        Returns the (N, 3) coordinates of the atoms as a view.
+        """
+        return self.atoms["xyz"]
 
-    host_mm_region_I_pdb : str, optional
-        PDB file of the receptor in the MM region preceeding the
-        QM region.
+    def records(self, record_name="ATOM"):
+        """
+        Returns the atoms of the ATOM or HETATM records.
+        """
+        return self.atoms[self.atoms["record_name"] == record_name]
 
-    host_mm_region_II_pdb : str, optional
-        PDB file of the receptor in the MM region following the
-        QM region.
+    def write(self, pdb_file, atoms=None, append_newline=True):
+        """
+        Writes a PDB file with the given atoms (all the atoms of the
+        file by default) and the other records of the file, in the
+        order of their line index.
+        """
+        if atoms is None:
+            atoms = self.atoms
+        atom_names = [
+            " " + i if len(i) < 4 else i for i in atoms["atom_name"].tolist()
+        ]
+        lines = []
+        for i, atom in enumerate(atoms.tolist()):
+            line = (
+                "%-6s%5d %-4s%-1s%3s %-1s%4d%-1s   %8.3f%8.3f%8.3f%6.2f%6.2f"
+                "       %-3s%2s%s"
+            ) % (
+                atom[0],
+                atom[1],
+                atom_names[i],
+                atom[3],
+                atom[4],
+                atom[5],
+                atom[6],
+                atom[7],
+                atom[8][0],
+                atom[8][1],
+                atom[8][2],
+                atom[9],
+                atom[10],
+                atom[11],
+                atom[12],
+                atom[13],
+            )
+            lines.append((atom[14], line))
+        lines = sorted(lines + self.others, key=lambda i: i[0])
+        with open(pdb_file, "w") as f:
+            f.write("\n".join([line.ljust(80) for i, line in lines]))
+            if append_newline:
+                f.write("\n")
+        self.cache.pop(os.path.abspath(pdb_file), None)
+
+
+def get_host_region_masks(
+    residue_numbers, resid_num, num_residues, qm_resids=None
+):
 
-    num_residues : int, optional
-        Number of residues required in the QM region of the receptor.
     """
+    Returns boolean masks of the receptor atoms in the QM region,
+    the MM region preceding the QM region (MM region I) and the MM
+    region following the QM region (MM region II).
 
-    def __init__(
-        self,
-        init_pdb,
-        distance,
-        num_residues,
-        guest_resname,
-        cleaned_pdb="system.pdb",
-        guest_init_pdb="guest_init.pdb",
-        host_pdb="host.pdb",
-        guest_pdb="guest_init_II.pdb",
-        guest_xyz="guest_coord.txt",
-        residue_list="residue_list.txt",
-        host_qm_atoms="host_qm.txt",
-        host_mm_atoms="host_mm.txt",
-        host_qm_pdb="host_qm.pdb",
-        host_mm_pdb="host_mm.pdb",
-        qm_pdb="qm.pdb",
-        mm_pdb="mm.pdb",
-        host_mm_region_I_atoms="host_mm_region_I.txt",
-        host_mm_region_II_atoms="host_mm_region_II.txt",
-        host_mm_region_I_pdb="host_mm_region_I.pdb",
-        host_mm_region_II_pdb="host_mm_region_II.pdb",
-    ):
+    The QM region comprises the num_residues residues centred on the
+    median of the residues in the proximity of the ligand.
+
+    Parameters
+    ----------
+    residue_numbers : numpy.ndarray
+        Residue number of every atom of the receptor.
+
+    resid_num : list
+        Residue numbers of the receptor within the proximity of
+        the ligand.
+
+    num_residues : int
+        Number of residues required in the QM region of the
+        receptor.
+
+    qm_resids : list, optional
+        Residue numbers of the QM region. If given, they define the
+        QM region instead of the residues centred on the median.
+
+    Returns
+    -------
+    qm_mask : numpy.ndarray
+        Mask of the atoms in the QM region.
+
+    mm_region_I_mask : numpy.ndarray
+        Mask of the atoms in the MM region preceding the QM region.
+
+    mm_region_II_mask : numpy.ndarray
+        Mask of the atoms in the MM region following the QM region.
+
+    """
+    if qm_resids is None:
+        median_residue = int(statistics.median(resid_num))
+        approximated_res_list = np.arange(
+            median_residue - int(int(num_residues) / 2),
+            median_residue + int(int(num_residues) / 2),
+        )
+    else:
+        approximated_res_list = np.asarray(qm_resids, dtype=int)
+    qm_mask = np.isin(residue_numbers, approximated_res_list)
+    mm_region_I_mask = np.zeros(len(residue_numbers), dtype=bool)
+    if len(approximated_res_list) > 0:
+        mm_region_I_mask = ~qm_mask & (
+            residue_numbers < approximated_res_list.max()
+        )
+    mm_region_II_mask = ~qm_mask & ~mm_region_I_mask
+    return qm_mask, mm_region_I_mask, mm_region_II_mask
+
+
+def get_basis_function_counts(element_symbols, basis_set):
+
+    """
+    Returns the number of basis functions of every atom for a Pople
+    basis set (STO-3G, 3-21G and 6-31G with polarization and diffuse
+    functions, e.g. 6-31+G(d,p)). Cartesian d functions are assumed,
+    as in Gaussian for these basis sets.
+
+    Parameters
+    ----------
+    element_symbols : list
+        Element symbols of the atoms.
+
+    basis_set : str
+        Basis set used for the QM calculation.
+
+    Returns
+    -------
+    basis_function_counts : numpy.ndarray
+        Number of basis functions of every atom, or None if the
+        basis set or one of the elements (beyond Ar) is not supported.
+
+    """
+    match = re.fullmatch(
+        r"(STO-3G|3-21|6-31)(\+{0,2})G?(\*{0,2}|\(D\)|\(D,P\))",
+        basis_set.strip().upper().replace(" ", ""),
+    )
+    if match is None:
+        return None
+    family, diffuse, polarization = match.groups()
+    polarization = {"(D)": "*", "(D,P)": "**"}.get(polarization, polarization)
+    # Number of basis functions of the atoms of the first, second
+    # and third row of the periodic table
+    row_counts = {"STO-3G": (1, 5, 9), "3-21": (2, 9, 13), "6-31": (2, 9, 13)}
+    symbols = "H He Li Be B C N O F Ne Na Mg Al Si P S Cl Ar".split()
+    basis_function_counts = []
+    for element_symbol in element_symbols:
+        element_symbol = element_symbol.strip().capitalize()
+        if element_symbol not in symbols:
+            return None
+        atomic_number = symbols.index(element_symbol) + 1
+        row = 0 if atomic_number <= 2 else 1 if atomic_number <= 10 else 2
+        count = row_counts[family][row]
+        if row == 0:
+            count += 3 * (polarization == "**") + (diffuse == "++")
+        else:
+            count += 6 * (len(polarization) > 0) + 4 * (len(diffuse) > 0)
+        basis_function_counts.append(count)
+    return np.array(basis_function_counts, dtype=int)
+
+
+def get_residue_distances(residue_numbers, host_coords, guest_coords):
+
+    """
+    Returns the receptor residues ranked by their minimum distance
+    to the ligand.
+
+    Parameters
+    ----------
+    residue_numbers : numpy.ndarray
+        Residue number of every atom of the receptor.
+
+    host_coords : numpy.ndarray
+        Coordinates of the atoms of the receptor.
+
+    guest_coords : numpy.ndarray
+        Coordinates of the atoms of the ligand.
+
+    Returns
+    -------
+    ranked_residues : numpy.ndarray
+        Residue numbers, from the closest to the farthest residue.
+
+    min_distances : numpy.ndarray
+        Minimum distance of every ranked residue to the ligand.
+
+    """
+    nearest_distances, _ = cKDTree(guest_coords).query(host_coords)
+    residues, residue_index = np.unique(residue_numbers, return_inverse=True)
+    min_distances = np.full(len(residues), np.inf)
+    np.minimum.at(min_distances, residue_index, nearest_distances)
+    order = np.argsort(min_distances, kind="stable")
+    return residues[order], min_distances[order]
+
+
+def print_qm_cost(element_symbols, basis_set):
+
+    """
+    Prints the predicted cost of a QM calculation, i.e. the number of
+    atoms and basis functions of the QM region. The cost of the QM
+    calculation grows roughly with the third to fourth power of the
+    number of basis functions.
+
+    Parameters
+    ----------
+    element_symbols : list
+        Element symbols of the atoms of the QM region.
+
+    basis_set : str
+        Basis set used for the QM calculation.
+
+    Returns
+    -------
+    num_atoms : int
+        Number of atoms of the QM region.
+
+    num_basis_functions : int
+        Number of basis functions of the QM region, or None if they
+        cannot be counted for the basis set.
+
+    """
+    num_atoms = len(element_symbols)
+    basis_function_counts = get_basis_function_counts(
+        element_symbols, basis_set
+    )
+    num_basis_functions = None
+    if basis_function_counts is not None:
+        num_basis_functions = int(basis_function_counts.sum())
+    print(
+        "Predicted QM cost : "
+        + str(num_atoms)
+        + " atoms, "
+        + str(num_basis_functions)
+        + " basis functions ("
+        + basis_set
+        + ")"
+    )
+    return num_atoms, num_basis_functions
+
+
+def select_residues_by_budget(ranked_residues, residue_costs, budget):
+
+    """
+    Greedily fills a QM budget with the ranked receptor residues.
+    Residues are taken in the order of the ranking and a residue
+    that does not fit in the remaining budget is skipped, so that
+    smaller residues further down the ranking can still fill it.
+
+    Parameters
+    ----------
+    ranked_residues : numpy.ndarray
+        Residue numbers, from the closest to the farthest residue.
+
+    residue_costs : numpy.ndarray
+        Cost (number of atoms or basis functions) of every ranked
+        residue.
+
+    budget : int
+        Maximum total cost of the selected residues.
+
+    Returns
+    -------
+    selected_residues : list
+        Selected residue numbers, in the order of the ranking.
+
+    """
+    selected_residues = []
+    remaining_budget = budget
+    for residue, cost in zip(ranked_residues, residue_costs):
+        if cost <= remaining_budget:
+            selected_residues.append(residue)
+            remaining_budget -= cost
+    return selected_residues
+
+
+def split_pdb(
+    pdb_file,
+    ligand_resname=None,
+    receptor_pdb=None,
+    ligand_pdb=None,
+    solvent_pdb=None,
+    ions_pdb=None,
+    renumber=True,
+    hetatm_to_atom=False,
+    solvent_resnames=None,
+    ion_resnames=None,
+):
+
+    """
+    Splits a PDB file into receptor, ligand, solvent and ion PDB
+    files in a single streaming pass.
+
+    Every ATOM / HETATM record is classified by its residue name
+    (columns 18-20) and written straight to its output, so only one
+    line is held in memory at a time. Passing the same file name
+    for several outputs merges those entities into one file in the
+    order of the input. Entities without an output are discarded.
+    CRYST1 is copied to the solvent output only, TER, MODEL, ENDMDL
+    and CONECT records are dropped and every output is terminated
+    with END.
+
+    Parameters
+    ----------
+    pdb_file : str
+        PDB file to split.
+
+    ligand_resname : str, optional
+        Three letter residue ID for the ligand.
+
+    receptor_pdb : str, optional
+        Output PDB file for the receptor, i.e. every residue that
+        is not the ligand, solvent or an ion.
+
+    ligand_pdb : str, optional
+        Output PDB file for the ligand.
+
+    solvent_pdb : str, optional
+        Output PDB file for the solvent.
+
+    ions_pdb : str, optional
+        Output PDB file for the ions.
+
+    renumber : bool, optional
+        If True, atom numbers and residue numbers are renumbered
+        consecutively from 1 in every output file, as pdb4amber does.
+
+    hetatm_to_atom : bool, optional
+        If True, HETATM records are written as ATOM records.
+
+    solvent_resnames : tuple, optional
+        Residue names of the solvent molecules (by default
+        PdbFile.solvent_resnames).
+
+    ion_resnames : tuple, optional
+        Residue names of the ions (by default PdbFile.ion_resnames).
+
+    Returns
+    -------
+    num_atoms : dict
+        Number of atoms written to every output file.
+
+    """
+    outputs = {
+        "receptor": receptor_pdb,
+        "ligand": ligand_pdb,
+        "solvent": solvent_pdb,
+        "ions": ions_pdb,
+    }
+    if solvent_resnames is None:
+        solvent_resnames = PdbFile.solvent_resnames
+    if ion_resnames is None:
+        ion_resnames = PdbFile.ion_resnames
+    categories = {}
+    for resname in solvent_resnames:
+        categories[resname] = "solvent"
+    for resname in ion_resnames:
+        categories[resname] = "ions"
+    if ligand_resname:
+        categories[ligand_resname.strip()] = "ligand"
+    pdb_files = list(dict.fromkeys(i for i in outputs.values() if i))
+    num_atoms = dict.fromkeys(pdb_files, 0)
+    num_residues = dict.fromkeys(pdb_files, 0)
+    last_residue = dict.fromkeys(pdb_files)
+    with ExitStack() as stack:
+        handles = {
+            i: stack.enter_context(open(i, "w")) for i in pdb_files
+        }
+        category_handles = {
+            category: handles.get(pdb) for category, pdb in outputs.items()
+        }
+        cryst_handle = category_handles["solvent"]
+        with open(pdb_file) as f:
+            for line in f:
+                record_name = line[:6]
+                if record_name == "CRYST1":
+                    if cryst_handle is not None:
+                        cryst_handle.write(line)
+                    continue
+                if record_name not in ("ATOM  ", "HETATM"):
+                    continue
+                category = categories.get(line[17:20].strip(), "receptor")
+                handle = category_handles[category]
+                if handle is None:
+                    continue
+                pdb = outputs[category]
+                line = line.rstrip("\n")
+                if hetatm_to_atom and record_name == "HETATM":
+                    line = "ATOM  " + line[6:]
+                num_atoms[pdb] += 1
+                if renumber:
+                    residue = line[17:27]
+                    if residue != last_residue[pdb]:
+                        last_residue[pdb] = residue
+                        num_residues[pdb] += 1
+                    line = (
+                        line[:6]
+                        + "{:5d}".format(num_atoms[pdb] % 100000)
+                        + line[11:22]
+                        + "{:4d}".format(num_residues[pdb] % 10000)
+                        + " "
+                        + line[27:]
+                    )
+                handle.write(line + "\n")
+        for handle in handles.values():
+            handle.write("END\n")
+    return num_atoms
+
+
+def run_pdb4amber(input_pdb, output_pdb, options=()):
+
+    """
+    Runs pdb4amber on a PDB file and removes the auxiliary files
+    it writes next to the output PDB file.
+
+    Parameters
+    ----------
+    input_pdb : str
+        PDB file to be processed.
+
+    output_pdb : str
+        PDB file written by pdb4amber.
+
+    options : tuple, optional
+        Additional command line options for pdb4amber.
+
+    """
+    sp.run(["pdb4amber", "-i", input_pdb, "-o", output_pdb, *options])
+    for suffix in ("_nonprot.pdb", "_renum.txt", "_sslink", "_water.pdb"):
+        if os.path.exists(output_pdb[:-4] + suffix):
+            os.remove(output_pdb[:-4] + suffix)
+
+
+def read_dcd_header(dcd_file):
+
+    """
+    Reads the header of a DCD trajectory file and returns the
+    layout of its frames.
+
+    Parameters
+    ----------
+    dcd_file : str
+        DCD trajectory file.
+
+    Returns
+    -------
+    frame_dtype : numpy.dtype
+        Structured dtype of one frame record, including the Fortran
+        record markers, with the coordinates in the x, y and z fields.
+
+    header_size : int
+        Size of the header in bytes, i.e. offset of the first frame.
+
+    """
+    with open(dcd_file, "rb") as f:
+        header = f.read(92)
+        byte_order = "<" if np.frombuffer(header, "<i4", 1)[0] == 84 else ">"
+        if header[4:8] != b"CORD":
+            raise ValueError("Not a DCD trajectory file.")
+        icntrl = np.frombuffer(header, byte_order + "i4", 20, 8)
+        if icntrl[8] != 0:
+            raise ValueError("DCD files with fixed atoms are not supported.")
+        if icntrl[11] != 0:
+            raise ValueError("4D DCD files are not supported.")
+        has_unit_cell = icntrl[10] != 0
+        title_size = np.frombuffer(f.read(4), byte_order + "i4")[0]
+        f.seek(title_size + 4, 1)
+        num_atoms = np.frombuffer(f.read(12), byte_order + "i4")[1]
+        header_size = f.tell()
+    fields = []
+    if has_unit_cell:
+        fields += [
+            ("cell_head", byte_order + "i4"),
+            ("cell", byte_order + "f8", (6,)),
+            ("cell_tail", byte_order + "i4"),
+        ]
+    for axis in "xyz":
+        fields += [
+            (axis + "_head", byte_order + "i4"),
+            (axis, byte_order + "f4", (num_atoms,)),
+            (axis + "_tail", byte_order + "i4"),
+        ]
+    return np.dtype(fields), header_size
+
+
+def get_trajectory_frame_offsets(trajectory_file):
+
+    """
+    Returns the byte offsets of the frames of a DCD trajectory file
+    or of a (multi-model) PDB file, without reading the coordinates.
+
+    Parameters
+    ----------
+    trajectory_file : str
+        DCD trajectory file or PDB file, where every MODEL record
+        starts a new frame.
+
+    Returns
+    -------
+    frame_offsets : numpy.ndarray
+        Byte offset of every frame.
+
+    """
+    if trajectory_file.lower().endswith(".dcd"):
+        frame_dtype, header_size = read_dcd_header(trajectory_file)
+        num_frames = (
+            os.path.getsize(trajectory_file) - header_size
+        ) // frame_dtype.itemsize
+        return header_size + frame_dtype.itemsize * np.arange(num_frames)
+    frame_offsets = []
+    offset = 0
+    with open(trajectory_file, "rb") as f:
+        for line in f:
+            if line.startswith(b"MODEL"):
+                frame_offsets.append(offset)
+            offset += len(line)
+    if not frame_offsets:
+        frame_offsets.append(0)
+    return np.array(frame_offsets, dtype=int)
+
+
+def read_trajectory_frames(trajectory_file, frame_offsets):
+
+    """
+    Reads the coordinates of consecutive frames of a DCD trajectory
+    file or of a (multi-model) PDB file.
+
+    Parameters
+    ----------
+    trajectory_file : str
+        DCD trajectory file or PDB file.
+
+    frame_offsets : numpy.ndarray
+        Byte offsets (from get_trajectory_frame_offsets) of the
+        consecutive frames to be read.
+
+    Returns
+    -------
+    frames : numpy.ndarray
+        Coordinates (in Angstrom) of shape (n_frames, n_atoms, 3).
+
+    """
+    if trajectory_file.lower().endswith(".dcd"):
+        frame_dtype, _ = read_dcd_header(trajectory_file)
+        records = np.memmap(
+            trajectory_file,
+            dtype=frame_dtype,
+            mode="r",
+            offset=int(frame_offsets[0]),
+            shape=(len(frame_offsets),),
+        )
+        return np.stack(
+            [records["x"], records["y"], records["z"]], axis=-1
+        ).astype(float)
+    frames = []
+    with open(trajectory_file, "rb") as f:
+        f.seek(int(frame_offsets[0]))
+        xyz = []
+        for line in f:
+            if line.startswith((b"ATOM", b"HETATM")):
+                xyz.append(line[30:54].ljust(24))
+            elif line.startswith((b"ENDMDL", b"END", b"MODEL")) and xyz:
+                frames.append(b"".join(xyz))
+                xyz = []
+                if len(frames) == len(frame_offsets):
+                    break
+        if xyz:
+            frames.append(b"".join(xyz))
+    frames = np.frombuffer(b"".join(frames), dtype="S8").astype(float)
+    return frames.reshape(len(frame_offsets), -1, 3)
+
+
+def get_trajectory_contact_counts(
+    trajectory_file,
+    frame_offsets,
+    host_index,
+    guest_index,
+    residue_index,
+    num_residues,
+    distance,
+):
+
+    """
+    Counts, for every receptor residue, the frames in which any of
+    its atoms is closer than the distance to any atom of the ligand.
+
+    Parameters
+    ----------
+    trajectory_file : str
+        DCD trajectory file or PDB file.
+
+    frame_offsets : numpy.ndarray
+        Byte offsets of the consecutive frames to be read.
+
+    host_index : numpy.ndarray
+        Indices of the receptor atoms in the trajectory.
+
+    guest_index : numpy.ndarray
+        Indices of the ligand atoms in the trajectory.
+
+    residue_index : numpy.ndarray
+        Index (between 0 and num_residues - 1) of the residue of
+        every receptor atom.
+
+    num_residues : int
+        Number of receptor residues.
+
+    distance : float
+        The distance required to define the QM region of the receptor.
+
+    Returns
+    -------
+    contact_counts : numpy.ndarray
+        Number of frames in contact with the ligand, per residue.
+
+    """
+    contact_counts = np.zeros(num_residues, dtype=int)
+    frames = read_trajectory_frames(trajectory_file, frame_offsets)
+    for frame in frames:
+        tree = cKDTree(frame[guest_index])
+        nearest_distances, _ = tree.query(
+            frame[host_index], distance_upper_bound=float(distance)
+        )
+        contact_residues = np.unique(
+            residue_index[nearest_distances < float(distance)]
+        )
+        contact_counts[contact_residues] += 1
+    return contact_counts
+
+
+class PrepareQMMM:
+
+    """
+    A class used to segregate the QM and MM regions.
+
+    This class contain methods to remove the solvent, ions and all
+    entities that are exclusive of receptor and the ligand. It also
+    defines the Quantum Mechanical (QM) region and the Molecular
+    Mechanical (MM) region based upon the distance of the ligand
+    from the receptor and the chosen number of receptor residues. It
+    is also assumed that the initial PDB file will have the receptor
+    followed by the ligand.
+
+    ...
+
+    Attributes
+    ----------
+    init_pdb : str
+        Initial PDB file containing the receptor-ligand complex with
+        solvent, ions, etc.
+
+    cleaned_pdb : str
+        Formatted PDB file containing only the receptor and the ligand.
+
+    guest_init_pdb : str
+        A separate ligand PDB file with atom numbers not beginning from 1.
+
+    host_pdb : str
+        A separate receptor PDB file with atom numbers beginning from 1.
+
+    guest_resname : str
+        Three letter residue ID for the ligand.
+
+    guest_pdb : str, optional
+        Ligand PDB file with atom numbers beginning from 1.
+
+    guest_xyz : str, optional
+        A text file of the XYZ coordinates of the ligand.
+
+    distance : float, optional
+        The distance required to define the QM region of the receptor.
+        This is the distance between the atoms of the ligand and the
+        atoms of the receptor.
+
+    residue_list : str, optional
+        A text file of the residue numbers of the receptor within the
+        proximity (as defined by the distance) from the ligand.
+
+    host_qm_atoms : str, optional
+        A text file of the atom numbers of the receptors in the QM
+        region.
+
+    host_mm_atoms : str, optional
+        A text file of the atom numbers of the receptors in the MM
+        region (all atoms except atoms in the QM region)
+
+    host_qm_pdb : str, optional
+        PDB file for the receptor's QM region.
+
+    host_mm_pdb : str, optional
+        PDB file for the receptor's MM region.
+
+    qm_pdb : str, optional
+        PDB file for the QM region (receptor's QM region and the
+        ligand).
+
+    mm_pdb : str, optional
+        PDB file for the MM region.
+
+    host_mm_region_I_atoms : str, optional
+        A text file of the atom numbers of the receptors in the MM
+        region preceeding the QM region.
+
+    host_mm_region_II_atoms : str, optional
+        A text file of the atom numbers of the receptors in the MM
+        region following the QM region.
+
+    host_mm_region_I_pdb : str, optional
+        PDB file of the receptor in the MM region preceeding the
+        QM region.
+
+    host_mm_region_II_pdb : str, optional
+        PDB file of the receptor in the MM region following the
+        QM region.
+
+    num_residues : int, optional
+        Number of residues required in the QM region of the receptor.
+
+    use_pdb4amber : bool, optional
+        If True, the receptor - ligand complex is renumbered and
+        formatted with pdb4amber, otherwise it is renumbered natively
+        while the input PDB file is split.
+
+    trajectory_file : str, optional
+        MD trajectory (DCD file or multi-model PDB file) of the
+        receptor - ligand complex used to select the QM region over
+        many frames.
+
+    trajectory_topology : str, optional
+        PDB file with the atoms of the trajectory in the same order
+        (init_pdb by default).
+
+    contact_frequency : float, optional
+        Minimum fraction of the frames of the trajectory in which a
+        receptor residue must be within the distance from the ligand
+        to be in the proximity of the ligand. The default (0.0)
+        selects the union of the residues over all the frames.
+
+    frames_per_chunk : int, optional
+        Number of frames of the trajectory read at a time.
+
+    n_workers : int, optional
+        Number of worker processes over which the chunks of frames
+        are spread.
+
+    qm_atom_budget : int, optional
+        Maximum number of atoms (ligand included) in the QM region.
+        If given (or if qm_basis_budget is given), the QM region of
+        the receptor is built by get_qm_resids_by_budget instead of
+        the num_residues residues around the median residue.
+
+    qm_basis_budget : int, optional
+        Maximum number of basis functions (ligand included) in the
+        QM region.
+
+    basis_set : str, optional
+        Basis set used to count the basis functions of the QM region.
+
+    qm_residue_list : str, optional
+        A text file of the residue numbers of the receptor in the QM
+        region selected within the budget.
+    """
+
+    def __init__(
+        self,
+        init_pdb,
+        distance,
+        num_residues,
+        guest_resname,
+        cleaned_pdb="system.pdb",
+        guest_init_pdb="guest_init.pdb",
+        host_pdb="host.pdb",
+        guest_pdb="guest_init_II.pdb",
+        guest_xyz="guest_coord.txt",
+        residue_list="residue_list.txt",
+        host_qm_atoms="host_qm.txt",
+        host_mm_atoms="host_mm.txt",
+        host_qm_pdb="host_qm.pdb",
+        host_mm_pdb="host_mm.pdb",
+        qm_pdb="qm.pdb",
+        mm_pdb="mm.pdb",
+        host_mm_region_I_atoms="host_mm_region_I.txt",
+        host_mm_region_II_atoms="host_mm_region_II.txt",
+        host_mm_region_I_pdb="host_mm_region_I.pdb",
+        host_mm_region_II_pdb="host_mm_region_II.pdb",
+        use_pdb4amber=False,
+        trajectory_file=None,
+        trajectory_topology=None,
+        contact_frequency=0.0,
+        frames_per_chunk=1000,
+        n_workers=1,
+        qm_atom_budget=None,
+        qm_basis_budget=None,
+        basis_set="6-31G",
+        qm_residue_list="qm_residue_list.txt",
+    ):
 
         self.init_pdb = init_pdb
         self.distance = distance
@@ -2573,82 +5024,76 @@ class PrepareQMMM:
         self.host_mm_region_II_atoms = host_mm_region_II_atoms
         self.host_mm_region_I_pdb = host_mm_region_I_pdb
         self.host_mm_region_II_pdb = host_mm_region_II_pdb
+        self.use_pdb4amber = use_pdb4amber
+        self.trajectory_file = trajectory_file
+        self.trajectory_topology = trajectory_topology
+        self.contact_frequency = contact_frequency
+        self.frames_per_chunk = frames_per_chunk
+        self.n_workers = n_workers
+        self.qm_atom_budget = qm_atom_budget
+        self.qm_basis_budget = qm_basis_budget
+        self.basis_set = basis_set
+        self.qm_residue_list = qm_residue_list
 
     def clean_up(self):
         """
         Reads the given PDB file, removes all entities except the
         receptor and ligand and saves a new pdb file.
         """
-        ions = [
-            "Na+",
-            "Cs+",
-            "K+",
-            "Li+",
-            "Rb+",
-            "Cl-",
-            "Br-",
-            "F-",
-            "I-",
-            "Ca2",
-        ]
+        if not self.use_pdb4amber:
+            split_pdb(
+                self.init_pdb,
+                ligand_resname=self.guest_resname,
+                receptor_pdb=self.cleaned_pdb,
+                ligand_pdb=self.cleaned_pdb,
+                hetatm_to_atom=True,
+            )
+            return
         intermediate_file_1 = self.cleaned_pdb[:-4] + "_intermediate_1.pdb"
         intermediate_file_2 = self.cleaned_pdb[:-4] + "_intermediate_2.pdb"
-        command = (
-            "pdb4amber -i "
-            + self.init_pdb
-            + " -o "
-            + intermediate_file_1
-            + " --noter --dry"
+        split_pdb(
+            self.init_pdb,
+            ligand_resname=self.guest_resname,
+            receptor_pdb=intermediate_file_1,
+            ligand_pdb=intermediate_file_1,
+            renumber=False,
         )
-        os.system(command)
-        to_delete = (
-            intermediate_file_1[:-4] + "_nonprot.pdb",
-            intermediate_file_1[:-4] + "_renum.txt",
-            intermediate_file_1[:-4] + "_sslink",
-            intermediate_file_1[:-4] + "_water.pdb",
+        run_pdb4amber(
+            intermediate_file_1, intermediate_file_2, options=("--noter",)
         )
-        os.system("rm -rf " + " ".join(to_delete))
-        with open(intermediate_file_1) as f1, open(
-                intermediate_file_2, "w") as f2:
-            for line in f1:
-                if not any(ion in line for ion in ions):
-                    f2.write(line)
-        with open(intermediate_file_2, "r") as f1:
-            filedata = f1.read()
-        filedata = filedata.replace("HETATM", "ATOM  ")
-        with open(self.cleaned_pdb, "w") as f2:
-            f2.write(filedata)
-        command = "rm -rf " + intermediate_file_1 + " " + intermediate_file_2
-        os.system(command)
+        split_pdb(
+            intermediate_file_2,
+            receptor_pdb=self.cleaned_pdb,
+            renumber=False,
+            hetatm_to_atom=True,
+        )
+        os.remove(intermediate_file_1)
+        os.remove(intermediate_file_2)
 
     def create_host_guest(self):
         """
         Saves separate receptor and ligand PDB files.
         """
-        with open(self.cleaned_pdb) as f1, open(self.host_pdb, "w") as f2:
-            for line in f1:
-                if not self.guest_resname in line and not "CRYST1" in line:
-                    f2.write(line)
-        with open(self.cleaned_pdb) as f1, open(
-            self.guest_init_pdb, "w"
-        ) as f2:
-            for line in f1:
-                if self.guest_resname in line or "END" in line:
-                    f2.write(line)
+        split_pdb(
+            self.cleaned_pdb,
+            ligand_resname=self.guest_resname,
+            receptor_pdb=self.host_pdb,
+            ligand_pdb=self.guest_init_pdb,
+            renumber=False,
+        )
 
     def realign_guest(self):
         """
         Saves a ligand PDB file with atom numbers beginning from 1.
         """
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.guest_init_pdb)
-        to_subtract = min(ppdb.df["ATOM"]["atom_number"]) - 1
-        ppdb.df["ATOM"]["atom_number"] = (
-            ppdb.df["ATOM"]["atom_number"] - to_subtract
-        )
+        pdb = PdbFile.load(self.guest_init_pdb)
+        atoms = pdb.atoms.copy()
+        atom_mask = atoms["record_name"] == "ATOM"
+        to_subtract = min(atoms["atom_number"][atom_mask]) - 1
+        atoms["atom_number"][atom_mask] -= to_subtract
         intermediate_file_1 = self.guest_pdb[:-4] + "_intermediate_1.pdb"
         intermediate_file_2 = self.guest_pdb[:-4] + "_intermediate_2.pdb"
-        ppdb.to_pdb(path=intermediate_file_1)
+        pdb.write(intermediate_file_1, atoms)
         command = (
             "pdb4amber -i "
             + intermediate_file_1
@@ -2674,93 +5119,202 @@ class PrepareQMMM:
         """
         Saves a text file of the XYZ coordinates of the ligand.
         """
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.guest_pdb)
-        xyz = ppdb.df["ATOM"][["x_coord", "y_coord", "z_coord"]]
-        xyz_to_list = xyz.values.tolist()
-        np.savetxt(self.guest_xyz, xyz_to_list)
+        xyz = PdbFile.load(self.guest_pdb).records("ATOM")["xyz"]
+        np.savetxt(self.guest_xyz, xyz)
 
     def get_qm_resids(self):
         """
         Saves a text file of the residue numbers of the receptor within the
         proximity (as defined by the distance) from the ligand.
         """
-        guest_coord_list = np.loadtxt(self.guest_xyz)
-        host_atom_list = []
-        for i in range(len(guest_coord_list)):
-            reference_point = guest_coord_list[i]
-            # TODO: move reads outside of loop
-            ppdb = PandasPdb()
-            ppdb.read_pdb(self.host_pdb) 
-            distances = ppdb.distance(xyz=reference_point, records=("ATOM"))
-            all_within_distance = ppdb.df["ATOM"][
-                distances < float(self.distance)
-            ]
-            host_df = all_within_distance["atom_number"]
-            host_list = host_df.values.tolist()
-            host_atom_list.append(host_list)
-        host_atom_list = list(itertools.chain(*host_atom_list))
-        host_atom_list = set(host_atom_list)
-        host_atom_list = list(host_atom_list)
-        host_atom_list.sort()
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.host_pdb)
-        df = ppdb.df["ATOM"][["atom_number", "residue_number", "residue_name"]]
-        index_list = []
-        for i in host_atom_list:
-            indices = np.where(df["atom_number"] == i)
-            indices = list(indices)[0]
-            indices = list(indices)
-            index_list.append(indices)
-        index_list = list(itertools.chain.from_iterable(index_list))
-        df1 = df.iloc[
-            index_list,
+        guest_coord_list = np.loadtxt(self.guest_xyz, ndmin=2)
+        df = PdbFile.load(self.host_pdb).records("ATOM")
+        host_coord_list = df["xyz"]
+        # Atoms strictly closer than the distance to any guest atom
+        tree = cKDTree(host_coord_list)
+        neighbours = tree.query_ball_point(
+            guest_coord_list, r=np.nextafter(float(self.distance), 0)
+        )
+        host_index_list = np.unique(
+            np.fromiter(itertools.chain(*neighbours), dtype=int)
+        )
+        atom_numbers = df["atom_number"]
+        residue_numbers = df["residue_number"]
+        host_atom_list = np.unique(atom_numbers[host_index_list])
+        index_list = np.flatnonzero(np.isin(atom_numbers, host_atom_list))
+        index_list = index_list[
+            np.argsort(atom_numbers[index_list], kind="stable")
+        ]
+        resid_num = list(pd.unique(residue_numbers[index_list]))
+        np.savetxt(self.residue_list, resid_num, fmt="%i")
+
+    def get_qm_resids_from_trajectory(self):
+        """
+        Saves a text file of the residue numbers of the receptor within
+        the proximity (as defined by the distance) from the ligand in at
+        least contact_frequency of the frames of the trajectory. The
+        trajectory is streamed in chunks of frames_per_chunk frames, so
+        it is never loaded into memory as a whole.
+        """
+        if self.trajectory_file is None:
+            raise ValueError("No trajectory file given.")
+        topology_pdb = self.trajectory_topology or self.init_pdb
+        residue_names = PdbFile.load(topology_pdb).atoms["residue_name"]
+        guest_mask = residue_names == self.guest_resname
+        host_mask = ~guest_mask & ~np.isin(
+            residue_names, PdbFile.solvent_resnames + PdbFile.ion_resnames
+        )
+        host_residue_numbers = PdbFile.load(self.host_pdb).records("ATOM")[
+            "residue_number"
+        ]
+        if len(host_residue_numbers) != host_mask.sum():
+            raise ValueError(
+                "Number of receptor atoms in the trajectory topology does "
+                "not equal the number of atoms in the receptor PDB file."
+            )
+        residue_numbers, residue_index = np.unique(
+            host_residue_numbers, return_inverse=True
+        )
+        host_index = np.flatnonzero(host_mask)
+        guest_index = np.flatnonzero(guest_mask)
+        frame_offsets = get_trajectory_frame_offsets(self.trajectory_file)
+        kwargs_list = [
+            dict(
+                trajectory_file=self.trajectory_file,
+                frame_offsets=frame_offsets[i : i + self.frames_per_chunk],
+                host_index=host_index,
+                guest_index=guest_index,
+                residue_index=residue_index,
+                num_residues=len(residue_numbers),
+                distance=self.distance,
+            )
+            for i in range(0, len(frame_offsets), self.frames_per_chunk)
+        ]
+        if self.n_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                futures = [
+                    executor.submit(get_trajectory_contact_counts, **kwargs)
+                    for kwargs in kwargs_list
+                ]
+                contact_counts = sum(i.result() for i in futures)
+        else:
+            contact_counts = sum(
+                get_trajectory_contact_counts(**kwargs)
+                for kwargs in kwargs_list
+            )
+        contact_frequencies = contact_counts / len(frame_offsets)
+        resid_num = residue_numbers[
+            (contact_counts > 0)
+            & (contact_frequencies >= float(self.contact_frequency))
         ]
-        # TODO: make it write list of integers
-        resid_num = list(df1.residue_number.unique())
         np.savetxt(self.residue_list, resid_num, fmt="%i")
 
+    def get_qm_resids_by_budget(self):
+        """
+        Saves a text file of the residue numbers of the receptor in the
+        QM region, built by ranking the receptor residues by their
+        minimum distance to the ligand and greedily filling the QM atom
+        or basis function budget. The predicted cost of the QM region is
+        printed.
+        """
+        if self.qm_atom_budget is None and self.qm_basis_budget is None:
+            raise ValueError("No QM atom or basis function budget given.")
+        guest_atoms = PdbFile.load(self.guest_pdb).records("ATOM")
+        df = PdbFile.load(self.host_pdb).records("ATOM")
+        residue_numbers = df["residue_number"]
+        ranked_residues, _ = get_residue_distances(
+            residue_numbers, df["xyz"], guest_atoms["xyz"]
+        )
+        host_counts = {
+            "atoms": np.ones(len(df), dtype=int),
+            "basis functions": get_basis_function_counts(
+                df["element_symbol"], self.basis_set
+            ),
+        }
+        guest_counts = {
+            "atoms": np.ones(len(guest_atoms), dtype=int),
+            "basis functions": get_basis_function_counts(
+                guest_atoms["element_symbol"], self.basis_set
+            ),
+        }
+        budgets = {
+            "atoms": self.qm_atom_budget,
+            "basis functions": self.qm_basis_budget,
+        }
+        # Residue of each atom, to sum the costs of the residues at once
+        residues, residue_index = np.unique(
+            residue_numbers, return_inverse=True
+        )
+        qm_resids = ranked_residues
+        for name, budget in budgets.items():
+            if budget is None:
+                continue
+            if host_counts[name] is None or guest_counts[name] is None:
+                element_symbols = np.concatenate(
+                    [guest_atoms["element_symbol"], df["element_symbol"]]
+                )
+                uncounted = sorted(
+                    set(
+                        i.strip().capitalize()
+                        for i in element_symbols
+                        if get_basis_function_counts([i], self.basis_set)
+                        is None
+                    )
+                )
+                raise ValueError(
+                    "Basis functions cannot be counted for the basis set "
+                    + self.basis_set
+                    + " and the elements "
+                    + ", ".join(uncounted)
+                )
+            residue_costs = np.bincount(
+                residue_index, weights=host_counts[name]
+            ).astype(int)[np.searchsorted(residues, qm_resids)]
+            qm_resids = select_residues_by_budget(
+                qm_resids, residue_costs, budget - guest_counts[name].sum()
+            )
+        qm_resids = np.sort(np.array(qm_resids, dtype=int))
+        np.savetxt(self.qm_residue_list, qm_resids, fmt="%i")
+        qm_mask = np.isin(residue_numbers, qm_resids)
+        print_qm_cost(
+            np.concatenate(
+                [guest_atoms["element_symbol"], df["element_symbol"][qm_mask]]
+            ),
+            self.basis_set,
+        )
+
+    def get_region_masks(self, residue_numbers):
+        """
+        Returns the masks of the receptor's QM region, MM region
+        preceding the QM region and MM region following the QM region,
+        either from the residues selected within the QM budget or from
+        the num_residues residues around the median residue.
+        """
+        if self.qm_atom_budget is None and self.qm_basis_budget is None:
+            resid_num = np.loadtxt(self.residue_list, ndmin=1)
+            return get_host_region_masks(
+                residue_numbers, resid_num, self.num_residues
+            )
+        qm_resids = np.loadtxt(self.qm_residue_list, ndmin=1)
+        return get_host_region_masks(
+            residue_numbers, None, None, qm_resids=qm_resids
+        )
+
     def get_host_qm_mm_atoms(self):
         """
         Saves a text file of the atom numbers of the receptors in the QM
         region and MM region separately.
         """
-        resid_num = np.loadtxt(self.residue_list)
-        # approximated_res_list = [int(i) for i in resid_num]
-        approximated_res_list = []
-        # TODO: what is this doing?
-        for i in range(
-            int(statistics.median(resid_num))
-            - int(int(self.num_residues) / 2),
-            int(statistics.median(resid_num))
-            + int(int(self.num_residues) / 2),
-        ):
-            approximated_res_list.append(i)
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.host_pdb)
-        df = ppdb.df["ATOM"][["atom_number", "residue_number", "residue_name"]]
-        host_index_nested_list = []
-        for i in approximated_res_list:
-            indices = np.where(df["residue_number"] == i)
-            #TODO: the program seems to error when this line is removed, which
-            # makes no sense.
-            indices = list(indices)[0]
-            indices = list(indices)
-            host_index_nested_list.append(indices)
-        host_index_list = list(
-            itertools.chain.from_iterable(host_index_nested_list)
-        )
-        df_atom = df.iloc[host_index_list]
-        df_atom_number = df_atom["atom_number"]
-        host_atom_list = df_atom_number.values.tolist()
-        selected_atoms = []
-        selected_atoms.extend(host_atom_list)
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.host_pdb)
-        len_atoms = []
-        for i in range(len(ppdb.df["ATOM"])):
-            len_atoms.append(i + 1)
-        non_selected_atoms = list(set(len_atoms).difference(selected_atoms))
+        df = PdbFile.load(self.host_pdb).records("ATOM")
+        residue_numbers = df["residue_number"]
+        qm_mask, _, _ = self.get_region_masks(residue_numbers)
+        host_index_list = np.flatnonzero(qm_mask)
+        host_index_list = host_index_list[
+            np.argsort(residue_numbers[host_index_list], kind="stable")
+        ]
+        selected_atoms = df["atom_number"][host_index_list]
+        len_atoms = np.arange(1, len(df) + 1)
+        non_selected_atoms = np.setdiff1d(len_atoms, selected_atoms)
         assert len(non_selected_atoms) + len(selected_atoms) == len(len_atoms),\
             "Sum of the atoms in the selected and non-selected region "\
             "does not equal the length of list of total atoms."
@@ -2772,28 +5326,19 @@ class PrepareQMMM:
         Saves a PDB file for the receptor's QM region and MM
         region separately.
         """
-        selected_atoms = np.loadtxt(self.host_qm_atoms)
-        # TODO: not necessary if savetxt writes in integers
-        selected_atoms = [int(i) for i in selected_atoms]
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.host_pdb)
-        for i in selected_atoms:
-            ppdb.df["ATOM"] = ppdb.df["ATOM"][
-                ppdb.df["ATOM"]["atom_number"] != i
-            ]
-        ppdb.to_pdb(
-            path=self.host_mm_pdb, records=None, gz=False, append_newline=True,
-        )
-        non_selected_atoms = np.loadtxt(self.host_mm_atoms)
-        non_selected_atoms = [int(i) for i in non_selected_atoms]
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.host_pdb)
-        for i in non_selected_atoms:
-            ppdb.df["ATOM"] = ppdb.df["ATOM"][
-                ppdb.df["ATOM"]["atom_number"] != i
-            ]
-        ppdb.to_pdb(
-            path=self.host_qm_pdb, records=None, gz=False, append_newline=True,
+        selected_atoms = np.loadtxt(self.host_qm_atoms, ndmin=1)
+        non_selected_atoms = np.loadtxt(self.host_mm_atoms, ndmin=1)
+        pdb = PdbFile.load(self.host_pdb)
+        atoms = pdb.atoms
+        other_mask = atoms["record_name"] != "ATOM"
+        atom_numbers = atoms["atom_number"]
+        pdb.write(
+            self.host_mm_pdb,
+            atoms[other_mask | ~np.isin(atom_numbers, selected_atoms)],
+        )
+        pdb.write(
+            self.host_qm_pdb,
+            atoms[other_mask | ~np.isin(atom_numbers, non_selected_atoms)],
         )
 
     def get_host_mm_region_atoms(self):
@@ -2802,71 +5347,23 @@ class PrepareQMMM:
         preceding the QM region and saves another text file for the
         atoms of the receptor's MM region folllowing the QM region.
         """
-        resid_num = np.loadtxt(self.residue_list)
-        approximated_res_list = []
-        for i in range(
-            int(statistics.median(resid_num))
-            - int(int(self.num_residues) / 2),
-            int(statistics.median(resid_num))
-            + int(int(self.num_residues) / 2),
-        ):
-            approximated_res_list.append(i)
-        # print(approximated_res_list)
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.host_pdb)
-        df = ppdb.df["ATOM"][["residue_number"]]
-        res_list = list(set(df["residue_number"].to_list()))
-        res_mm_list = list(set(res_list).difference(approximated_res_list))
-        # print(res_mm_list)
-        res_mm_region_I_list = []
-        # TODO: This can probably be made into a single loop by comparing i
-        # to the maximum value within approximated_res_list
-        for i in res_mm_list:
-            for j in approximated_res_list:
-                if i < j:
-                    res_mm_region_I_list.append(i)
-        res_mm_region_I_list = list(set(res_mm_region_I_list))
-        res_mm_region_II_list = list(
-            set(res_mm_list).difference(res_mm_region_I_list)
-        )
-        # print(res_mm_region_II_list)
-        ppdb.read_pdb(self.host_mm_pdb)
-        df = ppdb.df["ATOM"][["atom_number", "residue_number", "residue_name"]]
-        mm_region_I_index_nested_list = []
-        for i in res_mm_region_I_list:
-            indices = np.where(df["residue_number"] == i)
-            # TODO: again, this is strange code
-            indices = list(indices)[0]
-            indices = list(indices)
-            mm_region_I_index_nested_list.append(indices)
-        mm_region_I_index_list = list(
-            itertools.chain.from_iterable(mm_region_I_index_nested_list)
-        )
-        df_atom = df.iloc[mm_region_I_index_list]
-        df_atom_number = df_atom["atom_number"]
-        mm_region_I_atom_list = df_atom_number.values.tolist()
-        mm_region_I_atoms = []
-        mm_region_I_atoms.extend(mm_region_I_atom_list)
-        mm_region_II_index_nested_list = []
-        for i in res_mm_region_II_list:
-            indices = np.where(df["residue_number"] == i)
-            # TODO: again, this is strange code
-            indices = list(indices)[0]
-            indices = list(indices)
-            mm_region_II_index_nested_list.append(indices)
-        mm_region_II_index_list = list(
-            itertools.chain.from_iterable(mm_region_II_index_nested_list)
-        )
-        df_atom = df.iloc[mm_region_II_index_list]
-        df_atom_number = df_atom["atom_number"]
-        mm_region_II_atom_list = df_atom_number.values.tolist()
-        mm_region_II_atoms = []
-        mm_region_II_atoms.extend(mm_region_II_atom_list)
-        ppdb.read_pdb(self.host_mm_pdb)
-        len_atoms = []
-        for i in range(len(ppdb.df["ATOM"])):
-            len_atoms.append(i + 1)
-        assert len(mm_region_I_atoms) + len(mm_region_II_atoms) == len(len_atoms),\
+        df = PdbFile.load(self.host_mm_pdb).records("ATOM")
+        residue_numbers = df["residue_number"]
+        atom_numbers = df["atom_number"]
+        _, mm_region_I_mask, mm_region_II_mask = self.get_region_masks(
+            residue_numbers
+        )
+        mm_region_I_index_list = np.flatnonzero(mm_region_I_mask)
+        mm_region_I_index_list = mm_region_I_index_list[
+            np.argsort(residue_numbers[mm_region_I_index_list], kind="stable")
+        ]
+        mm_region_I_atoms = atom_numbers[mm_region_I_index_list]
+        mm_region_II_index_list = np.flatnonzero(mm_region_II_mask)
+        mm_region_II_index_list = mm_region_II_index_list[
+            np.argsort(residue_numbers[mm_region_II_index_list], kind="stable")
+        ]
+        mm_region_II_atoms = atom_numbers[mm_region_II_index_list]
+        assert len(mm_region_I_atoms) + len(mm_region_II_atoms) == len(df),\
             "Sum of the atoms in the selected and non-selected region "\
             "does not equal the length of list of total atoms."
         np.savetxt(self.host_mm_region_I_atoms, mm_region_I_atoms, fmt="%i")
@@ -2878,38 +5375,70 @@ class PrepareQMMM:
         the QM region and saves another PDB file for the receptor's
         MM region folllowing the QM region.
         """
-        mm_region_I_atoms = np.loadtxt(self.host_mm_region_I_atoms)
-        mm_region_I_atoms = [int(i) for i in mm_region_I_atoms]
-        mm_region_II_atoms = np.loadtxt(self.host_mm_region_II_atoms)
-        mm_region_II_atoms = [int(i) for i in mm_region_II_atoms]
+        mm_region_I_atoms = np.loadtxt(self.host_mm_region_I_atoms, ndmin=1)
+        mm_region_II_atoms = np.loadtxt(self.host_mm_region_II_atoms, ndmin=1)
         
         # NOTE: this is a slightly confusing way to define the atoms to 
         # write to a PDB - the members that are *not* in a section, rather
         # than the members that are.
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.host_mm_pdb)
-        for i in mm_region_II_atoms:
-            ppdb.df["ATOM"] = ppdb.df["ATOM"][
-                ppdb.df["ATOM"]["atom_number"] != i
-            ]
-        ppdb.to_pdb(
-            path=self.host_mm_region_I_pdb,
-            records=None,
-            gz=False,
-            append_newline=True,
-        )
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.host_mm_pdb)
-        for i in mm_region_I_atoms:
-            ppdb.df["ATOM"] = ppdb.df["ATOM"][
-                ppdb.df["ATOM"]["atom_number"] != i
+        pdb = PdbFile.load(self.host_mm_pdb)
+        atoms = pdb.atoms
+        other_mask = atoms["record_name"] != "ATOM"
+        atom_numbers = atoms["atom_number"]
+        pdb.write(
+            self.host_mm_region_I_pdb,
+            atoms[other_mask | ~np.isin(atom_numbers, mm_region_II_atoms)],
+        )
+        pdb.write(
+            self.host_mm_region_II_pdb,
+            atoms[other_mask | ~np.isin(atom_numbers, mm_region_I_atoms)],
+        )
+
+    def save_host_regions(self):
+        """
+        Saves the atom numbers and the PDB files of the receptor's QM
+        region, MM region, MM region preceding the QM region and MM
+        region following the QM region from a single read of the
+        receptor PDB file.
+
+        This is equivalent to calling get_host_qm_mm_atoms,
+        save_host_pdbs, get_host_mm_region_atoms and
+        save_host_mm_regions_pdbs in turn.
+        """
+        pdb = PdbFile.load(self.host_pdb)
+        other_mask = pdb.atoms["record_name"] != "ATOM"
+        df = pdb.atoms[~other_mask]
+        residue_numbers = df["residue_number"]
+        atom_numbers = df["atom_number"]
+        (
+            qm_mask,
+            mm_region_I_mask,
+            mm_region_II_mask,
+        ) = self.get_region_masks(residue_numbers)
+        region_atoms = []
+        for mask in [qm_mask, mm_region_I_mask, mm_region_II_mask]:
+            index_list = np.flatnonzero(mask)
+            index_list = index_list[
+                np.argsort(residue_numbers[index_list], kind="stable")
             ]
-        ppdb.to_pdb(
-            path=self.host_mm_region_II_pdb,
-            records=None,
-            gz=False,
-            append_newline=True,
-        )
+            region_atoms.append(atom_numbers[index_list])
+        np.savetxt(self.host_qm_atoms, region_atoms[0], fmt="%i")
+        np.savetxt(
+            self.host_mm_atoms,
+            np.setdiff1d(np.arange(1, len(df) + 1), region_atoms[0]),
+            fmt="%i",
+        )
+        np.savetxt(self.host_mm_region_I_atoms, region_atoms[1], fmt="%i")
+        np.savetxt(self.host_mm_region_II_atoms, region_atoms[2], fmt="%i")
+        for mask, pdb_file in [
+            (qm_mask, self.host_qm_pdb),
+            (~qm_mask, self.host_mm_pdb),
+            (mm_region_I_mask, self.host_mm_region_I_pdb),
+            (mm_region_II_mask, self.host_mm_region_II_pdb),
+        ]:
+            pdb.write(
+                pdb_file, np.concatenate([df[mask], pdb.atoms[other_mask]])
+            )
 
     def get_qm_mm_regions(self):
         """
@@ -2934,6 +5463,506 @@ class PrepareQMMM:
             f2.write("END")
 
 
+def normalize_qm_input(input_text, program=None, tolerance=1e-4):
+
+    """
+    Returns a normalized copy of a QM input file, so that inputs
+    describing the same calculation give the same text.
+
+    Whitespace is normalized in every program. For Gaussian, the
+    link 0 commands (%Chk, %Mem, %NProcShared, ...) and the title are
+    dropped and the keywords of the route section are sorted and
+    uppercased. For psi4, the memory and set_num_threads lines are
+    dropped. The coordinates of the molecule specification are
+    rounded to the tolerance.
+
+    Parameters
+    ----------
+    input_text : str
+        Content of the QM input file.
+
+    program : str, optional
+        "gaussian", "psi4" or None (whitespace normalization only).
+
+    tolerance : float, optional
+        Tolerance (in Angstrom) to which the coordinates are rounded.
+
+    Returns
+    -------
+    normalized_text : str
+        Normalized QM input.
+
+    """
+
+    def round_line(line):
+        tokens = []
+        for token in line.split():
+            try:
+                if "." in token:
+                    token = str(int(round(float(token) / tolerance)))
+            except ValueError:
+                pass
+            tokens.append(token)
+        return " ".join(tokens)
+
+    lines = [" ".join(line.split()) for line in input_text.splitlines()]
+    normalized_lines = []
+    if program == "gaussian":
+        lines = [line for line in lines if not line.startswith("%")]
+        while lines and not lines[0]:
+            lines.pop(0)
+        route = []
+        while lines and lines[0]:
+            route += lines.pop(0).upper().split()
+        normalized_lines.append(" ".join(sorted(route)))
+        # Title section
+        while lines and not lines[0]:
+            lines.pop(0)
+        while lines and lines[0]:
+            lines.pop(0)
+        while lines and not lines[0]:
+            lines.pop(0)
+        # Charge and multiplicity, then the molecule specification
+        in_molecule = True
+        for line in lines:
+            if not line:
+                in_molecule = False
+            normalized_lines.append(round_line(line) if in_molecule else line)
+    elif program == "psi4":
+        in_molecule = False
+        for line in lines:
+            if line.startswith(("memory", "set_num_threads")):
+                continue
+            if line.startswith("}"):
+                in_molecule = False
+            normalized_lines.append(round_line(line) if in_molecule else line)
+            if line.startswith("molecule"):
+                in_molecule = True
+    else:
+        normalized_lines = lines
+    return "\n".join(normalized_lines).strip() + "\n"
+
+
+class QMCache:
+
+    """
+    A class used to cache the results of QM calculations on disk.
+
+    Every cache entry is a directory named by the SHA-256 hash of the
+    normalized QM inputs (see normalize_qm_input), i.e. of the
+    geometry rounded to a tolerance, the charge, the multiplicity,
+    the functional, the basis set and the keywords. The entry holds
+    a copy of the result files of the calculation (e.g. .log, .chk
+    and .fchk files or torsiondrive scan files), each stored under
+    its role name. Identical calculations of later runs (or of other
+    pipelines sharing the cache directory) copy the result files back
+    instead of running again. When the cache grows beyond max_size,
+    the least recently used entries are evicted.
+
+    ...
+
+    Attributes
+    ----------
+    cache_dir : str, optional
+        Directory of the cache (~/.cache/qmmmrebind by default).
+
+    max_size : float, optional
+        Maximum size (in GB) of the cache.
+
+    tolerance : float, optional
+        Tolerance (in Angstrom) to which the coordinates are rounded
+        before hashing.
+
+    stats : dict
+        Number of hits, misses, saved entries and evicted entries
+        since the object was created.
+
+    """
+
+    def __init__(
+        self,
+        cache_dir=None,
+        max_size=10.0,
+        tolerance=1e-4,
+    ):
+
+        if cache_dir is None:
+            cache_dir = os.path.join(
+                os.path.expanduser("~"), ".cache", "qmmmrebind"
+            )
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.tolerance = tolerance
+        self.stats = {"hits": 0, "misses": 0, "saves": 0, "evictions": 0}
+
+    def get_key(self, input_files, program=None):
+        """
+        Returns the hash of the normalized content of the QM input
+        files of a calculation.
+        """
+        sha256 = hashlib.sha256()
+        for input_file in input_files:
+            with open(input_file, "r") as f:
+                input_text = normalize_qm_input(
+                    f.read(), program=program, tolerance=self.tolerance
+                )
+            sha256.update(input_text.encode() + b"\0")
+        return sha256.hexdigest()
+
+    def load(self, key, files):
+        """
+        Copies the cached result files of an entry to the given
+        paths (a dict of role: path) and returns True, or returns
+        False if the entry does not hold all of them.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        if not all(
+            os.path.isfile(os.path.join(entry_dir, role)) for role in files
+        ):
+            self.stats["misses"] += 1
+            return False
+        for role, path in files.items():
+            shutil.copyfile(os.path.join(entry_dir, role), path)
+        # The modification time of an entry records its last use
+        os.utime(entry_dir)
+        self.stats["hits"] += 1
+        return True
+
+    def save(self, key, files):
+        """
+        Copies the existing result files (a dict of role: path) to
+        the entry and evicts the least recently used entries if the
+        cache exceeds its maximum size.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        os.makedirs(entry_dir, exist_ok=True)
+        for role, path in files.items():
+            if os.path.isfile(path):
+                # Copied to a temporary file first, so that concurrent
+                # readers never see a partially written file
+                tmp_file = os.path.join(entry_dir, role + ".tmp")
+                shutil.copyfile(path, tmp_file)
+                os.replace(tmp_file, os.path.join(entry_dir, role))
+        os.utime(entry_dir)
+        self.stats["saves"] += 1
+        self.evict(keep=key)
+
+    def get_entries(self):
+        """
+        Returns a list of (last use, size in bytes, key) tuples of the
+        entries of the cache, from the least to the most recently used.
+        """
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for key in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, key)
+            if not os.path.isdir(entry_dir):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(entry_dir, i))
+                for i in os.listdir(entry_dir)
+            )
+            entries.append((os.path.getmtime(entry_dir), size, key))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used entries (except keep) until
+        the cache does not exceed its maximum size.
+        """
+        entries = self.get_entries()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total_size <= self.max_size * 1024 ** 3:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, key))
+            total_size -= size
+            self.stats["evictions"] += 1
+
+    def report(self):
+        """
+        Prints and returns the number of entries, the size (in GB) and
+        the hit, miss, save and eviction counts of the cache.
+        """
+        entries = self.get_entries()
+        report = dict(
+            entries=len(entries),
+            size=sum(size for _, size, _ in entries) / 1024 ** 3,
+            max_size=self.max_size,
+            **self.stats
+        )
+        print(
+            "QM cache "
+            + self.cache_dir
+            + " : "
+            + ", ".join([i + " = " + str(j) for i, j in report.items()])
+        )
+        return report
+
+    def get_gaussian_files(self, gaussian_job):
+        """
+        Returns the result files (log, chk and fchk) of a Gaussian
+        calculation (as described by get_gaussian_job of the Gaussian
+        classes), the checkpoint file being read from %Chk.
+        """
+        files = {"log": gaussian_job["log_file"]}
+        with open(gaussian_job["input_file"], "r") as f:
+            chk_file = re.search(r"(?im)^%Chk\s*=\s*(\S+)", f.read())
+        if chk_file is not None:
+            files["chk"] = chk_file.group(1)
+            files["fchk"] = chk_file.group(1)[:-4] + ".fchk"
+        return files
+
+    def load_gaussian(self, gaussian_job, roles):
+        """
+        Restores the cached result files (roles among "log", "chk" and
+        "fchk") of a Gaussian calculation and returns True on a hit.
+        """
+        files = self.get_gaussian_files(gaussian_job)
+        return self.load(
+            self.get_key([gaussian_job["input_file"]], program="gaussian"),
+            {role: files[role] for role in roles if role in files},
+        )
+
+    def save_gaussian(self, gaussian_job, roles):
+        """
+        Saves the result files (roles among "log", "chk" and "fchk")
+        of a Gaussian calculation in the cache.
+        """
+        files = self.get_gaussian_files(gaussian_job)
+        self.save(
+            self.get_key([gaussian_job["input_file"]], program="gaussian"),
+            {role: files[role] for role in roles if role in files},
+        )
+
+
+async def run_gaussian_job_async(
+    input_file,
+    log_file,
+    gauss_out_file,
+    fchk_out_file,
+    n_processors,
+    gaussian_command="g16",
+    formchk_command="formchk",
+    qm_cache=None,
+):
+
+    """
+    Runs a Gaussian QM calculation asynchronously and converts its
+    checkpoint file to a formatted checkpoint file as soon as it
+    finishes successfully.
+
+    The input file is passed to Gaussian through the standard input
+    with its %NProcShared command set to n_processors, so the input
+    file itself is left unchanged. The output of Gaussian is streamed
+    to the log file and the lines reporting the progress of the
+    calculation (SCF energies, optimization steps and termination)
+    are printed.
+
+    Parameters
+    ----------
+    input_file : str
+        Gaussian input file (.com extension).
+
+    log_file : str
+        Gaussian log file (.log extension).
+
+    gauss_out_file : str
+        File to which the standard error of Gaussian is written.
+
+    fchk_out_file : str
+        File to which the output of formchk is written.
+
+    n_processors : int
+        Number of processors set in the %NProcShared command.
+
+    gaussian_command : str, optional
+        Gaussian executable.
+
+    formchk_command : str, optional
+        formchk executable.
+
+    qm_cache : QMCache, optional
+        Cache of the QM results. On a hit the log, chk and fchk files
+        are restored from the cache instead of running the job.
+
+    Returns
+    -------
+    return_code : int
+        Return code of the Gaussian calculation.
+
+    """
+    gaussian_job = dict(input_file=input_file, log_file=log_file)
+    if qm_cache is not None and qm_cache.load_gaussian(
+        gaussian_job, ["log", "chk", "fchk"]
+    ):
+        return 0
+    with open(input_file, "r") as f:
+        input_text = f.read()
+    input_text = re.sub(
+        r"(?im)^%NProcShared\s*=\s*\d+",
+        "%NProcShared = " + str(n_processors),
+        input_text,
+    )
+    chk_file = re.search(r"(?im)^%Chk\s*=\s*(\S+)", input_text)
+    progress_keywords = [
+        "SCF Done",
+        "Step number",
+        "Normal termination",
+        "Error termination",
+    ]
+
+    async def feed_input(process):
+        process.stdin.write(input_text.encode())
+        await process.stdin.drain()
+        process.stdin.close()
+
+    with open(gauss_out_file, "w+") as f_out, open(log_file, "w") as f_log:
+        process = await asyncio.create_subprocess_exec(
+            gaussian_command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=f_out,
+        )
+        # The input is fed concurrently so that a full output pipe
+        # cannot block the writing of a large input
+        feeding = asyncio.ensure_future(feed_input(process))
+        async for line in process.stdout:
+            line = line.decode()
+            f_log.write(line)
+            if any(keyword in line for keyword in progress_keywords):
+                print(input_file + " : " + line.strip())
+        await feeding
+        return_code = await process.wait()
+    if qm_cache is not None and return_code == 0:
+        qm_cache.save_gaussian(gaussian_job, ["log", "chk"])
+    if return_code == 0 and chk_file is not None:
+        chk_file = chk_file.group(1)
+        with open(fchk_out_file, "w+") as f:
+            process = await asyncio.create_subprocess_exec(
+                formchk_command,
+                chk_file,
+                chk_file[:-4] + ".fchk",
+                stdout=f,
+                stderr=asyncio.subprocess.STDOUT,
+            )
+            if await process.wait() == 0 and qm_cache is not None:
+                qm_cache.save_gaussian(gaussian_job, ["fchk"])
+    return return_code
+
+
+async def run_gaussian_jobs_async(
+    gaussian_jobs,
+    n_cores=None,
+    gaussian_command="g16",
+    formchk_command="formchk",
+):
+
+    """
+    Runs independent Gaussian QM calculations concurrently with a
+    shared core budget, so that the QM wall time becomes the one of
+    the longest calculation instead of the sum of all of them.
+
+    The cores are split between the calculations running at the same
+    time (at most n_cores calculations of at least one core each) by
+    overriding the %NProcShared command of every input file. When the
+    cores cannot be split evenly, the leftover cores go one each to the
+    first calculations, so that no core is left idle.
+    The QM cache (qm_cache) of every object is used if given.
+
+    Parameters
+    ----------
+    gaussian_jobs : list
+        PrepareGaussianGuest, PrepareGaussianHostGuest or
+        PrepareGaussianHost objects whose input files are written.
+
+    n_cores : int, optional
+        Total number of cores shared by the calculations (all the
+        cores available to the process by default).
+
+    gaussian_command : str, optional
+        Gaussian executable.
+
+    formchk_command : str, optional
+        formchk executable.
+
+    Returns
+    -------
+    return_codes : list
+        Return code of every Gaussian calculation.
+
+    """
+    if n_cores is None:
+        n_cores = get_num_cores()
+    num_slots = max(1, min(len(gaussian_jobs), n_cores))
+    # Each slot holds its number of cores while a calculation runs on it
+    slots = asyncio.Queue()
+    for i in range(num_slots):
+        slots.put_nowait(
+            max(1, n_cores // num_slots + (i < n_cores % num_slots))
+        )
+
+    async def run_job(gaussian_job):
+        n_processors = await slots.get()
+        try:
+            return await run_gaussian_job_async(
+                **gaussian_job.get_gaussian_job(),
+                n_processors=n_processors,
+                gaussian_command=gaussian_command,
+                formchk_command=formchk_command,
+                qm_cache=gaussian_job.qm_cache,
+            )
+        finally:
+            slots.put_nowait(n_processors)
+
+    return list(await asyncio.gather(*[run_job(i) for i in gaussian_jobs]))
+
+
+def run_gaussian_jobs(
+    gaussian_jobs,
+    n_cores=None,
+    gaussian_command="g16",
+    formchk_command="formchk",
+):
+
+    """
+    Blocking wrapper of run_gaussian_jobs_async.
+
+    Parameters
+    ----------
+    gaussian_jobs : list
+        PrepareGaussianGuest, PrepareGaussianHostGuest or
+        PrepareGaussianHost objects whose input files are written.
+
+    n_cores : int, optional
+        Total number of cores shared by the calculations (all the
+        cores available to the process by default).
+
+    gaussian_command : str, optional
+        Gaussian executable.
+
+    formchk_command : str, optional
+        formchk executable.
+
+    Returns
+    -------
+    return_codes : list
+        Return code of every Gaussian calculation.
+
+    """
+    return asyncio.run(
+        run_gaussian_jobs_async(
+            gaussian_jobs,
+            n_cores=n_cores,
+            gaussian_command=gaussian_command,
+            formchk_command=formchk_command,
+        )
+    )
+
+
 class PrepareGaussianGuest:
 
     """
@@ -3006,6 +6035,9 @@ class PrepareGaussianGuest:
         Formatted checkpoint file obtained from the checkpoint file
         using formchk command.
 
+    qm_cache: QMCache, optional
+        Cache of the QM results. If given, the calculation is not run
+        again when the cache holds the results of an identical input.
 
     """
 
@@ -3025,6 +6057,7 @@ class PrepareGaussianGuest:
         add_keywords_III="IOP(6/33=2,6/42=6)",
         gauss_out_file="guest.out",
         fchk_out_file="guest_fchk.out",
+        qm_cache=None,
     ):
 
         self.charge = charge
@@ -3041,6 +6074,7 @@ class PrepareGaussianGuest:
         self.add_keywords_I = add_keywords_I
         self.add_keywords_II = add_keywords_II
         self.add_keywords_III = add_keywords_III
+        self.qm_cache = qm_cache
 
     def write_input(self):
         """
@@ -3070,13 +6104,15 @@ class PrepareGaussianGuest:
         command_line_6 = self.guest_pdb[:-4] + " " + "gaussian input file"
         command_line_7 = " "
         command_line_8 = str(self.charge) + " " + str(self.multiplicity)
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.guest_pdb)
-        df = ppdb.df["ATOM"]
-        df_1 = ppdb.df["ATOM"]["element_symbol"]
-        df_1.columns = ["atom"]
-        df_2 = df[["x_coord", "y_coord", "z_coord"]]
-        df_merged = pd.concat([df_1, df_2], axis=1)
+        atoms = PdbFile.load(self.guest_pdb).records("ATOM")
+        df_merged = pd.DataFrame(
+            {
+                "element_symbol": atoms["element_symbol"],
+                "x_coord": atoms["xyz"][:, 0],
+                "y_coord": atoms["xyz"][:, 1],
+                "z_coord": atoms["xyz"][:, 2],
+            }
+        )
         command_line_9 = df_merged.to_string(header=False, index=False)
         command_line_10 = " "
         command = [
@@ -3095,22 +6131,313 @@ class PrepareGaussianGuest:
         with open(self.guest_pdb[:-4] + ".com", "w") as f:
             f.write(commands)
 
+    def get_gaussian_job(self):
+        """
+        Returns the files of the Gaussian QM calculation for the
+        ligand, as used by run_gaussian_jobs.
+        """
+        return dict(
+            input_file=self.guest_pdb[:-4] + ".com",
+            log_file=self.guest_pdb[:-4] + ".log",
+            gauss_out_file=self.gauss_out_file,
+            fchk_out_file=self.fchk_out_file,
+        )
+
     def run_gaussian(self):
         """
         Runs the Gaussian QM calculation for the ligand locally.
         """
+        if self.qm_cache is not None and self.qm_cache.load_gaussian(
+            self.get_gaussian_job(), ["log", "chk"]
+        ):
+            return
         execute_command = (
             "g16"
             + " < "
             + self.guest_pdb[:-4]
             + ".com"
             + " > "
-            + self.guest_pdb[:-4]
+            + self.guest_pdb[:-4]
+            + ".log"
+        )
+        with open(self.gauss_out_file, "w+") as f:
+            returncode = sp.run(
+                execute_command, shell=True, stdout=f, stderr=sp.STDOUT,
+            ).returncode
+        if self.qm_cache is not None and returncode == 0:
+            self.qm_cache.save_gaussian(
+                self.get_gaussian_job(), ["log", "chk"]
+            )
+
+    def get_fchk(self):
+        """
+        Converts the Gaussian checkpoint file (.chk) to a formatted checkpoint
+        file (.fchk).
+        """
+        if self.qm_cache is not None and self.qm_cache.load_gaussian(
+            self.get_gaussian_job(), ["fchk"]
+        ):
+            return
+        execute_command = (
+            "formchk"
+            + " "
+            + self.guest_pdb[:-4]
+            + ".chk"
+            + " "
+            + self.guest_pdb[:-4]
+            + ".fchk"
+        )
+        with open(self.fchk_out_file, "w+") as f:
+            returncode = sp.run(
+                execute_command, shell=True, stdout=f, stderr=sp.STDOUT,
+            ).returncode
+        if self.qm_cache is not None and returncode == 0:
+            self.qm_cache.save_gaussian(self.get_gaussian_job(), ["fchk"])
+
+
+class PrepareGaussianHostGuest:
+
+    """
+    A class used to prepare the QM engine input file (Gaussian) for
+    the receptor - ligand complex and run the QM calculations with
+    the appropriate keywords.
+
+    This class contain methods to write an input file (.com extension)
+    for the QM engine for the receptor - ligand complex. It then runs
+    a QM calculation with the given basis set and functional. Checkpoint
+    file is then converted to a formatted checkpoint file. Output files
+    (.log, .chk, and .fhck) will then be used to extract charges for the
+    ligand and the receptor.
+
+    ...
+
+    Attributes
+    ----------
+    charge : int, optional
+        Total charge of the receptor - ligand complex.
+
+    multiplicity : int, optional
+        Spin Multiplicity (2S+1) of the ligand where S represents
+        the total spin of the ligand.
+
+    guest_pdb : str, optional
+        Ligand PDB file with atom numbers beginning from 1.
+
+    host_qm_pdb : str, optional
+        PDB file for the receptor's QM region.
+
+    n_processors : int, optional
+        Number of processors to be used for Gaussian program to run and
+        set in %NProcShared command of Gaussian.
+
+    memory : int, optional
+        Memory (in GB) to be used set in %Mem command of Gaussian.
+
+    functional: str, optional
+        Exchange/Correlation or hybrid functional to use in the Gaussian
+        QM calculation.
+
+    basis_set: str, optional
+        Basis set to use for the Gaussian QM calculation.
+
+    optimisation: str, optional
+        set to "OPT" to perform a geometry optimization on the ligand
+        specified in the system; else set to an empty string.
+
+    frequency: str, optional
+        set to "FREQ" for Gaussian to perform a frequency calculation;
+        else set to an empty string.
+
+    add_keywords_I: str, optional
+        Specifies the integration grid.
+
+    add_keywords_II: str, optional
+        Specifies the QM engine to select one of the methods for
+        analyzing the electron density of the system. Methods used
+        are based on fitting the molecular electrostatic potential.
+        Methods used are : POP=CHELPG (Charges from Electrostatic
+        Potentials using a Grid based method) and POP=MK
+        (Merz-Singh-Kollman scheme)
+
+    add_keywords_III: str, optional
+        Used to include the IOp keyword (to set the internal options to
+        specific values) in the Gaussian command.
+
+    gauss_system_out_file : str, optional
+        This file contains the output script obtained after running
+        the Gaussian QM calculation.
+
+    fchk_system_out_file : str, optional
+        Formatted checkpoint file obtained from the checkpoint file
+        using formchk command.
+
+    host_guest_input : str, optional
+        Gaussian input file (.com extension) for the receptor - ligand
+        QM region.
+
+    qm_guest_charge_parameter_file : str, optional
+        File containing the charges of ligand atoms and their corresponding
+        atoms. Charge obtained are the polarised charged due to the
+        surrounding receptor's region.
+
+    qm_host_charge_parameter_file : str, optional
+        File containing the charges of the QM region of the receptor.
+
+    qm_guest_atom_charge_parameter_file : str, optional
+        File containing the charges of ligand atoms. Charge obtained
+        are the polarised charged due to the surrounding receptor's region.
+
+    qm_cache : QMCache, optional
+        Cache of the QM results. If given, the calculation is not run
+        again when the cache holds the results of an identical input.
+
+    """
+
+    def __init__(
+        self,
+        charge=0,
+        multiplicity=1,
+        guest_pdb="guest_init_II.pdb",
+        host_qm_pdb="host_qm.pdb",
+        n_processors=12,
+        memory=50,
+        functional="B3LYP",
+        basis_set="6-31G",
+        optimisation="",
+        frequency="",
+        add_keywords_I="INTEGRAL=(GRID=ULTRAFINE)",
+        add_keywords_II="POP(MK,READRADII)",
+        add_keywords_III="IOP(6/33=2,6/42=6) SCRF=PCM",
+        gauss_system_out_file="system_qm.out",
+        fchk_system_out_file="system_qm_fchk.out",
+        host_guest_input="host_guest.com",
+        qm_guest_charge_parameter_file="guest_qm_surround_charges.txt",
+        qm_host_charge_parameter_file="host_qm_surround_charges.txt",
+        qm_guest_atom_charge_parameter_file="guest_qm_atom_surround_charges.txt",
+        qm_cache=None,
+    ):
+
+        self.charge = charge
+        self.multiplicity = multiplicity
+        self.guest_pdb = guest_pdb
+        self.host_qm_pdb = host_qm_pdb
+        self.n_processors = n_processors
+        self.memory = memory
+        self.functional = functional
+        self.basis_set = basis_set
+        self.optimisation = optimisation
+        self.frequency = frequency
+        self.add_keywords_I = add_keywords_I
+        self.add_keywords_II = add_keywords_II
+        self.add_keywords_III = add_keywords_III
+        self.gauss_system_out_file = gauss_system_out_file
+        self.fchk_system_out_file = fchk_system_out_file
+        self.host_guest_input = host_guest_input
+        self.qm_guest_charge_parameter_file = qm_guest_charge_parameter_file
+        self.qm_host_charge_parameter_file = qm_host_charge_parameter_file
+        self.qm_guest_atom_charge_parameter_file = (
+            qm_guest_atom_charge_parameter_file
+        )
+        self.qm_cache = qm_cache
+
+    def write_input(self):
+        """
+        Writes a Gaussian input file for the receptor - ligand QM region.
+        """
+        command_line_1 = "%Chk = " + self.host_guest_input[:-4] + ".chk"
+        command_line_2 = "%Mem = " + str(self.memory) + "GB"
+        command_line_3 = "%NProcShared = " + str(self.n_processors)
+        command_line_4 = (
+            "# "
+            + self.functional
+            + " "
+            + self.basis_set
+            + " "
+            + self.optimisation
+            + " "
+            + self.frequency
+            + " "
+            + self.add_keywords_I
+            + " "
+            + self.add_keywords_II
+            + " "
+            + self.add_keywords_III
+        )
+        command_line_5 = " "
+        command_line_6 = "Gaussian Input File"
+        command_line_7 = " "
+        command_line_8 = str(self.charge) + " " + str(self.multiplicity)
+        df_merged_list = []
+        for pdb_file in [self.guest_pdb, self.host_qm_pdb]:
+            atoms = PdbFile.load(pdb_file).records("ATOM")
+            df_merged_list.append(
+                pd.DataFrame(
+                    {
+                        "element_symbol": atoms["element_symbol"],
+                        "decide_freeze": ["0"] * len(atoms),
+                        "x_coord": atoms["xyz"][:, 0],
+                        "y_coord": atoms["xyz"][:, 1],
+                        "z_coord": atoms["xyz"][:, 2],
+                    }
+                )
+            )
+        df_merged = pd.concat(df_merged_list, axis=0)
+        print_qm_cost(df_merged["element_symbol"].values, self.basis_set)
+        command_line_9 = df_merged.to_string(header=False, index=False)
+        command_line_10 = " "
+        command = [
+            command_line_1,
+            command_line_2,
+            command_line_3,
+            command_line_4,
+            command_line_5,
+            command_line_6,
+            command_line_7,
+            command_line_8,
+            command_line_9,
+            command_line_10,
+        ]
+        commands = "\n".join(command)
+
+        with open(self.host_guest_input, "w") as f:
+            f.write(commands)
+
+    def get_gaussian_job(self):
+        """
+        Returns the files of the Gaussian QM calculation for the
+        ligand - receptor region, as used by run_gaussian_jobs.
+        """
+        return dict(
+            input_file=self.host_guest_input,
+            log_file=self.host_guest_input[:-4] + ".log",
+            gauss_out_file=self.gauss_system_out_file,
+            fchk_out_file=self.fchk_system_out_file,
+        )
+
+    def run_gaussian(self):
+        """
+        Runs the Gaussian QM calculation for the ligand - receptor region
+        locally.
+        """
+        if self.qm_cache is not None and self.qm_cache.load_gaussian(
+            self.get_gaussian_job(), ["log", "chk"]
+        ):
+            return
+        execute_command = (
+            "g16"
+            + " < "
+            + self.host_guest_input
+            + " > "
+            + self.host_guest_input[:-4]
             + ".log"
         )
-        with open(self.gauss_out_file, "w+") as f:
-            sp.run(
+        with open(self.gauss_system_out_file, "w+") as f:
+            returncode = sp.run(
                 execute_command, shell=True, stdout=f, stderr=sp.STDOUT,
+            ).returncode
+        if self.qm_cache is not None and returncode == 0:
+            self.qm_cache.save_gaussian(
+                self.get_gaussian_job(), ["log", "chk"]
             )
 
     def get_fchk(self):
@@ -3118,311 +6445,878 @@ class PrepareGaussianGuest:
         Converts the Gaussian checkpoint file (.chk) to a formatted checkpoint
         file (.fchk).
         """
+        if self.qm_cache is not None and self.qm_cache.load_gaussian(
+            self.get_gaussian_job(), ["fchk"]
+        ):
+            return
         execute_command = (
             "formchk"
             + " "
-            + self.guest_pdb[:-4]
+            + self.host_guest_input[:-4]
             + ".chk"
             + " "
-            + self.guest_pdb[:-4]
+            + self.host_guest_input[:-4]
             + ".fchk"
         )
-        with open(self.fchk_out_file, "w+") as f:
-            sp.run(
+        with open(self.fchk_system_out_file, "w+") as f:
+            returncode = sp.run(
                 execute_command, shell=True, stdout=f, stderr=sp.STDOUT,
-            )
+            ).returncode
+        if self.qm_cache is not None and returncode == 0:
+            self.qm_cache.save_gaussian(self.get_gaussian_job(), ["fchk"])
+
+    def get_qm_host_guest_charges(self):
+        """
+        Extract charge information for the receptor - ligand QM region.
+        """
+        log_file = self.host_guest_input[:-4] + ".log"
+        charges = GaussianLog.load(log_file).get_esp_charges()
+        number_guest_atoms = len(PdbFile.load(self.guest_pdb).records("ATOM"))
+        df_charge = pd.DataFrame(
+            {"Atom": charges["element_symbol"], "Charge": charges["charge"]}
+        )
+        number_host_atoms = df_charge.shape[0] - number_guest_atoms
+        df_charge_guest = df_charge.head(number_guest_atoms)
+        df_charge_host = df_charge.tail(number_host_atoms)
+        df_charge_only_guest = df_charge_guest["Charge"]
+        df_charge_guest.to_csv(
+            self.qm_guest_charge_parameter_file,
+            index=False,
+            header=False,
+            sep=" ",
+            float_format="%.6f",
+        )
+        df_charge_host.to_csv(
+            self.qm_host_charge_parameter_file,
+            index=False,
+            header=False,
+            sep=" ",
+            float_format="%.6f",
+        )
+        df_charge_only_guest.to_csv(
+            self.qm_guest_atom_charge_parameter_file,
+            index=False,
+            header=False,
+            sep=" ",
+            float_format="%.6f",
+        )
 
 
-class PrepareGaussianHostGuest:
+class FchkFile:
 
     """
-    A class used to prepare the QM engine input file (Gaussian) for
-    the receptor - ligand complex and run the QM calculations with
-    the appropriate keywords.
+    A class used to read Gaussian formatted checkpoint (.fchk) files.
 
-    This class contain methods to write an input file (.com extension)
-    for the QM engine for the receptor - ligand complex. It then runs
-    a QM calculation with the given basis set and functional. Checkpoint
-    file is then converted to a formatted checkpoint file. Output files
-    (.log, .chk, and .fhck) will then be used to extract charges for the
-    ligand and the receptor.
+    The file is streamed once when the object is created to build an
+    index of all of its sections. Scalar sections are stored directly
+    while only the byte offsets of the integer (I) and real (R) array
+    sections are recorded. Arrays are parsed into NumPy arrays on
+    demand and kept for later requests, e.g.
+    fchk["Cartesian Force Constants"] returns the packed lower
+    triangle of the hessian as a float64 array.
 
     ...
 
     Attributes
     ----------
-    charge : int, optional
-        Total charge of the receptor - ligand complex.
+    fchk_file: str
+        Formatted checkpoint file.
+
+    title: str
+        Title of the job (first line of the file).
+
+    job: str
+        Job type, method and basis set (second line of the file).
+
+    sections: dict
+        Maps the name of each section to a tuple of its data type
+        ("I", "R", "C", "L" or "H"), its number of values and either
+        its value (scalar sections) or the byte offsets of the
+        beginning and the end of its data (array sections).
+
+    """
+
+    # Number of values per line for each type of array section
+    values_per_line = {"I": 6, "R": 5, "C": 5, "L": 72, "H": 9}
+    dtypes = {"I": np.int64, "R": np.float64}
+    # Formatted checkpoint files most recently read, keyed by path
+    cache = FileCache()
+
+    def __init__(self, fchk_file):
+
+        self.fchk_file = fchk_file
+        self.sections = {}
+        self.arrays = {}
+        with open(self.fchk_file, "rb") as f:
+            self.title = f.readline().decode().strip()
+            self.job = f.readline().decode().strip()
+            offset = f.tell()
+            line = f.readline()
+            while line:
+                offset = offset + len(line)
+                line = line.decode()
+                name = line[:40].strip()
+                data_type = line[43]
+                if line[47:49] == "N=":
+                    size = int(line[49:])
+                    n_lines = int(
+                        math.ceil(size / self.values_per_line[data_type])
+                    )
+                    begin = offset
+                    for i in range(n_lines):
+                        offset = offset + len(f.readline())
+                    self.sections[name] = (data_type, size, (begin, offset))
+                else:
+                    value = line[49:].strip()
+                    if data_type == "I":
+                        value = int(value)
+                    elif data_type == "R":
+                        value = float(value)
+                    self.sections[name] = (data_type, 1, value)
+                line = f.readline()
+
+    @classmethod
+    def load(cls, fchk_file):
+        """
+        Returns the FchkFile object for a formatted checkpoint file,
+        reusing the one already read as long as the file has not
+        been modified since.
+        """
+        path = os.path.abspath(fchk_file)
+        stat = os.stat(path)
+        mtime = (stat.st_mtime_ns, stat.st_size)
+        if path not in cls.cache or cls.cache[path][0] != mtime:
+            cls.cache[path] = (mtime, cls(fchk_file))
+        return cls.cache[path][1]
+
+    def __contains__(self, name):
+        return name in self.sections
+
+    def __getitem__(self, name):
+        """
+        Returns the value of a scalar section, or the values of an
+        integer or real array section as a NumPy array.
+        """
+        data_type, size, value = self.sections[name]
+        if not isinstance(value, tuple):
+            return value
+        if data_type not in self.dtypes:
+            raise ValueError(
+                "Only integer and real array sections can be read, "
+                + name
+                + " is of type "
+                + data_type
+            )
+        if name not in self.arrays:
+            begin, end = value
+            with open(self.fchk_file, "rb") as f:
+                f.seek(begin)
+                data = f.read(end - begin)
+            array = np.fromstring(data, dtype=self.dtypes[data_type], sep=" ")
+            if array.size != size:
+                raise ValueError(
+                    "Expected " + str(size) + " values for " + name
+                )
+            self.arrays[name] = array
+        return self.arrays[name]
 
-    multiplicity : int, optional
-        Spin Multiplicity (2S+1) of the ligand where S represents
-        the total spin of the ligand.
+    def keys(self):
+        """
+        Returns the names of all the sections of the file.
+        """
+        return self.sections.keys()
 
-    guest_pdb : str, optional
-        Ligand PDB file with atom numbers beginning from 1.
 
-    host_qm_pdb : str, optional
-        PDB file for the receptor's QM region.
+def unpack_hessian(packed_hessian):
 
-    n_processors : int, optional
-        Number of processors to be used for Gaussian program to run and
-        set in %NProcShared command of Gaussian.
+    """
+    Returns the symmetric hessian matrix from its lower triangle
+    packed row by row, as stored in formatted checkpoint files.
 
-    memory : int, optional
-        Memory (in GB) to be used set in %Mem command of Gaussian.
+    Parameters
+    ----------
+    packed_hessian : (3N * (3N + 1) / 2, ) array
+        Lower triangle of the hessian matrix.
 
-    functional: str, optional
-        Exchange/Correlation or hybrid functional to use in the Gaussian
-        QM calculation.
+    Returns
+    -------
+    hessian : (3N, 3N) array
+        Symmetric hessian matrix.
 
-    basis_set: str, optional
-        Basis set to use for the Gaussian QM calculation.
+    """
+    length_hessian = int(
+        round((math.sqrt(8 * len(packed_hessian) + 1) - 1) / 2)
+    )
+    hessian = np.zeros((length_hessian, length_hessian))
+    lower_i, lower_j = np.tril_indices(length_hessian)
+    hessian[lower_i, lower_j] = packed_hessian
+    hessian[lower_j, lower_i] = packed_hessian
+    return hessian
 
-    optimisation: str, optional
-        set to "OPT" to perform a geometry optimization on the ligand
-        specified in the system; else set to an empty string.
 
-    frequency: str, optional
-        set to "FREQ" for Gaussian to perform a frequency calculation;
-        else set to an empty string.
+def load_hessian(fchk_file):
 
-    add_keywords_I: str, optional
-        Specifies the integration grid.
+    """
+    Returns the hessian matrix (in kcal/mol/Angstrom^2) of a formatted
+    checkpoint file as a read-only memory-mapped array.
 
-    add_keywords_II: str, optional
-        Specifies the QM engine to select one of the methods for
-        analyzing the electron density of the system. Methods used
-        are based on fitting the molecular electrostatic potential.
-        Methods used are : POP=CHELPG (Charges from Electrostatic
-        Potentials using a Grid based method) and POP=MK
-        (Merz-Singh-Kollman scheme)
+    The unpacked hessian is cached in a binary .npy file next to the
+    formatted checkpoint file, with a stamp file holding the
+    modification time (in ns) and size of the latter. The cache is
+    rebuilt whenever the formatted checkpoint file changes. The new
+    .npy file is written to a temporary file and then moved in place,
+    so that the arrays mapped by earlier calls are left untouched.
 
-    add_keywords_III: str, optional
-        Used to include the IOp keyword (to set the internal options to
-        specific values) in the Gaussian command.
+    Parameters
+    ----------
+    fchk_file : str
+        Formatted checkpoint file.
 
-    gauss_system_out_file : str, optional
-        This file contains the output script obtained after running
-        the Gaussian QM calculation.
+    Returns
+    -------
+    hessian : (3N, 3N) numpy.memmap
+        Hessian matrix.
+
+    """
+    hessian_npy = os.path.splitext(fchk_file)[0] + "_hessian.npy"
+    hessian_stamp = os.path.splitext(fchk_file)[0] + "_hessian_stamp.txt"
+    stat = os.stat(fchk_file)
+    fchk_stamp = str(stat.st_mtime_ns) + " " + str(stat.st_size)
+    cached_stamp = None
+    if os.path.exists(hessian_npy) and os.path.exists(hessian_stamp):
+        with open(hessian_stamp, "r") as f:
+            cached_stamp = f.read().strip()
+    if cached_stamp != fchk_stamp:
+        fchk = FchkFile.load(fchk_file)
+        hessian = unpack_hessian(fchk["Cartesian Force Constants"])
+        hessian = (hessian * HARTREE_PER_KCAL_MOL) / (
+            BOHRS_PER_ANGSTROM ** 2
+        )  # Change from Hartree/bohr to kcal/mol/ang
+        with open(hessian_npy + ".tmp", "wb") as f:
+            np.save(f, hessian)
+        os.replace(hessian_npy + ".tmp", hessian_npy)
+        with open(hessian_stamp + ".tmp", "w") as f:
+            f.write(fchk_stamp)
+        os.replace(hessian_stamp + ".tmp", hessian_stamp)
+    return np.load(hessian_npy, mmap_mode="r")
 
-    fchk_system_out_file : str, optional
-        Formatted checkpoint file obtained from the checkpoint file
-        using formchk command.
 
-    host_guest_input : str, optional
-        Gaussian input file (.com extension) for the receptor - ligand
-        QM region.
+class GaussianLog:
 
-    qm_guest_charge_parameter_file : str, optional
-        File containing the charges of ligand atoms and their corresponding
-        atoms. Charge obtained are the polarised charged due to the
-        surrounding receptor's region.
+    """
+    A class used to read Gaussian log (.log) files.
 
-    qm_host_charge_parameter_file : str, optional
-        File containing the charges of the QM region of the receptor.
+    Log files of optimization and frequency calculations can be
+    hundreds of MB long, so the file is memory-mapped instead of being
+    read and only the last occurrence of each block needed is located,
+    by searching backwards from the end of the file. Only these
+    regions are parsed into NumPy arrays, which are kept for later
+    requests.
 
-    qm_guest_atom_charge_parameter_file : str, optional
-        File containing the charges of ligand atoms. Charge obtained
-        are the polarised charged due to the surrounding receptor's region.
+    ...
+
+    Attributes
+    ----------
+    log_file: str
+        Gaussian log file.
+
+    blocks: dict
+        Blocks already parsed, keyed by name.
+
+    """
+
+    # First line of the table of the redundant internal coordinates
+    internal_coordinates_header = (
+        b"! Name  Definition              Value          Derivative Info."
+        b"                !"
+    )
+    esp_charges_begin = b"Fitting point charges to electrostatic potential"
+    esp_charges_end = b" Sum of ESP charges ="
+    esp_charge_dtype = np.dtype(
+        [
+            ("atom_number", np.int64),
+            ("element_symbol", "U2"),
+            ("charge", np.float64),
+        ]
+    )
+    # Log files most recently read, keyed by path
+    cache = FileCache()
+
+    def __init__(self, log_file):
+
+        self.log_file = log_file
+        self.blocks = {}
+
+    @classmethod
+    def load(cls, log_file):
+        """
+        Returns the GaussianLog object for a log file, reusing the one
+        already read as long as the file has not been modified since.
+        """
+        path = os.path.abspath(log_file)
+        stat = os.stat(path)
+        mtime = (stat.st_mtime_ns, stat.st_size)
+        if path not in cls.cache or cls.cache[path][0] != mtime:
+            cls.cache[path] = (mtime, cls(log_file))
+        return cls.cache[path][1]
+
+    def get_internal_coordinates(self):
+        """
+        Returns the bonds (N, 2) and the angles (M, 3) of the last
+        table of redundant internal coordinates, as atom indices
+        starting from 0.
+        """
+        if "internal_coordinates" not in self.blocks:
+            bond_list = []
+            angle_list = []
+            with open(self.log_file, "rb") as f, mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mm:
+                begin = mm.rfind(self.internal_coordinates_header)
+                if begin == -1:
+                    raise ValueError(
+                        "No redundant internal coordinates in "
+                        + self.log_file
+                    )
+                mm.seek(begin)
+                # Skips the header and the line below it
+                mm.readline()
+                mm.readline()
+                line = mm.readline().split()
+                # Stops when all bond and angles recorded
+                while len(line) > 2 and line[1][:1] in [b"R", b"A"]:
+                    # Subtraction due to python array indexing at 0
+                    x = [int(i) - 1 for i in line[2][2:-1].split(b",")]
+                    if line[1][:1] == b"R":
+                        bond_list.append(x)
+                    else:
+                        angle_list.append(x)
+                    line = mm.readline().split()
+            self.blocks["internal_coordinates"] = (
+                np.array(bond_list, dtype=np.int64).reshape(-1, 2),
+                np.array(angle_list, dtype=np.int64).reshape(-1, 3),
+            )
+        return self.blocks["internal_coordinates"]
+
+    def get_esp_charges(self):
+        """
+        Returns the last ESP charges of the log file as a structured
+        array with fields atom_number, element_symbol and charge.
+        """
+        if "esp_charges" not in self.blocks:
+            with open(self.log_file, "rb") as f, mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mm:
+                end = mm.rfind(self.esp_charges_end)
+                begin = mm.rfind(self.esp_charges_begin, 0, end)
+                if end == -1 or begin == -1:
+                    raise ValueError("No ESP charges in " + self.log_file)
+                mm.seek(begin)
+                # Skips the title, the RMS, "ESP charges:" and the
+                # column number lines
+                for i in range(4):
+                    mm.readline()
+                rows = mm[mm.tell() : end].split()
+            self.blocks["esp_charges"] = np.array(
+                [
+                    (int(rows[i]), rows[i + 1].decode(), float(rows[i + 2]))
+                    for i in range(0, len(rows), 3)
+                ],
+                dtype=self.esp_charge_dtype,
+            )
+        return self.blocks["esp_charges"]
+
+
+def get_bonds_angles(element_symbols, coords, bond_factor=1.2):
+
+    """
+    Returns the bonds and angles of a molecule from its coordinates,
+    in the order of the redundant internal coordinates of Gaussian.
+
+    Two atoms are bonded when their distance is shorter than
+    bond_factor times the sum of their covalent radii. Bonds are sorted
+    by their atom indices and angles are grouped by their central atom.
+
+    Parameters
+    ----------
+    element_symbols : (N, ) array
+        Element symbols of the atoms.
+
+    coords : (N, 3) array
+        Coordinates of the atoms (in Angstrom).
+
+    bond_factor : float, optional
+        Tolerance on the sum of the covalent radii.
+
+    Returns
+    -------
+    bond_list : (M, 2) array
+        Atom indices (starting from 0) of the bonds.
+
+    angle_list : (L, 3) array
+        Atom indices (starting from 0) of the angles.
+
+    """
+    element_symbols = [i.strip().title() for i in element_symbols]
+    # Covalent radii from pm to Angstrom
+    radii = {
+        i: element(i).covalent_radius / 100.0 for i in set(element_symbols)
+    }
+    radius = np.array([radii[i] for i in element_symbols])
+    coords = np.asarray(coords, dtype=float)
+    distances = np.linalg.norm(
+        coords[:, np.newaxis, :] - coords[np.newaxis, :, :], axis=-1
+    )
+    bonded = distances < bond_factor * (
+        radius[:, np.newaxis] + radius[np.newaxis, :]
+    )
+    np.fill_diagonal(bonded, False)
+    bond_list = np.argwhere(np.triu(bonded))
+    angle_list = [
+        [i, center, k]
+        for center in range(len(coords))
+        for i, k in itertools.combinations(np.flatnonzero(bonded[center]), 2)
+    ]
+    return bond_list, np.array(angle_list, dtype=int).reshape(-1, 3)
+
+
+def get_esp_fitting_points(
+    element_symbols, coords, layers=(1.4, 1.6, 1.8, 2.0), density=6.0
+):
+
+    """
+    Returns the points where the electrostatic potential is fitted,
+    following the Merz-Kollman scheme: points are placed on spheres
+    of layers times the Merz-Kollman radius around each atom, keeping
+    only those outside the spheres of the other atoms.
+
+    Parameters
+    ----------
+    element_symbols : (N, ) array
+        Element symbols of the atoms.
+
+    coords : (N, 3) array
+        Coordinates of the atoms (in Angstrom).
+
+    layers : tuple, optional
+        Scaling factors of the radii of the successive layers.
+
+    density : float, optional
+        Number of points per square Angstrom. The default matches
+        the grid of the Gaussian calculations (IOP(6/42=6)).
+
+    Returns
+    -------
+    points : (P, 3) array
+        Coordinates of the fitting points (in Angstrom).
+
+    """
+    element_symbols = [i.strip().title() for i in element_symbols]
+    # Van der Waals radii (from pm) for the elements without a
+    # Merz-Kollman radius
+    radii = {
+        i: merz_kollman_radii.get(i, element(i).vdw_radius / 100.0)
+        for i in set(element_symbols)
+    }
+    radius = np.array([radii[i] for i in element_symbols])
+    coords = np.asarray(coords, dtype=float)
+    tree = cKDTree(coords)
+    points = []
+    for layer in layers:
+        for i in range(len(coords)):
+            layer_radius = layer * radius[i]
+            n_points = max(int(4 * np.pi * layer_radius ** 2 * density), 1)
+            # Points evenly spread on the sphere by a golden spiral
+            z = 1 - (2 * np.arange(n_points) + 1) / n_points
+            phi = np.pi * (3 - np.sqrt(5)) * np.arange(n_points)
+            sphere = np.column_stack(
+                [
+                    np.sqrt(1 - z ** 2) * np.cos(phi),
+                    np.sqrt(1 - z ** 2) * np.sin(phi),
+                    z,
+                ]
+            )
+            sphere = coords[i] + layer_radius * sphere
+            # Only the atoms whose scaled spheres can reach this
+            # sphere are compared with its points
+            neighbors = np.array(
+                [
+                    k
+                    for k in tree.query_ball_point(
+                        coords[i], layer_radius + layer * radius.max()
+                    )
+                    if k != i
+                ],
+                dtype=int,
+            )
+            distances = np.linalg.norm(
+                sphere[:, np.newaxis, :] - coords[np.newaxis, neighbors, :],
+                axis=-1,
+            )
+            inside = np.any(distances < layer * radius[neighbors], axis=1)
+            points.append(sphere[~inside])
+    return np.concatenate(points)
+
+
+def fit_esp_charges(coords, points, esp, total_charge=0):
+
+    """
+    Returns the atomic charges reproducing the electrostatic potential
+    at the fitting points in the least squares sense, constrained to
+    the total charge of the molecule.
+
+    Parameters
+    ----------
+    coords : (N, 3) array
+        Coordinates of the atoms (in Angstrom).
+
+    points : (P, 3) array
+        Coordinates of the fitting points (in Angstrom).
+
+    esp : (P, ) array
+        Electrostatic potential at the fitting points (in atomic
+        units).
+
+    total_charge : int, optional
+        Total charge of the molecule.
+
+    Returns
+    -------
+    charges : (N, ) array
+        Atomic charges.
+
+    """
+    # Inverse distances in atomic units
+    inverse_distances = BOHRS_PER_ANGSTROM / np.linalg.norm(
+        np.asarray(points)[:, np.newaxis, :]
+        - np.asarray(coords)[np.newaxis, :, :],
+        axis=-1,
+    )
+    n_atoms = inverse_distances.shape[1]
+    # Normal equations with a Lagrange multiplier for the total charge
+    a = np.ones((n_atoms + 1, n_atoms + 1))
+    a[:n_atoms, :n_atoms] = inverse_distances.T @ inverse_distances
+    a[n_atoms, n_atoms] = 0.0
+    b = np.append(inverse_distances.T @ np.asarray(esp), total_charge)
+    return np.linalg.solve(a, b)[:n_atoms]
+
+
+class Psi4QM:
+
+    """
+    A class used to run the QM calculations of the ligand or of the
+    receptor QM region in process with the psi4 Python API, as an
+    alternative to Gaussian.
+
+    The geometry optimization, the hessian and the ESP charges are
+    computed in one run and kept in memory, so that no checkpoint file
+    has to be converted or parsed. The results are exposed through the
+    same interface as the Gaussian output readers: the sections of
+    the formatted checkpoint file used by QMMMReBind (FchkFile) and the
+    internal coordinates and ESP charges of the log file
+    (GaussianLog), so that the object can be passed as qm_engine to
+    ParameterizeGuest and ParameterizeHost. psi4 is only imported
+    when the calculation is run.
+
+    ...
+
+    Attributes
+    ----------
+    pdb_file: str
+        PDB file of the ligand or of the receptor QM region.
+
+    charge: int, optional
+        Charge of the system.
+
+    multiplicity: int, optional
+        Spin multiplicity of the system.
+
+    functional: str, optional
+        Exchange/Correlation or hybrid functional to use in the QM
+        calculation.
+
+    basis_set: str, optional
+        Basis set to use for the QM calculation.
+
+    optimisation: bool, optional
+        If True, the geometry is optimized before the hessian and the
+        ESP charges are computed.
+
+    n_threads: int, optional
+        Number of threads used by psi4.
+
+    memory: int, optional
+        Memory (in GB) used by psi4.
+
+    psi4_output_file: str, optional
+        Output file of psi4.
+
+    esp_density: float, optional
+        Number of ESP fitting points per square Angstrom. The default
+        of 6 points matches the Merz-Kollman grid requested from
+        Gaussian with IOP(6/33=2,6/42=6), so that the charges of both
+        engines are comparable.
+
+    sections: dict
+        Results of the calculation, keyed by the name of the
+        corresponding section of the formatted checkpoint file.
+
+    blocks: dict
+        Internal coordinates and ESP charges of the calculation, keyed
+        as in GaussianLog.
 
     """
 
     def __init__(
         self,
+        pdb_file,
         charge=0,
         multiplicity=1,
-        guest_pdb="guest_init_II.pdb",
-        host_qm_pdb="host_qm.pdb",
-        n_processors=12,
-        memory=50,
         functional="B3LYP",
         basis_set="6-31G",
-        optimisation="",
-        frequency="",
-        add_keywords_I="INTEGRAL=(GRID=ULTRAFINE)",
-        add_keywords_II="POP(MK,READRADII)",
-        add_keywords_III="IOP(6/33=2,6/42=6) SCRF=PCM",
-        gauss_system_out_file="system_qm.out",
-        fchk_system_out_file="system_qm_fchk.out",
-        host_guest_input="host_guest.com",
-        qm_guest_charge_parameter_file="guest_qm_surround_charges.txt",
-        qm_host_charge_parameter_file="host_qm_surround_charges.txt",
-        qm_guest_atom_charge_parameter_file="guest_qm_atom_surround_charges.txt",
+        optimisation=True,
+        n_threads=1,
+        memory=2,
+        psi4_output_file=None,
+        esp_density=6.0,
     ):
 
-        self.charge = charge
-        self.multiplicity = multiplicity
-        self.guest_pdb = guest_pdb
-        self.host_qm_pdb = host_qm_pdb
-        self.n_processors = n_processors
-        self.memory = memory
+        self.pdb_file = pdb_file
+        self.charge = charge
+        self.multiplicity = multiplicity
         self.functional = functional
         self.basis_set = basis_set
         self.optimisation = optimisation
-        self.frequency = frequency
-        self.add_keywords_I = add_keywords_I
-        self.add_keywords_II = add_keywords_II
-        self.add_keywords_III = add_keywords_III
-        self.gauss_system_out_file = gauss_system_out_file
-        self.fchk_system_out_file = fchk_system_out_file
-        self.host_guest_input = host_guest_input
-        self.qm_guest_charge_parameter_file = qm_guest_charge_parameter_file
-        self.qm_host_charge_parameter_file = qm_host_charge_parameter_file
-        self.qm_guest_atom_charge_parameter_file = (
-            qm_guest_atom_charge_parameter_file
-        )
+        self.n_threads = n_threads
+        self.memory = memory
+        self.psi4_output_file = psi4_output_file
+        if self.psi4_output_file is None:
+            self.psi4_output_file = self.pdb_file[:-4] + "_psi4.out"
+        self.esp_density = esp_density
+        self.sections = {}
+        self.blocks = {}
+
+    def run(self):
+        """
+        Runs the QM calculation (only once) and returns the object.
+        """
+        if self.sections:
+            return self
+        import psi4
+
+        atoms = PdbFile.load(self.pdb_file).records("ATOM")
+        element_symbols = [i.strip().title() for i in atoms["element_symbol"]]
+        psi4.core.set_output_file(self.psi4_output_file, False)
+        psi4.set_num_threads(self.n_threads)
+        psi4.set_memory(str(self.memory) + " GB")
+        psi4.set_options(
+            {
+                "basis": self.basis_set,
+                "reference": "rhf" if self.multiplicity == 1 else "uhf",
+            }
+        )
+        # The orientation of the PDB file is kept so that the results
+        # map back to its atoms
+        molecule = psi4.core.Molecule.from_arrays(
+            geom=atoms["xyz"],
+            elem=element_symbols,
+            molecular_charge=self.charge,
+            molecular_multiplicity=self.multiplicity,
+            units="Angstrom",
+            fix_com=True,
+            fix_orientation=True,
+            fix_symmetry="c1",
+        )
+        if self.optimisation:
+            psi4.optimize(self.functional, molecule=molecule)
+        energy, wfn = psi4.energy(
+            self.functional, molecule=molecule, return_wfn=True
+        )
+        hessian = psi4.hessian(
+            self.functional, molecule=molecule, ref_wfn=wfn
+        ).np
+        geometry = molecule.geometry().np
+        coords = geometry * psi4.constants.bohr2angstroms
+        points = get_esp_fitting_points(
+            element_symbols, coords, density=self.esp_density
+        )
+        # The points are read in the units of the molecule (Angstrom)
+        esp = (
+            psi4.core.ESPPropCalc(wfn)
+            .compute_esp_over_grid_in_memory(
+                psi4.core.Matrix.from_array(points)
+            )
+            .np.ravel()
+        )
+        charges = fit_esp_charges(coords, points, esp, self.charge)
+        print(
+            "ESP charges of "
+            + self.pdb_file
+            + " fitted at "
+            + str(len(points))
+            + " points"
+        )
+        lower_i, lower_j = np.tril_indices(len(hessian))
+        self.sections = {
+            "Number of atoms": len(atoms),
+            "Total Energy": energy,
+            "Atomic numbers": np.array(
+                [int(molecule.Z(i)) for i in range(molecule.natom())]
+            ),
+            "Current cartesian coordinates": geometry.ravel(),
+            "Cartesian Force Constants": hessian[lower_i, lower_j],
+        }
+        self.blocks = {
+            "internal_coordinates": get_bonds_angles(element_symbols, coords),
+            "esp_charges": np.array(
+                list(zip(range(1, len(atoms) + 1), element_symbols, charges)),
+                dtype=GaussianLog.esp_charge_dtype,
+            ),
+        }
+        return self
 
-    def write_input(self):
+    def __getitem__(self, name):
+        return self.run().sections[name]
+
+    def keys(self):
         """
-        Writes a Gaussian input file for the receptor - ligand QM region.
+        Returns the names of all the sections of the results.
         """
-        command_line_1 = "%Chk = " + self.host_guest_input[:-4] + ".chk"
-        command_line_2 = "%Mem = " + str(self.memory) + "GB"
-        command_line_3 = "%NProcShared = " + str(self.n_processors)
-        command_line_4 = (
-            "# "
-            + self.functional
-            + " "
-            + self.basis_set
-            + " "
-            + self.optimisation
-            + " "
-            + self.frequency
-            + " "
-            + self.add_keywords_I
-            + " "
-            + self.add_keywords_II
-            + " "
-            + self.add_keywords_III
-        )
-        command_line_5 = " "
-        command_line_6 = "Gaussian Input File"
-        command_line_7 = " "
-        command_line_8 = str(self.charge) + " " + str(self.multiplicity)
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.guest_pdb)
-        df = ppdb.df["ATOM"]
-        df_1 = ppdb.df["ATOM"]["element_symbol"]
-        df_1.columns = ["atom"]
-        df_3 = df[["x_coord", "y_coord", "z_coord"]]
-        df_2 = pd.Series(["0"] * len(df), name="decide_freeze")
-        df_merged_1 = pd.concat([df_1, df_2, df_3], axis=1)
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.host_qm_pdb)
-        df = ppdb.df["ATOM"]
-        df_1 = ppdb.df["ATOM"]["element_symbol"]
-        df_1.columns = ["atom"]
-        df_3 = df[["x_coord", "y_coord", "z_coord"]]
-        df_2 = pd.Series(["0"] * len(df), name="decide_freeze")
-        df_merged_2 = pd.concat([df_1, df_2, df_3], axis=1)
-        df_merged = pd.concat([df_merged_1, df_merged_2], axis=0)
-        command_line_9 = df_merged.to_string(header=False, index=False)
-        command_line_10 = " "
-        command = [
-            command_line_1,
-            command_line_2,
-            command_line_3,
-            command_line_4,
-            command_line_5,
-            command_line_6,
-            command_line_7,
-            command_line_8,
-            command_line_9,
-            command_line_10,
-        ]
-        commands = "\n".join(command)
+        return self.run().sections.keys()
 
-        with open(self.host_guest_input, "w") as f:
-            f.write(commands)
+    def get_internal_coordinates(self):
+        """
+        Returns the bonds (N, 2) and the angles (M, 3) of the optimized
+        geometry, as atom indices starting from 0.
+        """
+        return self.run().blocks["internal_coordinates"]
 
-    def run_gaussian(self):
+    def get_esp_charges(self):
         """
-        Runs the Gaussian QM calculation for the ligand - receptor region
-        locally.
+        Returns the ESP charges as a structured array with fields
+        atom_number, element_symbol and charge.
         """
-        execute_command = (
-            "g16"
-            + " < "
-            + self.host_guest_input
-            + " > "
-            + self.host_guest_input[:-4]
-            + ".log"
-        )
-        with open(self.gauss_system_out_file, "w+") as f:
-            sp.run(
-                execute_command, shell=True, stdout=f, stderr=sp.STDOUT,
-            )
+        return self.run().blocks["esp_charges"]
 
-    def get_fchk(self):
+    def get_hessian(self):
         """
-        Converts the Gaussian checkpoint file (.chk) to a formatted checkpoint
-        file (.fchk).
+        Returns the hessian matrix (in kcal/mol/Angstrom^2).
         """
-        execute_command = (
-            "formchk"
-            + " "
-            + self.host_guest_input[:-4]
-            + ".chk"
-            + " "
-            + self.host_guest_input[:-4]
-            + ".fchk"
+        hessian = unpack_hessian(self["Cartesian Force Constants"])
+        return (hessian * HARTREE_PER_KCAL_MOL) / (
+            BOHRS_PER_ANGSTROM ** 2
+        )  # Change from Hartree/bohr to kcal/mol/ang
+
+
+class BondedTopology:
+
+    """
+    A class used to hold the bonded graph of a molecule.
+
+    The bonds are stored once as adjacency arrays in compressed sparse
+    row form: the neighbors of atom i are
+    indices[indptr[i] : indptr[i + 1]], in ascending order. Proper
+    dihedrals are then enumerated by walking the bonds instead of
+    testing every permutation of four atoms.
+
+    ...
+
+    Attributes
+    ----------
+    bond_list: (M, 2) numpy.ndarray
+        Atom indices (starting from 0) of the bonds.
+
+    n_atoms: int
+        Number of atoms of the molecule.
+
+    indptr: (n_atoms + 1, ) numpy.ndarray
+        Offsets of the neighbors of each atom in indices.
+
+    indices: (2M, ) numpy.ndarray
+        Neighbors of all the atoms.
+
+    """
+
+    # Bonded topologies most recently read, keyed by path
+    cache = FileCache()
+
+    def __init__(self, bond_list, n_atoms=None):
+
+        self.bond_list = np.asarray(bond_list, dtype=np.int64).reshape(-1, 2)
+        self.n_atoms = n_atoms
+        if self.n_atoms is None:
+            self.n_atoms = int(self.bond_list.max(initial=-1)) + 1
+        pairs = np.concatenate([self.bond_list, self.bond_list[:, ::-1]])
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        self.indptr = np.searchsorted(
+            pairs[:, 0], np.arange(self.n_atoms + 1)
         )
-        with open(self.fchk_system_out_file, "w+") as f:
-            sp.run(
-                execute_command, shell=True, stdout=f, stderr=sp.STDOUT,
+        self.indices = pairs[:, 1]
+
+    @classmethod
+    def load(cls, bond_parameter_file):
+        """
+        Returns the bonded topology of a bond parameter file (the atom
+        numbers starting from 1 being in its last two columns), reusing
+        the one already read as long as the file has not been modified
+        since.
+        """
+        path = os.path.abspath(bond_parameter_file)
+        stat = os.stat(path)
+        mtime = (stat.st_mtime_ns, stat.st_size)
+        if path not in cls.cache or cls.cache[path][0] != mtime:
+            bond_list = np.loadtxt(
+                bond_parameter_file, usecols=(3, 4), dtype=int, ndmin=2
             )
+            cls.cache[path] = (mtime, cls(bond_list - 1))
+        return cls.cache[path][1]
 
-    def get_qm_host_guest_charges(self):
+    def neighbors(self, atom):
         """
-        Extract charge information for the receptor - ligand QM region.
+        Returns the atoms bonded to an atom.
         """
-        log_file = self.host_guest_input[:-4] + ".log"
-        with open(log_file, "r") as f:
-            lines = f.readlines()
-        for i in range(len(lines)):
-            if "Fitting point charges to electrostatic potential" in lines[i]:
-                to_begin = int(i)
-            if " Sum of ESP charges =" in lines[i]:
-                to_end = int(i)
-        
-        # Why + 4?
-        charges = lines[to_begin + 4 : to_end]
-        charge_list = []
-        for i in range(len(charges)):
-            charge_list.append(charges[i].strip().split())
-        charge_list_value = []
-        atom_list = []
-        for i in range(len(charge_list)):
-            charge_list_value.append(charge_list[i][2])
-            atom_list.append(charge_list[i][1])
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.guest_pdb)
-        df_guest = ppdb.df["ATOM"]
-        number_guest_atoms = df_guest.shape[0]
-        data_tuples = list(zip(atom_list, charge_list_value))
-        df_charge = pd.DataFrame(data_tuples, columns=["Atom", "Charge"])
-        number_host_atoms = df_charge.shape[0] - number_guest_atoms
-        df_charge_guest = df_charge.head(number_guest_atoms)
-        df_charge_host = df_charge.tail(number_host_atoms)
-        df_charge_only_guest = df_charge_guest["Charge"]
-        df_charge_guest.to_csv(
-            self.qm_guest_charge_parameter_file,
-            index=False,
-            header=False,
-            sep=" ",
-        )
-        df_charge_host.to_csv(
-            self.qm_host_charge_parameter_file,
-            index=False,
-            header=False,
-            sep=" ",
-        )
-        df_charge_only_guest.to_csv(
-            self.qm_guest_atom_charge_parameter_file,
-            index=False,
-            header=False,
-            sep=" ",
+        return self.indices[self.indptr[atom] : self.indptr[atom + 1]]
+
+    def is_bonded(self, atoms_i, atoms_j):
+        """
+        Returns whether atoms_i[n] and atoms_j[n] are bonded for each n.
+        """
+        atoms_i = np.asarray(atoms_i)
+        atoms_j = np.asarray(atoms_j)
+        # Bonds encoded as i * scale + j, sorted as the adjacency arrays
+        scale = max(self.n_atoms, int(np.max(atoms_j, initial=-1)) + 1)
+        keys = (
+            np.repeat(np.arange(self.n_atoms), np.diff(self.indptr)) * scale
+            + self.indices
         )
+        queries = atoms_i * scale + atoms_j
+        if len(keys) == 0:
+            return np.zeros(np.shape(queries), dtype=bool)
+        positions = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+        return keys[positions] == queries
+
+    def get_proper_dihedrals(self):
+        """
+        Returns the proper dihedrals (i, j, k, l) as atom indices
+        starting from 0, each listed once in the direction with i < l
+        and sorted.
+        """
+        proper_dihedrals = []
+        for atom_j in range(self.n_atoms):
+            for atom_k in self.neighbors(atom_j):
+                for atom_i in self.neighbors(atom_j):
+                    if atom_i == atom_k:
+                        continue
+                    for atom_l in self.neighbors(atom_k):
+                        # i < l skips the reverse direction and the
+                        # three-membered rings (i == l)
+                        if atom_l != atom_j and atom_i < atom_l:
+                            proper_dihedrals.append(
+                                [atom_i, atom_j, atom_k, atom_l]
+                            )
+        proper_dihedrals = np.array(proper_dihedrals, dtype=np.int64)
+        proper_dihedrals = proper_dihedrals.reshape(-1, 4)
+        return proper_dihedrals[np.lexsort(proper_dihedrals.T[::-1])]
 
 
 class ParameterizeGuest:
@@ -3492,6 +7386,17 @@ class ParameterizeGuest:
     basis_set: str, optional
         Basis set to use for the Gaussian QM calculation.
 
+    linear_angle_sampling: {"grid", "analytic"}, optional
+        Sampling of the unit sphere used for the force constants of
+        linear angles (see sphere_sampled_angle_constant).
+
+    linear_angle_samples: int, optional
+        Number of samples for the "analytic" linear angle sampling.
+
+    qm_engine: Psi4QM, optional
+        In-process QM calculation of the ligand whose results are used
+        instead of the Gaussian formatted checkpoint and log files.
+
     """
 
     def __init__(
@@ -3510,6 +7415,9 @@ class ParameterizeGuest:
         proper_dihedral_file="proper_dihedrals.txt",
         functional="B3LYP",
         basis_set="6-31G",
+        linear_angle_sampling="grid",
+        linear_angle_samples=360,
+        qm_engine=None,
     ):
 
         self.xyz_file = xyz_file
@@ -3526,57 +7434,55 @@ class ParameterizeGuest:
         self.proper_dihedral_file = proper_dihedral_file
         self.functional = functional
         self.basis_set = basis_set
+        self.linear_angle_sampling = linear_angle_sampling
+        self.linear_angle_samples = linear_angle_samples
+        self.qm_engine = qm_engine
+
+    def get_qm_checkpoint(self):
+        """
+        Returns the QM engine if given, otherwise the formatted
+        checkpoint file.
+        """
+        if self.qm_engine is not None:
+            return self.qm_engine.run()
+        return FchkFile.load(self.guest_pdb[:-4] + ".fchk")
+
+    def get_qm_log(self):
+        """
+        Returns the QM engine if given, otherwise the Gaussian log file.
+        """
+        if self.qm_engine is not None:
+            return self.qm_engine.run()
+        return GaussianLog.load(self.guest_pdb[:-4] + ".log")
+
+    def get_qm_hessian(self):
+        """
+        Returns the hessian matrix (in kcal/mol/Angstrom^2) from the QM
+        engine if given, otherwise from the formatted checkpoint file.
+        """
+        if self.qm_engine is not None:
+            return self.qm_engine.get_hessian()
+        return load_hessian(self.guest_pdb[:-4] + ".fchk")
 
     def get_xyz(self):
         """
         Saves XYZ file from the formatted checkpoint file.
         """
-        fchk_file = self.guest_pdb[:-4] + ".fchk"
-        with open(fchk_file, "r") as f:
-            lines = f.readlines()
-        for i in range(len(lines)):
-            if "Current cartesian coordinates" in lines[i]:
-                no_coordinates = re.findall(r"\d+|\d+.\d+", lines[i])
-                no_coordinates = int(no_coordinates[0])
-                to_begin = int(i)
-                
-        cartesian_coords = lines[
-            to_begin + 1 : to_begin + 1 + int(math.ceil(no_coordinates / 5))
-        ]
-        cartesian_list = []
-        for i in range(len(cartesian_coords)):
-            cartesian_list.append(cartesian_coords[i].strip().split())
-        
-        coordinates_list = [
-            item for sublist in cartesian_list for item in sublist
-        ]
+        fchk = self.get_qm_checkpoint()
         # Converted from Atomic units (Bohrs) to Angstroms
-        list_coords = [float(x) * BOHRS_PER_ANGSTROM for x in coordinates_list]
-        for i in range(len(lines)):
-            if "Atomic numbers" in lines[i]:
-                to_begin = int(i)
-            if "Nuclear charges" in lines[i]:
-                to_end = int(i)
-        atomic_number_strings = lines[to_begin + 1 : to_end]
-        atom_numbers_nested = []
-        for i in range(len(atomic_number_strings)):
-            atom_numbers_nested.append(atomic_number_strings[i].strip().split())
-        numbers = [item for sublist in atom_numbers_nested for item in sublist]
-        N = int(no_coordinates / 3)
+        coords = (
+            fchk["Current cartesian coordinates"].reshape(-1, 3)
+            * BOHRS_PER_ANGSTROM
+        )
+        numbers = fchk["Atomic numbers"]
+        N = len(coords)
         # Opens the new xyz file
         with open(self.xyz_file, "w") as file:
             file.write(str(N) + "\n \n")
-            coords = np.zeros((N, 3))
-            n = 0
-            names = []
             # Gives name for atomic number
-            for x in range(0, len(numbers)):
-                names.append(element_list[int(numbers[x]) - 1][1])
+            names = [element_list[number - 1][1] for number in numbers]
             # Print coordinates to new input_coords.xyz file
             for i in range(0, N):
-                for j in range(0, 3):
-                    coords[i][j] = list_coords[n]
-                    n = n + 1
                 file.write(
                     names[i]
                     + str(round(coords[i][0], 3))
@@ -3586,7 +7492,6 @@ class ParameterizeGuest:
                     + str(round(coords[i][2], 3))
                     + "\n"
                 )
-            
         np.savetxt(self.coordinate_file, coords, fmt="%s")
 
     def get_unprocessed_hessian(self):
@@ -3594,23 +7499,8 @@ class ParameterizeGuest:
         Saves a text file of the unprocessed hessian matrix from the
         formatted checkpoint file.
         """
-        fchk_file = self.guest_pdb[:-4] + ".fchk"
-        with open(fchk_file, "r") as f:
-            lines = f.readlines()
-        for i in range(len(lines)):
-            if "Cartesian Force Constants" in lines[i]:
-                no_hessian = re.findall(r"\d+|\d+.\d+", lines[i])
-                no_hessian = int(no_hessian[0])
-                to_begin = int(i)
-        hessian = lines[
-            to_begin + 1 : to_begin + 1 + int(math.ceil(no_hessian / 5))
-        ]
-        hessian_list = []
-        for i in range(len(hessian)):
-            hessian_list.append(hessian[i].strip().split())
-        unprocessed_Hessian = [
-            item for sublist in hessian_list for item in sublist
-        ]
+        fchk = self.get_qm_checkpoint()
+        unprocessed_Hessian = fchk["Cartesian Force Constants"]
         np.savetxt(
             self.unprocessed_hessian_file, unprocessed_Hessian, fmt="%s",
         )
@@ -3620,97 +7510,28 @@ class ParameterizeGuest:
         Saves a text file containing bonds and angles from the gaussian
         log file.
         """
-        log_file = self.guest_pdb[:-4] + ".log"
-        with open(log_file, "r") as fid:
-            tline = fid.readline()
-            bond_list = []
-            angle_list = []
-            tmp = "R"  # States if bond or angle
-            # Finds the bond and angles from the .log file
-            while tline:
-                tline = fid.readline()
-                # Line starts at point when bond and angle list occurs
-                if (
-                    len(tline) > 80
-                    and tline[0:81].strip()
-                    == "! Name  Definition              Value          Derivative Info.                !"
-                ):
-                    tline = fid.readline()
-                    tline = fid.readline()
-                    # Stops when all bond and angles recorded
-                    while (tmp[0] == "R") or (tmp[0] == "A"):
-                        line = tline.split()
-                        tmp = line[1]
-                        # Bond or angles listed as string
-                        list_terms = line[2][2:-1]
-                        # Bond List
-                        if tmp[0] == "R":
-                            x = list_terms.split(",")
-                            # Subtraction due to python array indexing at 0
-                            x = [(int(i) - 1) for i in x]
-                            bond_list.append(x)
-                            # Angle List
-                        if tmp[0] == "A":
-                            x = list_terms.split(",")
-                            # Subtraction due to python array indexing at 0
-                            x = [(int(i) - 1) for i in x]
-                            angle_list.append(x)
-                        tline = fid.readline()
-                    # Leave loop
-                    tline = -1
-            np.savetxt(self.bond_list_file, bond_list, fmt="%s")
-            np.savetxt(self.angle_list_file, angle_list, fmt="%s")
+        bond_list, angle_list = self.get_qm_log().get_internal_coordinates()
+        np.savetxt(self.bond_list_file, bond_list, fmt="%s")
+        np.savetxt(self.angle_list_file, angle_list, fmt="%s")
         
     def get_hessian(self):
         """
-        Extracts hessian matrix from the unprocessed hessian matrix
-        and saves into a new file.
+        Saves the hessian matrix obtained from the formatted
+        checkpoint file into a new file.
         """
-        unprocessed_Hessian = np.loadtxt(self.unprocessed_hessian_file)
-        fchk_file = self.guest_pdb[:-4] + ".fchk"
-        with open(fchk_file, "r") as f:
-            lines = f.readlines()
-        for i in range(len(lines)):
-            if "Current cartesian coordinates" in lines[i]:
-                no_coordinates = re.findall(r"\d+|\d+.\d+", lines[i])
-                no_coordinates = int(no_coordinates[0])
-        
-        N = int(no_coordinates / 3)
-        length_hessian = 3 * N
-        hessian = np.zeros((length_hessian, length_hessian))
-        m = 0
-        # Write the hessian in a 2D array format
-        for i in range(0, length_hessian):
-            for j in range(0, (i + 1)):
-                hessian[i][j] = unprocessed_Hessian[m]
-                hessian[j][i] = unprocessed_Hessian[m]
-                m = m + 1
-        hessian = (hessian * HARTREE_PER_KCAL_MOL) / (
-            BOHRS_PER_ANGSTROM ** 2
-        )  # Change from Hartree/bohr to kcal/mol/ang
+        hessian = self.get_qm_hessian()
         np.savetxt(self.hessian_file, hessian, fmt="%s")
 
     def get_atom_names(self):
         """
         Saves a list of atom names from the formatted checkpoint file.
         """
-        fchk_file = self.guest_pdb[:-4] + ".fchk"
-        with open(fchk_file, "r") as f:
-            lines = f.readlines()
-        for i in range(len(lines)):
-            if "Atomic numbers" in lines[i]:
-                to_begin = int(i)
-            if "Nuclear charges" in lines[i]:
-                to_end = int(i)
-        atomic_numbers = lines[to_begin + 1 : to_end]
-        atom_numbers = []
-        for i in range(len(atomic_numbers)):
-            atom_numbers.append(atomic_numbers[i].strip().split())
-        numbers = [item for sublist in atom_numbers for item in sublist]
+        fchk = self.get_qm_checkpoint()
+        numbers = fchk["Atomic numbers"]
         names = []
         # Gives name for atomic number
         for x in range(0, len(numbers)):
-            names.append(element_list[int(numbers[x]) - 1][1])
+            names.append(element_list[numbers[x] - 1][1])
         atom_names = []
         for i in range(0, len(names)):
             atom_names.append(names[i].strip() + str(i + 1))
@@ -3721,370 +7542,94 @@ class ParameterizeGuest:
         Saves the bond and angle parameter files obtained from
         the formatted checkpoint file.
         """
-        fchk_file = self.guest_pdb[:-4] + ".fchk"
-        with open(fchk_file, "r") as f:
-            lines = f.readlines()
-        for i in range(len(lines)):
-            if "Current cartesian coordinates" in lines[i]:
-                no_coordinates = re.findall(r"\d+|\d+.\d+", lines[i])
-                no_coordinates = int(no_coordinates[0])
-        N = int(no_coordinates / 3)
         coords = np.loadtxt(self.coordinate_file)
-        hessian = np.loadtxt(self.hessian_file)
-        bond_list = np.loadtxt(self.bond_list_file, dtype=int)
+        hessian = self.get_qm_hessian()
+        bond_list = np.loadtxt(self.bond_list_file, dtype=int).reshape(-1, 2)
+        angle_list = np.loadtxt(self.angle_list_file, dtype=int).reshape(
+            -1, 3
+        )
         atom_names = np.loadtxt(self.atom_names_file, dtype=str)
-        # Find bond lengths
-        bond_lengths = np.zeros((N, N))
-        for i in range(0, N):
-            for j in range(0, N):
-                diff_i_j = np.array(coords[i, :]) - np.array(coords[j, :])
-                bond_lengths[i][j] = np.linalg.norm(diff_i_j)
-        eigenvectors = np.empty((3, 3, N, N), dtype=complex)
-        eigenvalues = np.empty((N, N, 3), dtype=complex)
-        partial_hessian = np.zeros((3, 3))
-        for i in range(0, N):
-            for j in range(0, N):
-                partial_hessian = hessian[
-                    (i * 3) : ((i + 1) * 3), (j * 3) : ((j + 1) * 3)
-                ]
-                [a, b] = np.linalg.eig(partial_hessian)
-                eigenvalues[i, j, :] = a
-                eigenvectors[:, :, i, j] = b
-        # Modified Seminario method to find the bond parameters and
-        # print them to file
-        file_bond = open(self.bond_parameter_file, "w")
-        k_b = np.zeros(len(bond_list))
-        bond_length_list = np.zeros(len(bond_list))
-        unique_values_bonds = []  # Used to find average values
-        for i in range(0, len(bond_list)):
-            AB = force_constant_bond(
-                bond_list[i][0],
-                bond_list[i][1],
-                eigenvalues,
-                eigenvectors,
-                coords,
-            )
-            BA = force_constant_bond(
-                bond_list[i][1],
-                bond_list[i][0],
-                eigenvalues,
-                eigenvectors,
-                coords,
-            )
-            # Order of bonds sometimes causes slight differences,
-            # find the mean
-            k_b[i] = np.real((AB + BA) / 2)
-            # Vibrational_scaling takes into account DFT deficities /
-            # anharmocity
-            vibrational_scaling = get_vibrational_scaling(
-                functional=self.functional, basis_set=self.basis_set
-            )
-            vibrational_scaling_squared = vibrational_scaling ** 2
-            k_b[i] = k_b[i] * vibrational_scaling_squared
-            bond_length_list[i] = bond_lengths[bond_list[i][0]][
-                bond_list[i][1]
-            ]
-            file_bond.write(
-                atom_names[bond_list[i][0]]
-                + "-"
-                + atom_names[bond_list[i][1]]
-                + "  "
-            )
-            file_bond.write(
-                str("%#.5g" % k_b[i])
-                + "   "
-                + str("%#.4g" % bond_length_list[i])
-                + "   "
-                + str(bond_list[i][0] + 1)
-                + "   "
-                + str(bond_list[i][1] + 1)
-            )
-            file_bond.write("\n")
-            unique_values_bonds.append(
-                [
-                    atom_names[bond_list[i][0]],
-                    atom_names[bond_list[i][1]],
-                    k_b[i],
-                    bond_length_list[i],
-                    1,
-                ]
-            )
-        file_bond.close()
-        angle_list = np.loadtxt(self.angle_list_file, dtype=int)
-        # Modified Seminario method to find the angle parameters
-        # and print them to file
-        file_angle = open(self.angle_parameter_file, "w")
-        k_theta = np.zeros(len(angle_list))
-        theta_0 = np.zeros(len(angle_list))
-        unique_values_angles = []  # Used to find average values
-        # Modified Seminario part goes here ...
-        # Connectivity information for Modified Seminario Method
-        central_atoms_angles = []
-        # A structure is created with the index giving the central
-        # atom of the angle,
-        # an array then lists the angles with that central atom.
-        # i.e. central_atoms_angles{3} contains an array of angles
-        # with central atom 3
-        for i in range(0, len(coords)):
-            central_atoms_angles.append([])
-            for j in range(0, len(angle_list)):
-                if i == angle_list[j][1]:
-                    # For angle ABC, atoms A C are written to array
-                    AC_array = [angle_list[j][0], angle_list[j][2], j]
-                    central_atoms_angles[i].append(AC_array)
-                    # For angle ABC, atoms C A are written to array
-                    CA_array = [angle_list[j][2], angle_list[j][0], j]
-                    central_atoms_angles[i].append(CA_array)
-        # Sort rows by atom number
-        for i in range(0, len(coords)):
-            central_atoms_angles[i] = sorted(
-                central_atoms_angles[i], key=itemgetter(0)
-            )
-        # Find normals u_PA for each angle
-        unit_PA_all_angles = []
-        for i in range(0, len(central_atoms_angles)):
-            unit_PA_all_angles.append([])
-            for j in range(0, len(central_atoms_angles[i])):
-                # For the angle at central_atoms_angles[i][j,:] the
-                # corresponding u_PA value
-                # is found for the plane ABC and bond AB, where ABC
-                # corresponds to the order
-                # of the arguements. This is why the reverse order
-                # was also added
-                unit_PA_all_angles[i].append(
-                    u_PA_from_angles(
-                        central_atoms_angles[i][j][0],
-                        i,
-                        central_atoms_angles[i][j][1],
-                        coords,
-                    )
+        # Vibrational_scaling takes into account DFT deficities /
+        # anharmocity
+        vibrational_scaling = get_vibrational_scaling(
+            functional=self.functional, basis_set=self.basis_set
+        )
+        # Modified Seminario method to find the bond and angle parameters
+        k_b, bond_length_list, k_theta, theta_0 = modified_seminario_method(
+            coords=coords,
+            hessian=hessian,
+            bond_list=bond_list,
+            angle_list=angle_list,
+            vibrational_scaling=vibrational_scaling,
+            linear_angle_sampling=self.linear_angle_sampling,
+            linear_angle_samples=self.linear_angle_samples,
+        )
+        with open(self.bond_parameter_file, "w") as file_bond:
+            for i in range(0, len(bond_list)):
+                file_bond.write(
+                    atom_names[bond_list[i][0]]
+                    + "-"
+                    + atom_names[bond_list[i][1]]
+                    + "  "
                 )
-        # Finds the contributing factors from the other angle terms
-        # scaling_factor_all_angles
-        # = cell(max(max(angle_list))); %This array will contain
-        # scaling factor and angle list position
-        scaling_factor_all_angles = []
-        for i in range(0, len(central_atoms_angles)):
-            scaling_factor_all_angles.append([])
-            for j in range(0, len(central_atoms_angles[i])):
-                n = 1
-                m = 1
-                angles_around = 0
-                additional_contributions = 0
-                scaling_factor_all_angles[i].append([0, 0])
-                # Position in angle list
-                scaling_factor_all_angles[i][j][1] = central_atoms_angles[i][
-                    j
-                ][2]
-                # Goes through the list of angles with the same central atom
-                # and computes the
-                # term need for the modified Seminario method
-                # Forwards directions, finds the same bonds with the central atom i
-                while (
-                    ((j + n) < len(central_atoms_angles[i]))
-                    and central_atoms_angles[i][j][0]
-                    == central_atoms_angles[i][j + n][0]
-                ):
-                    additional_contributions = (
-                        additional_contributions
-                        + (
-                            abs(
-                                np.dot(
-                                    unit_PA_all_angles[i][j][:],
-                                    unit_PA_all_angles[i][j + n][:],
-                                )
-                            )
-                        )
-                        ** 2
-                    )
-                    n = n + 1
-                    angles_around = angles_around + 1
-                # Backwards direction, finds the same bonds with the central atom i
-                while ((j - m) >= 0) and central_atoms_angles[i][j][
-                    0
-                ] == central_atoms_angles[i][j - m][0]:
-                    additional_contributions = (
-                        additional_contributions
-                        + (
-                            abs(
-                                np.dot(
-                                    unit_PA_all_angles[i][j][:],
-                                    unit_PA_all_angles[i][j - m][:],
-                                )
-                            )
-                        )
-                        ** 2
-                    )
-                    m = m + 1
-                    angles_around = angles_around + 1
-                if n != 1 or m != 1:
-                    # Finds the mean value of the additional contribution to
-                    # change to normal
-                    # Seminario method comment out + part
-                    scaling_factor_all_angles[i][j][0] = 1 + (
-                        additional_contributions / (m + n - 2)
-                    )
-                else:
-                    scaling_factor_all_angles[i][j][0] = 1
-        scaling_factors_angles_list = []
-        for i in range(0, len(angle_list)):
-            scaling_factors_angles_list.append([])
-        # Orders the scaling factors according to the angle list
-        for i in range(0, len(central_atoms_angles)):
-            for j in range(0, len(central_atoms_angles[i])):
-                scaling_factors_angles_list[
-                    scaling_factor_all_angles[i][j][1]
-                ].append(scaling_factor_all_angles[i][j][0])
-        # Finds the angle force constants with the scaling factors
-        # included for each angle
-        for i in range(0, len(angle_list)):
-            # Ensures that there is no difference when the
-            # ordering is changed
-            [AB_k_theta, AB_theta_0] = force_angle_constant(
-                angle_list[i][0],
-                angle_list[i][1],
-                angle_list[i][2],
-                bond_lengths,
-                eigenvalues,
-                eigenvectors,
-                coords,
-                scaling_factors_angles_list[i][0],
-                scaling_factors_angles_list[i][1],
-            )
-            [BA_k_theta, BA_theta_0] = force_angle_constant(
-                angle_list[i][2],
-                angle_list[i][1],
-                angle_list[i][0],
-                bond_lengths,
-                eigenvalues,
-                eigenvectors,
-                coords,
-                scaling_factors_angles_list[i][1],
-                scaling_factors_angles_list[i][0],
-            )
-            k_theta[i] = (AB_k_theta + BA_k_theta) / 2
-            theta_0[i] = (AB_theta_0 + BA_theta_0) / 2
-            # Vibrational_scaling takes into account DFT
-            # deficities/ anharmonicity
-            k_theta[i] = k_theta[i] * vibrational_scaling_squared
-            file_angle.write(
-                atom_names[angle_list[i][0]]
-                + "-"
-                + atom_names[angle_list[i][1]]
-                + "-"
-                + atom_names[angle_list[i][2]]
-                + "  "
-            )
-            file_angle.write(
-                str("%#.4g" % k_theta[i])
-                + "   "
-                + str("%#.4g" % theta_0[i])
-                + "   "
-                + str(angle_list[i][0] + 1)
-                + "   "
-                + str(angle_list[i][1] + 1)
-                + "   "
-                + str(angle_list[i][2] + 1)
-            )
-            file_angle.write("\n")
-            unique_values_angles.append(
-                [
-                    atom_names[angle_list[i][0]],
-                    atom_names[angle_list[i][1]],
-                    atom_names[angle_list[i][2]],
-                    k_theta[i],
-                    theta_0[i],
-                    1,
-                ]
-            )
-        file_angle.close()
+                file_bond.write(
+                    str("%#.5g" % k_b[i])
+                    + "   "
+                    + str("%#.4g" % bond_length_list[i])
+                    + "   "
+                    + str(bond_list[i][0] + 1)
+                    + "   "
+                    + str(bond_list[i][1] + 1)
+                )
+                file_bond.write("\n")
+        with open(self.angle_parameter_file, "w") as file_angle:
+            for i in range(0, len(angle_list)):
+                file_angle.write(
+                    atom_names[angle_list[i][0]]
+                    + "-"
+                    + atom_names[angle_list[i][1]]
+                    + "-"
+                    + atom_names[angle_list[i][2]]
+                    + "  "
+                )
+                file_angle.write(
+                    str("%#.4g" % k_theta[i])
+                    + "   "
+                    + str("%#.4g" % theta_0[i])
+                    + "   "
+                    + str(angle_list[i][0] + 1)
+                    + "   "
+                    + str(angle_list[i][1] + 1)
+                    + "   "
+                    + str(angle_list[i][2] + 1)
+                )
+                file_angle.write("\n")
 
     def get_charges(self):
         """
         Saves the atomic charges in a text file obtained from
         the Gaussian log file.
         """
-        log_file = self.guest_pdb[:-4] + ".log"
-        with open(log_file, "r") as f:
-            lines = f.readlines()
-        for i in range(len(lines)):
-            if "Fitting point charges to electrostatic potential" in lines[i]:
-                to_begin = int(i)
-            if " Sum of ESP charges =" in lines[i]:
-                to_end = int(i)
-        charges = lines[to_begin + 4 : to_end]
-        charge_list = []
-        for i in range(len(charges)):
-            charge_list.append(charges[i].strip().split())
-        charge_list_value = []
-        atom_list = []
-        for i in range(len(charge_list)):
-            charge_list_value.append(charge_list[i][2])
-            atom_list.append(charge_list[i][1])
-        data_tuples = list(zip(atom_list, charge_list_value))
-        df_charge = pd.DataFrame(data_tuples, columns=["Atom", "Charge"])
+        charges = self.get_qm_log().get_esp_charges()
+        df_charge = pd.DataFrame(
+            {"Atom": charges["element_symbol"], "Charge": charges["charge"]}
+        )
         df_charge.to_csv(
-            self.charge_parameter_file, index=False, header=False, sep=" ",
+            self.charge_parameter_file,
+            index=False,
+            header=False,
+            sep=" ",
+            float_format="%.6f",
         )
 
     def get_proper_dihedrals(self):
         """
         Saves proper dihedral angles of the ligand in a text file.
         """
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.guest_pdb)
-        no_atoms = len(ppdb.df["ATOM"])
-        atom_index_list = []
-        for i in range(no_atoms):
-            atom_index_list.append(i + 1)
-        possible_dihedrals = []
-        for dihed in itertools.permutations(atom_index_list, 4):
-            possible_dihedrals.append(dihed)
-        df_bonds = pd.read_csv(
-            self.bond_parameter_file, header=None, delimiter=r"\s+"
-        )
-        df_bonds.columns = [
-            "bond",
-            "k_bond",
-            "bond_length",
-            "bond_1",
-            "bond_2",
-        ]
-        bond1 = df_bonds["bond_1"].values.tolist()
-        bond2 = df_bonds["bond_2"].values.tolist()
-        bond_list_list = []
-        for i in range(len(bond1)):
-            args = (bond1[i], bond2[i])
-            bond_list_list.append(list(args))
-        reverse_bond_list_list = []
-        for bonds in bond_list_list:
-            reverse_bond_list_list.append(reverse_list(bonds))
-        bond_lists = bond_list_list + reverse_bond_list_list
-        proper_dihed_repeated = []
-        for i in range(len(possible_dihedrals)):
-            dihed_frag = (
-                [possible_dihedrals[i][0], possible_dihedrals[i][1]],
-                [possible_dihedrals[i][1], possible_dihedrals[i][2]],
-                [possible_dihedrals[i][2], possible_dihedrals[i][3]],
-            )
-            a = [
-                dihed_frag[0] in bond_lists,
-                dihed_frag[1] in bond_lists,
-                dihed_frag[2] in bond_lists,
-            ]
-            if a == [True, True, True]:
-                proper_dihed_repeated.append(possible_dihedrals[i])
-
-        len_repeated_dihed_list = len(proper_dihed_repeated)
-        proper_dihedrals = proper_dihed_repeated
-        for x in proper_dihedrals:
-            z = x[::-1]
-            if z in proper_dihedrals:
-                proper_dihedrals.remove(z)
-        len_non_repeated_dihed_list = len(proper_dihedrals)
-        # print(len_repeated_dihed_list == len_non_repeated_dihed_list * 2)
+        topology = BondedTopology.load(self.bond_parameter_file)
+        # Atom numbers starting from 1
+        proper_dihedrals = topology.get_proper_dihedrals() + 1
         np.savetxt(self.proper_dihedral_file, proper_dihedrals, fmt="%s")
-        # return(proper_dihedrals)
 
 
 class PrepareGaussianHost:
@@ -4159,6 +7704,10 @@ class PrepareGaussianHost:
         Formatted checkpoint file obtained from the checkpoint file
         using formchk command.
 
+    qm_cache: QMCache, optional
+        Cache of the QM results. If given, the calculation is not run
+        again when the cache holds the results of an identical input.
+
     """
 
     def __init__(
@@ -4177,6 +7726,7 @@ class PrepareGaussianHost:
         add_keywords_III="IOP(6/33=2,6/42=6)",
         gauss_out_file="host_qm.out",
         fchk_out_file="host_qm_fchk.out",
+        qm_cache=None,
     ):
 
         self.charge = charge
@@ -4193,6 +7743,7 @@ class PrepareGaussianHost:
         self.add_keywords_I = add_keywords_I
         self.add_keywords_II = add_keywords_II
         self.add_keywords_III = add_keywords_III
+        self.qm_cache = qm_cache
 
     def write_input(self):
         """
@@ -4222,13 +7773,16 @@ class PrepareGaussianHost:
         command_line_6 = self.host_qm_pdb[:-4] + " " + "gaussian input file"
         command_line_7 = " "
         command_line_8 = str(self.charge) + " " + str(self.multiplicity)
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.host_qm_pdb)
-        df = ppdb.df["ATOM"]
-        df_1 = ppdb.df["ATOM"]["element_symbol"]
-        df_1.columns = ["atom"]
-        df_2 = df[["x_coord", "y_coord", "z_coord"]]
-        df_merged = pd.concat([df_1, df_2], axis=1)
+        atoms = PdbFile.load(self.host_qm_pdb).records("ATOM")
+        print_qm_cost(atoms["element_symbol"], self.basis_set)
+        df_merged = pd.DataFrame(
+            {
+                "element_symbol": atoms["element_symbol"],
+                "x_coord": atoms["xyz"][:, 0],
+                "y_coord": atoms["xyz"][:, 1],
+                "z_coord": atoms["xyz"][:, 2],
+            }
+        )
         command_line_9 = df_merged.to_string(header=False, index=False)
         command_line_10 = " "
         command = [
@@ -4247,10 +7801,26 @@ class PrepareGaussianHost:
         with open(self.host_qm_pdb[:-4] + ".com", "w") as f:
             f.write(commands)
 
+    def get_gaussian_job(self):
+        """
+        Returns the files of the Gaussian QM calculation for the
+        receptor, as used by run_gaussian_jobs.
+        """
+        return dict(
+            input_file=self.host_qm_pdb[:-4] + ".com",
+            log_file=self.host_qm_pdb[:-4] + ".log",
+            gauss_out_file=self.gauss_out_file,
+            fchk_out_file=self.fchk_out_file,
+        )
+
     def run_gaussian(self):
         """
         Runs the Gaussian QM calculation for the receptor locally.
         """
+        if self.qm_cache is not None and self.qm_cache.load_gaussian(
+            self.get_gaussian_job(), ["log", "chk"]
+        ):
+            return
         execute_command = (
             "g16"
             + " < "
@@ -4261,8 +7831,12 @@ class PrepareGaussianHost:
             + ".log"
         )
         with open(self.gauss_out_file, "w+") as f:
-            sp.run(
+            returncode = sp.run(
                 execute_command, shell=True, stdout=f, stderr=sp.STDOUT,
+            ).returncode
+        if self.qm_cache is not None and returncode == 0:
+            self.qm_cache.save_gaussian(
+                self.get_gaussian_job(), ["log", "chk"]
             )
 
     def get_fchk(self):
@@ -4270,6 +7844,10 @@ class PrepareGaussianHost:
         Converts the Gaussian checkpoint file (.chk) to a formatted checkpoint
         file (.fchk).
         """
+        if self.qm_cache is not None and self.qm_cache.load_gaussian(
+            self.get_gaussian_job(), ["fchk"]
+        ):
+            return
         execute_command = (
             "formchk"
             + " "
@@ -4280,9 +7858,11 @@ class PrepareGaussianHost:
             + ".fchk"
         )
         with open(self.fchk_out_file, "w+") as f:
-            sp.run(
+            returncode = sp.run(
                 execute_command, shell=True, stdout=f, stderr=sp.STDOUT,
-            )
+            ).returncode
+        if self.qm_cache is not None and returncode == 0:
+            self.qm_cache.save_gaussian(self.get_gaussian_job(), ["fchk"])
 
 
 class ParameterizeHost:
@@ -4349,6 +7929,18 @@ class ParameterizeHost:
     basis_set: str, optional
         Basis set to use for the Gaussian QM calculation.
 
+    linear_angle_sampling: {"grid", "analytic"}, optional
+        Sampling of the unit sphere used for the force constants of
+        linear angles (see sphere_sampled_angle_constant).
+
+    linear_angle_samples: int, optional
+        Number of samples for the "analytic" linear angle sampling.
+
+    qm_engine: Psi4QM, optional
+        In-process QM calculation of the receptor QM region whose
+        results are used instead of the Gaussian formatted checkpoint
+        and log files.
+
     """
 
     def __init__(
@@ -4366,6 +7958,9 @@ class ParameterizeHost:
         host_qm_pdb="host_qm.pdb",
         functional="B3LYP",
         basis_set="6-31G",
+        linear_angle_sampling="grid",
+        linear_angle_samples=360,
+        qm_engine=None,
     ):
 
         self.xyz_file = xyz_file
@@ -4381,66 +7976,64 @@ class ParameterizeHost:
         self.host_qm_pdb = host_qm_pdb
         self.functional = functional
         self.basis_set = basis_set
+        self.linear_angle_sampling = linear_angle_sampling
+        self.linear_angle_samples = linear_angle_samples
+        self.qm_engine = qm_engine
+
+    def get_qm_checkpoint(self):
+        """
+        Returns the QM engine if given, otherwise the formatted
+        checkpoint file.
+        """
+        if self.qm_engine is not None:
+            return self.qm_engine.run()
+        return FchkFile.load(self.host_qm_pdb[:-4] + ".fchk")
+
+    def get_qm_log(self):
+        """
+        Returns the QM engine if given, otherwise the Gaussian log file.
+        """
+        if self.qm_engine is not None:
+            return self.qm_engine.run()
+        return GaussianLog.load(self.host_qm_pdb[:-4] + ".log")
+
+    def get_qm_hessian(self):
+        """
+        Returns the hessian matrix (in kcal/mol/Angstrom^2) from the QM
+        engine if given, otherwise from the formatted checkpoint file.
+        """
+        if self.qm_engine is not None:
+            return self.qm_engine.get_hessian()
+        return load_hessian(self.host_qm_pdb[:-4] + ".fchk")
 
     def get_xyz(self):
         """
         Saves XYZ file from the formatted checkpoint file.
         """
-        fchk_file = self.host_qm_pdb[:-4] + ".fchk"
-        with open(fchk_file, "r") as f:
-            lines = f.readlines()
-        for i in range(len(lines)):
-            if "Current cartesian coordinates" in lines[i]:
-                no_coordinates = re.findall(r"\d+|\d+.\d+", lines[i])
-                no_coordinates = int(no_coordinates[0])
-        for i in range(len(lines)):
-            if "Current cartesian coordinates" in lines[i]:
-                to_begin = int(i)
-        cartesian_coords = lines[
-            to_begin + 1 : to_begin + 1 + int(math.ceil(no_coordinates / 5))
-        ]
-        cartesian_list = []
-        for i in range(len(cartesian_coords)):
-            cartesian_list.append(cartesian_coords[i].strip().split())
-        coordinates_list = [
-            item for sublist in cartesian_list for item in sublist
-        ]
-        list_coords = [float(x) * float(0.529) for x in coordinates_list]
-        for i in range(len(lines)):
-            if "Atomic numbers" in lines[i]:
-                to_begin = int(i)
-            if "Nuclear charges" in lines[i]:
-                to_end = int(i)
-        atomic_numbers = lines[to_begin + 1 : to_end]
-        atom_numbers = []
-        for i in range(len(atomic_numbers)):
-            atom_numbers.append(atomic_numbers[i].strip().split())
-        numbers = [item for sublist in atom_numbers for item in sublist]
-        N = int(no_coordinates / 3)
+        fchk = self.get_qm_checkpoint()
+        # Converted from Atomic units (Bohrs) to Angstroms
+        coords = (
+            fchk["Current cartesian coordinates"].reshape(-1, 3)
+            * BOHRS_PER_ANGSTROM
+        )
+        numbers = fchk["Atomic numbers"]
+        N = len(coords)
         # Opens the new xyz file
-        file = open(self.xyz_file, "w")
-        file.write(str(N) + "\n \n")
-        coords = np.zeros((N, 3))
-        n = 0
-        names = []
-        # Gives name for atomic number
-        for x in range(0, len(numbers)):
-            names.append(element_list[int(numbers[x]) - 1][1])
-        # Print coordinates to new input_coords.xyz file
-        for i in range(0, N):
-            for j in range(0, 3):
-                coords[i][j] = list_coords[n]
-                n = n + 1
-            file.write(
-                names[i]
-                + str(round(coords[i][0], 3))
-                + " "
-                + str(round(coords[i][1], 3))
-                + " "
-                + str(round(coords[i][2], 3))
-                + "\n"
-            )
-        file.close()
+        with open(self.xyz_file, "w") as file:
+            file.write(str(N) + "\n \n")
+            # Gives name for atomic number
+            names = [element_list[number - 1][1] for number in numbers]
+            # Print coordinates to new input_coords.xyz file
+            for i in range(0, N):
+                file.write(
+                    names[i]
+                    + str(round(coords[i][0], 3))
+                    + " "
+                    + str(round(coords[i][1], 3))
+                    + " "
+                    + str(round(coords[i][2], 3))
+                    + "\n"
+                )
         np.savetxt(self.coordinate_file, coords, fmt="%s")
 
     def get_unprocessed_hessian(self):
@@ -4448,25 +8041,8 @@ class ParameterizeHost:
         Saves a text file of the unprocessed hessian matrix from the
         formatted checkpoint file.
         """
-        fchk_file = self.host_qm_pdb[:-4] + ".fchk"
-        with open(fchk_file, "r") as f:
-            lines = f.readlines()
-        for i in range(len(lines)):
-            if "Cartesian Force Constants" in lines[i]:
-                no_hessian = re.findall(r"\d+|\d+.\d+", lines[i])
-                no_hessian = int(no_hessian[0])
-        for i in range(len(lines)):
-            if "Cartesian Force Constants" in lines[i]:
-                to_begin = int(i)
-        hessian = lines[
-            to_begin + 1 : to_begin + 1 + int(math.ceil(no_hessian / 5))
-        ]
-        hessian_list = []
-        for i in range(len(hessian)):
-            hessian_list.append(hessian[i].strip().split())
-        unprocessed_Hessian = [
-            item for sublist in hessian_list for item in sublist
-        ]
+        fchk = self.get_qm_checkpoint()
+        unprocessed_Hessian = fchk["Cartesian Force Constants"]
         np.savetxt(
             self.unprocessed_hessian_file, unprocessed_Hessian, fmt="%s",
         )
@@ -4476,100 +8052,28 @@ class ParameterizeHost:
         Saves a text file containing bonds and angles from the gaussian
         log file.
         """
-        log_file = self.host_qm_pdb[:-4] + ".log"
-        fid = open(log_file, "r")
-        tline = fid.readline()
-        bond_list = []
-        angle_list = []
-        n = 1
-        n_bond = 1
-        n_angle = 1
-        tmp = "R"  # States if bond or angle
-        B = []
-        # Finds the bond and angles from the .log file
-        while tline:
-            tline = fid.readline()
-            # Line starts at point when bond and angle list occurs
-            if (
-                len(tline) > 80
-                and tline[0:81].strip()
-                == "! Name  Definition              Value          Derivative Info.                !"
-            ):
-                tline = fid.readline()
-                tline = fid.readline()
-                # Stops when all bond and angles recorded
-                while (tmp[0] == "R") or (tmp[0] == "A"):
-                    line = tline.split()
-                    tmp = line[1]
-                    # Bond or angles listed as string
-                    list_terms = line[2][2:-1]
-                    # Bond List
-                    if tmp[0] == "R":
-                        x = list_terms.split(",")
-                        # Subtraction due to python array indexing at 0
-                        x = [(int(i) - 1) for i in x]
-                        bond_list.append(x)
-                        # Angle List
-                    if tmp[0] == "A":
-                        x = list_terms.split(",")
-                        # Subtraction due to python array indexing at 0
-                        x = [(int(i) - 1) for i in x]
-                        angle_list.append(x)
-                    tline = fid.readline()
-                # Leave loop
-                tline = -1
+        bond_list, angle_list = self.get_qm_log().get_internal_coordinates()
         np.savetxt(self.bond_list_file, bond_list, fmt="%s")
         np.savetxt(self.angle_list_file, angle_list, fmt="%s")
 
     def get_hessian(self):
         """
-        Extracts hessian matrix from the unprocessed hessian matrix
-        and saves into a new file.
+        Saves the hessian matrix obtained from the formatted
+        checkpoint file into a new file.
         """
-        unprocessed_Hessian = np.loadtxt(self.unprocessed_hessian_file)
-        fchk_file = self.host_qm_pdb[:-4] + ".fchk"
-        with open(fchk_file, "r") as f:
-            lines = f.readlines()
-        for i in range(len(lines)):
-            if "Current cartesian coordinates" in lines[i]:
-                no_coordinates = re.findall(r"\d+|\d+.\d+", lines[i])
-                no_coordinates = int(no_coordinates[0])
-        N = int(no_coordinates / 3)
-        length_hessian = 3 * N
-        hessian = np.zeros((length_hessian, length_hessian))
-        m = 0
-        # Write the hessian in a 2D array format
-        for i in range(0, (length_hessian)):
-            for j in range(0, (i + 1)):
-                hessian[i][j] = unprocessed_Hessian[m]
-                hessian[j][i] = unprocessed_Hessian[m]
-                m = m + 1
-        hessian = (hessian * (627.509391)) / (
-            0.529 ** 2
-        )  # Change from Hartree/bohr to kcal/mol/ang
+        hessian = self.get_qm_hessian()
         np.savetxt(self.hessian_file, hessian, fmt="%s")
 
     def get_atom_names(self):
         """
         Saves a list of atom names from the formatted checkpoint file.
         """
-        fchk_file = self.host_qm_pdb[:-4] + ".fchk"
-        with open(fchk_file, "r") as f:
-            lines = f.readlines()
-        for i in range(len(lines)):
-            if "Atomic numbers" in lines[i]:
-                to_begin = int(i)
-            if "Nuclear charges" in lines[i]:
-                to_end = int(i)
-        atomic_numbers = lines[to_begin + 1 : to_end]
-        atom_numbers = []
-        for i in range(len(atomic_numbers)):
-            atom_numbers.append(atomic_numbers[i].strip().split())
-        numbers = [item for sublist in atom_numbers for item in sublist]
+        fchk = self.get_qm_checkpoint()
+        numbers = fchk["Atomic numbers"]
         names = []
         # Gives name for atomic number
         for x in range(0, len(numbers)):
-            names.append(element_list[int(numbers[x]) - 1][1])
+            names.append(element_list[numbers[x] - 1][1])
         atom_names = []
         for i in range(0, len(names)):
             atom_names.append(names[i].strip() + str(i + 1))
@@ -4580,307 +8084,452 @@ class ParameterizeHost:
         Saves the bond and angle parameter files obtained from
         the formatted checkpoint file.
         """
-        fchk_file = self.host_qm_pdb[:-4] + ".fchk"
-        with open(fchk_file, "r") as f:
-            lines = f.readlines()
-        for i in range(len(lines)):
-            if "Current cartesian coordinates" in lines[i]:
-                no_coordinates = re.findall(r"\d+|\d+.\d+", lines[i])
-                no_coordinates = int(no_coordinates[0])
-        N = int(no_coordinates / 3)
         coords = np.loadtxt(self.coordinate_file)
-        hessian = np.loadtxt(self.hessian_file)
-        bond_list = np.loadtxt(self.bond_list_file, dtype=int)
+        hessian = self.get_qm_hessian()
+        bond_list = np.loadtxt(self.bond_list_file, dtype=int).reshape(-1, 2)
+        angle_list = np.loadtxt(self.angle_list_file, dtype=int).reshape(
+            -1, 3
+        )
         atom_names = np.loadtxt(self.atom_names_file, dtype=str)
-        # Find bond lengths
-        bond_lengths = np.zeros((N, N))
-        for i in range(0, N):
-            for j in range(0, N):
-                diff_i_j = np.array(coords[i, :]) - np.array(coords[j, :])
-                bond_lengths[i][j] = np.linalg.norm(diff_i_j)
-        eigenvectors = np.empty((3, 3, N, N), dtype=complex)
-        eigenvalues = np.empty((N, N, 3), dtype=complex)
-        partial_hessian = np.zeros((3, 3))
-        for i in range(0, N):
-            for j in range(0, N):
-                partial_hessian = hessian[
-                    (i * 3) : ((i + 1) * 3), (j * 3) : ((j + 1) * 3)
-                ]
-                [a, b] = np.linalg.eig(partial_hessian)
-                eigenvalues[i, j, :] = a
-                eigenvectors[:, :, i, j] = b
-        # Modified Seminario method to find the bond parameters
-        # and print them to file
-        file_bond = open(self.bond_parameter_file, "w")
-        k_b = np.zeros(len(bond_list))
-        bond_length_list = np.zeros(len(bond_list))
-        unique_values_bonds = []  # Used to find average values
-        for i in range(0, len(bond_list)):
-            AB = force_constant_bond(
-                bond_list[i][0],
-                bond_list[i][1],
-                eigenvalues,
-                eigenvectors,
-                coords,
-            )
-            BA = force_constant_bond(
-                bond_list[i][1],
-                bond_list[i][0],
-                eigenvalues,
-                eigenvectors,
-                coords,
-            )
-            # Order of bonds sometimes causes slight differences,
-            # find the mean
-            k_b[i] = np.real((AB + BA) / 2)
-            # Vibrational_scaling takes into account DFT deficities
-            # / anharmocity
-            vibrational_scaling = get_vibrational_scaling(
-                functional=self.functional, basis_set=self.basis_set
-            )
-            vibrational_scaling_squared = vibrational_scaling ** 2
-            k_b[i] = k_b[i] * vibrational_scaling_squared
-            bond_length_list[i] = bond_lengths[bond_list[i][0]][
-                bond_list[i][1]
-            ]
-            file_bond.write(
-                atom_names[bond_list[i][0]]
-                + "-"
-                + atom_names[bond_list[i][1]]
-                + "  "
-            )
-            file_bond.write(
-                str("%#.5g" % k_b[i])
-                + "   "
-                + str("%#.4g" % bond_length_list[i])
-                + "   "
-                + str(bond_list[i][0] + 1)
-                + "   "
-                + str(bond_list[i][1] + 1)
-            )
-            file_bond.write("\n")
-            unique_values_bonds.append(
-                [
-                    atom_names[bond_list[i][0]],
-                    atom_names[bond_list[i][1]],
-                    k_b[i],
-                    bond_length_list[i],
-                    1,
-                ]
-            )
-        file_bond.close()
-        angle_list = np.loadtxt(self.angle_list_file, dtype=int)
-        # Modified Seminario method to find the angle parameters
-        # and print them to file
-        file_angle = open(self.angle_parameter_file, "w")
-        k_theta = np.zeros(len(angle_list))
-        theta_0 = np.zeros(len(angle_list))
-        unique_values_angles = []  # Used to find average values
-        # Modified Seminario part goes here ...
-        # Connectivity information for Modified Seminario Method
-        central_atoms_angles = []
-        # A structure is created with the index giving the central
-        # atom of the angle, an array then lists the angles with
-        # that central atom.
-        # i.e. central_atoms_angles{3} contains an array of angles
-        # with central atom 3
-        for i in range(0, len(coords)):
-            central_atoms_angles.append([])
-            for j in range(0, len(angle_list)):
-                if i == angle_list[j][1]:
-                    # For angle ABC, atoms A C are written to array
-                    AC_array = [angle_list[j][0], angle_list[j][2], j]
-                    central_atoms_angles[i].append(AC_array)
-                    # For angle ABC, atoms C A are written to array
-                    CA_array = [angle_list[j][2], angle_list[j][0], j]
-                    central_atoms_angles[i].append(CA_array)
-        # Sort rows by atom number
-        for i in range(0, len(coords)):
-            central_atoms_angles[i] = sorted(
-                central_atoms_angles[i], key=itemgetter(0)
-            )
-        # Find normals u_PA for each angle
-        unit_PA_all_angles = []
-        for i in range(0, len(central_atoms_angles)):
-            unit_PA_all_angles.append([])
-            for j in range(0, len(central_atoms_angles[i])):
-                # For the angle at central_atoms_angles[i][j,:] the corresponding
-                # u_PA value is found for the plane ABC and bond AB,
-                # where ABC corresponds to the order of the arguements.
-                # This is why the reverse order was also added
-                unit_PA_all_angles[i].append(
-                    u_PA_from_angles(
-                        central_atoms_angles[i][j][0],
-                        i,
-                        central_atoms_angles[i][j][1],
-                        coords,
-                    )
+        # Vibrational_scaling takes into account DFT deficities /
+        # anharmocity
+        vibrational_scaling = get_vibrational_scaling(
+            functional=self.functional, basis_set=self.basis_set
+        )
+        # Modified Seminario method to find the bond and angle parameters
+        k_b, bond_length_list, k_theta, theta_0 = modified_seminario_method(
+            coords=coords,
+            hessian=hessian,
+            bond_list=bond_list,
+            angle_list=angle_list,
+            vibrational_scaling=vibrational_scaling,
+            linear_angle_sampling=self.linear_angle_sampling,
+            linear_angle_samples=self.linear_angle_samples,
+        )
+        with open(self.bond_parameter_file, "w") as file_bond:
+            for i in range(0, len(bond_list)):
+                file_bond.write(
+                    atom_names[bond_list[i][0]]
+                    + "-"
+                    + atom_names[bond_list[i][1]]
+                    + "  "
                 )
-        # Finds the contributing factors from the other angle terms
-        # scaling_factor_all_angles = cell(max(max(angle_list)));
-        # This array will contain scaling factor and angle list position
-        scaling_factor_all_angles = []
-        for i in range(0, len(central_atoms_angles)):
-            scaling_factor_all_angles.append([])
-            for j in range(0, len(central_atoms_angles[i])):
-                n = 1
-                m = 1
-                angles_around = 0
-                additional_contributions = 0
-                scaling_factor_all_angles[i].append([0, 0])
-                # Position in angle list
-                scaling_factor_all_angles[i][j][1] = central_atoms_angles[i][
-                    j
-                ][2]
-                # Goes through the list of angles with the same central
-                # atom and computes the term need for the modified Seminario method
-                # Forwards directions, finds the same bonds with the central atom i
-                while (
-                    ((j + n) < len(central_atoms_angles[i]))
-                    and central_atoms_angles[i][j][0]
-                    == central_atoms_angles[i][j + n][0]
-                ):
-                    additional_contributions = (
-                        additional_contributions
-                        + (
-                            abs(
-                                np.dot(
-                                    unit_PA_all_angles[i][j][:],
-                                    unit_PA_all_angles[i][j + n][:],
-                                )
-                            )
-                        )
-                        ** 2
-                    )
-                    n = n + 1
-                    angles_around = angles_around + 1
-                # Backwards direction, finds the same bonds with the central atom i
-                while ((j - m) >= 0) and central_atoms_angles[i][j][
-                    0
-                ] == central_atoms_angles[i][j - m][0]:
-                    additional_contributions = (
-                        additional_contributions
-                        + (
-                            abs(
-                                np.dot(
-                                    unit_PA_all_angles[i][j][:],
-                                    unit_PA_all_angles[i][j - m][:],
-                                )
-                            )
-                        )
-                        ** 2
-                    )
-                    m = m + 1
-                    angles_around = angles_around + 1
-                if n != 1 or m != 1:
-                    # Finds the mean value of the additional contribution to
-                    # change to normal Seminario method comment out + part
-                    scaling_factor_all_angles[i][j][0] = 1 + (
-                        additional_contributions / (m + n - 2)
-                    )
-                else:
-                    scaling_factor_all_angles[i][j][0] = 1
-        scaling_factors_angles_list = []
-        for i in range(0, len(angle_list)):
-            scaling_factors_angles_list.append([])
-        # Orders the scaling factors according to the angle list
-        for i in range(0, len(central_atoms_angles)):
-            for j in range(0, len(central_atoms_angles[i])):
-                scaling_factors_angles_list[
-                    scaling_factor_all_angles[i][j][1]
-                ].append(scaling_factor_all_angles[i][j][0])
-        # Finds the angle force constants with the scaling factors
-        # included for each angle
-        for i in range(0, len(angle_list)):
-            # Ensures that there is no difference when the
-            # ordering is changed
-            [AB_k_theta, AB_theta_0] = force_angle_constant(
-                angle_list[i][0],
-                angle_list[i][1],
-                angle_list[i][2],
-                bond_lengths,
-                eigenvalues,
-                eigenvectors,
-                coords,
-                scaling_factors_angles_list[i][0],
-                scaling_factors_angles_list[i][1],
-            )
-            [BA_k_theta, BA_theta_0] = force_angle_constant(
-                angle_list[i][2],
-                angle_list[i][1],
-                angle_list[i][0],
-                bond_lengths,
-                eigenvalues,
-                eigenvectors,
-                coords,
-                scaling_factors_angles_list[i][1],
-                scaling_factors_angles_list[i][0],
-            )
-            k_theta[i] = (AB_k_theta + BA_k_theta) / 2
-            theta_0[i] = (AB_theta_0 + BA_theta_0) / 2
-            # Vibrational_scaling takes into account DFT
-            # deficities / anharmonicity
-            k_theta[i] = k_theta[i] * vibrational_scaling_squared
-            file_angle.write(
-                atom_names[angle_list[i][0]]
-                + "-"
-                + atom_names[angle_list[i][1]]
-                + "-"
-                + atom_names[angle_list[i][2]]
-                + "  "
-            )
-            file_angle.write(
-                str("%#.4g" % k_theta[i])
-                + "   "
-                + str("%#.4g" % theta_0[i])
-                + "   "
-                + str(angle_list[i][0] + 1)
-                + "   "
-                + str(angle_list[i][1] + 1)
-                + "   "
-                + str(angle_list[i][2] + 1)
-            )
-            file_angle.write("\n")
-            unique_values_angles.append(
-                [
-                    atom_names[angle_list[i][0]],
-                    atom_names[angle_list[i][1]],
-                    atom_names[angle_list[i][2]],
-                    k_theta[i],
-                    theta_0[i],
-                    1,
-                ]
-            )
-        file_angle.close()
+                file_bond.write(
+                    str("%#.5g" % k_b[i])
+                    + "   "
+                    + str("%#.4g" % bond_length_list[i])
+                    + "   "
+                    + str(bond_list[i][0] + 1)
+                    + "   "
+                    + str(bond_list[i][1] + 1)
+                )
+                file_bond.write("\n")
+        with open(self.angle_parameter_file, "w") as file_angle:
+            for i in range(0, len(angle_list)):
+                file_angle.write(
+                    atom_names[angle_list[i][0]]
+                    + "-"
+                    + atom_names[angle_list[i][1]]
+                    + "-"
+                    + atom_names[angle_list[i][2]]
+                    + "  "
+                )
+                file_angle.write(
+                    str("%#.4g" % k_theta[i])
+                    + "   "
+                    + str("%#.4g" % theta_0[i])
+                    + "   "
+                    + str(angle_list[i][0] + 1)
+                    + "   "
+                    + str(angle_list[i][1] + 1)
+                    + "   "
+                    + str(angle_list[i][2] + 1)
+                )
+                file_angle.write("\n")
 
     def get_charges(self):
         """
         Saves the atomic charges in a text file obtained from
         the Gaussian log file.
         """
-        log_file = self.host_qm_pdb[:-4] + ".log"
-        with open(log_file, "r") as f:
-            lines = f.readlines()
-        for i in range(len(lines)):
-            if "Fitting point charges to electrostatic potential" in lines[i]:
-                to_begin = int(i)
-            if " Sum of ESP charges =" in lines[i]:
-                to_end = int(i)
-        charges = lines[to_begin + 4 : to_end]
-        charge_list = []
-        for i in range(len(charges)):
-            charge_list.append(charges[i].strip().split())
-        charge_list_value = []
-        atom_list = []
-        for i in range(len(charge_list)):
-            charge_list_value.append(charge_list[i][2])
-            atom_list.append(charge_list[i][1])
-        data_tuples = list(zip(atom_list, charge_list_value))
-        df_charge = pd.DataFrame(data_tuples, columns=["Atom", "Charge"])
+        charges = self.get_qm_log().get_esp_charges()
+        df_charge = pd.DataFrame(
+            {"Atom": charges["element_symbol"], "Charge": charges["charge"]}
+        )
         df_charge.to_csv(
-            self.charge_parameter_file, index=False, header=False, sep=" ",
+            self.charge_parameter_file,
+            index=False,
+            header=False,
+            sep=" ",
+            float_format="%.6f",
+        )
+
+
+class QMParameterSet:
+
+    """
+    A class used to hold the QM derived bond, angle, torsion and charge
+    parameters of a system in structured NumPy arrays.
+
+    The parameter set is handed from one reparameterization step to the
+    next in memory: the parameter sets most recently saved or loaded
+    are kept in a cache (a FileCache) keyed by the path of their
+    parameter file, so the text file is only parsed when it was
+    modified outside of this class or dropped from the cache. The text
+    file keeps the "Begin/Finish writing the ... Parameters" layout,
+    each parameter being written as the XML line that replaces the
+    corresponding line of the serialized system. Optionally, the arrays
+    are also saved in a compact binary .npz file next to the text file
+    and read back from there by later runs.
+
+    ...
+
+    Attributes
+    ----------
+    bonds: numpy.ndarray
+        Structured array of the bond parameters with fields p1, p2
+        (atom indices), d (bond length in nm) and k (force constant in
+        kJ/mol/nm^2).
+
+    angles: numpy.ndarray
+        Structured array of the angle parameters with fields p1, p2, p3
+        (atom indices), a (angle in radians) and k (force constant in
+        kJ/mol/radian^2).
+
+    torsions: numpy.ndarray
+        Structured array of the torsion parameters with fields p1, p2,
+        p3, p4 (atom indices), periodicity, phase (in radians) and k
+        (force constant in kJ/mol).
+
+    charges: numpy.ndarray
+        Structured array of the nonbonded parameters with fields atom
+        (atom index), q (charge), eps and sig.
+
+    """
+
+    bond_dtype = np.dtype(
+        [
+            ("p1", np.int64),
+            ("p2", np.int64),
+            ("d", np.float64),
+            ("k", np.float64),
+        ]
+    )
+    angle_dtype = np.dtype(
+        [
+            ("p1", np.int64),
+            ("p2", np.int64),
+            ("p3", np.int64),
+            ("a", np.float64),
+            ("k", np.float64),
+        ]
+    )
+    torsion_dtype = np.dtype(
+        [
+            ("p1", np.int64),
+            ("p2", np.int64),
+            ("p3", np.int64),
+            ("p4", np.int64),
+            ("periodicity", np.int64),
+            ("phase", np.float64),
+            ("k", np.float64),
+        ]
+    )
+    charge_dtype = np.dtype(
+        [
+            ("atom", np.int64),
+            ("q", np.float64),
+            ("eps", np.float64),
+            ("sig", np.float64),
+        ]
+    )
+    # Parameter file sections in the order in which they are written
+    sections = ["Bond", "Angle", "Torsion", "Charge"]
+    # Parameter sets most recently saved or loaded, keyed by path
+    cache = FileCache()
+
+    def __init__(self, bonds=None, angles=None, torsions=None, charges=None):
+
+        self.bonds = np.array(
+            [] if bonds is None else bonds, dtype=self.bond_dtype
+        )
+        self.angles = np.array(
+            [] if angles is None else angles, dtype=self.angle_dtype
+        )
+        self.torsions = np.array(
+            [] if torsions is None else torsions, dtype=self.torsion_dtype
+        )
+        self.charges = np.array(
+            [] if charges is None else charges, dtype=self.charge_dtype
+        )
+
+    @classmethod
+    def from_qm_files(
+        cls,
+        charge_parameter_file,
+        bond_parameter_file,
+        angle_parameter_file,
+        atom_numbers,
+    ):
+        """
+        Returns the parameter set built from the charge, bond and angle
+        parameter files obtained from the QM calculations, converted to
+        OpenMM units.
+
+        Parameters
+        ----------
+        charge_parameter_file : str
+            File containing the QM charges.
+
+        bond_parameter_file : str
+            File containing the bond parameters from the Modified
+            Seminario method.
+
+        angle_parameter_file : str
+            File containing the angle parameters from the Modified
+            Seminario method.
+
+        atom_numbers : list
+            Indices of the QM atoms in the system, in the order of the
+            QM calculation.
+
+        Returns
+        -------
+        qm_params : QMParameterSet
+            Parameter set of the QM region.
+
+        """
+        offset = min(atom_numbers) - 1
+        df_charges = pd.read_csv(
+            charge_parameter_file, header=None, delimiter=r"\s+"
+        )
+        df_charges.columns = ["atom", "charges"]
+        charges = [
+            (atom, round(q, 6), 0.0, 0.0)
+            for atom, q in zip(atom_numbers, df_charges["charges"].tolist())
+        ]
+        df = pd.read_csv(bond_parameter_file, header=None, delimiter=r"\s+")
+        df.columns = ["bond", "k_bond", "bond_length", "bond_1", "bond_2"]
+        bonds = [
+            (
+                p1 + offset,
+                p2 + offset,
+                round(d / 10.00, 6),
+                # kcal/mol * A^2 to kJ/mol * nm^2
+                round(k * KCAL_MOL_PER_KJ_MOL * ANGSTROMS_PER_NM ** 2, 10),
+            )
+            for p1, p2, d, k in zip(
+                df["bond_1"].tolist(),
+                df["bond_2"].tolist(),
+                df["bond_length"].tolist(),
+                df["k_bond"].tolist(),
+            )
+        ]
+        df = pd.read_csv(angle_parameter_file, header=None, delimiter=r"\s+")
+        df.columns = [
+            "angle",
+            "k_angle",
+            "angle_degrees",
+            "angle_1",
+            "angle_2",
+            "angle_3",
+        ]
+        angles = [
+            (
+                p1 + offset,
+                p2 + offset,
+                p3 + offset,
+                round(a * RADIANS_PER_DEGREE, 6),
+                # kcal/mol * radian^2 to kJ/mol * radian^2
+                round(k * KCAL_MOL_PER_KJ_MOL, 6),
+            )
+            for p1, p2, p3, a, k in zip(
+                df["angle_1"].tolist(),
+                df["angle_2"].tolist(),
+                df["angle_3"].tolist(),
+                df["angle_degrees"].tolist(),
+                df["k_angle"].tolist(),
+            )
+        ]
+        return cls(bonds=bonds, angles=angles, charges=charges)
+
+    @classmethod
+    def concatenate(cls, qm_params_list):
+        """
+        Returns a parameter set containing the parameters of all the
+        given parameter sets, in order.
+        """
+        return cls(
+            bonds=np.concatenate([i.bonds for i in qm_params_list]),
+            angles=np.concatenate([i.angles for i in qm_params_list]),
+            torsions=np.concatenate([i.torsions for i in qm_params_list]),
+            charges=np.concatenate([i.charges for i in qm_params_list]),
         )
 
+    def bond_lines(self):
+        """
+        Returns the XML lines of the bond parameters.
+        """
+        return [
+            "                                "
+            + '<Bond d="{}" k="{}" p1="{}" p2="{}"/>\n'.format(
+                float(d), float(k), int(p1), int(p2)
+            )
+            for p1, p2, d, k in self.bonds
+        ]
+
+    def angle_lines(self):
+        """
+        Returns the XML lines of the angle parameters.
+        """
+        return [
+            "                                "
+            + '<Angle a="{}" k="{}" p1="{}" p2="{}" p3="{}"/>\n'.format(
+                float(a), float(k), int(p1), int(p2), int(p3)
+            )
+            for p1, p2, p3, a, k in self.angles
+        ]
+
+    def torsion_lines(self):
+        """
+        Returns the XML lines of the torsion parameters.
+        """
+        return [
+            "                                "
+            + '<Torsion k="{}" p1="{}" p2="{}" p3="{}" p4="{}" '.format(
+                float(k), int(p1), int(p2), int(p3), int(p4)
+            )
+            + 'periodicity="{}" phase="{}"/>\n'.format(
+                int(periodicity), float(phase)
+            )
+            for p1, p2, p3, p4, periodicity, phase, k in self.torsions
+        ]
+
+    def charge_lines(self):
+        """
+        Returns the lines of the charge parameters.
+        """
+        return [
+            '<Particle q="{}" eps="{}" sig="{}" atom="{}"/>\n'.format(
+                float(q), float(eps), float(sig), int(atom)
+            )
+            for atom, q, eps, sig in self.charges
+        ]
+
+    def write(self, params_file):
+        """
+        Writes the parameters to a text file, one section per type of
+        parameter. The torsion section is only written when the
+        parameter set has torsion parameters.
+        """
+        lines = {
+            "Bond": self.bond_lines(),
+            "Angle": self.angle_lines(),
+            "Torsion": self.torsion_lines(),
+            "Charge": self.charge_lines(),
+        }
+        with open(params_file, "w") as f:
+            for section in self.sections:
+                if section == "Torsion" and len(self.torsions) == 0:
+                    continue
+                f.write("Begin writing the " + section + " Parameters\n")
+                f.writelines(lines[section])
+                f.write("Finish writing the " + section + " Parameters\n")
+
+    @classmethod
+    def from_lines(cls, lines):
+        """
+        Returns the parameter set of a list of bond, angle, torsion
+        and charge parameter lines, tokenizing each line once.
+        """
+        attribute = re.compile(r'(\w+)="([^"]*)"')
+        fields = {
+            "Bond": ["p1", "p2", "d", "k"],
+            "Angle": ["p1", "p2", "p3", "a", "k"],
+            "Torsion": ["p1", "p2", "p3", "p4", "periodicity", "phase", "k"],
+            "Particle": ["atom", "q", "eps", "sig"],
+        }
+        params = {name: [] for name in fields}
+        for line in lines:
+            name = line.split(None, 1)[0][1:]
+            if name not in fields:
+                raise ValueError("Not a parameter line: " + line)
+            values = dict(attribute.findall(line))
+            params[name].append(tuple(values[i] for i in fields[name]))
+        return cls(
+            bonds=params["Bond"],
+            angles=params["Angle"],
+            torsions=params["Torsion"],
+            charges=params["Particle"],
+        )
+
+    @classmethod
+    def read(cls, params_file):
+        """
+        Returns the parameter set read from a text file written by
+        QMParameterSet.write.
+        """
+        with open(params_file, "r") as f:
+            lines = [
+                line
+                for line in f
+                if line.strip()
+                and not line.startswith(("Begin writing", "Finish writing"))
+            ]
+        return cls.from_lines(lines)
+
+    def save(self, params_file, binary=False):
+        """
+        Writes the parameters to a text file and keeps the parameter
+        set in memory for the next steps. If binary is True, the arrays
+        are also saved in a .npz file next to the text file, stamped
+        with the modification time (in ns) and size of the latter. An
+        existing .npz file is always kept up to date.
+        """
+        self.write(params_file)
+        stat = os.stat(params_file)
+        mtime = (stat.st_mtime_ns, stat.st_size)
+        params_npz = os.path.splitext(params_file)[0] + ".npz"
+        if binary or os.path.exists(params_npz):
+            with open(params_npz, "wb") as f:
+                np.savez(
+                    f,
+                    bonds=self.bonds,
+                    angles=self.angles,
+                    torsions=self.torsions,
+                    charges=self.charges,
+                    stamp=np.array(mtime, dtype=np.int64),
+                )
+        self.cache[os.path.abspath(params_file)] = (mtime, self)
+
+    @classmethod
+    def load(cls, params_file):
+        """
+        Returns the parameter set of a parameter file. The parameter
+        set kept in memory or its .npz file are used as long as the
+        text file has not been modified since they were saved,
+        otherwise the text file is parsed.
+        """
+        path = os.path.abspath(params_file)
+        stat = os.stat(path)
+        mtime = (stat.st_mtime_ns, stat.st_size)
+        if path not in cls.cache or cls.cache[path][0] != mtime:
+            params_npz = os.path.splitext(path)[0] + ".npz"
+            qm_params = None
+            if os.path.exists(params_npz):
+                with np.load(params_npz) as npz:
+                    if "stamp" in npz and tuple(npz["stamp"]) == mtime:
+                        qm_params = cls(
+                            bonds=npz["bonds"],
+                            angles=npz["angles"],
+                            torsions=npz["torsions"],
+                            charges=npz["charges"],
+                        )
+            if qm_params is None:
+                qm_params = cls.read(params_file)
+            cls.cache[path] = (mtime, qm_params)
+        return cls.cache[path][1]
+
 
 class GuestAmberXMLAmber:
 
@@ -5012,6 +8661,10 @@ class GuestAmberXMLAmber:
         Argument to specify how to load the topology. Can either be "openmm"
         or "parmed".
 
+    binary_params: bool, optional
+        Also save the QM parameters in a compact binary .npz file
+        next to system_qm_params_file.
+
     """
 
     def __init__(
@@ -5049,6 +8702,7 @@ class GuestAmberXMLAmber:
         prmtop_system_params="guest_params.prmtop",
         inpcrd_system_params="guest_params.inpcrd",
         load_topology="openmm",
+        binary_params=False,
     ):
 
         self.charge = charge
@@ -5089,6 +8743,7 @@ class GuestAmberXMLAmber:
         self.prmtop_system_params = prmtop_system_params
         self.inpcrd_system_params = inpcrd_system_params
         self.load_topology = load_topology
+        self.binary_params = binary_params
 
     def generate_xml_antechamber(self):
         """
@@ -5257,765 +8912,75 @@ class GuestAmberXMLAmber:
                 + str(self.num_charge_atoms)
                 + "   "
                 + str(self.index_charge_atom_1)
-                + "   "
-                + str(self.charge_atom_1)
-                + "   "
-                + str(self.index_charge_atom_2)
-                + "   "
-                + str(self.charge_atom_2)
-                + "\n"
-            )
-            line_2 = "M  END" + "\n"
-            line_3 = "$$$$"
-            out.write(line_1)
-            out.write(line_2)
-            out.write(line_3)
-        # off_molecule = openforcefield.topology.Molecule(self.system_sdf)
-        off_molecule = Molecule(self.system_sdf)
-        # force_field = openforcefield.typing.engines.smirnoff.ForceField("openff_unconstrained-1.0.0.offxml")
-        force_field = ForceField("openff_unconstrained-1.0.0.offxml")
-        system = force_field.create_openmm_system(off_molecule.to_topology())
-        pdbfile = simtk.openmm.app.PDBFile(self.system_pdb)
-        structure = parmed.openmm.load_topology(
-            pdbfile.topology, system, xyz=pdbfile.positions
-        )
-        with open(self.system_xml, "w") as f:
-            f.write(simtk.openmm.XmlSerializer.serialize(system))
-
-    def write_system_params(self):
-        """
-        Saves the parameters obtained from the QM log files in a text file.
-        """
-        # Charges from QM files
-        df_charges = pd.read_csv(
-            self.charge_parameter_file, header=None, delimiter=r"\s+"
-        )
-        df_charges.columns = ["atom", "charges"]
-        qm_charges = df_charges["charges"].values.tolist()
-        qm_charges = [round(num, 6) for num in qm_charges]
-        # print(qm_charges)
-        # Bond Parameters from QM files
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.system_qm_pdb)
-        atom_name_list = ppdb.df["ATOM"]["atom_number"].values.tolist()
-        atom_name_list = [i - 1 for i in atom_name_list]
-        # print(atom_name_list)
-        df = pd.read_csv(
-            self.bond_parameter_file, header=None, delimiter=r"\s+"
-        )
-        df.columns = [
-            "bond",
-            "k_bond",
-            "bond_length",
-            "bond_1",
-            "bond_2",
-        ]
-        # print(df.head())
-        bond_1_list = df["bond_1"].values.tolist()
-        bond_1_list = [x - 1 + min(atom_name_list) for x in bond_1_list]
-        bond_2_list = df["bond_2"].values.tolist()
-        bond_2_list = [x - 1 + min(atom_name_list) for x in bond_2_list]
-        # print(bond_1_list)
-        # print(bond_2_list)
-        k_bond_list = df["k_bond"].values.tolist()
-        #k_bond_list = [
-        #    i * 418.40 for i in k_bond_list
-        #]  # kcal/mol * A^2 to kJ/mol * nm^2
-        
-        k_bond_list = [
-            i * KCAL_MOL_PER_KJ_MOL * ANGSTROMS_PER_NM**2 for i in k_bond_list
-        ]  # kcal/mol * A^2 to kJ/mol * nm^2
-        k_bond_list = [round(num, 10) for num in k_bond_list]
-        # print(k_bond_list)
-        bond_length_list = df["bond_length"].values.tolist()
-        # TODO: units here? Anstroms per nm?
-        bond_length_list = [i / 10.00 for i in bond_length_list]
-        bond_length_list = [round(num, 6) for num in bond_length_list]
-        # print(bond_length_list)
-        # Angle Parameters from QM files
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.system_qm_pdb)
-        atom_name_list = ppdb.df["ATOM"]["atom_number"].values.tolist()
-        atom_name_list = [i - 1 for i in atom_name_list]
-        # print(atom_name_list)
-        df = pd.read_csv(
-            self.angle_parameter_file, header=None, delimiter=r"\s+"
-        )
-        df.columns = [
-            "angle",
-            "k_angle",
-            "angle_degrees",
-            "angle_1",
-            "angle_2",
-            "angle_3",
-        ]
-        # print(df.head())
-        angle_1_list = df["angle_1"].values.tolist()
-        angle_1_list = [x - 1 + min(atom_name_list) for x in angle_1_list]
-        # print(angle_1_list)
-        angle_2_list = df["angle_2"].values.tolist()
-        angle_2_list = [x - 1 + min(atom_name_list) for x in angle_2_list]
-        # print(angle_2_list)
-        angle_3_list = df["angle_3"].values.tolist()
-        angle_3_list = [x - 1 + min(atom_name_list) for x in angle_3_list]
-        # print(angle_3_list)
-        k_angle_list = df["k_angle"].values.tolist()
-        k_angle_list = [
-            i * KCAL_MOL_PER_KJ_MOL for i in k_angle_list
-        ]  # kcal/mol * radian^2 to kJ/mol * radian^2
-        k_angle_list = [round(num, 6) for num in k_angle_list]
-        # print(k_angle_list)
-        angle_list = df["angle_degrees"].values.tolist()
-        angle_list = [i * RADIANS_PER_DEGREE for i in angle_list]
-        angle_list = [round(num, 6) for num in angle_list]
-        # print(angle_list)
-        xml = open(self.system_qm_params_file, "w")
-        xml.write("Begin writing the Bond Parameters" + "\n")
-        # TODO: These should use string formatting to become more concise
-        for i in range(len(k_bond_list)):
-            xml.write(
-                "                                "
-                + "<Bond"
-                + " "
-                + "d="
-                + '"'
-                + str(bond_length_list[i])
-                + '"'
-                + " "
-                + "k="
-                + '"'
-                + str(k_bond_list[i])
-                + '"'
-                + " "
-                + "p1="
-                + '"'
-                + str(bond_1_list[i])
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + str(bond_2_list[i])
-                + '"'
-                + "/>"
-                + "\n"
-            )
-        xml.write("Finish writing the Bond Parameters" + "\n")
-        xml.write("Begin writing the Angle Parameters" + "\n")
-        for i in range(len(k_angle_list)):
-            xml.write(
-                "                                "
-                + "<Angle"
-                + " "
-                + "a="
-                + '"'
-                + str(angle_list[i])
-                + '"'
-                + " "
-                + "k="
-                + '"'
-                + str(k_angle_list[i])
-                + '"'
-                + " "
-                + "p1="
-                + '"'
-                + str(angle_1_list[i])
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + str(angle_2_list[i])
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + str(angle_3_list[i])
-                + '"'
-                + "/>"
-                + "\n"
-            )
-        xml.write("Finish writing the Angle Parameters" + "\n")
-        xml.write("Begin writing the Charge Parameters" + "\n")
-        for i in range(len(qm_charges)):
-            xml.write(
-                "<Particle"
-                + " "
-                + "q="
-                + '"'
-                + str(qm_charges[i])
-                + '"'
-                + " "
-                + "eps="
-                + '"'
-                + str(0.00)
-                + '"'
-                + " "
-                + "sig="
-                + '"'
-                + str(0.00)
-                + '"'
-                + " "
-                + "atom="
-                + '"'
-                + str(atom_name_list[i])
-                + '"'
-                + "/>"
+                + "   "
+                + str(self.charge_atom_1)
+                + "   "
+                + str(self.index_charge_atom_2)
+                + "   "
+                + str(self.charge_atom_2)
                 + "\n"
             )
-        xml.write("Finish writing the Charge Parameters" + "\n")
-        xml.close()
+            line_2 = "M  END" + "\n"
+            line_3 = "$$$$"
+            out.write(line_1)
+            out.write(line_2)
+            out.write(line_3)
+        # off_molecule = openforcefield.topology.Molecule(self.system_sdf)
+        off_molecule = Molecule(self.system_sdf)
+        # force_field = openforcefield.typing.engines.smirnoff.ForceField("openff_unconstrained-1.0.0.offxml")
+        force_field = ForceField("openff_unconstrained-1.0.0.offxml")
+        system = force_field.create_openmm_system(off_molecule.to_topology())
+        pdbfile = simtk.openmm.app.PDBFile(self.system_pdb)
+        structure = parmed.openmm.load_topology(
+            pdbfile.topology, system, xyz=pdbfile.positions
+        )
+        with open(self.system_xml, "w") as f:
+            f.write(simtk.openmm.XmlSerializer.serialize(system))
+
+    def write_system_params(self):
+        """
+        Saves the parameters obtained from the QM log files in a text file.
+        """
+        atoms = PdbFile.load(self.system_qm_pdb).records("ATOM")
+        atom_name_list = atoms["atom_number"].tolist()
+        atom_name_list = [i - 1 for i in atom_name_list]
+        qm_params = QMParameterSet.from_qm_files(
+            charge_parameter_file=self.charge_parameter_file,
+            bond_parameter_file=self.bond_parameter_file,
+            angle_parameter_file=self.angle_parameter_file,
+            atom_numbers=atom_name_list,
+        )
+        qm_params.save(self.system_qm_params_file, binary=self.binary_params)
 
     def write_intermediate_reparameterised_system_xml(self):
         """
         Writes a reparameterised XML force field file for
         ligand but without the QM obtained charges.
         """
-        # Bond Parameters
-        f_params = open(self.system_qm_params_file, "r")
-        lines_params = f_params.readlines()
-        # Bond Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Bond Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Bond Parameters" in lines_params[i]:
-                to_end = int(i)
-        bond_params = lines_params[to_begin + 1 : to_end]
-        index_search_replace_bond = []
-        for i in bond_params:
-            bond_line_to_replace = i
-            # print(bond_line_to_replace)
-            atom_number_list = [
-                re.findall("\d*\.?\d+", i)[3],
-                re.findall("\d*\.?\d+", i)[5],
-            ]
-            # print(atom_number_list)
-            comb_1 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_2 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_list_bond = [comb_1, comb_2]
-            # print(comb_list_bond)
-            list_search_bond = [
-                search_in_file(file=self.system_xml, word=comb_1),
-                search_in_file(file=self.system_xml, word=comb_2),
-            ]
-            # print(list_search_bond)
-            for j in range(len(list_search_bond)):
-                if list_search_bond[j] != []:
-                    to_add = (list_search_bond[j], i)
-                    # print(to_add)
-                    index_search_replace_bond.append(to_add)
-        # Angle Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Angle Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Angle Parameters" in lines_params[i]:
-                to_end = int(i)
-        angle_params = lines_params[to_begin + 1 : to_end]
-        index_search_replace_angle = []
-        for i in angle_params:
-            angle_line_to_replace = i
-            # print(angle_line_to_replace)
-        index_search_replace_angle = []
-        for i in angle_params:
-            angle_line_to_replace = i
-            # print(angle_line_to_replace)
-            atom_number_list = [
-                re.findall("\d*\.?\d+", i)[3],
-                re.findall("\d*\.?\d+", i)[5],
-                re.findall("\d*\.?\d+", i)[7],
-            ]
-            # print(atom_number_list)
-            comb_1 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + "/>"
-            )
-            comb_2 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_3 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + "/>"
-            )
-            comb_4 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_5 = (
-                "p1="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_6 = (
-                "p1="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_list_angle = [
-                comb_1,
-                comb_2,
-                comb_3,
-                comb_4,
-                comb_5,
-                comb_6,
-            ]
-            # print(comb_list_angle)
-            list_search_angle = [
-                search_in_file(file=self.system_xml, word=comb_1),
-                search_in_file(file=self.system_xml, word=comb_2),
-                search_in_file(file=self.system_xml, word=comb_3),
-                search_in_file(file=self.system_xml, word=comb_4),
-                search_in_file(file=self.system_xml, word=comb_5),
-                search_in_file(file=self.system_xml, word=comb_6),
-            ]
-            # print(list_search_angle)
-            for j in range(len(list_search_angle)):
-                if list_search_angle[j] != []:
-                    to_add = (list_search_angle[j], i)
-                    # print(to_add)
-                    index_search_replace_angle.append(to_add)
-        f_org = open(self.system_xml)
-        lines = f_org.readlines()
-        for i in range(len(index_search_replace_bond)):
-            line_number = index_search_replace_bond[i][0][0][0] - 1
-            line_to_replace = index_search_replace_bond[i][0][0][1]
-            line_to_replace_with = index_search_replace_bond[i][1]
-            lines[line_number] = line_to_replace_with
-        for i in range(len(index_search_replace_angle)):
-            line_number = index_search_replace_angle[i][0][0][0] - 1
-            line_to_replace = index_search_replace_angle[i][0][0][1]
-            line_to_replace_with = index_search_replace_angle[i][1]
-            lines[line_number] = line_to_replace_with
-        f_cop = open(self.reparameterised_intermediate_system_xml_file, "w")
-        for i in lines:
-            f_cop.write(i)
-        f_cop.close()
+        qm_params = QMParameterSet.load(self.system_qm_params_file)
+        patch_system_xml(
+            self.system_xml,
+            self.reparameterised_intermediate_system_xml_file,
+            qm_params.bond_lines() + qm_params.angle_lines(),
+        )
 
     def write_reparameterised_system_xml(self):
         """
         Writes a reparameterised XML force field file for the ligand.
         """
-        # Bond Parameters
-        f_params = open(self.system_qm_params_file, "r")
-        lines_params = f_params.readlines()
-        # Bond Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Bond Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Bond Parameters" in lines_params[i]:
-                to_end = int(i)
-        bond_params = lines_params[to_begin + 1 : to_end]
-        index_search_replace_bond = []
-        # TODO: These should use string formatting to become more concise
-        for i in bond_params:
-            bond_line_to_replace = i
-            # print(bond_line_to_replace)
-            atom_number_list = [
-                re.findall("\d*\.?\d+", i)[3],
-                re.findall("\d*\.?\d+", i)[5],
-            ]
-            # print(atom_number_list)
-            comb_1 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_2 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_list_bond = [comb_1, comb_2]
-            # print(comb_list_bond)
-            list_search_bond = [
-                search_in_file(file=self.system_xml, word=comb_1),
-                search_in_file(file=self.system_xml, word=comb_2),
-            ]
-            # print(list_search_bond)
-            for j in range(len(list_search_bond)):
-                if list_search_bond[j] != []:
-                    to_add = (list_search_bond[j], i)
-                    # print(to_add)
-                    index_search_replace_bond.append(to_add)
-        # Angle Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Angle Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Angle Parameters" in lines_params[i]:
-                to_end = int(i)
-        angle_params = lines_params[to_begin + 1 : to_end]
-        index_search_replace_angle = []
-        for i in angle_params:
-            angle_line_to_replace = i
-            # print(angle_line_to_replace)
-        index_search_replace_angle = []
-        for i in angle_params:
-            angle_line_to_replace = i
-            # print(angle_line_to_replace)
-            atom_number_list = [
-                re.findall("\d*\.?\d+", i)[3],
-                re.findall("\d*\.?\d+", i)[5],
-                re.findall("\d*\.?\d+", i)[7],
-            ]
-            # print(atom_number_list)
-            comb_1 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + "/>"
-            )
-            comb_2 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_3 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + "/>"
-            )
-            comb_4 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_5 = (
-                "p1="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_6 = (
-                "p1="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_list_angle = [
-                comb_1,
-                comb_2,
-                comb_3,
-                comb_4,
-                comb_5,
-                comb_6,
-            ]
-            # print(comb_list_angle)
-            list_search_angle = [
-                search_in_file(file=self.system_xml, word=comb_1),
-                search_in_file(file=self.system_xml, word=comb_2),
-                search_in_file(file=self.system_xml, word=comb_3),
-                search_in_file(file=self.system_xml, word=comb_4),
-                search_in_file(file=self.system_xml, word=comb_5),
-                search_in_file(file=self.system_xml, word=comb_6),
-            ]
-            # print(list_search_angle)
-            for j in range(len(list_search_angle)):
-                if list_search_angle[j] != []:
-                    to_add = (list_search_angle[j], i)
-                    # print(to_add)
-                    index_search_replace_angle.append(to_add)
-        f_org = open(self.system_xml)
-        lines = f_org.readlines()
-        for i in range(len(index_search_replace_bond)):
-            line_number = index_search_replace_bond[i][0][0][0] - 1
-            line_to_replace = index_search_replace_bond[i][0][0][1]
-            line_to_replace_with = index_search_replace_bond[i][1]
-            lines[line_number] = line_to_replace_with
-        for i in range(len(index_search_replace_angle)):
-            line_number = index_search_replace_angle[i][0][0][0] - 1
-            line_to_replace = index_search_replace_angle[i][0][0][1]
-            line_to_replace_with = index_search_replace_angle[i][1]
-            lines[line_number] = line_to_replace_with
-        f_cop = open(self.reparameterised_intermediate_system_xml_file, "w")
-        for i in lines:
-            f_cop.write(i)
-        f_cop.close()
-
-        f_params = open(self.system_qm_params_file)
-        lines_params = f_params.readlines()
-        # Charge Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Charge Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Charge Parameters" in lines_params[i]:
-                to_end = int(i)
-        charge_params = lines_params[to_begin + 1 : to_end]
-        non_bonded_index = []
-        for k in charge_params:
-            non_bonded_index.append(int(re.findall("[-+]?\d*\.\d+|\d+", k)[3]))
-        charge_for_index = []
-        for k in charge_params:
-            charge_for_index.append(
-                float(re.findall("[-+]?\d*\.\d+|\d+", k)[0])
-            )
-
-        xml_off = open(self.system_xml)
-        xml_off_lines = xml_off.readlines()
-        for i in range(len(xml_off_lines)):
-            if "<GlobalParameters/>" in xml_off_lines[i]:
-                to_begin = int(i)
-            if "<Exceptions>" in xml_off_lines[i]:
-                to_end = int(i)
-        nonbond_params = xml_off_lines[to_begin + 4 : to_end - 1]
-        # print(len(nonbond_params))
-        f_non_bonded = open(self.system_xml_non_bonded_file, "w")
-        for x in nonbond_params:
-            f_non_bonded.write(x)
-        f_non_bonded = open(self.system_xml_non_bonded_file)
-        lines_non_bonded = f_non_bonded.readlines()
-        # print(len(lines_non_bonded))
-        lines_non_bonded_to_write = []
-        for i in range(len(non_bonded_index)):
-            line_ = lines_non_bonded[non_bonded_index[i]]
-            # print(line_)
-            eps = float(re.findall("[-+]?\d*\.\d+|\d+", line_)[0])
-            sig = float(re.findall("[-+]?\d*\.\d+|\d+", line_)[2])
-            line_to_replace = (
-                "                                "
-                + "<Particle "
-                + "eps="
-                + '"'
-                + str(eps)
-                + '"'
-                + " "
-                + "q="
-                + '"'
-                + str(charge_for_index[i])
-                + '"'
-                + " "
-                + "sig="
-                + '"'
-                + str(sig)
-                + '"'
-                + "/>"
-            )
-            lines_non_bonded_to_write.append(line_to_replace)
-        data_ = list(zip(non_bonded_index, lines_non_bonded_to_write))
-
-        df_non_bonded_params = pd.DataFrame(
-            data_, columns=["line_index", "line"]
-        )
-        # print(df_non_bonded_params.head())
-        f_non_bonded_ = open(self.system_xml_non_bonded_file)
-        lines_non_bonded_ = f_non_bonded_.readlines()
-        for i in range(len(lines_non_bonded_)):
-            if i in non_bonded_index:
-                lines_non_bonded_[i] = (
-                    df_non_bonded_params.loc[
-                        df_non_bonded_params.line_index == i, "line"
-                    ].values[0]
-                ) + "\n"
-        # print(len(lines_non_bonded_))
-        f_write_non_bonded_reparams = open(
-            self.system_xml_non_bonded_reparams_file, "w"
-        )
-        for p in range(len(lines_non_bonded_)):
-            f_write_non_bonded_reparams.write(lines_non_bonded_[p])
-        f_write_non_bonded_reparams.close()
-        f_ = open(self.system_xml_non_bonded_reparams_file)
-        lines_ = f_.readlines()
-        print(len(lines_) == len(lines_non_bonded))
-
-        xml_off = open(self.reparameterised_intermediate_system_xml_file)
-        # TODO: implement function(s) to read certain types of files. DRY principle
-        xml_off_lines = xml_off.readlines()
-        for i in range(len(xml_off_lines)):
-            if "<GlobalParameters/>" in xml_off_lines[i]:
-                to_begin = int(i)
-            if "<Exceptions>" in xml_off_lines[i]:
-                to_end = int(i)
-
-        lines_before_params = xml_off_lines[: to_begin + 4]
-        f__ = open(self.system_xml_non_bonded_reparams_file)
-        lines_params_non_bonded = f__.readlines()
-        lines_after_params = xml_off_lines[to_end - 1 :]
-        f_reparams_xml = open(self.reparameterised_system_xml_file, "w")
-        for x in lines_before_params:
-            f_reparams_xml.write(x)
-        for x in lines_params_non_bonded:
-            f_reparams_xml.write(x)
-        for x in lines_after_params:
-            f_reparams_xml.write(x)
-        f_reparams_xml.close()
+        qm_params = QMParameterSet.load(self.system_qm_params_file)
+        patch_system_xml(
+            self.system_xml,
+            self.reparameterised_intermediate_system_xml_file,
+            qm_params.bond_lines() + qm_params.angle_lines(),
+        )
+        patch_system_xml(
+            self.reparameterised_intermediate_system_xml_file,
+            self.reparameterised_system_xml_file,
+            charges=qm_params.charges,
+            non_bonded_file=self.system_xml_non_bonded_file,
+            non_bonded_reparams_file=self.system_xml_non_bonded_reparams_file,
+        )
 
     def save_amber_params_non_qm_charges(self):
         """
@@ -6842,6 +9807,10 @@ class HostAmberXMLAmber:
         Argument to specify how to load the topology. Can either be "openmm"
         or "parmed".
 
+    binary_params: bool, optional
+        Also save the QM parameters in a compact binary .npz file
+        next to system_qm_params_file.
+
     """
 
     def __init__(
@@ -6873,6 +9842,7 @@ class HostAmberXMLAmber:
         prmtop_system_params="host_params.prmtop",
         inpcrd_system_params="host_params.inpcrd",
         load_topology="openmm",
+        binary_params=False,
     ):
         self.system_pdb = system_pdb
         self.system_sdf = system_sdf
@@ -6907,6 +9877,7 @@ class HostAmberXMLAmber:
         self.prmtop_system_params = prmtop_system_params
         self.inpcrd_system_params = inpcrd_system_params
         self.load_topology = load_topology
+        self.binary_params = binary_params
 
     def generate_xml_from_pdb_sdf(self):
         """
@@ -7028,505 +9999,34 @@ class HostAmberXMLAmber:
         """
         Saves the parameters obtained from the QM log files in a text file.
         """
-        # Charges from QM files
-        df_charges = pd.read_csv(
-            self.charge_parameter_file, header=None, delimiter=r"\s+"
-        )
-        df_charges.columns = ["atom", "charges"]
-        qm_charges = df_charges["charges"].values.tolist()
-        qm_charges = [round(num, 6) for num in qm_charges]
-        # print(qm_charges)
-        # Bond Parameters from QM files
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.system_qm_pdb)
-        atom_name_list = ppdb.df["ATOM"]["atom_number"].values.tolist()
-        atom_name_list = [i - 1 for i in atom_name_list]
-        # print(atom_name_list)
-        df = pd.read_csv(
-            self.bond_parameter_file, header=None, delimiter=r"\s+"
-        )
-        df.columns = [
-            "bond",
-            "k_bond",
-            "bond_length",
-            "bond_1",
-            "bond_2",
-        ]
-        # print(df.head())
-        bond_1_list = df["bond_1"].values.tolist()
-        bond_1_list = [x - 1 + min(atom_name_list) for x in bond_1_list]
-        bond_2_list = df["bond_2"].values.tolist()
-        bond_2_list = [x - 1 + min(atom_name_list) for x in bond_2_list]
-        # print(bond_1_list)
-        # print(bond_2_list)
-        k_bond_list = df["k_bond"].values.tolist()
-        k_bond_list = [
-            i * KCAL_MOL_PER_KJ_MOL * ANGSTROMS_PER_NM**2 for i in k_bond_list
-        ]  # kcal/mol * A^2 to kJ/mol * nm^2
-        k_bond_list = [round(num, 10) for num in k_bond_list]
-        # print(k_bond_list)
-        bond_length_list = df["bond_length"].values.tolist()
-        bond_length_list = [i / 10.00 for i in bond_length_list]
-        bond_length_list = [round(num, 6) for num in bond_length_list]
-        # print(bond_length_list)
-        # Angle Parameters from QM files
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.system_qm_pdb)
-        atom_name_list = ppdb.df["ATOM"]["atom_number"].values.tolist()
+        atoms = PdbFile.load(self.system_qm_pdb).records("ATOM")
+        atom_name_list = atoms["atom_number"].tolist()
         atom_name_list = [i - 1 for i in atom_name_list]
-        # print(atom_name_list)
-        df = pd.read_csv(
-            self.angle_parameter_file, header=None, delimiter=r"\s+"
+        qm_params = QMParameterSet.from_qm_files(
+            charge_parameter_file=self.charge_parameter_file,
+            bond_parameter_file=self.bond_parameter_file,
+            angle_parameter_file=self.angle_parameter_file,
+            atom_numbers=atom_name_list,
         )
-        df.columns = [
-            "angle",
-            "k_angle",
-            "angle_degrees",
-            "angle_1",
-            "angle_2",
-            "angle_3",
-        ]
-        # print(df.head())
-        angle_1_list = df["angle_1"].values.tolist()
-        angle_1_list = [x - 1 + min(atom_name_list) for x in angle_1_list]
-        # print(angle_1_list)
-        angle_2_list = df["angle_2"].values.tolist()
-        angle_2_list = [x - 1 + min(atom_name_list) for x in angle_2_list]
-        # print(angle_2_list)
-        angle_3_list = df["angle_3"].values.tolist()
-        angle_3_list = [x - 1 + min(atom_name_list) for x in angle_3_list]
-        # print(angle_3_list)
-        k_angle_list = df["k_angle"].values.tolist()
-        k_angle_list = [
-            i * 4.184 for i in k_angle_list
-        ]  # kcal/mol * radian^2 to kJ/mol * radian^2
-        k_angle_list = [round(num, 6) for num in k_angle_list]
-        # print(k_angle_list)
-        angle_list = df["angle_degrees"].values.tolist()
-        angle_list = [(i * math.pi) / 180.00 for i in angle_list]
-        angle_list = [round(num, 6) for num in angle_list]
-        # print(angle_list)
-        xml = open(self.system_qm_params_file, "w")
-        xml.write("Begin writing the Bond Parameters" + "\n")
-        for i in range(len(k_bond_list)):
-            xml.write(
-                "                                "
-                + "<Bond"
-                + " "
-                + "d="
-                + '"'
-                + str(bond_length_list[i])
-                + '"'
-                + " "
-                + "k="
-                + '"'
-                + str(k_bond_list[i])
-                + '"'
-                + " "
-                + "p1="
-                + '"'
-                + str(bond_1_list[i])
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + str(bond_2_list[i])
-                + '"'
-                + "/>"
-                + "\n"
-            )
-        xml.write("Finish writing the Bond Parameters" + "\n")
-        xml.write("Begin writing the Angle Parameters" + "\n")
-        for i in range(len(k_angle_list)):
-            xml.write(
-                "                                "
-                + "<Angle"
-                + " "
-                + "a="
-                + '"'
-                + str(angle_list[i])
-                + '"'
-                + " "
-                + "k="
-                + '"'
-                + str(k_angle_list[i])
-                + '"'
-                + " "
-                + "p1="
-                + '"'
-                + str(angle_1_list[i])
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + str(angle_2_list[i])
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + str(angle_3_list[i])
-                + '"'
-                + "/>"
-                + "\n"
-            )
-        xml.write("Finish writing the Angle Parameters" + "\n")
-        xml.write("Begin writing the Charge Parameters" + "\n")
-        for i in range(len(qm_charges)):
-            xml.write(
-                "<Particle"
-                + " "
-                + "q="
-                + '"'
-                + str(qm_charges[i])
-                + '"'
-                + " "
-                + "eps="
-                + '"'
-                + str(0.00)
-                + '"'
-                + " "
-                + "sig="
-                + '"'
-                + str(0.00)
-                + '"'
-                + " "
-                + "atom="
-                + '"'
-                + str(atom_name_list[i])
-                + '"'
-                + "/>"
-                + "\n"
-            )
-        xml.write("Finish writing the Charge Parameters" + "\n")
-        xml.close()
+        qm_params.save(self.system_qm_params_file, binary=self.binary_params)
 
     def write_reparameterised_system_xml(self):
         """
         Writes a reparameterised XML force field file for the ligand.
         """
-        # Bond Parameters
-        f_params = open(self.system_qm_params_file, "r")
-        lines_params = f_params.readlines()
-        # Bond Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Bond Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Bond Parameters" in lines_params[i]:
-                to_end = int(i)
-        bond_params = lines_params[to_begin + 1 : to_end]
-        index_search_replace_bond = []
-        for i in bond_params:
-            bond_line_to_replace = i
-            # print(bond_line_to_replace)
-            atom_number_list = [
-                re.findall("\d*\.?\d+", i)[3],
-                re.findall("\d*\.?\d+", i)[5],
-            ]
-            # print(atom_number_list)
-            comb_1 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_2 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_list_bond = [comb_1, comb_2]
-            # print(comb_list_bond)
-            list_search_bond = [
-                search_in_file(file=self.system_xml, word=comb_1),
-                search_in_file(file=self.system_xml, word=comb_2),
-            ]
-            # print(list_search_bond)
-            for j in range(len(list_search_bond)):
-                if list_search_bond[j] != []:
-                    to_add = (list_search_bond[j], i)
-                    # print(to_add)
-                    index_search_replace_bond.append(to_add)
-        # Angle Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Angle Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Angle Parameters" in lines_params[i]:
-                to_end = int(i)
-        angle_params = lines_params[to_begin + 1 : to_end]
-        index_search_replace_angle = []
-        for i in angle_params:
-            angle_line_to_replace = i
-            # print(angle_line_to_replace)
-        index_search_replace_angle = []
-        for i in angle_params:
-            angle_line_to_replace = i
-            # print(angle_line_to_replace)
-            atom_number_list = [
-                re.findall("\d*\.?\d+", i)[3],
-                re.findall("\d*\.?\d+", i)[5],
-                re.findall("\d*\.?\d+", i)[7],
-            ]
-            # print(atom_number_list)
-            comb_1 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + "/>"
-            )
-            comb_2 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_3 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + "/>"
-            )
-            comb_4 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_5 = (
-                "p1="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_6 = (
-                "p1="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_list_angle = [
-                comb_1,
-                comb_2,
-                comb_3,
-                comb_4,
-                comb_5,
-                comb_6,
-            ]
-            # print(comb_list_angle)
-            list_search_angle = [
-                search_in_file(file=self.system_xml, word=comb_1),
-                search_in_file(file=self.system_xml, word=comb_2),
-                search_in_file(file=self.system_xml, word=comb_3),
-                search_in_file(file=self.system_xml, word=comb_4),
-                search_in_file(file=self.system_xml, word=comb_5),
-                search_in_file(file=self.system_xml, word=comb_6),
-            ]
-            # print(list_search_angle)
-            for j in range(len(list_search_angle)):
-                if list_search_angle[j] != []:
-                    to_add = (list_search_angle[j], i)
-                    # print(to_add)
-                    index_search_replace_angle.append(to_add)
-        f_org = open(self.system_xml)
-        lines = f_org.readlines()
-        for i in range(len(index_search_replace_bond)):
-            line_number = index_search_replace_bond[i][0][0][0] - 1
-            line_to_replace = index_search_replace_bond[i][0][0][1]
-            line_to_replace_with = index_search_replace_bond[i][1]
-            lines[line_number] = line_to_replace_with
-        for i in range(len(index_search_replace_angle)):
-            line_number = index_search_replace_angle[i][0][0][0] - 1
-            line_to_replace = index_search_replace_angle[i][0][0][1]
-            line_to_replace_with = index_search_replace_angle[i][1]
-            lines[line_number] = line_to_replace_with
-        f_cop = open(self.reparameterised_intermediate_system_xml_file, "w")
-        for i in lines:
-            f_cop.write(i)
-        f_cop.close()
-
-        f_params = open(self.system_qm_params_file)
-        lines_params = f_params.readlines()
-        # Charge Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Charge Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Charge Parameters" in lines_params[i]:
-                to_end = int(i)
-        charge_params = lines_params[to_begin + 1 : to_end]
-        non_bonded_index = []
-        for k in charge_params:
-            non_bonded_index.append(int(re.findall("[-+]?\d*\.\d+|\d+", k)[3]))
-        charge_for_index = []
-        for k in charge_params:
-            charge_for_index.append(
-                float(re.findall("[-+]?\d*\.\d+|\d+", k)[0])
-            )
-
-        xml_off = open(self.system_xml)
-        xml_off_lines = xml_off.readlines()
-        for i in range(len(xml_off_lines)):
-            if "<GlobalParameters/>" in xml_off_lines[i]:
-                to_begin = int(i)
-            if "<Exceptions>" in xml_off_lines[i]:
-                to_end = int(i)
-        nonbond_params = xml_off_lines[to_begin + 4 : to_end - 1]
-        # print(len(nonbond_params))
-        f_non_bonded = open(self.system_xml_non_bonded_file, "w")
-        for x in nonbond_params:
-            f_non_bonded.write(x)
-        f_non_bonded = open(self.system_xml_non_bonded_file)
-        lines_non_bonded = f_non_bonded.readlines()
-        # print(len(lines_non_bonded))
-        lines_non_bonded_to_write = []
-        for i in range(len(non_bonded_index)):
-            line_ = lines_non_bonded[non_bonded_index[i]]
-            # print(line_)
-            eps = float(re.findall("[-+]?\d*\.\d+|\d+", line_)[0])
-            sig = float(re.findall("[-+]?\d*\.\d+|\d+", line_)[2])
-            line_to_replace = (
-                "                                "
-                + "<Particle "
-                + "eps="
-                + '"'
-                + str(eps)
-                + '"'
-                + " "
-                + "q="
-                + '"'
-                + str(charge_for_index[i])
-                + '"'
-                + " "
-                + "sig="
-                + '"'
-                + str(sig)
-                + '"'
-                + "/>"
-            )
-            lines_non_bonded_to_write.append(line_to_replace)
-        data_ = list(zip(non_bonded_index, lines_non_bonded_to_write))
-
-        df_non_bonded_params = pd.DataFrame(
-            data_, columns=["line_index", "line"]
-        )
-        # print(df_non_bonded_params.head())
-        f_non_bonded_ = open(self.system_xml_non_bonded_file)
-        lines_non_bonded_ = f_non_bonded_.readlines()
-        for i in range(len(lines_non_bonded_)):
-            if i in non_bonded_index:
-                lines_non_bonded_[i] = (
-                    df_non_bonded_params.loc[
-                        df_non_bonded_params.line_index == i, "line"
-                    ].values[0]
-                ) + "\n"
-        # print(len(lines_non_bonded_))
-        f_write_non_bonded_reparams = open(
-            self.system_xml_non_bonded_reparams_file, "w"
-        )
-        for p in range(len(lines_non_bonded_)):
-            f_write_non_bonded_reparams.write(lines_non_bonded_[p])
-        f_write_non_bonded_reparams.close()
-        f_ = open(self.system_xml_non_bonded_reparams_file)
-        lines_ = f_.readlines()
-        print(len(lines_) == len(lines_non_bonded))
-
-        xml_off = open(self.reparameterised_intermediate_system_xml_file)
-        xml_off_lines = xml_off.readlines()
-        for i in range(len(xml_off_lines)):
-            if "<GlobalParameters/>" in xml_off_lines[i]:
-                to_begin = int(i)
-            if "<Exceptions>" in xml_off_lines[i]:
-                to_end = int(i)
-
-        lines_before_params = xml_off_lines[: to_begin + 4]
-        f__ = open(self.system_xml_non_bonded_reparams_file)
-        lines_params_non_bonded = f__.readlines()
-        lines_after_params = xml_off_lines[to_end - 1 :]
-        f_reparams_xml = open(self.reparameterised_system_xml_file, "w")
-        for x in lines_before_params:
-            f_reparams_xml.write(x)
-        for x in lines_params_non_bonded:
-            f_reparams_xml.write(x)
-        for x in lines_after_params:
-            f_reparams_xml.write(x)
-        f_reparams_xml.close()
+        qm_params = QMParameterSet.load(self.system_qm_params_file)
+        patch_system_xml(
+            self.system_xml,
+            self.reparameterised_intermediate_system_xml_file,
+            qm_params.bond_lines() + qm_params.angle_lines(),
+        )
+        patch_system_xml(
+            self.reparameterised_intermediate_system_xml_file,
+            self.reparameterised_system_xml_file,
+            charges=qm_params.charges,
+            non_bonded_file=self.system_xml_non_bonded_file,
+            non_bonded_reparams_file=self.system_xml_non_bonded_reparams_file,
+        )
 
     def save_amber_params(self):
         """
@@ -8208,6 +10708,208 @@ class MergeHostGuestTopology:
         system.save(self.system_inpcrd, overwrite=True)
 
 
+class TorsionTable:
+
+    """
+    A class used to hold the torsion parameters of the reparameterized
+    ligand, from which the dihedral angles scanned with torsiondrive
+    are selected.
+
+    The torsions are read once into a NumPy structured array and the
+    atoms of all the torsions are kept as a single (T, 4) array, so
+    that selecting the dihedral angles to scan (removing duplicates,
+    hydrogen atoms or unbonded atoms) is done with mask operations over
+    whole arrays. As for QMParameterSet, the tables most recently saved
+    or loaded are kept in a cache keyed by the path of their text file.
+
+    ...
+
+    Attributes
+    ----------
+    torsions: numpy.ndarray
+        Structured array of the torsion parameters with fields k
+        (force constant in kJ/mol), p1, p2, p3, p4 (atom numbers
+        starting from 1), periodicity and phase (in radians), in the
+        column order of the text file.
+
+    atoms: numpy.ndarray
+        (T, 4) array of the atom numbers of the torsions.
+
+    """
+
+    torsion_dtype = np.dtype(
+        [
+            ("k", np.float64),
+            ("p1", np.int64),
+            ("p2", np.int64),
+            ("p3", np.int64),
+            ("p4", np.int64),
+            ("periodicity", np.int64),
+            ("phase", np.float64),
+        ]
+    )
+    # Torsion tables most recently saved or loaded, keyed by path
+    cache = FileCache()
+
+    def __init__(self, torsions=None):
+
+        self.torsions = np.array(
+            [] if torsions is None else torsions, dtype=self.torsion_dtype
+        )
+        self.atoms = np.column_stack(
+            [self.torsions[i] for i in ["p1", "p2", "p3", "p4"]]
+        ).reshape(-1, 4)
+
+    @classmethod
+    def from_xml(cls, xml_file):
+        """
+        Returns the torsion table of the (last) PeriodicTorsionForce of
+        a serialized System, tokenizing each torsion line once.
+        """
+        with open(xml_file, "r") as f:
+            lines = f.readlines()
+        for i in range(len(lines)):
+            if "<Torsions>" in lines[i]:
+                to_begin = int(i)
+            if "</Torsions>" in lines[i]:
+                to_end = int(i)
+        attribute = re.compile(r'(\w+)="([^"]*)"')
+        torsions = []
+        for line in lines[to_begin + 1 : to_end]:
+            values = dict(attribute.findall(line))
+            torsions.append(
+                (
+                    round(float(values["k"]), 10),
+                    # Atom numbers starting from 1
+                    int(values["p1"]) + 1,
+                    int(values["p2"]) + 1,
+                    int(values["p3"]) + 1,
+                    int(values["p4"]) + 1,
+                    int(values["periodicity"]),
+                    round(float(values["phase"]), 8),
+                )
+            )
+        return cls(torsions)
+
+    @classmethod
+    def from_system(cls, system):
+        """
+        Returns the torsion table of the (last) PeriodicTorsionForce of
+        an OpenMM System.
+        """
+        torsions = []
+        for force in system.getForces():
+            if isinstance(force, simtk.openmm.PeriodicTorsionForce):
+                torsions = []
+                for i in range(force.getNumTorsions()):
+                    (
+                        p1,
+                        p2,
+                        p3,
+                        p4,
+                        periodicity,
+                        phase,
+                        k,
+                    ) = force.getTorsionParameters(i)
+                    torsions.append(
+                        (
+                            round(
+                                k.value_in_unit(
+                                    simtk.unit.kilojoule_per_mole
+                                ),
+                                10,
+                            ),
+                            p1 + 1,
+                            p2 + 1,
+                            p3 + 1,
+                            p4 + 1,
+                            periodicity,
+                            round(phase.value_in_unit(simtk.unit.radian), 8),
+                        )
+                    )
+        return cls(torsions)
+
+    def write(self, torsion_file):
+        """
+        Writes the torsion parameters to a text file, one torsion per
+        line.
+        """
+        pd.DataFrame(self.torsions).to_csv(
+            torsion_file, index=False, header=False, sep=" "
+        )
+
+    @classmethod
+    def read(cls, torsion_file):
+        """
+        Returns the torsion table read from a text file written by
+        TorsionTable.write.
+        """
+        return cls(
+            [tuple(i) for i in np.loadtxt(torsion_file, ndmin=2).tolist()]
+        )
+
+    def save(self, torsion_file):
+        """
+        Writes the torsion parameters to a text file and keeps the
+        table in memory for the next steps.
+        """
+        self.write(torsion_file)
+        stat = os.stat(torsion_file)
+        mtime = (stat.st_mtime_ns, stat.st_size)
+        self.cache[os.path.abspath(torsion_file)] = (mtime, self)
+
+    @classmethod
+    def load(cls, torsion_file):
+        """
+        Returns the torsion table of a text file, reusing the one kept
+        in memory as long as the file has not been modified since.
+        """
+        path = os.path.abspath(torsion_file)
+        stat = os.stat(path)
+        mtime = (stat.st_mtime_ns, stat.st_size)
+        if path not in cls.cache or cls.cache[path][0] != mtime:
+            cls.cache[path] = (mtime, cls.read(torsion_file))
+        return cls.cache[path][1]
+
+    def get_dihedrals(self, element_symbols=None, topology=None):
+        """
+        Returns the dihedral angles of the torsions (atom numbers
+        starting from 1), each set of four atoms being kept once, in
+        the order of its first torsion.
+
+        Parameters
+        ----------
+        element_symbols : numpy.ndarray, optional
+            Element symbols indexed by atom number. If given, the
+            dihedral angles with a hydrogen atom are left out.
+
+        topology : BondedTopology, optional
+            Bonded topology of the ligand. If given, only the dihedral
+            angles whose atoms are bonded in sequence are kept.
+
+        Returns
+        -------
+        dihedrals : (D, 4) numpy.ndarray
+            Atom numbers of the dihedral angles.
+
+        """
+        # Canonical tuple of a dihedral angle: its sorted atoms
+        _, first = np.unique(
+            np.sort(self.atoms, axis=1), axis=0, return_index=True
+        )
+        dihedrals = self.atoms[np.sort(first)]
+        mask = np.ones(len(dihedrals), dtype=bool)
+        if element_symbols is not None:
+            mask &= ~np.any(element_symbols[dihedrals] == "H", axis=1)
+        if topology is not None:
+            # Atom indices starting from 0
+            atoms = dihedrals - 1
+            mask &= topology.is_bonded(atoms[:, :3], atoms[:, 1:]).all(
+                axis=1
+            )
+        return dihedrals[mask]
+
+
 class TorsionDriveSims:
 
     """
@@ -8291,6 +10993,55 @@ class TorsionDriveSims:
         Only activate grid points if the new optimization is lower than
         the previous lowest energy (in a.u.).
 
+    n_jobs : int, optional
+        Maximum number of torsiondrive calculations running
+        concurrently.
+
+    n_threads : int, optional
+        Number of threads used by the QM engine for each torsiondrive
+        calculation. If given, it is also written to the psi4 input
+        files. Otherwise, it defaults to the number of cores available
+        to run_torsion_sim divided by n_jobs, so that the inputs can be
+        prepared on a different machine. n_jobs * n_threads must not
+        exceed the number of cores available to run_torsion_sim.
+
+    qm_scan_file : str, optional
+        Output scan file written by a completed torsiondrive
+        calculation.
+
+    torsion_drive_log_file : str, optional
+        Log file written in each torsiondrive directory with the
+        output of the torsiondrive calculation.
+
+    torsion_sim_summary_file : str, optional
+        Text file summarizing the exit status of the torsiondrive
+        calculations.
+
+    qm_cache : QMCache, optional
+        Cache of the QM results. If given, the scan and log files of a
+        torsiondrive directory are restored from the cache instead of
+        running the calculation when its psi4 input, dihedral and
+        torsiondrive command files match a cached calculation.
+
+    deduplicate_dihedrals : bool, optional
+        If True, a single torsiondrive calculation is run for the
+        dihedral angles sharing a central bond, and for the
+        topologically equivalent central bonds if system_sdf is
+        given. The fitted parameters are then applied by
+        TorsionDriveParams to the scanned dihedral angle and its
+        symmetry equivalents only; the other dihedral angles around
+        a scanned bond keep their OpenFF parameters (see
+        group_equivalent_dihedrals).
+
+    system_sdf : str, optional
+        Ligand SDF file used to find the topologically equivalent
+        atoms when deduplicating the dihedral angles.
+
+    equivalent_dihedral_text_file : str, optional
+        File written in each torsiondrive directory with the
+        dihedral angles sharing the parameters of the scanned one,
+        when the dihedral angles are deduplicated.
+
     """
 
     def __init__(
@@ -8314,6 +11065,15 @@ class TorsionDriveSims:
         dihedral_interval=15,
         engine="psi4",
         energy_threshold=0.00001,
+        n_jobs=1,
+        n_threads=None,
+        qm_scan_file="scan.xyz",
+        torsion_drive_log_file="torsion_drive.log",
+        torsion_sim_summary_file="torsion_sim_summary.txt",
+        qm_cache=None,
+        deduplicate_dihedrals=False,
+        system_sdf=None,
+        equivalent_dihedral_text_file="equivalent_dihedrals.txt",
     ):
 
         self.charge = charge
@@ -8335,6 +11095,30 @@ class TorsionDriveSims:
         self.dihedral_interval = dihedral_interval
         self.engine = engine
         self.energy_threshold = energy_threshold
+        self.n_jobs = n_jobs
+        self.n_threads = n_threads
+        self.qm_scan_file = qm_scan_file
+        self.torsion_drive_log_file = torsion_drive_log_file
+        self.torsion_sim_summary_file = torsion_sim_summary_file
+        self.qm_cache = qm_cache
+        self.deduplicate_dihedrals = deduplicate_dihedrals
+        self.system_sdf = system_sdf
+        self.equivalent_dihedral_text_file = equivalent_dihedral_text_file
+
+    def get_n_threads(self):
+        """
+        Returns the number of threads of each torsiondrive calculation
+        on the current machine, checking that n_jobs calculations fit
+        in the available cores.
+        """
+        n_threads = self.n_threads
+        if n_threads is None:
+            n_threads = max(1, get_num_cores() // self.n_jobs)
+        if self.n_jobs * n_threads > get_num_cores():
+            raise ValueError(
+                "n_jobs * n_threads exceeds the number of available cores."
+            )
+        return n_threads
 
     def write_torsion_drive_run_file(self):
         """
@@ -8396,62 +11180,10 @@ class TorsionDriveSims:
         Saves a text file containing torsional parameters from the reparameterized XML
         force field file.
         """
-        xml_off = open(self.reparameterised_system_xml_file, "r")
-        xml_off_lines = xml_off.readlines()
-        for i in range(len(xml_off_lines)):
-            if "<Torsions>" in xml_off_lines[i]:
-                to_begin = int(i)
-            if "</Torsions>" in xml_off_lines[i]:
-                to_end = int(i)
-        torsion_params = xml_off_lines[to_begin + 1 : to_end]
-
-        k_list_off = []
-        for i in range(len(torsion_params)):
-            k_list_off.append(
-                float(re.findall("\d*\.?\d+", torsion_params[i])[0])
-            )
-        k_list_off = [round(num, 10) for num in k_list_off]
-        # print(k_list_off)
-        p1 = []
-        for i in range(len(torsion_params)):
-            p1.append(int(re.findall("\d*\.?\d+", torsion_params[i])[2]))
-        p1 = [i + 1 for i in p1]
-        # print(p1)
-        p2 = []
-        for i in range(len(torsion_params)):
-            p2.append(int(re.findall("\d*\.?\d+", torsion_params[i])[4]))
-        p2 = [i + 1 for i in p2]
-        # print(p2)
-        p3 = []
-        for i in range(len(torsion_params)):
-            p3.append(int(re.findall("\d*\.?\d+", torsion_params[i])[6]))
-        p3 = [i + 1 for i in p3]
-        # print(p3)
-        p4 = []
-        for i in range(len(torsion_params)):
-            p4.append(int(re.findall("\d*\.?\d+", torsion_params[i])[8]))
-        p4 = [i + 1 for i in p4]
-        # print(p4)
-        periodicity = []
-        for i in range(len(torsion_params)):
-            periodicity.append(
-                int(re.findall("\d*\.?\d+", torsion_params[i])[9])
-            )
-        # print(periodicity)
-        phase = []
-        for i in range(len(torsion_params)):
-            phase.append(float(re.findall("\d*\.?\d+", torsion_params[i])[10]))
-        phase = [round(num, 8) for num in phase]
-        # print(phase)
-        data_tuples = list(zip(k_list_off, p1, p2, p3, p4, periodicity, phase))
-        df_tor = pd.DataFrame(
-            data_tuples,
-            columns=["k", "p1", "p2", "p3", "p4", "periodicity", "phase",],
-        )
-        # print(df_tor.head())
-        df_tor.to_csv(
-            self.torsion_xml_file, index=False, header=False, sep=" "
+        torsion_table = TorsionTable.from_xml(
+            self.reparameterised_system_xml_file
         )
+        torsion_table.save(self.torsion_xml_file)
 
     def write_psi4_input(self):
         """
@@ -8470,6 +11202,10 @@ class TorsionDriveSims:
             if self.method_torsion_drive == "native_opt":
                 f.write("GEOM_MAXITER" + " " + str(self.iterations) + "\n")
             f.write("}" + "\n")
+            if self.n_threads is not None:
+                f.write(
+                    "set_num_threads(" + str(self.n_threads) + ")" + "\n"
+                )
             if self.method_torsion_drive == "native_opt":
                 f.write(
                     "optimize" + "(" + "'" + self.functional + "'" ")" + "\n"
@@ -8479,37 +11215,81 @@ class TorsionDriveSims:
                     "gradient" + "(" + "'" + self.functional + "'" ")" + "\n"
                 )
 
-    def create_torsion_drive_dir(self):
-        """
-        Creates a directory for carrying out torsiondrive
-        calculations for all the proper dihedral angles.
+    def get_torsion_drive_dihedrals(
+        self, exclude_hydrogens=False, bonded_only=False
+    ):
         """
-        df_tor = pd.read_csv(
-            self.torsion_xml_file, header=None, delimiter=r"\s+"
-        )
-        df_tor.columns = [
-            "k",
-            "p1",
-            "p2",
-            "p3",
-            "p4",
-            "periodicity",
-            "phase",
-        ]
-        # print(df_tor.head())
-        df_dihedrals = df_tor[["p1", "p2", "p3", "p4"]]
-        # print(df_dihedrals.head())
-        dihedrals_list_list = []
-        for i in range(len(df_dihedrals)):
-            dihedrals_list_list.append(df_dihedrals.iloc[i].values.tolist())
-        set_list = set()
-        unique_dihedrals_list_list = []
-        for x in dihedrals_list_list:
-            srtd = tuple(sorted(x))
-            if srtd not in set_list:
-                unique_dihedrals_list_list.append(x)
-                set_list.add(srtd)
-        # print(unique_dihedrals_list_list)
+        Returns the dihedral angles (atom numbers starting from 1) of
+        the torsional parameters to scan with torsiondrive.
+
+        Parameters
+        ----------
+        exclude_hydrogens : bool, optional
+            If True, the dihedral angles with a hydrogen atom are left
+            out.
+
+        bonded_only : bool, optional
+            If True, only the dihedral angles whose atoms are bonded in
+            sequence are kept.
+
+        Returns
+        -------
+        dihedrals : (D, 4) numpy.ndarray
+            Atom numbers of the dihedral angles.
+
+        """
+        element_symbols = None
+        if exclude_hydrogens:
+            atoms = PdbFile.load(self.template_pdb).records("ATOM")
+            # Element symbols indexed by atom number
+            element_symbols = np.full(
+                atoms["atom_number"].max() + 1, "", dtype="U2"
+            )
+            element_symbols[atoms["atom_number"]] = atoms["element_symbol"]
+        topology = None
+        if bonded_only:
+            topology = BondedTopology.load(self.system_bonds_file)
+        dihedrals = TorsionTable.load(self.torsion_xml_file).get_dihedrals(
+            element_symbols=element_symbols, topology=topology
+        )
+        if element_symbols is not None:
+            print(element_symbols[dihedrals].tolist())
+        return dihedrals
+
+    def group_torsion_drive_dihedrals(self, dihedrals):
+        """
+        Returns the groups of equivalent dihedral angles (atom numbers
+        starting from 1), the first dihedral angle of each group being
+        the one to scan (see group_equivalent_dihedrals). The symmetry
+        classes are taken from the OpenFF Molecule of system_sdf, if
+        given.
+        """
+        symmetry_classes = None
+        if self.system_sdf is not None:
+            symmetry_classes = get_symmetry_classes(Molecule(self.system_sdf))
+        return group_equivalent_dihedrals(dihedrals, symmetry_classes)
+
+    def write_torsion_drive_dirs(self, dihedrals):
+        """
+        Creates a directory for carrying out torsiondrive calculations
+        with a torsiondrive folder for each dihedral angle. If
+        deduplicate_dihedrals is True, a single folder is created for
+        each group of equivalent dihedral angles, with the dihedral
+        angles sharing its parameters in equivalent_dihedral_text_file.
+        """
+        equivalent_dihedrals = None
+        if self.deduplicate_dihedrals:
+            equivalent_dihedrals = self.group_torsion_drive_dihedrals(
+                dihedrals
+            )
+            dihedrals = np.array(
+                [i[0] for i in equivalent_dihedrals], dtype=np.int64
+            ).reshape(-1, 4)
+            print(
+                "Scanning "
+                + str(len(equivalent_dihedrals))
+                + " groups of equivalent dihedral angles"
+            )
         os.system("rm -rf " + self.tor_dir)
         os.system("mkdir " + self.tor_dir)
         parent_cwd = os.getcwd()
@@ -8531,444 +11311,163 @@ class TorsionDriveSims:
         )
         os.chdir(parent_cwd + "/" + self.tor_dir)
         torsion_drive_dir = os.getcwd()
-        for i in range(len(unique_dihedrals_list_list)):
+        for i in range(len(dihedrals)):
             dir_name = "torsion_drive" + "_" + str(i)
             os.system("rm -rf " + dir_name)
             os.system("mkdir " + dir_name)
             os.chdir(torsion_drive_dir + "/" + dir_name)
-            with open(self.dihedral_text_file, "w") as f:
-                f.write(
-                    "# dihedral definition by atom indices starting from 1"
-                    + "\n"
-                )
-                f.write("# i     j     k     l" + "\n")
-                i_ = unique_dihedrals_list_list[i][0]
-                j_ = unique_dihedrals_list_list[i][1]
-                k_ = unique_dihedrals_list_list[i][2]
-                l_ = unique_dihedrals_list_list[i][3]
-                f.write(
-                    " "
-                    + "{:< 6d}".format(i_)
-                    + "{:< 6d}".format(j_)
-                    + "{:< 6d}".format(k_)
-                    + "{:< 6d}".format(l_)
-                    + "\n"
+            write_dihedral_text_file(self.dihedral_text_file, dihedrals[i])
+            if equivalent_dihedrals is not None:
+                write_dihedral_text_file(
+                    self.equivalent_dihedral_text_file,
+                    equivalent_dihedrals[i],
                 )
-                shutil.copy(
-                    torsion_drive_dir + "/" + self.psi_input_file,
-                    torsion_drive_dir
-                    + "/"
-                    + dir_name
-                    + "/"
-                    + self.psi_input_file,
-                )
-                shutil.copy(
-                    torsion_drive_dir + "/" + self.template_pdb,
-                    torsion_drive_dir
-                    + "/"
-                    + dir_name
-                    + "/"
-                    + self.template_pdb,
-                )
-                shutil.copy(
-                    torsion_drive_dir + "/" + self.torsion_drive_run_file,
-                    torsion_drive_dir
-                    + "/"
-                    + dir_name
-                    + "/"
-                    + self.torsion_drive_run_file,
-                )
-                os.chdir(torsion_drive_dir)
+            shutil.copy(
+                torsion_drive_dir + "/" + self.psi_input_file,
+                torsion_drive_dir
+                + "/"
+                + dir_name
+                + "/"
+                + self.psi_input_file,
+            )
+            shutil.copy(
+                torsion_drive_dir + "/" + self.template_pdb,
+                torsion_drive_dir
+                + "/"
+                + dir_name
+                + "/"
+                + self.template_pdb,
+            )
+            shutil.copy(
+                torsion_drive_dir + "/" + self.torsion_drive_run_file,
+                torsion_drive_dir
+                + "/"
+                + dir_name
+                + "/"
+                + self.torsion_drive_run_file,
+            )
+            os.chdir(torsion_drive_dir)
         os.system("rm -rf " + self.psi_input_file)
         os.system("rm -rf " + self.template_pdb)
         os.system("rm -rf " + self.torsion_drive_run_file)
         os.chdir(parent_cwd)
 
+    def create_torsion_drive_dir(self):
+        """
+        Creates a directory for carrying out torsiondrive
+        calculations for all the proper dihedral angles.
+        """
+        dihedrals = self.get_torsion_drive_dihedrals()
+        self.write_torsion_drive_dirs(dihedrals)
+
     def create_non_H_torsion_drive_dir(self):
         """
         Creates a directory for carrying out torsiondrive
         calculations for all non-hydrogen torsional angles.
         """
-        df_tor = pd.read_csv(
-            self.torsion_xml_file, header=None, delimiter=r"\s+"
-        )
-        df_tor.columns = [
-            "k",
-            "p1",
-            "p2",
-            "p3",
-            "p4",
-            "periodicity",
-            "phase",
-        ]
-        # print(df_tor.head())
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.template_pdb)
-        df_index_symbol = ppdb.df["ATOM"][["atom_number", "element_symbol"]]
-        # print(df_index_symbol.head())
-        df_dihedrals = df_tor[["p1", "p2", "p3", "p4"]]
-        # print(df_dihedrals.head())
-        dihedrals_list_list = []
-        for i in range(len(df_dihedrals)):
-            dihedrals_list_list.append(df_dihedrals.iloc[i].values.tolist())
-        set_list = set()
-        unique_dihedrals_list_list = []
-        for x in dihedrals_list_list:
-            srtd = tuple(sorted(x))
-            if srtd not in set_list:
-                unique_dihedrals_list_list.append(x)
-                set_list.add(srtd)
-        # print(unique_dihedrals_list_list)
-        atom_dihedral_list = []
-        for sub_list in unique_dihedrals_list_list:
-            atom_dihedral_list.append(
-                [
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[0]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[1]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[2]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[3]
-                    ]["element_symbol"].to_list()[0],
-                ]
-            )
-        # print(atom_dihedral_list)
-        index_to_include = []
-        for i in range(len(atom_dihedral_list)):
-            if "H" not in atom_dihedral_list[i]:
-                index_to_include.append(i)
-        non_H_dihedrals = []
-        for i in index_to_include:
-            non_H_dihedrals.append(unique_dihedrals_list_list[i])
-        # print(non_H_dihedrals)
-        non_H_atom_dihedral_list = []
-        for sub_list in non_H_dihedrals:
-            non_H_atom_dihedral_list.append(
-                [
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[0]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[1]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[2]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[3]
-                    ]["element_symbol"].to_list()[0],
-                ]
-            )
-        print(non_H_atom_dihedral_list)
-        os.system("rm -rf " + self.tor_dir)
-        os.system("mkdir " + self.tor_dir)
-        parent_cwd = os.getcwd()
-        shutil.copy(
-            parent_cwd + "/" + self.psi_input_file,
-            parent_cwd + "/" + self.tor_dir + "/" + self.psi_input_file,
-        )
-        shutil.copy(
-            parent_cwd + "/" + self.template_pdb,
-            parent_cwd + "/" + self.tor_dir + "/" + self.template_pdb,
-        )
-        shutil.copy(
-            parent_cwd + "/" + self.torsion_drive_run_file,
-            parent_cwd
-            + "/"
-            + self.tor_dir
-            + "/"
-            + self.torsion_drive_run_file,
-        )
-        os.chdir(parent_cwd + "/" + self.tor_dir)
-        torsion_drive_dir = os.getcwd()
-        for i in range(len(non_H_dihedrals)):
-            dir_name = "torsion_drive" + "_" + str(i)
-            os.system("rm -rf " + dir_name)
-            os.system("mkdir " + dir_name)
-            os.chdir(torsion_drive_dir + "/" + dir_name)
-            with open(self.dihedral_text_file, "w") as f:
-                f.write(
-                    "# dihedral definition by atom indices starting from 1"
-                    + "\n"
-                )
-                f.write("# i     j     k     l" + "\n")
-                i_ = non_H_dihedrals[i][0]
-                j_ = non_H_dihedrals[i][1]
-                k_ = non_H_dihedrals[i][2]
-                l_ = non_H_dihedrals[i][3]
-                f.write(
-                    " "
-                    + "{:< 6d}".format(i_)
-                    + "{:< 6d}".format(j_)
-                    + "{:< 6d}".format(k_)
-                    + "{:< 6d}".format(l_)
-                    + "\n"
-                )
-                shutil.copy(
-                    torsion_drive_dir + "/" + self.psi_input_file,
-                    torsion_drive_dir
-                    + "/"
-                    + dir_name
-                    + "/"
-                    + self.psi_input_file,
-                )
-                shutil.copy(
-                    torsion_drive_dir + "/" + self.template_pdb,
-                    torsion_drive_dir
-                    + "/"
-                    + dir_name
-                    + "/"
-                    + self.template_pdb,
-                )
-                shutil.copy(
-                    torsion_drive_dir + "/" + self.torsion_drive_run_file,
-                    torsion_drive_dir
-                    + "/"
-                    + dir_name
-                    + "/"
-                    + self.torsion_drive_run_file,
-                )
-                os.chdir(torsion_drive_dir)
-        os.system("rm -rf " + self.psi_input_file)
-        os.system("rm -rf " + self.template_pdb)
-        os.system("rm -rf " + self.torsion_drive_run_file)
-        os.chdir(parent_cwd)
+        dihedrals = self.get_torsion_drive_dihedrals(exclude_hydrogens=True)
+        self.write_torsion_drive_dirs(dihedrals)
 
     def create_non_H_bonded_torsion_drive_dir(self):
         """
         Creates a directory for carrying out torsiondrive
         calculations for all non-hydrogen bonded torsional angles.
         """
-        df_tor = pd.read_csv(
-            self.torsion_xml_file, header=None, delimiter=r"\s+"
-        )
-        df_tor.columns = [
-            "k",
-            "p1",
-            "p2",
-            "p3",
-            "p4",
-            "periodicity",
-            "phase",
-        ]
-        # print(df_tor.head())
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.template_pdb)
-        df_index_symbol = ppdb.df["ATOM"][["atom_number", "element_symbol"]]
-        # print(df_index_symbol.head())
-        df_dihedrals = df_tor[["p1", "p2", "p3", "p4"]]
-        # print(df_dihedrals.head())
-        dihedrals_list_list = []
-        for i in range(len(df_dihedrals)):
-            dihedrals_list_list.append(df_dihedrals.iloc[i].values.tolist())
-        set_list = set()
-        unique_dihedrals_list_list = []
-        for x in dihedrals_list_list:
-            srtd = tuple(sorted(x))
-            if srtd not in set_list:
-                unique_dihedrals_list_list.append(x)
-                set_list.add(srtd)
-        # print(unique_dihedrals_list_list)
-        atom_dihedral_list = []
-        for sub_list in unique_dihedrals_list_list:
-            atom_dihedral_list.append(
-                [
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[0]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[1]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[2]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[3]
-                    ]["element_symbol"].to_list()[0],
-                ]
-            )
-        # print(atom_dihedral_list)
-        index_to_include = []
-        for i in range(len(atom_dihedral_list)):
-            if "H" not in atom_dihedral_list[i]:
-                index_to_include.append(i)
-        non_H_dihedrals = []
-        for i in index_to_include:
-            non_H_dihedrals.append(unique_dihedrals_list_list[i])
-        # print(non_H_dihedrals)
-        non_H_atom_dihedral_list = []
-        for sub_list in non_H_dihedrals:
-            non_H_atom_dihedral_list.append(
-                [
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[0]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[1]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[2]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[3]
-                    ]["element_symbol"].to_list()[0],
-                ]
-            )
-        # print(non_H_atom_dihedral_list)
-        df_bonds_all = pd.read_csv(
-            self.system_bonds_file, header=None, delimiter=r"\s+"
-        )
-        df_bonds_all.columns = [
-            "bond_names",
-            "k",
-            "angle",
-            "b1",
-            "b2",
-        ]
-        df_bonds = df_bonds_all[["b1", "b2"]]
-        bonds_list_list = []
-        for i in range(len(df_bonds)):
-            bonds_list_list.append(df_bonds.iloc[i].values.tolist())
-        # print(bonds_list_list)
-        reverse_bond_list_list = []
-        for i in bonds_list_list:
-            reverse_bond_list_list.append(reverse_list(i))
-        # print(reverse_bond_list_list)
-        bond_list = bonds_list_list + reverse_bond_list_list
-        # print(bond_list)
-        non_H_dihedral_bonds_list = []
-        for i in non_H_dihedrals:
-            non_H_dihedral_bonds_list.append(
-                [[i[0], i[1]], [i[1], i[2]], [i[2], i[3]]]
-            )
-        # print(non_H_dihedral_bonds_list)
-        bonded_index_to_include = []
-        for i in range(len(non_H_dihedral_bonds_list)):
-            if [
-                non_H_dihedral_bonds_list[i][0] in bond_list,
-                non_H_dihedral_bonds_list[i][1] in bond_list,
-                non_H_dihedral_bonds_list[i][2] in bond_list,
-            ] == [True, True, True]:
-                bonded_index_to_include.append(i)
-        # print(bonded_index_to_include)
-        non_H_bonded_dihedrals = []
-        for i in bonded_index_to_include:
-            non_H_bonded_dihedrals.append(non_H_dihedrals[i])
-        # print(non_H_bonded_dihedrals)
-        non_H_bonded_atom_dihedral_list = []
-        for sub_list in non_H_bonded_dihedrals:
-            non_H_bonded_atom_dihedral_list.append(
-                [
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[0]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[1]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[2]
-                    ]["element_symbol"].to_list()[0],
-                    df_index_symbol.loc[
-                        df_index_symbol["atom_number"] == sub_list[3]
-                    ]["element_symbol"].to_list()[0],
-                ]
-            )
-        print(non_H_bonded_atom_dihedral_list)
-        os.system("rm -rf " + self.tor_dir)
-        os.system("mkdir " + self.tor_dir)
-        parent_cwd = os.getcwd()
-        shutil.copy(
-            parent_cwd + "/" + self.psi_input_file,
-            parent_cwd + "/" + self.tor_dir + "/" + self.psi_input_file,
-        )
-        shutil.copy(
-            parent_cwd + "/" + self.template_pdb,
-            parent_cwd + "/" + self.tor_dir + "/" + self.template_pdb,
-        )
-        shutil.copy(
-            parent_cwd + "/" + self.torsion_drive_run_file,
-            parent_cwd
-            + "/"
-            + self.tor_dir
-            + "/"
-            + self.torsion_drive_run_file,
+        dihedrals = self.get_torsion_drive_dihedrals(
+            exclude_hydrogens=True, bonded_only=True
         )
-        os.chdir(parent_cwd + "/" + self.tor_dir)
-        torsion_drive_dir = os.getcwd()
-        for i in range(len(non_H_bonded_dihedrals)):
-            dir_name = "torsion_drive" + "_" + str(i)
-            os.system("rm -rf " + dir_name)
-            os.system("mkdir " + dir_name)
-            os.chdir(torsion_drive_dir + "/" + dir_name)
-            with open(self.dihedral_text_file, "w") as f:
-                f.write(
-                    "# dihedral definition by atom indices starting from 1"
-                    + "\n"
-                )
-                f.write("# i     j     k     l" + "\n")
-                i_ = non_H_bonded_dihedrals[i][0]
-                j_ = non_H_bonded_dihedrals[i][1]
-                k_ = non_H_bonded_dihedrals[i][2]
-                l_ = non_H_bonded_dihedrals[i][3]
-                f.write(
-                    " "
-                    + "{:< 6d}".format(i_)
-                    + "{:< 6d}".format(j_)
-                    + "{:< 6d}".format(k_)
-                    + "{:< 6d}".format(l_)
-                    + "\n"
-                )
-                shutil.copy(
-                    torsion_drive_dir + "/" + self.psi_input_file,
-                    torsion_drive_dir
-                    + "/"
-                    + dir_name
-                    + "/"
-                    + self.psi_input_file,
-                )
-                shutil.copy(
-                    torsion_drive_dir + "/" + self.template_pdb,
-                    torsion_drive_dir
-                    + "/"
-                    + dir_name
-                    + "/"
-                    + self.template_pdb,
-                )
-                shutil.copy(
-                    torsion_drive_dir + "/" + self.torsion_drive_run_file,
-                    torsion_drive_dir
-                    + "/"
-                    + dir_name
-                    + "/"
-                    + self.torsion_drive_run_file,
-                )
-                os.chdir(torsion_drive_dir)
-        os.system("rm -rf " + self.psi_input_file)
-        os.system("rm -rf " + self.template_pdb)
-        os.system("rm -rf " + self.torsion_drive_run_file)
-        os.chdir(parent_cwd)
+        self.write_torsion_drive_dirs(dihedrals)
 
-    def run_torsion_sim(self):
+    def run_torsion_sim(self, restart=False):
         """
         Run torsion scans using torsiondrive locally.
-        """
-        parent_cwd = os.getcwd()
-        target_dir = parent_cwd + "/" + self.tor_dir
-        num_folders = 0
-        for _, dirnames, filenames in os.walk(target_dir):
-            num_folders += len(dirnames)
-        for i in range(num_folders):
-            dir_ = "torsion_drive" + "_" + str(i)
-            os.chdir(parent_cwd + "/" + self.tor_dir + "/" + dir_)
-            run_command = "bash" + " " + self.torsion_drive_run_file
-            # os.system(run_command)
-            print(run_command)
-            os.chdir(parent_cwd)
+
+        The torsiondrive directories are run concurrently, with at
+        most n_jobs calculations running at a time. A directory is
+        complete when its calculation exits successfully and writes
+        the scan file. The status of every directory is saved in
+        torsion_sim_summary_file. With a QM cache, the results of
+        the directories found in the cache are restored ("cached")
+        and the results of the completed ones are saved.
+
+        Parameters
+        ----------
+        restart : bool, optional
+            If True, only the directories without a scan file
+            (failed or incomplete calculations) are run again.
+
+        Returns
+        -------
+        torsion_sim_status : list
+            List of (directory, status, exit status) tuples where
+            status is one of "complete", "failed", "incomplete",
+            "skipped" or "cached".
+
+        """
+        n_threads = self.get_n_threads()
+        target_dir = os.path.join(os.getcwd(), self.tor_dir)
+        torsion_drive_dirs = get_torsion_drive_dirs(target_dir)
+        run_dirs = []
+        cached_dirs = []
+        cache_keys = {}
+        cache_files = {}
+        for i in torsion_drive_dirs:
+            scan_file = os.path.join(target_dir, i, self.qm_scan_file)
+            if restart and os.path.isfile(scan_file):
+                continue
+            if self.qm_cache is not None:
+                cache_keys[i] = self.qm_cache.get_key(
+                    [
+                        os.path.join(target_dir, i, j)
+                        for j in [
+                            self.psi_input_file,
+                            self.dihedral_text_file,
+                            self.torsion_drive_run_file,
+                        ]
+                    ],
+                    program="psi4",
+                )
+                cache_files[i] = {
+                    "scan": scan_file,
+                    "log": os.path.join(
+                        target_dir, i, self.torsion_drive_log_file
+                    ),
+                }
+                if self.qm_cache.load(cache_keys[i], cache_files[i]):
+                    cached_dirs.append(i)
+                    continue
+            run_dirs.append(i)
+        with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+            futures = {}
+            for i in run_dirs:
+                print("Running torsiondrive in directory" + " : " + i)
+                futures[i] = executor.submit(
+                    run_torsion_drive_dir,
+                    torsion_drive_dir=os.path.join(target_dir, i),
+                    torsion_drive_run_file=self.torsion_drive_run_file,
+                    torsion_drive_log_file=self.torsion_drive_log_file,
+                    n_threads=n_threads,
+                )
+            returncodes = {i: futures[i].result() for i in run_dirs}
+        torsion_sim_status = []
+        for i in torsion_drive_dirs:
+            scan_file = os.path.join(target_dir, i, self.qm_scan_file)
+            if i in cached_dirs:
+                torsion_sim_status.append((i, "cached", ""))
+            elif i not in returncodes:
+                torsion_sim_status.append((i, "skipped", ""))
+            elif returncodes[i] != 0:
+                torsion_sim_status.append((i, "failed", returncodes[i]))
+            elif not os.path.isfile(scan_file):
+                torsion_sim_status.append((i, "incomplete", returncodes[i]))
+            else:
+                torsion_sim_status.append((i, "complete", returncodes[i]))
+                if self.qm_cache is not None:
+                    self.qm_cache.save(cache_keys[i], cache_files[i])
+        with open(self.torsion_sim_summary_file, "w") as f:
+            for i in torsion_sim_status:
+                f.write(" ".join([str(j) for j in i]).strip() + "\n")
+        return torsion_sim_status
 
 
 class TorsionDriveParams:
@@ -9035,9 +11534,9 @@ class TorsionDriveParams:
         Argument to specify how to load the topology. Can either
         be "openmm" or "parmed".
 
-    method : str, optional
-        Minimization method for fitting of torsional
-        parameters.
+    method : {"nnls", "lsq_linear"}, optional
+        Bounded linear least squares solver for fitting of
+        torsional parameters.
 
     dihedral_text_file : str, optional
         Dihedral information file for torsiondrive.
@@ -9054,6 +11553,30 @@ class TorsionDriveParams:
         XML force field file for the ligand obtained with
         torsional reparamaterization.
 
+    n_workers : int, optional
+        Number of worker processes used to fit the torsiondrive
+        directories concurrently. If 1, the directories are
+        fitted one after another in the current process.
+
+    T : float, optional
+        Temperature (in K) of the Boltzmann weights of the scan
+        points in the fitting of torsional parameters. If None,
+        all the scan points have the same weight.
+
+    global_fit : bool, optional
+        If True, the torsional parameters of all the torsiondrive
+        directories are fitted simultaneously to all the scans
+        (see fit_global_dihedral_params) instead of fitting each
+        directory on its own. The global fit always solves the
+        sparse bounded problem with scipy.optimize.lsq_linear, so
+        method does not apply to it.
+
+    equivalent_dihedral_text_file : str, optional
+        File of the dihedral angles equivalent to the scanned one in
+        a torsiondrive directory, written by TorsionDriveSims when
+        the dihedral angles are deduplicated. The fitted parameters
+        are applied to all of them.
+
     """
     
     def __init__(
@@ -9073,11 +11596,15 @@ class TorsionDriveParams:
         system_xml="torsion_drive_input.xml",
         qm_scan_file="scan.xyz",
         load_topology="openmm",
-        method="L-BFGS-B",
+        method="nnls",
         dihedral_text_file="dihedrals.txt",
         system_init_sdf="torsion_drive_input_init.sdf",
         reparameterised_system_xml_file="guest_reparameterised.xml",
         reparameterised_torsional_system_xml_file="guest_torsional_reparameterized.xml",
+        n_workers=1,
+        T=None,
+        global_fit=False,
+        equivalent_dihedral_text_file="equivalent_dihedrals.txt",
     ):
 
         self.num_charge_atoms = num_charge_atoms
@@ -9103,61 +11630,135 @@ class TorsionDriveParams:
         self.reparameterised_torsional_system_xml_file = (
             reparameterised_torsional_system_xml_file
         )
+        self.n_workers = n_workers
+        self.T = T
+        self.global_fit = global_fit
+        self.equivalent_dihedral_text_file = equivalent_dihedral_text_file
+
+    def get_reparams_torsion_lines(self):
+        """
+        Returns the fitted torsional lines of all the torsiondrive
+        directories, merged in the natural order of the directory
+        names (torsion_drive_0, torsion_drive_1, ...).
+        """
+        if self.global_fit:
+            return self.get_global_reparams_torsion_lines()
+        target_dir = os.path.join(os.getcwd(), self.tor_dir)
+        torsion_drive_dirs = get_torsion_drive_dirs(target_dir)
+        kwargs_list = [
+            dict(
+                torsion_drive_dir=os.path.join(target_dir, i),
+                psi_input_file=self.psi_input_file,
+                xyz_file=self.xyz_file,
+                coords_file=self.coords_file,
+                template_pdb=self.template_pdb,
+                system_pdb=self.system_pdb,
+                system_init_sdf=self.system_init_sdf,
+                system_sdf=self.system_sdf,
+                num_charge_atoms=self.num_charge_atoms,
+                index_charge_atom_1=self.index_charge_atom_1,
+                charge_atom_1=self.charge_atom_1,
+                system_xml=self.system_xml,
+                qm_scan_file=self.qm_scan_file,
+                load_topology=self.load_topology,
+                method=self.method,
+                dihedral_text_file=self.dihedral_text_file,
+                T=self.T,
+                equivalent_dihedral_text_file=(
+                    self.equivalent_dihedral_text_file
+                ),
+            )
+            for i in torsion_drive_dirs
+        ]
+        if self.n_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                futures = [
+                    executor.submit(get_torsion_drive_dir_lines, **kwargs)
+                    for kwargs in kwargs_list
+                ]
+                torsional_parameters_list = [i.result() for i in futures]
+        else:
+            torsional_parameters_list = [
+                get_torsion_drive_dir_lines(**kwargs)
+                for kwargs in kwargs_list
+            ]
+        torsional_parameters = [
+            item
+            for sublist in torsional_parameters_list
+            if sublist is not None
+            for item in sublist
+        ]
+        return torsional_parameters
+
+    def get_global_reparams_torsion_lines(self):
+        """
+        Returns the torsional lines of all the torsiondrive
+        directories, fitted simultaneously to all the scans.
+        """
+        target_dir = os.path.join(os.getcwd(), self.tor_dir)
+        torsion_drive_dirs = get_torsion_drive_dirs(target_dir)
+        kwargs_list = [
+            dict(
+                torsion_drive_dir=os.path.join(target_dir, i),
+                psi_input_file=self.psi_input_file,
+                xyz_file=self.xyz_file,
+                coords_file=self.coords_file,
+                template_pdb=self.template_pdb,
+                system_pdb=self.system_pdb,
+                system_init_sdf=self.system_init_sdf,
+                system_sdf=self.system_sdf,
+                num_charge_atoms=self.num_charge_atoms,
+                index_charge_atom_1=self.index_charge_atom_1,
+                charge_atom_1=self.charge_atom_1,
+                system_xml=self.system_xml,
+                qm_scan_file=self.qm_scan_file,
+                load_topology=self.load_topology,
+                dihedral_text_file=self.dihedral_text_file,
+                equivalent_dihedral_text_file=(
+                    self.equivalent_dihedral_text_file
+                ),
+            )
+            for i in torsion_drive_dirs
+        ]
+        if self.n_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                futures = [
+                    executor.submit(get_torsion_drive_dir_scan, **kwargs)
+                    for kwargs in kwargs_list
+                ]
+                scans = [i.result() for i in futures]
+        else:
+            scans = [
+                get_torsion_drive_dir_scan(**kwargs) for kwargs in kwargs_list
+            ]
+        scans = [i for i in scans if i is not None]
+        if not scans:
+            return []
+        dihedrals, k_array = fit_global_dihedral_params(scans, T=self.T)
+        # Dihedral angles sharing the parameters of each fitted one
+        equivalent_atom_indices = OrderedDict()
+        for scan in scans:
+            equivalent_atom_indices.setdefault(
+                tuple(scan["atom_index"]), scan["equivalent_atom_indices"]
+            )
+        torsional_parameters = [
+            item
+            for atom_index, opt_param in zip(dihedrals, k_array)
+            for equivalent_atom_index in equivalent_atom_indices[
+                tuple(atom_index)
+            ]
+            for item in get_torsion_xml_lines(
+                equivalent_atom_index, opt_param
+            )
+        ]
+        return torsional_parameters
 
     def write_reparams_torsion_lines(self):
         """
         Saves a text file containing torsional parameters for the ligand
         obtained through openforcefield.
         """
-        torsional_parameters_list = []
-        parent_cwd = os.getcwd()
-        # TODO: use os.path.join
-        target_dir = os.path.join(parent_cwd, self.tor_dir)
-        # TODO: let's use a more informative variable name than 'i'
-        for i in os.listdir(target_dir):
-            os.chdir(os.path.join(parent_cwd, self.tor_dir, i))
-            if os.path.isfile(self.qm_scan_file):
-                print("Entering directory" + " : " + os.getcwd())
-                torsiondrive_input_to_xyz(
-                    psi_input_file=self.psi_input_file, xyz_file=self.xyz_file,
-                )
-                xyz_to_pdb(
-                    xyz_file=self.xyz_file,
-                    coords_file=self.coords_file,
-                    template_pdb=self.template_pdb,
-                    system_pdb=self.system_pdb,
-                )
-                generate_xml_from_charged_pdb_sdf(
-                    system_pdb=self.system_pdb,
-                    system_init_sdf=self.system_init_sdf,
-                    system_sdf=self.system_sdf,
-                    num_charge_atoms=self.num_charge_atoms,
-                    index_charge_atom_1=self.index_charge_atom_1,
-                    charge_atom_1=self.charge_atom_1,
-                    system_xml=self.system_xml,
-                )
-                torsional_lines = get_torsional_lines(
-                    template_pdb=self.template_pdb,
-                    system_xml=self.system_xml,
-                    qm_scan_file=self.qm_scan_file,
-                    load_topology=self.load_topology,
-                    method=self.method,
-                    dihedral_text_file=self.dihedral_text_file,
-                )
-                # print(torsional_lines)
-                torsional_parameters_list.append(torsional_lines)
-                remove_mm_files(qm_scan_file=self.qm_scan_file)
-                os.chdir(parent_cwd)
-            else:
-                print("Entering directory" + " : " + os.getcwd())
-                print(
-                    "Torsional Scan file not found, optimization may not \
-                     be complete. Existing!!"
-                )
-                os.chdir(parent_cwd)
-        torsional_parameters = [
-            item for sublist in torsional_parameters_list for item in sublist
-        ]
+        torsional_parameters = self.get_reparams_torsion_lines()
         with open(self.reparameterized_torsional_params_file, "w") as f:
             for i in torsional_parameters:
                 f.write(i + "\n")
@@ -9167,53 +11768,7 @@ class TorsionDriveParams:
         Saves a text file containing torsional parameters for a charged ligand
         obtained through openforcefield.
         """
-        torsional_parameters_list = []
-        parent_cwd = os.getcwd()
-        target_dir = os.path.join(parent_cwd, self.tor_dir)
-        for i in os.listdir(target_dir):
-            os.chdir(os.path.join(parent_cwd, self.tor_dir, i))
-            if os.path.isfile(self.qm_scan_file):
-                print("Entering directory" + " : " + os.getcwd())
-                torsiondrive_input_to_xyz(
-                    psi_input_file=self.psi_input_file, xyz_file=self.xyz_file,
-                )
-                xyz_to_pdb(
-                    xyz_file=self.xyz_file,
-                    coords_file=self.coords_file,
-                    template_pdb=self.template_pdb,
-                    system_pdb=self.system_pdb,
-                )
-                generate_xml_from_charged_pdb_sdf(
-                    system_pdb=self.system_pdb,
-                    system_init_sdf=self.system_init_sdf,
-                    system_sdf=self.system_sdf,
-                    num_charge_atoms=self.num_charge_atoms,
-                    index_charge_atom_1=self.index_charge_atom_1,
-                    charge_atom_1=self.charge_atom_1,
-                    system_xml=self.system_xml,
-                )
-                torsional_lines = get_torsional_lines(
-                    template_pdb=self.template_pdb,
-                    system_xml=self.system_xml,
-                    qm_scan_file=self.qm_scan_file,
-                    load_topology=self.load_topology,
-                    method=self.method,
-                    dihedral_text_file=self.dihedral_text_file,
-                )
-                # print(torsional_lines)
-                torsional_parameters_list.append(torsional_lines)
-                remove_mm_files(qm_scan_file=self.qm_scan_file)
-                os.chdir(parent_cwd)
-            else:
-                print("Entering directory" + " : " + os.getcwd())
-                print(
-                    "Torsional Scan file not found, optimization may not \
-                     be complete. Existing!!"
-                )
-                os.chdir(parent_cwd)
-        torsional_parameters = [
-            item for sublist in torsional_parameters_list for item in sublist
-        ]
+        torsional_parameters = self.get_reparams_torsion_lines()
         with open(self.reparameterized_torsional_params_file, "w") as f:
             for i in torsional_parameters:
                 f.write(i + "\n")
@@ -9224,74 +11779,12 @@ class TorsionDriveParams:
         torsional parameters.
         """
         with open(self.reparameterized_torsional_params_file, "r") as xml_tor:
-            xml_tor_lines = xml_tor.readlines()
-        non_zero_k_tor = []
-        for i in xml_tor_lines:
-            to_find = "k=" + '"' + "0.0" + '"'
-            if to_find not in i:
-                non_zero_k_tor.append(i)
-        # print(non_zero_k_tor)
-        p1 = []
-        for i in range(len(non_zero_k_tor)):
-            p1.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[2]))
-        # print(p1)
-        p2 = []
-        for i in range(len(non_zero_k_tor)):
-            p2.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[4]))
-        # print(p2)
-        p3 = []
-        for i in range(len(non_zero_k_tor)):
-            p3.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[6]))
-        # print(p3)
-        p4 = []
-        for i in range(len(non_zero_k_tor)):
-            p4.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[8]))
-        # print(p4)
-        periodicity = []
-        for i in range(len(non_zero_k_tor)):
-            periodicity.append(
-                int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[9])
-            )
-        # print(periodicity)
-        # TODO: there may be a way to consolidate the reparametrization of 
-        #  the XML file to obey the DRY principle
-        xml_tor_reparams = open(self.reparameterised_system_xml_file, "r")
-        xml_tor_reparams_lines = xml_tor_reparams.readlines()
-        # A string template and formatting should be used here
-        for j in range(len(xml_tor_reparams_lines)):
-            for i in range(len(non_zero_k_tor)):
-                to_find_tor = (
-                    "p1="
-                    + '"'
-                    + str(p1[i])
-                    + '"'
-                    + " "
-                    + "p2="
-                    + '"'
-                    + str(p2[i])
-                    + '"'
-                    + " "
-                    + "p3="
-                    + '"'
-                    + str(p3[i])
-                    + '"'
-                    + " "
-                    + "p4="
-                    + '"'
-                    + str(p4[i])
-                    + '"'
-                    + " "
-                    + "periodicity="
-                    + '"'
-                    + str(periodicity[i])
-                    + '"'
-                )
-                if to_find_tor in xml_tor_reparams_lines[j]:
-                    # print(xml_tor_reparams_lines[j])
-                    xml_tor_reparams_lines[j] = non_zero_k_tor[i]
-        with open(self.reparameterised_torsional_system_xml_file, "w") as f:
-            for i in xml_tor_reparams_lines:
-                f.write(i)
+            non_zero_k_tor = [i for i in xml_tor if 'k="0.0"' not in i]
+        patch_system_xml(
+            self.reparameterised_system_xml_file,
+            self.reparameterised_torsional_system_xml_file,
+            non_zero_k_tor,
+        )
 
 
 class PrepareSolvatedParams:
@@ -9314,7 +11807,8 @@ class PrepareSolvatedParams:
         solvent, ions, etc.
 
     intermediate_pdb : str, optional
-        An intermediate PDB file formed during pdb4amber processing.
+        An intermediate PDB file formed during pdb4amber processing
+        (only used if use_pdb4amber is True).
 
     solvent_pdb : str, optional
         PDB file containing the water, ions, etc.
@@ -9356,6 +11850,11 @@ class PrepareSolvatedParams:
         PDB file of the receptor - ligand complex and
         the solvent.
 
+    use_pdb4amber : bool, optional
+        If True, the solvent and the ions are renumbered and
+        formatted with pdb4amber, otherwise they are renumbered
+        natively while the input PDB file is split.
+
     """
 
     def __init__(
@@ -9374,6 +11873,7 @@ class PrepareSolvatedParams:
         system_solvent_prmtop="system_qmmmrebind.prmtop",
         system_solvent_inpcrd="system_qmmmrebind.inpcrd",
         system_solvent_pdb="system_qmmmrebind.pdb",
+        use_pdb4amber=False,
     ):
 
         self.init_pdb = init_pdb
@@ -9390,54 +11890,27 @@ class PrepareSolvatedParams:
         self.system_solvent_prmtop = system_solvent_prmtop
         self.system_solvent_inpcrd = system_solvent_inpcrd
         self.system_solvent_pdb = system_solvent_pdb
+        self.use_pdb4amber = use_pdb4amber
 
     def create_solvent_pdb(self):
         """
         Generates a PDB file containing the solvent and the ions.
         """
-        water_variables = ["HOH", "WAT"]
-        ions = [
-            "Na+",
-            "Cs+",
-            "K+",
-            "Li+",
-            "Rb+",
-            "Cl-",
-            "Br-",
-            "F-",
-            "I-",
-            "Ca2",
-        ]
-        pdb_variables = ["END", "CRYST"]
-        with open(self.init_pdb) as f1, open(self.intermediate_pdb, "w") as f2:
-            for line in f1:
-                if (
-                    any(
-                        water_variable in line
-                        for water_variable in water_variables
-                    )
-                    or any(
-                        pdb_variable in line for pdb_variable in pdb_variables
-                    )
-                    or any(ion in line for ion in ions)
-                ):
-                    f2.write(line)
-        command = (
-            "pdb4amber -i " + self.intermediate_pdb + " -o " + self.solvent_pdb
-        )
-        os.system(command)
-        command = (
-            "rm -rf "
-            + self.solvent_pdb[:-4]
-            + "_nonprot.pdb "
-            + self.solvent_pdb[:-4]
-            + "_renum.txt "
-            + self.solvent_pdb[:-4]
-            + "_sslink"
+        if not self.use_pdb4amber:
+            split_pdb(
+                self.init_pdb,
+                solvent_pdb=self.solvent_pdb,
+                ions_pdb=self.solvent_pdb,
+            )
+            return
+        split_pdb(
+            self.init_pdb,
+            solvent_pdb=self.intermediate_pdb,
+            ions_pdb=self.intermediate_pdb,
+            renumber=False,
         )
-        os.system(command)
-        command = "rm -rf " + self.intermediate_pdb
-        os.system(command)
+        run_pdb4amber(self.intermediate_pdb, self.solvent_pdb)
+        os.remove(self.intermediate_pdb)
 
     def parameterize_solvent_pdb(self):
         """
@@ -9791,6 +12264,10 @@ class SystemAmberSystem:
     inpcrd_system_params: str, optional
         Reparameterized INPCRD file.
 
+    binary_params: bool, optional
+        Also save the QM parameters in compact binary .npz files next
+        to the QM parameter files.
+
     """
 
     def __init__(
@@ -9825,6 +12302,7 @@ class SystemAmberSystem:
         inpcrd_system_intermediate_params="hostguest_intermediate.inpcrd",
         prmtop_system_params="hostguest_params.prmtop",
         inpcrd_system_params="hostguest_params.inpcrd",
+        binary_params=False,
     ):
 
         self.host_pdb = host_pdb
@@ -9873,6 +12351,7 @@ class SystemAmberSystem:
         )
         self.prmtop_system_params = prmtop_system_params
         self.inpcrd_system_params = inpcrd_system_params
+        self.binary_params = binary_params
 
     def generate_xml_from_prmtop(self):
 
@@ -9894,175 +12373,17 @@ class SystemAmberSystem:
         index of the last atom of the receptor ).
         """
 
-        # Charges from QM files
-        df_charges = pd.read_csv(
-            self.charge_parameter_file_guest, header=None, delimiter=r"\s+"
-        )
-        df_charges.columns = ["atom", "charges"]
-        qm_charges = df_charges["charges"].values.tolist()
-        qm_charges = [round(num, 6) for num in qm_charges]
-        # print(qm_charges)
-        # Bond Parameters from QM files
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.guest_qm_pdb)
-        atom_name_list = ppdb.df["ATOM"]["atom_number"].values.tolist()
-        # atom_name_list = [i - 1 for i in atom_name_list]
-        no_host_atoms = get_num_host_atoms(self.host_pdb)
-        atom_name_list = [i - 1 + no_host_atoms for i in atom_name_list]
-        # print(atom_name_list)
-        df = pd.read_csv(
-            self.bond_parameter_file_guest, header=None, delimiter=r"\s+"
-        )
-        df.columns = ["bond", "k_bond", "bond_length", "bond_1", "bond_2"]
-        # print(df.head())
-        bond_1_list = df["bond_1"].values.tolist()
-        bond_1_list = [x - 1 + min(atom_name_list) for x in bond_1_list]
-        bond_2_list = df["bond_2"].values.tolist()
-        bond_2_list = [x - 1 + min(atom_name_list) for x in bond_2_list]
-        # print(bond_1_list)
-        # print(bond_2_list)
-        k_bond_list = df["k_bond"].values.tolist()
-        k_bond_list = [
-            i * KCAL_MOL_PER_KJ_MOL * ANGSTROMS_PER_NM**2 for i in k_bond_list
-        ]  # kcal/mol * A^2 to kJ/mol * nm^2
-        k_bond_list = [round(num, 10) for num in k_bond_list]
-        # print(k_bond_list)
-        bond_length_list = df["bond_length"].values.tolist()
-        bond_length_list = [i / 10.00 for i in bond_length_list]
-        bond_length_list = [round(num, 6) for num in bond_length_list]
-        # print(bond_length_list)
-        # Angle Parameters from QM files
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.guest_qm_pdb)
-        atom_name_list = ppdb.df["ATOM"]["atom_number"].values.tolist()
-        # atom_name_list = [i - 1 for i in atom_name_list]
+        atoms = PdbFile.load(self.guest_qm_pdb).records("ATOM")
+        atom_name_list = atoms["atom_number"].tolist()
         no_host_atoms = get_num_host_atoms(self.host_pdb)
         atom_name_list = [i - 1 + no_host_atoms for i in atom_name_list]
-        # print(atom_name_list)
-        df = pd.read_csv(
-            self.angle_parameter_file_guest, header=None, delimiter=r"\s+"
+        qm_params = QMParameterSet.from_qm_files(
+            charge_parameter_file=self.charge_parameter_file_guest,
+            bond_parameter_file=self.bond_parameter_file_guest,
+            angle_parameter_file=self.angle_parameter_file_guest,
+            atom_numbers=atom_name_list,
         )
-        df.columns = [
-            "angle",
-            "k_angle",
-            "angle_degrees",
-            "angle_1",
-            "angle_2",
-            "angle_3",
-        ]
-        # print(df.head())
-        angle_1_list = df["angle_1"].values.tolist()
-        angle_1_list = [x - 1 + min(atom_name_list) for x in angle_1_list]
-        # print(angle_1_list)
-        angle_2_list = df["angle_2"].values.tolist()
-        angle_2_list = [x - 1 + min(atom_name_list) for x in angle_2_list]
-        # print(angle_2_list)
-        angle_3_list = df["angle_3"].values.tolist()
-        angle_3_list = [x - 1 + min(atom_name_list) for x in angle_3_list]
-        # print(angle_3_list)
-        k_angle_list = df["k_angle"].values.tolist()
-        k_angle_list = [
-            i * 4.184 for i in k_angle_list
-        ]  # kcal/mol * radian^2 to kJ/mol * radian^2
-        k_angle_list = [round(num, 6) for num in k_angle_list]
-        # print(k_angle_list)
-        angle_list = df["angle_degrees"].values.tolist()
-        angle_list = [(i * math.pi) / 180.00 for i in angle_list]
-        angle_list = [round(num, 6) for num in angle_list]
-        # print(angle_list)
-        xml = open(self.guest_qm_params_file, "w")
-        xml.write("Begin writing the Bond Parameters" + "\n")
-        for i in range(len(k_bond_list)):
-            xml.write(
-                "                                "
-                + "<Bond"
-                + " "
-                + "d="
-                + '"'
-                + str(bond_length_list[i])
-                + '"'
-                + " "
-                + "k="
-                + '"'
-                + str(k_bond_list[i])
-                + '"'
-                + " "
-                + "p1="
-                + '"'
-                + str(bond_1_list[i])
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + str(bond_2_list[i])
-                + '"'
-                + "/>"
-                + "\n"
-            )
-        xml.write("Finish writing the Bond Parameters" + "\n")
-        xml.write("Begin writing the Angle Parameters" + "\n")
-        for i in range(len(k_angle_list)):
-            xml.write(
-                "                                "
-                + "<Angle"
-                + " "
-                + "a="
-                + '"'
-                + str(angle_list[i])
-                + '"'
-                + " "
-                + "k="
-                + '"'
-                + str(k_angle_list[i])
-                + '"'
-                + " "
-                + "p1="
-                + '"'
-                + str(angle_1_list[i])
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + str(angle_2_list[i])
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + str(angle_3_list[i])
-                + '"'
-                + "/>"
-                + "\n"
-            )
-        xml.write("Finish writing the Angle Parameters" + "\n")
-        xml.write("Begin writing the Charge Parameters" + "\n")
-        for i in range(len(qm_charges)):
-            xml.write(
-                "<Particle"
-                + " "
-                + "q="
-                + '"'
-                + str(qm_charges[i])
-                + '"'
-                + " "
-                + "eps="
-                + '"'
-                + str(0.00)
-                + '"'
-                + " "
-                + "sig="
-                + '"'
-                + str(0.00)
-                + '"'
-                + " "
-                + "atom="
-                + '"'
-                + str(atom_name_list[i])
-                + '"'
-                + "/>"
-                + "\n"
-            )
-        xml.write("Finish writing the Charge Parameters" + "\n")
-        xml.close()
+        qm_params.save(self.guest_qm_params_file, binary=self.binary_params)
 
     def write_host_params(self):
 
@@ -10071,171 +12392,16 @@ class SystemAmberSystem:
         receptor in a text file.
         """
 
-        # Charges from QM files
-        df_charges = pd.read_csv(
-            self.charge_parameter_file_host, header=None, delimiter=r"\s+"
-        )
-        df_charges.columns = ["atom", "charges"]
-        qm_charges = df_charges["charges"].values.tolist()
-        qm_charges = [round(num, 6) for num in qm_charges]
-        # print(qm_charges)
-        # Bond Parameters from QM files
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.host_qm_pdb)
-        atom_name_list = ppdb.df["ATOM"]["atom_number"].values.tolist()
-        atom_name_list = [i - 1 for i in atom_name_list]
-        # print(atom_name_list)
-        df = pd.read_csv(
-            self.bond_parameter_file_host, header=None, delimiter=r"\s+"
-        )
-        df.columns = ["bond", "k_bond", "bond_length", "bond_1", "bond_2"]
-        # print(df.head())
-        bond_1_list = df["bond_1"].values.tolist()
-        bond_1_list = [x - 1 + min(atom_name_list) for x in bond_1_list]
-        bond_2_list = df["bond_2"].values.tolist()
-        bond_2_list = [x - 1 + min(atom_name_list) for x in bond_2_list]
-        # print(bond_1_list)
-        # print(bond_2_list)
-        k_bond_list = df["k_bond"].values.tolist()
-        k_bond_list = [
-            i * KCAL_MOL_PER_KJ_MOL * ANGSTROMS_PER_NM**2 for i in k_bond_list
-        ]  # kcal/mol * A^2 to kJ/mol * nm^2
-        k_bond_list = [round(num, 10) for num in k_bond_list]
-        # print(k_bond_list)
-        bond_length_list = df["bond_length"].values.tolist()
-        bond_length_list = [i / 10.00 for i in bond_length_list]
-        bond_length_list = [round(num, 6) for num in bond_length_list]
-        # print(bond_length_list)
-        # Angle Parameters from QM files
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.host_qm_pdb)
-        atom_name_list = ppdb.df["ATOM"]["atom_number"].values.tolist()
+        atoms = PdbFile.load(self.host_qm_pdb).records("ATOM")
+        atom_name_list = atoms["atom_number"].tolist()
         atom_name_list = [i - 1 for i in atom_name_list]
-        # print(atom_name_list)
-        df = pd.read_csv(
-            self.angle_parameter_file_host, header=None, delimiter=r"\s+"
+        qm_params = QMParameterSet.from_qm_files(
+            charge_parameter_file=self.charge_parameter_file_host,
+            bond_parameter_file=self.bond_parameter_file_host,
+            angle_parameter_file=self.angle_parameter_file_host,
+            atom_numbers=atom_name_list,
         )
-        df.columns = [
-            "angle",
-            "k_angle",
-            "angle_degrees",
-            "angle_1",
-            "angle_2",
-            "angle_3",
-        ]
-        # print(df.head())
-        angle_1_list = df["angle_1"].values.tolist()
-        angle_1_list = [x - 1 + min(atom_name_list) for x in angle_1_list]
-        # print(angle_1_list)
-        angle_2_list = df["angle_2"].values.tolist()
-        angle_2_list = [x - 1 + min(atom_name_list) for x in angle_2_list]
-        # print(angle_2_list)
-        angle_3_list = df["angle_3"].values.tolist()
-        angle_3_list = [x - 1 + min(atom_name_list) for x in angle_3_list]
-        # print(angle_3_list)
-        k_angle_list = df["k_angle"].values.tolist()
-        k_angle_list = [
-            i * 4.184 for i in k_angle_list
-        ]  # kcal/mol * radian^2 to kJ/mol * radian^2
-        k_angle_list = [round(num, 6) for num in k_angle_list]
-        # print(k_angle_list)
-        angle_list = df["angle_degrees"].values.tolist()
-        angle_list = [(i * math.pi) / 180.00 for i in angle_list]
-        angle_list = [round(num, 6) for num in angle_list]
-        # print(angle_list)
-        xml = open(self.host_qm_params_file, "w")
-        xml.write("Begin writing the Bond Parameters" + "\n")
-        for i in range(len(k_bond_list)):
-            xml.write(
-                "                                "
-                + "<Bond"
-                + " "
-                + "d="
-                + '"'
-                + str(bond_length_list[i])
-                + '"'
-                + " "
-                + "k="
-                + '"'
-                + str(k_bond_list[i])
-                + '"'
-                + " "
-                + "p1="
-                + '"'
-                + str(bond_1_list[i])
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + str(bond_2_list[i])
-                + '"'
-                + "/>"
-                + "\n"
-            )
-        xml.write("Finish writing the Bond Parameters" + "\n")
-        xml.write("Begin writing the Angle Parameters" + "\n")
-        for i in range(len(k_angle_list)):
-            xml.write(
-                "                                "
-                + "<Angle"
-                + " "
-                + "a="
-                + '"'
-                + str(angle_list[i])
-                + '"'
-                + " "
-                + "k="
-                + '"'
-                + str(k_angle_list[i])
-                + '"'
-                + " "
-                + "p1="
-                + '"'
-                + str(angle_1_list[i])
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + str(angle_2_list[i])
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + str(angle_3_list[i])
-                + '"'
-                + "/>"
-                + "\n"
-            )
-        xml.write("Finish writing the Angle Parameters" + "\n")
-        xml.write("Begin writing the Charge Parameters" + "\n")
-        for i in range(len(qm_charges)):
-            xml.write(
-                "<Particle"
-                + " "
-                + "q="
-                + '"'
-                + str(qm_charges[i])
-                + '"'
-                + " "
-                + "eps="
-                + '"'
-                + str(0.00)
-                + '"'
-                + " "
-                + "sig="
-                + '"'
-                + str(0.00)
-                + '"'
-                + " "
-                + "atom="
-                + '"'
-                + str(atom_name_list[i])
-                + '"'
-                + "/>"
-                + "\n"
-            )
-        xml.write("Finish writing the Charge Parameters" + "\n")
-        xml.close()
+        qm_params.save(self.host_qm_params_file, binary=self.binary_params)
 
     def merge_qm_params(self):
 
@@ -10245,83 +12411,15 @@ class SystemAmberSystem:
         index of the last atom of the receptor ).
         """
 
-        # Bond Parameters Host
-        f_params_host = open(self.host_qm_params_file, "r")
-        lines_params_host = f_params_host.readlines()
-        # Bond Parameters Host
-        for i in range(len(lines_params_host)):
-            if "Begin writing the Bond Parameters" in lines_params_host[i]:
-                to_begin = int(i)
-            if "Finish writing the Bond Parameters" in lines_params_host[i]:
-                to_end = int(i)
-        bond_params_host = lines_params_host[to_begin + 1 : to_end]
-        # Bond Parameters Guest
-        f_params_guest = open(self.guest_qm_params_file, "r")
-        lines_params_guest = f_params_guest.readlines()
-        # Bond Parameters Guest
-        for i in range(len(lines_params_guest)):
-            if "Begin writing the Bond Parameters" in lines_params_guest[i]:
-                to_begin = int(i)
-            if "Finish writing the Bond Parameters" in lines_params_guest[i]:
-                to_end = int(i)
-        bond_params_guest = lines_params_guest[to_begin + 1 : to_end]
-        bond_systems_params = bond_params_host + bond_params_guest
-        # Angle Parameters Host
-        f_params_host = open(self.host_qm_params_file, "r")
-        lines_params_host = f_params_host.readlines()
-        # Angle Parameters Host
-        for i in range(len(lines_params_host)):
-            if "Begin writing the Angle Parameters" in lines_params_host[i]:
-                to_begin = int(i)
-            if "Finish writing the Angle Parameters" in lines_params_host[i]:
-                to_end = int(i)
-        angle_params_host = lines_params_host[to_begin + 1 : to_end]
-        # Angle Parameters Guest
-        f_params_guest = open(self.guest_qm_params_file, "r")
-        lines_params_guest = f_params_guest.readlines()
-        # Angle Parameters Guest
-        for i in range(len(lines_params_guest)):
-            if "Begin writing the Angle Parameters" in lines_params_guest[i]:
-                to_begin = int(i)
-            if "Finish writing the Angle Parameters" in lines_params_guest[i]:
-                to_end = int(i)
-        angle_params_guest = lines_params_guest[to_begin + 1 : to_end]
-        angle_systems_params = angle_params_host + angle_params_guest
-        # Charge Parameters Host
-        f_params_host = open(self.host_qm_params_file, "r")
-        lines_params_host = f_params_host.readlines()
-        # Charge Parameters Host
-        for i in range(len(lines_params_host)):
-            if "Begin writing the Charge Parameters" in lines_params_host[i]:
-                to_begin = int(i)
-            if "Finish writing the Charge Parameters" in lines_params_host[i]:
-                to_end = int(i)
-        charge_params_host = lines_params_host[to_begin + 1 : to_end]
-        # Charge Parameters Guest
-        f_params_guest = open(self.guest_qm_params_file, "r")
-        lines_params_guest = f_params_guest.readlines()
-        # Charge Parameters Guest
-        for i in range(len(lines_params_guest)):
-            if "Begin writing the Charge Parameters" in lines_params_guest[i]:
-                to_begin = int(i)
-            if "Finish writing the Charge Parameters" in lines_params_guest[i]:
-                to_end = int(i)
-        charge_params_guest = lines_params_guest[to_begin + 1 : to_end]
-        charge_systems_params = charge_params_host + charge_params_guest
-        system_params = open(self.host_guest_qm_params_file, "w")
-        system_params.write("Begin writing the Bond Parameters" + "\n")
-        for i in range(len(bond_systems_params)):
-            system_params.write(bond_systems_params[i])
-        system_params.write("Finish writing the Bond Parameters" + "\n")
-        system_params.write("Begin writing the Angle Parameters" + "\n")
-        for i in range(len(angle_systems_params)):
-            system_params.write(angle_systems_params[i])
-        system_params.write("Finish writing the Angle Parameters" + "\n")
-        system_params.write("Begin writing the Charge Parameters" + "\n")
-        for i in range(len(charge_systems_params)):
-            system_params.write(charge_systems_params[i])
-        system_params.write("Finish writing the Charge Parameters" + "\n")
-        system_params.close()
+        qm_params = QMParameterSet.concatenate(
+            [
+                QMParameterSet.load(self.host_qm_params_file),
+                QMParameterSet.load(self.guest_qm_params_file),
+            ]
+        )
+        qm_params.save(
+            self.host_guest_qm_params_file, binary=self.binary_params
+        )
 
     def write_intermediate_reparameterised_system_xml(self):
 
@@ -10330,216 +12428,12 @@ class SystemAmberSystem:
         system but without the QM obtained charges.
         """
 
-        # Bond Parameters
-        f_params = open(self.host_guest_qm_params_file, "r")
-        lines_params = f_params.readlines()
-        # Bond Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Bond Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Bond Parameters" in lines_params[i]:
-                to_end = int(i)
-        bond_params = lines_params[to_begin + 1 : to_end]
-        index_search_replace_bond = []
-        for i in bond_params:
-            bond_line_to_replace = i
-            # print(bond_line_to_replace)
-            atom_number_list = [
-                re.findall("\d*\.?\d+", i)[3],
-                re.findall("\d*\.?\d+", i)[5],
-            ]
-            # print(atom_number_list)
-            comb_1 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_2 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_list_bond = [comb_1, comb_2]
-            # print(comb_list_bond)
-            list_search_bond = [
-                search_in_file(file=self.system_xml, word=comb_1),
-                search_in_file(file=self.system_xml, word=comb_2),
-            ]
-            # print(list_search_bond)
-            for j in range(len(list_search_bond)):
-                if list_search_bond[j] != []:
-                    to_add = (list_search_bond[j], i)
-                    # print(to_add)
-                    index_search_replace_bond.append(to_add)
-        # Angle Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Angle Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Angle Parameters" in lines_params[i]:
-                to_end = int(i)
-        angle_params = lines_params[to_begin + 1 : to_end]
-        index_search_replace_angle = []
-        for i in angle_params:
-            angle_line_to_replace = i
-            # print(angle_line_to_replace)
-        index_search_replace_angle = []
-        for i in angle_params:
-            angle_line_to_replace = i
-            # print(angle_line_to_replace)
-            atom_number_list = [
-                re.findall("\d*\.?\d+", i)[3],
-                re.findall("\d*\.?\d+", i)[5],
-                re.findall("\d*\.?\d+", i)[7],
-            ]
-            # print(atom_number_list)
-            comb_1 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + "/>"
-            )
-            comb_2 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_3 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + "/>"
-            )
-            comb_4 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_5 = (
-                "p1="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_6 = (
-                "p1="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_list_angle = [comb_1, comb_2, comb_3, comb_4, comb_5, comb_6]
-            # print(comb_list_angle)
-            list_search_angle = [
-                search_in_file(file=self.system_xml, word=comb_1),
-                search_in_file(file=self.system_xml, word=comb_2),
-                search_in_file(file=self.system_xml, word=comb_3),
-                search_in_file(file=self.system_xml, word=comb_4),
-                search_in_file(file=self.system_xml, word=comb_5),
-                search_in_file(file=self.system_xml, word=comb_6),
-            ]
-            # print(list_search_angle)
-            for j in range(len(list_search_angle)):
-                if list_search_angle[j] != []:
-                    to_add = (list_search_angle[j], i)
-                    # print(to_add)
-                    index_search_replace_angle.append(to_add)
-        f_org = open(self.system_xml)
-        lines = f_org.readlines()
-        for i in range(len(index_search_replace_bond)):
-            line_number = index_search_replace_bond[i][0][0][0] - 1
-            line_to_replace = index_search_replace_bond[i][0][0][1]
-            line_to_replace_with = index_search_replace_bond[i][1]
-            lines[line_number] = line_to_replace_with
-        for i in range(len(index_search_replace_angle)):
-            line_number = index_search_replace_angle[i][0][0][0] - 1
-            line_to_replace = index_search_replace_angle[i][0][0][1]
-            line_to_replace_with = index_search_replace_angle[i][1]
-            lines[line_number] = line_to_replace_with
-        f_cop = open(self.reparameterised_intermediate_system_xml_file, "w")
-        for i in lines:
-            f_cop.write(i)
-        f_cop.close()
+        qm_params = QMParameterSet.load(self.host_guest_qm_params_file)
+        patch_system_xml(
+            self.system_xml,
+            self.reparameterised_intermediate_system_xml_file,
+            qm_params.bond_lines() + qm_params.angle_lines(),
+        )
 
     def write_reparameterised_system_xml(self):
 
@@ -10547,317 +12441,19 @@ class SystemAmberSystem:
         Writes a reparameterised XML force field file for the system.
         """
 
-        # Bond Parameters
-        f_params = open(self.host_guest_qm_params_file, "r")
-        lines_params = f_params.readlines()
-        # Bond Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Bond Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Bond Parameters" in lines_params[i]:
-                to_end = int(i)
-        bond_params = lines_params[to_begin + 1 : to_end]
-        index_search_replace_bond = []
-        for i in bond_params:
-            bond_line_to_replace = i
-            # print(bond_line_to_replace)
-            atom_number_list = [
-                re.findall("\d*\.?\d+", i)[3],
-                re.findall("\d*\.?\d+", i)[5],
-            ]
-            # print(atom_number_list)
-            comb_1 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_2 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_list_bond = [comb_1, comb_2]
-            # print(comb_list_bond)
-            list_search_bond = [
-                search_in_file(file=self.system_xml, word=comb_1),
-                search_in_file(file=self.system_xml, word=comb_2),
-            ]
-            # print(list_search_bond)
-            for j in range(len(list_search_bond)):
-                if list_search_bond[j] != []:
-                    to_add = (list_search_bond[j], i)
-                    # print(to_add)
-                    index_search_replace_bond.append(to_add)
-        # Angle Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Angle Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Angle Parameters" in lines_params[i]:
-                to_end = int(i)
-        angle_params = lines_params[to_begin + 1 : to_end]
-        index_search_replace_angle = []
-        for i in angle_params:
-            angle_line_to_replace = i
-            # print(angle_line_to_replace)
-        index_search_replace_angle = []
-        for i in angle_params:
-            angle_line_to_replace = i
-            # print(angle_line_to_replace)
-            atom_number_list = [
-                re.findall("\d*\.?\d+", i)[3],
-                re.findall("\d*\.?\d+", i)[5],
-                re.findall("\d*\.?\d+", i)[7],
-            ]
-            # print(atom_number_list)
-            comb_1 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + "/>"
-            )
-            comb_2 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_3 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + "/>"
-            )
-            comb_4 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_5 = (
-                "p1="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_6 = (
-                "p1="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_list_angle = [comb_1, comb_2, comb_3, comb_4, comb_5, comb_6]
-            # print(comb_list_angle)
-            list_search_angle = [
-                search_in_file(file=self.system_xml, word=comb_1),
-                search_in_file(file=self.system_xml, word=comb_2),
-                search_in_file(file=self.system_xml, word=comb_3),
-                search_in_file(file=self.system_xml, word=comb_4),
-                search_in_file(file=self.system_xml, word=comb_5),
-                search_in_file(file=self.system_xml, word=comb_6),
-            ]
-            # print(list_search_angle)
-            for j in range(len(list_search_angle)):
-                if list_search_angle[j] != []:
-                    to_add = (list_search_angle[j], i)
-                    # print(to_add)
-                    index_search_replace_angle.append(to_add)
-        f_org = open(self.system_xml)
-        lines = f_org.readlines()
-        for i in range(len(index_search_replace_bond)):
-            line_number = index_search_replace_bond[i][0][0][0] - 1
-            line_to_replace = index_search_replace_bond[i][0][0][1]
-            line_to_replace_with = index_search_replace_bond[i][1]
-            lines[line_number] = line_to_replace_with
-        for i in range(len(index_search_replace_angle)):
-            line_number = index_search_replace_angle[i][0][0][0] - 1
-            line_to_replace = index_search_replace_angle[i][0][0][1]
-            line_to_replace_with = index_search_replace_angle[i][1]
-            lines[line_number] = line_to_replace_with
-        f_cop = open(self.reparameterised_intermediate_system_xml_file, "w")
-        for i in lines:
-            f_cop.write(i)
-        f_cop.close()
-        f_params = open(self.host_guest_qm_params_file)
-        lines_params = f_params.readlines()
-        # Charge Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Charge Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Charge Parameters" in lines_params[i]:
-                to_end = int(i)
-        charge_params = lines_params[to_begin + 1 : to_end]
-        non_bonded_index = []
-        for k in charge_params:
-            non_bonded_index.append(int(re.findall("[-+]?\d*\.\d+|\d+", k)[3]))
-        charge_for_index = []
-        for k in charge_params:
-            charge_for_index.append(
-                float(re.findall("[-+]?\d*\.\d+|\d+", k)[0])
-            )
-        xml_off = open(self.system_xml)
-        xml_off_lines = xml_off.readlines()
-        for i in range(len(xml_off_lines)):
-            if "<GlobalParameters/>" in xml_off_lines[i]:
-                to_begin = int(i)
-            if "<Exceptions>" in xml_off_lines[i]:
-                to_end = int(i)
-        nonbond_params = xml_off_lines[to_begin + 4 : to_end - 1]
-        # print(len(nonbond_params))
-        f_non_bonded = open(self.system_xml_non_bonded_file, "w")
-        for x in nonbond_params:
-            f_non_bonded.write(x)
-        f_non_bonded = open(self.system_xml_non_bonded_file)
-        lines_non_bonded = f_non_bonded.readlines()
-        # print(len(lines_non_bonded))
-        lines_non_bonded_to_write = []
-        for i in range(len(non_bonded_index)):
-            line_ = lines_non_bonded[non_bonded_index[i]]
-            # print(line_)
-            eps = float(re.findall("[-+]?\d*\.\d+|\d+", line_)[0])
-            sig = float(re.findall("[-+]?\d*\.\d+|\d+", line_)[2])
-            line_to_replace = (
-                "                                "
-                + "<Particle "
-                + "eps="
-                + '"'
-                + str(eps)
-                + '"'
-                + " "
-                + "q="
-                + '"'
-                + str(charge_for_index[i])
-                + '"'
-                + " "
-                + "sig="
-                + '"'
-                + str(sig)
-                + '"'
-                + "/>"
-            )
-            lines_non_bonded_to_write.append(line_to_replace)
-        data_ = list(zip(non_bonded_index, lines_non_bonded_to_write))
-        df_non_bonded_params = pd.DataFrame(
-            data_, columns=["line_index", "line"]
-        )
-        # print(df_non_bonded_params.head())
-        f_non_bonded_ = open(self.system_xml_non_bonded_file)
-        lines_non_bonded_ = f_non_bonded_.readlines()
-        for i in range(len(lines_non_bonded_)):
-            if i in non_bonded_index:
-                lines_non_bonded_[i] = (
-                    df_non_bonded_params.loc[
-                        df_non_bonded_params.line_index == i, "line"
-                    ].values[0]
-                ) + "\n"
-        # print(len(lines_non_bonded_))
-        f_write_non_bonded_reparams = open(
-            self.system_xml_non_bonded_reparams_file, "w"
-        )
-        for p in range(len(lines_non_bonded_)):
-            f_write_non_bonded_reparams.write(lines_non_bonded_[p])
-        f_write_non_bonded_reparams.close()
-        f_ = open(self.system_xml_non_bonded_reparams_file)
-        lines_ = f_.readlines()
-        print(len(lines_) == len(lines_non_bonded))
-        xml_off = open(self.reparameterised_intermediate_system_xml_file)
-        xml_off_lines = xml_off.readlines()
-        for i in range(len(xml_off_lines)):
-            if "<GlobalParameters/>" in xml_off_lines[i]:
-                to_begin = int(i)
-            if "<Exceptions>" in xml_off_lines[i]:
-                to_end = int(i)
-        lines_before_params = xml_off_lines[: to_begin + 4]
-        f__ = open(self.system_xml_non_bonded_reparams_file)
-        lines_params_non_bonded = f__.readlines()
-        lines_after_params = xml_off_lines[to_end - 1 :]
-        f_reparams_xml = open(self.reparameterised_system_xml_file, "w")
-        for x in lines_before_params:
-            f_reparams_xml.write(x)
-        for x in lines_params_non_bonded:
-            f_reparams_xml.write(x)
-        for x in lines_after_params:
-            f_reparams_xml.write(x)
-        f_reparams_xml.close()
+        qm_params = QMParameterSet.load(self.host_guest_qm_params_file)
+        patch_system_xml(
+            self.system_xml,
+            self.reparameterised_intermediate_system_xml_file,
+            qm_params.bond_lines() + qm_params.angle_lines(),
+        )
+        patch_system_xml(
+            self.reparameterised_intermediate_system_xml_file,
+            self.reparameterised_system_xml_file,
+            charges=qm_params.charges,
+            non_bonded_file=self.system_xml_non_bonded_file,
+            non_bonded_reparams_file=self.system_xml_non_bonded_reparams_file,
+        )
 
     def write_torsional_reparams_intermediate(self):
         """
@@ -10866,108 +12462,17 @@ class SystemAmberSystem:
         """
 
         no_host_atoms = get_num_host_atoms(self.host_pdb)
-        xml_tor = open(self.reparameterized_torsional_params_file, "r")
-        xml_tor_lines = xml_tor.readlines()
-        xml_tor_lines_renum = []
-        for i in xml_tor_lines:
-            i = i.replace(
-                "p1=" + '"' + str(int(re.findall("\d*\.?\d+", i)[2])) + '"',
-                "p1="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[2]) + no_host_atoms))
-                + '"',
-            )
-            i = i.replace(
-                "p2=" + '"' + str(int(re.findall("\d*\.?\d+", i)[4])) + '"',
-                "p2="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[4]) + no_host_atoms))
-                + '"',
-            )
-            i = i.replace(
-                "p3=" + '"' + str(int(re.findall("\d*\.?\d+", i)[6])) + '"',
-                "p3="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[6]) + no_host_atoms))
-                + '"',
-            )
-            i = i.replace(
-                "p4=" + '"' + str(int(re.findall("\d*\.?\d+", i)[8])) + '"',
-                "p4="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[8]) + no_host_atoms))
-                + '"',
-            )
-            xml_tor_lines_renum.append(i)
-
-        non_zero_k_tor = []
-        for i in xml_tor_lines_renum:
-            to_find = "k=" + '"' + "0.0" + '"'
-            if to_find not in i:
-                non_zero_k_tor.append(i)
-        # print(non_zero_k_tor)
-        p1 = []
-        for i in range(len(non_zero_k_tor)):
-            p1.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[2]))
-        # print(p1)
-        p2 = []
-        for i in range(len(non_zero_k_tor)):
-            p2.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[4]))
-        # print(p2)
-        p3 = []
-        for i in range(len(non_zero_k_tor)):
-            p3.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[6]))
-        # print(p3)
-        p4 = []
-        for i in range(len(non_zero_k_tor)):
-            p4.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[8]))
-        # print(p4)
-        periodicity = []
-        for i in range(len(non_zero_k_tor)):
-            periodicity.append(
-                int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[9])
-            )
-        # print(periodicity)
-        xml_tor_reparams = open(
-            self.reparameterised_intermediate_system_xml_file, "r"
-        )
-        xml_tor_reparams_lines = xml_tor_reparams.readlines()
-        for j in range(len(xml_tor_reparams_lines)):
-            for i in range(len(non_zero_k_tor)):
-                to_find_tor = (
-                    "p1="
-                    + '"'
-                    + str(p1[i])
-                    + '"'
-                    + " "
-                    + "p2="
-                    + '"'
-                    + str(p2[i])
-                    + '"'
-                    + " "
-                    + "p3="
-                    + '"'
-                    + str(p3[i])
-                    + '"'
-                    + " "
-                    + "p4="
-                    + '"'
-                    + str(p4[i])
-                    + '"'
-                    + " "
-                    + "periodicity="
-                    + '"'
-                    + str(periodicity[i])
-                    + '"'
-                )
-                if to_find_tor in xml_tor_reparams_lines[j]:
-                    print(xml_tor_reparams_lines[j])
-                    xml_tor_reparams_lines[j] = non_zero_k_tor[i]
-        with open(
-            self.reparameterised_intermediate_torsional_system_xml_file, "w"
-        ) as f:
-            for i in xml_tor_reparams_lines:
-                f.write(i)
+        with open(self.reparameterized_torsional_params_file, "r") as xml_tor:
+            non_zero_k_tor = [
+                shift_atom_indices(i, no_host_atoms)
+                for i in xml_tor
+                if 'k="0.0"' not in i
+            ]
+        patch_system_xml(
+            self.reparameterised_intermediate_system_xml_file,
+            self.reparameterised_intermediate_torsional_system_xml_file,
+            non_zero_k_tor,
+        )
 
     def write_torsional_reparams(self):
         """
@@ -10976,104 +12481,17 @@ class SystemAmberSystem:
         """
 
         no_host_atoms = get_num_host_atoms(self.host_pdb)
-        xml_tor = open(self.reparameterized_torsional_params_file, "r")
-        xml_tor_lines = xml_tor.readlines()
-        xml_tor_lines_renum = []
-        for i in xml_tor_lines:
-            i = i.replace(
-                "p1=" + '"' + str(int(re.findall("\d*\.?\d+", i)[2])) + '"',
-                "p1="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[2]) + no_host_atoms))
-                + '"',
-            )
-            i = i.replace(
-                "p2=" + '"' + str(int(re.findall("\d*\.?\d+", i)[4])) + '"',
-                "p2="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[4]) + no_host_atoms))
-                + '"',
-            )
-            i = i.replace(
-                "p3=" + '"' + str(int(re.findall("\d*\.?\d+", i)[6])) + '"',
-                "p3="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[6]) + no_host_atoms))
-                + '"',
-            )
-            i = i.replace(
-                "p4=" + '"' + str(int(re.findall("\d*\.?\d+", i)[8])) + '"',
-                "p4="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[8]) + no_host_atoms))
-                + '"',
-            )
-            xml_tor_lines_renum.append(i)
-
-        non_zero_k_tor = []
-        for i in xml_tor_lines_renum:
-            to_find = "k=" + '"' + "0.0" + '"'
-            if to_find not in i:
-                non_zero_k_tor.append(i)
-        # print(non_zero_k_tor)
-        p1 = []
-        for i in range(len(non_zero_k_tor)):
-            p1.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[2]))
-        # print(p1)
-        p2 = []
-        for i in range(len(non_zero_k_tor)):
-            p2.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[4]))
-        # print(p2)
-        p3 = []
-        for i in range(len(non_zero_k_tor)):
-            p3.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[6]))
-        # print(p3)
-        p4 = []
-        for i in range(len(non_zero_k_tor)):
-            p4.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[8]))
-        # print(p4)
-        periodicity = []
-        for i in range(len(non_zero_k_tor)):
-            periodicity.append(
-                int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[9])
-            )
-        # print(periodicity)
-        xml_tor_reparams = open(self.reparameterised_system_xml_file, "r")
-        xml_tor_reparams_lines = xml_tor_reparams.readlines()
-        for j in range(len(xml_tor_reparams_lines)):
-            for i in range(len(non_zero_k_tor)):
-                to_find_tor = (
-                    "p1="
-                    + '"'
-                    + str(p1[i])
-                    + '"'
-                    + " "
-                    + "p2="
-                    + '"'
-                    + str(p2[i])
-                    + '"'
-                    + " "
-                    + "p3="
-                    + '"'
-                    + str(p3[i])
-                    + '"'
-                    + " "
-                    + "p4="
-                    + '"'
-                    + str(p4[i])
-                    + '"'
-                    + " "
-                    + "periodicity="
-                    + '"'
-                    + str(periodicity[i])
-                    + '"'
-                )
-                if to_find_tor in xml_tor_reparams_lines[j]:
-                    print(xml_tor_reparams_lines[j])
-                    xml_tor_reparams_lines[j] = non_zero_k_tor[i]
-        with open(self.reparameterised_torsional_system_xml_file, "w") as f:
-            for i in xml_tor_reparams_lines:
-                f.write(i)
+        with open(self.reparameterized_torsional_params_file, "r") as xml_tor:
+            non_zero_k_tor = [
+                shift_atom_indices(i, no_host_atoms)
+                for i in xml_tor
+                if 'k="0.0"' not in i
+            ]
+        patch_system_xml(
+            self.reparameterised_system_xml_file,
+            self.reparameterised_torsional_system_xml_file,
+            non_zero_k_tor,
+        )
 
     def save_amber_params_non_qm_charges(self):
 
@@ -11645,6 +13063,58 @@ class SystemAmberSystem:
         df_compare = pd.concat([df_energy_xml, df_energy_prmtop], axis=1)
         print(df_compare)
 
+    def save_amber_params_from_system(self, qm_charges=True):
+
+        """
+        Saves amber generated topology files for the reparameterised
+        system without serializing it to a XML force field file.
+
+        The OpenMM System is created from the topology file and the QM
+        parameters, along with the reparameterized torsional parameters
+        of the ligand if available, are applied to its forces through
+        patch_system. The topology and coordinate files are then saved
+        straight from that System. This replaces the XML based steps
+        (generate_xml_from_prmtop, write_reparameterised_system_xml,
+        write_torsional_reparams and save_amber_params) once the QM
+        parameters have been written.
+
+        Parameters
+        ----------
+        qm_charges : bool, optional
+            Whether to apply the QM charges. If False, the files are
+            saved as prmtop_system_intermediate_params and
+            inpcrd_system_intermediate_params instead.
+
+        """
+
+        parm = parmed.load_file(self.prmtop_system, self.system_pdb)
+        system = parm.createSystem()
+        qm_params = QMParameterSet.load(self.host_guest_qm_params_file)
+        if os.path.isfile(self.reparameterized_torsional_params_file):
+            no_host_atoms = get_num_host_atoms(self.host_pdb)
+            with open(
+                self.reparameterized_torsional_params_file, "r"
+            ) as xml_tor:
+                non_zero_k_tor = [
+                    shift_atom_indices(i, no_host_atoms)
+                    for i in xml_tor
+                    if i.strip() and 'k="0.0"' not in i
+                ]
+            qm_params = QMParameterSet.concatenate(
+                [qm_params, QMParameterSet.from_lines(non_zero_k_tor)]
+            )
+        patch_system(system, qm_params, charges=qm_charges)
+        openmm_system = parmed.openmm.load_topology(parm.topology, system)
+        openmm_system.coordinates = parm.coordinates
+        if qm_charges:
+            prmtop_file = self.prmtop_system_params
+            inpcrd_file = self.inpcrd_system_params
+        else:
+            prmtop_file = self.prmtop_system_intermediate_params
+            inpcrd_file = self.inpcrd_system_intermediate_params
+        openmm_system.save(prmtop_file, overwrite=True)
+        openmm_system.save(inpcrd_file, overwrite=True)
+
 
 class SystemGuestAmberSystem:
 
@@ -11747,6 +13217,10 @@ class SystemGuestAmberSystem:
     inpcrd_system_params: str, optional
         Reparameterized INPCRD file.
 
+    binary_params: bool, optional
+        Also save the QM parameters in a compact binary .npz file
+        next to guest_qm_params_file.
+
     """
 
     def __init__(
@@ -11775,6 +13249,7 @@ class SystemGuestAmberSystem:
         inpcrd_system_intermediate_params="hostguest_intermediate.inpcrd",
         prmtop_system_params="hostguest_params.prmtop",
         inpcrd_system_params="hostguest_params.inpcrd",
+        binary_params=False,
     ):
 
         self.host_pdb = host_pdb
@@ -11817,6 +13292,7 @@ class SystemGuestAmberSystem:
         )
         self.prmtop_system_params = prmtop_system_params
         self.inpcrd_system_params = inpcrd_system_params
+        self.binary_params = binary_params
 
     def generate_xml_from_prmtop(self):
 
@@ -11838,176 +13314,17 @@ class SystemGuestAmberSystem:
         index of the last atom of the receptor ).
         """
 
-        # Charges from QM files
-        df_charges = pd.read_csv(
-            self.charge_parameter_file_guest, header=None, delimiter=r"\s+"
-        )
-        df_charges.columns = ["atom", "charges"]
-        qm_charges = df_charges["charges"].values.tolist()
-        qm_charges = [round(num, 6) for num in qm_charges]
-        # print(qm_charges)
-        # Bond Parameters from QM files
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.guest_qm_pdb)
-        atom_name_list = ppdb.df["ATOM"]["atom_number"].values.tolist()
-        # atom_name_list = [i - 1 for i in atom_name_list]
-        no_host_atoms = get_num_host_atoms(self.host_pdb)
-        atom_name_list = [i - 1 + no_host_atoms for i in atom_name_list]
-        # print(atom_name_list)
-        df = pd.read_csv(
-            self.bond_parameter_file_guest, header=None, delimiter=r"\s+"
-        )
-        df.columns = ["bond", "k_bond", "bond_length", "bond_1", "bond_2"]
-        # print(df.head())
-        bond_1_list = df["bond_1"].values.tolist()
-        bond_1_list = [x - 1 + min(atom_name_list) for x in bond_1_list]
-        bond_2_list = df["bond_2"].values.tolist()
-        bond_2_list = [x - 1 + min(atom_name_list) for x in bond_2_list]
-        # print(bond_1_list)
-        # print(bond_2_list)
-        k_bond_list = df["k_bond"].values.tolist()
-        k_bond_list = [
-            i * KCAL_MOL_PER_KJ_MOL * ANGSTROMS_PER_NM**2 for i in k_bond_list
-        ]  # kcal/mol * A^2 to kJ/mol * nm^2
-        k_bond_list = [round(num, 10) for num in k_bond_list]
-        # print(k_bond_list)
-        bond_length_list = df["bond_length"].values.tolist()
-        bond_length_list = [i / 10.00 for i in bond_length_list]
-        bond_length_list = [round(num, 6) for num in bond_length_list]
-        # print(bond_length_list)
-        # Angle Parameters from QM files
-        ppdb = PandasPdb()
-        ppdb.read_pdb(self.guest_qm_pdb)
-        atom_name_list = ppdb.df["ATOM"]["atom_number"].values.tolist()
-        # atom_name_list = [i - 1 for i in atom_name_list]
+        atoms = PdbFile.load(self.guest_qm_pdb).records("ATOM")
+        atom_name_list = atoms["atom_number"].tolist()
         no_host_atoms = get_num_host_atoms(self.host_pdb)
         atom_name_list = [i - 1 + no_host_atoms for i in atom_name_list]
-        # print(atom_name_list)
-        df = pd.read_csv(
-            self.angle_parameter_file_guest, header=None, delimiter=r"\s+"
+        qm_params = QMParameterSet.from_qm_files(
+            charge_parameter_file=self.charge_parameter_file_guest,
+            bond_parameter_file=self.bond_parameter_file_guest,
+            angle_parameter_file=self.angle_parameter_file_guest,
+            atom_numbers=atom_name_list,
         )
-        df.columns = [
-            "angle",
-            "k_angle",
-            "angle_degrees",
-            "angle_1",
-            "angle_2",
-            "angle_3",
-        ]
-        # print(df.head())
-        angle_1_list = df["angle_1"].values.tolist()
-        angle_1_list = [x - 1 + min(atom_name_list) for x in angle_1_list]
-        # print(angle_1_list)
-        angle_2_list = df["angle_2"].values.tolist()
-        angle_2_list = [x - 1 + min(atom_name_list) for x in angle_2_list]
-        # print(angle_2_list)
-        angle_3_list = df["angle_3"].values.tolist()
-        angle_3_list = [x - 1 + min(atom_name_list) for x in angle_3_list]
-        # print(angle_3_list)
-        k_angle_list = df["k_angle"].values.tolist()
-        k_angle_list = [
-            i * KCAL_MOL_PER_KJ_MOL for i in k_angle_list
-        ]  # kcal/mol * radian^2 to kJ/mol * radian^2
-        k_angle_list = [round(num, 6) for num in k_angle_list]
-        # print(k_angle_list)
-        angle_list = df["angle_degrees"].values.tolist()
-        angle_list = [i * RADIANS_PER_DEGREE for i in angle_list]
-        angle_list = [round(num, 6) for num in angle_list]
-        # print(angle_list)
-        xml = open(self.guest_qm_params_file, "w")
-        xml.write("Begin writing the Bond Parameters" + "\n")
-        # TODO: use string formatting and templates to write these lines
-        for i in range(len(k_bond_list)):
-            xml.write(
-                "                                "
-                + "<Bond"
-                + " "
-                + "d="
-                + '"'
-                + str(bond_length_list[i])
-                + '"'
-                + " "
-                + "k="
-                + '"'
-                + str(k_bond_list[i])
-                + '"'
-                + " "
-                + "p1="
-                + '"'
-                + str(bond_1_list[i])
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + str(bond_2_list[i])
-                + '"'
-                + "/>"
-                + "\n"
-            )
-        xml.write("Finish writing the Bond Parameters" + "\n")
-        xml.write("Begin writing the Angle Parameters" + "\n")
-        for i in range(len(k_angle_list)):
-            xml.write(
-                "                                "
-                + "<Angle"
-                + " "
-                + "a="
-                + '"'
-                + str(angle_list[i])
-                + '"'
-                + " "
-                + "k="
-                + '"'
-                + str(k_angle_list[i])
-                + '"'
-                + " "
-                + "p1="
-                + '"'
-                + str(angle_1_list[i])
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + str(angle_2_list[i])
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + str(angle_3_list[i])
-                + '"'
-                + "/>"
-                + "\n"
-            )
-        xml.write("Finish writing the Angle Parameters" + "\n")
-        xml.write("Begin writing the Charge Parameters" + "\n")
-        for i in range(len(qm_charges)):
-            xml.write(
-                "<Particle"
-                + " "
-                + "q="
-                + '"'
-                + str(qm_charges[i])
-                + '"'
-                + " "
-                + "eps="
-                + '"'
-                + str(0.00)
-                + '"'
-                + " "
-                + "sig="
-                + '"'
-                + str(0.00)
-                + '"'
-                + " "
-                + "atom="
-                + '"'
-                + str(atom_name_list[i])
-                + '"'
-                + "/>"
-                + "\n"
-            )
-        xml.write("Finish writing the Charge Parameters" + "\n")
-        xml.close()
+        qm_params.save(self.guest_qm_params_file, binary=self.binary_params)
 
     def write_intermediate_reparameterised_system_xml(self):
 
@@ -12016,216 +13333,12 @@ class SystemGuestAmberSystem:
         system but without the QM obtained charges.
         """
 
-        # Bond Parameters
-        f_params = open(self.guest_qm_params_file, "r")
-        lines_params = f_params.readlines()
-        # Bond Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Bond Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Bond Parameters" in lines_params[i]:
-                to_end = int(i)
-        bond_params = lines_params[to_begin + 1 : to_end]
-        index_search_replace_bond = []
-        for i in bond_params:
-            bond_line_to_replace = i
-            # print(bond_line_to_replace)
-            atom_number_list = [
-                re.findall("\d*\.?\d+", i)[3],
-                re.findall("\d*\.?\d+", i)[5],
-            ]
-            # print(atom_number_list)
-            comb_1 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_2 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_list_bond = [comb_1, comb_2]
-            # print(comb_list_bond)
-            list_search_bond = [
-                search_in_file(file=self.system_xml, word=comb_1),
-                search_in_file(file=self.system_xml, word=comb_2),
-            ]
-            # print(list_search_bond)
-            for j in range(len(list_search_bond)):
-                if list_search_bond[j] != []:
-                    to_add = (list_search_bond[j], i)
-                    # print(to_add)
-                    index_search_replace_bond.append(to_add)
-        # Angle Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Angle Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Angle Parameters" in lines_params[i]:
-                to_end = int(i)
-        angle_params = lines_params[to_begin + 1 : to_end]
-        index_search_replace_angle = []
-        for i in angle_params:
-            angle_line_to_replace = i
-            # print(angle_line_to_replace)
-        index_search_replace_angle = []
-        for i in angle_params:
-            angle_line_to_replace = i
-            # print(angle_line_to_replace)
-            atom_number_list = [
-                re.findall("\d*\.?\d+", i)[3],
-                re.findall("\d*\.?\d+", i)[5],
-                re.findall("\d*\.?\d+", i)[7],
-            ]
-            # print(atom_number_list)
-            comb_1 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + "/>"
-            )
-            comb_2 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_3 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + "/>"
-            )
-            comb_4 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_5 = (
-                "p1="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_6 = (
-                "p1="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_list_angle = [comb_1, comb_2, comb_3, comb_4, comb_5, comb_6]
-            # print(comb_list_angle)
-            list_search_angle = [
-                search_in_file(file=self.system_xml, word=comb_1),
-                search_in_file(file=self.system_xml, word=comb_2),
-                search_in_file(file=self.system_xml, word=comb_3),
-                search_in_file(file=self.system_xml, word=comb_4),
-                search_in_file(file=self.system_xml, word=comb_5),
-                search_in_file(file=self.system_xml, word=comb_6),
-            ]
-            # print(list_search_angle)
-            for j in range(len(list_search_angle)):
-                if list_search_angle[j] != []:
-                    to_add = (list_search_angle[j], i)
-                    # print(to_add)
-                    index_search_replace_angle.append(to_add)
-        f_org = open(self.system_xml)
-        lines = f_org.readlines()
-        for i in range(len(index_search_replace_bond)):
-            line_number = index_search_replace_bond[i][0][0][0] - 1
-            line_to_replace = index_search_replace_bond[i][0][0][1]
-            line_to_replace_with = index_search_replace_bond[i][1]
-            lines[line_number] = line_to_replace_with
-        for i in range(len(index_search_replace_angle)):
-            line_number = index_search_replace_angle[i][0][0][0] - 1
-            line_to_replace = index_search_replace_angle[i][0][0][1]
-            line_to_replace_with = index_search_replace_angle[i][1]
-            lines[line_number] = line_to_replace_with
-        f_cop = open(self.reparameterised_intermediate_system_xml_file, "w")
-        for i in lines:
-            f_cop.write(i)
-        f_cop.close()
+        qm_params = QMParameterSet.load(self.guest_qm_params_file)
+        patch_system_xml(
+            self.system_xml,
+            self.reparameterised_intermediate_system_xml_file,
+            qm_params.bond_lines() + qm_params.angle_lines(),
+        )
 
     def write_reparameterised_system_xml(self):
 
@@ -12233,319 +13346,19 @@ class SystemGuestAmberSystem:
         Writes a reparameterised XML force field file for the system.
         """
 
-        # Bond Parameters
-        with open(self.guest_qm_params_file, "r") as f_params:
-            lines_params = f_params.readlines()
-        # Bond Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Bond Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Bond Parameters" in lines_params[i]:
-                to_end = int(i)
-        bond_params = lines_params[to_begin + 1 : to_end]
-        index_search_replace_bond = []
-        # TODO: again, use string formatting.
-        for i in bond_params:
-            bond_line_to_replace = i
-            # print(bond_line_to_replace)
-            atom_number_list = [
-                re.findall("\d*\.?\d+", i)[3],
-                re.findall("\d*\.?\d+", i)[5],
-            ]
-            # print(atom_number_list)
-            comb_1 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_2 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_list_bond = [comb_1, comb_2]
-            # print(comb_list_bond)
-            list_search_bond = [
-                search_in_file(file=self.system_xml, word=comb_1),
-                search_in_file(file=self.system_xml, word=comb_2),
-            ]
-            # print(list_search_bond)
-            for j in range(len(list_search_bond)):
-                if list_search_bond[j] != []:
-                    to_add = (list_search_bond[j], i)
-                    # print(to_add)
-                    index_search_replace_bond.append(to_add)
-        # Angle Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Angle Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Angle Parameters" in lines_params[i]:
-                to_end = int(i)
-        angle_params = lines_params[to_begin + 1 : to_end]
-        index_search_replace_angle = []
-        for i in angle_params:
-            angle_line_to_replace = i
-            # print(angle_line_to_replace)
-        index_search_replace_angle = []
-        # TODO: use string formatting (generalize to function?)
-        for i in angle_params:
-            angle_line_to_replace = i
-            # print(angle_line_to_replace)
-            atom_number_list = [
-                re.findall("\d*\.?\d+", i)[3],
-                re.findall("\d*\.?\d+", i)[5],
-                re.findall("\d*\.?\d+", i)[7],
-            ]
-            # print(atom_number_list)
-            comb_1 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + "/>"
-            )
-            comb_2 = (
-                "p1="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_3 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + "/>"
-            )
-            comb_4 = (
-                "p1="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_5 = (
-                "p1="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + "/>"
-            )
-            comb_6 = (
-                "p1="
-                + '"'
-                + atom_number_list[2]
-                + '"'
-                + " "
-                + "p2="
-                + '"'
-                + atom_number_list[1]
-                + '"'
-                + " "
-                + "p3="
-                + '"'
-                + atom_number_list[0]
-                + '"'
-                + "/>"
-            )
-            comb_list_angle = [comb_1, comb_2, comb_3, comb_4, comb_5, comb_6]
-            # print(comb_list_angle)
-            list_search_angle = [
-                search_in_file(file=self.system_xml, word=comb_1),
-                search_in_file(file=self.system_xml, word=comb_2),
-                search_in_file(file=self.system_xml, word=comb_3),
-                search_in_file(file=self.system_xml, word=comb_4),
-                search_in_file(file=self.system_xml, word=comb_5),
-                search_in_file(file=self.system_xml, word=comb_6),
-            ]
-            # print(list_search_angle)
-            for j in range(len(list_search_angle)):
-                if list_search_angle[j] != []:
-                    to_add = (list_search_angle[j], i)
-                    # print(to_add)
-                    index_search_replace_angle.append(to_add)
-        f_org = open(self.system_xml)
-        lines = f_org.readlines()
-        for i in range(len(index_search_replace_bond)):
-            line_number = index_search_replace_bond[i][0][0][0] - 1
-            line_to_replace = index_search_replace_bond[i][0][0][1]
-            line_to_replace_with = index_search_replace_bond[i][1]
-            lines[line_number] = line_to_replace_with
-        for i in range(len(index_search_replace_angle)):
-            line_number = index_search_replace_angle[i][0][0][0] - 1
-            line_to_replace = index_search_replace_angle[i][0][0][1]
-            line_to_replace_with = index_search_replace_angle[i][1]
-            lines[line_number] = line_to_replace_with
-        f_cop = open(self.reparameterised_intermediate_system_xml_file, "w")
-        for i in lines:
-            f_cop.write(i)
-        f_cop.close()
-        f_params = open(self.guest_qm_params_file)
-        lines_params = f_params.readlines()
-        # Charge Parameters
-        for i in range(len(lines_params)):
-            if "Begin writing the Charge Parameters" in lines_params[i]:
-                to_begin = int(i)
-            if "Finish writing the Charge Parameters" in lines_params[i]:
-                to_end = int(i)
-        charge_params = lines_params[to_begin + 1 : to_end]
-        non_bonded_index = []
-        for k in charge_params:
-            non_bonded_index.append(int(re.findall("[-+]?\d*\.\d+|\d+", k)[3]))
-        charge_for_index = []
-        for k in charge_params:
-            charge_for_index.append(
-                float(re.findall("[-+]?\d*\.\d+|\d+", k)[0])
-            )
-        xml_off = open(self.system_xml)
-        xml_off_lines = xml_off.readlines()
-        for i in range(len(xml_off_lines)):
-            if "<GlobalParameters/>" in xml_off_lines[i]:
-                to_begin = int(i)
-            if "<Exceptions>" in xml_off_lines[i]:
-                to_end = int(i)
-        nonbond_params = xml_off_lines[to_begin + 4 : to_end - 1]
-        # print(len(nonbond_params))
-        f_non_bonded = open(self.system_xml_non_bonded_file, "w")
-        for x in nonbond_params:
-            f_non_bonded.write(x)
-        f_non_bonded = open(self.system_xml_non_bonded_file)
-        lines_non_bonded = f_non_bonded.readlines()
-        # print(len(lines_non_bonded))
-        lines_non_bonded_to_write = []
-        for i in range(len(non_bonded_index)):
-            line_ = lines_non_bonded[non_bonded_index[i]]
-            # print(line_)
-            eps = float(re.findall("[-+]?\d*\.\d+|\d+", line_)[0])
-            sig = float(re.findall("[-+]?\d*\.\d+|\d+", line_)[2])
-            line_to_replace = (
-                "                                "
-                + "<Particle "
-                + "eps="
-                + '"'
-                + str(eps)
-                + '"'
-                + " "
-                + "q="
-                + '"'
-                + str(charge_for_index[i])
-                + '"'
-                + " "
-                + "sig="
-                + '"'
-                + str(sig)
-                + '"'
-                + "/>"
-            )
-            lines_non_bonded_to_write.append(line_to_replace)
-        data_ = list(zip(non_bonded_index, lines_non_bonded_to_write))
-        df_non_bonded_params = pd.DataFrame(
-            data_, columns=["line_index", "line"]
-        )
-        # print(df_non_bonded_params.head())
-        f_non_bonded_ = open(self.system_xml_non_bonded_file)
-        lines_non_bonded_ = f_non_bonded_.readlines()
-        for i in range(len(lines_non_bonded_)):
-            if i in non_bonded_index:
-                lines_non_bonded_[i] = (
-                    df_non_bonded_params.loc[
-                        df_non_bonded_params.line_index == i, "line"
-                    ].values[0]
-                ) + "\n"
-        # print(len(lines_non_bonded_))
-        f_write_non_bonded_reparams = open(
-            self.system_xml_non_bonded_reparams_file, "w"
-        )
-        for p in range(len(lines_non_bonded_)):
-            f_write_non_bonded_reparams.write(lines_non_bonded_[p])
-        f_write_non_bonded_reparams.close()
-        f_ = open(self.system_xml_non_bonded_reparams_file)
-        lines_ = f_.readlines()
-        print(len(lines_) == len(lines_non_bonded))
-        xml_off = open(self.reparameterised_intermediate_system_xml_file)
-        xml_off_lines = xml_off.readlines()
-        for i in range(len(xml_off_lines)):
-            if "<GlobalParameters/>" in xml_off_lines[i]:
-                to_begin = int(i)
-            if "<Exceptions>" in xml_off_lines[i]:
-                to_end = int(i)
-        lines_before_params = xml_off_lines[: to_begin + 4]
-        f__ = open(self.system_xml_non_bonded_reparams_file)
-        lines_params_non_bonded = f__.readlines()
-        lines_after_params = xml_off_lines[to_end - 1 :]
-        f_reparams_xml = open(self.reparameterised_system_xml_file, "w")
-        for x in lines_before_params:
-            f_reparams_xml.write(x)
-        for x in lines_params_non_bonded:
-            f_reparams_xml.write(x)
-        for x in lines_after_params:
-            f_reparams_xml.write(x)
-        f_reparams_xml.close()
+        qm_params = QMParameterSet.load(self.guest_qm_params_file)
+        patch_system_xml(
+            self.system_xml,
+            self.reparameterised_intermediate_system_xml_file,
+            qm_params.bond_lines() + qm_params.angle_lines(),
+        )
+        patch_system_xml(
+            self.reparameterised_intermediate_system_xml_file,
+            self.reparameterised_system_xml_file,
+            charges=qm_params.charges,
+            non_bonded_file=self.system_xml_non_bonded_file,
+            non_bonded_reparams_file=self.system_xml_non_bonded_reparams_file,
+        )
 
     def write_torsional_reparams_intermediate(self):
         """
@@ -12554,108 +13367,17 @@ class SystemGuestAmberSystem:
         """
 
         no_host_atoms = get_num_host_atoms(self.host_pdb)
-        xml_tor = open(self.reparameterized_torsional_params_file, "r")
-        xml_tor_lines = xml_tor.readlines()
-        xml_tor_lines_renum = []
-        for i in xml_tor_lines:
-            i = i.replace(
-                "p1=" + '"' + str(int(re.findall("\d*\.?\d+", i)[2])) + '"',
-                "p1="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[2]) + no_host_atoms))
-                + '"',
-            )
-            i = i.replace(
-                "p2=" + '"' + str(int(re.findall("\d*\.?\d+", i)[4])) + '"',
-                "p2="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[4]) + no_host_atoms))
-                + '"',
-            )
-            i = i.replace(
-                "p3=" + '"' + str(int(re.findall("\d*\.?\d+", i)[6])) + '"',
-                "p3="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[6]) + no_host_atoms))
-                + '"',
-            )
-            i = i.replace(
-                "p4=" + '"' + str(int(re.findall("\d*\.?\d+", i)[8])) + '"',
-                "p4="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[8]) + no_host_atoms))
-                + '"',
-            )
-            xml_tor_lines_renum.append(i)
-
-        non_zero_k_tor = []
-        for i in xml_tor_lines_renum:
-            to_find = "k=" + '"' + "0.0" + '"'
-            if to_find not in i:
-                non_zero_k_tor.append(i)
-        # print(non_zero_k_tor)
-        p1 = []
-        for i in range(len(non_zero_k_tor)):
-            p1.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[2]))
-        # print(p1)
-        p2 = []
-        for i in range(len(non_zero_k_tor)):
-            p2.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[4]))
-        # print(p2)
-        p3 = []
-        for i in range(len(non_zero_k_tor)):
-            p3.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[6]))
-        # print(p3)
-        p4 = []
-        for i in range(len(non_zero_k_tor)):
-            p4.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[8]))
-        # print(p4)
-        periodicity = []
-        for i in range(len(non_zero_k_tor)):
-            periodicity.append(
-                int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[9])
-            )
-        # print(periodicity)
-        xml_tor_reparams = open(
-            self.reparameterised_intermediate_system_xml_file, "r"
-        )
-        xml_tor_reparams_lines = xml_tor_reparams.readlines()
-        for j in range(len(xml_tor_reparams_lines)):
-            for i in range(len(non_zero_k_tor)):
-                to_find_tor = (
-                    "p1="
-                    + '"'
-                    + str(p1[i])
-                    + '"'
-                    + " "
-                    + "p2="
-                    + '"'
-                    + str(p2[i])
-                    + '"'
-                    + " "
-                    + "p3="
-                    + '"'
-                    + str(p3[i])
-                    + '"'
-                    + " "
-                    + "p4="
-                    + '"'
-                    + str(p4[i])
-                    + '"'
-                    + " "
-                    + "periodicity="
-                    + '"'
-                    + str(periodicity[i])
-                    + '"'
-                )
-                if to_find_tor in xml_tor_reparams_lines[j]:
-                    print(xml_tor_reparams_lines[j])
-                    xml_tor_reparams_lines[j] = non_zero_k_tor[i]
-        with open(
-            self.reparameterised_intermediate_torsional_system_xml_file, "w"
-        ) as f:
-            for i in xml_tor_reparams_lines:
-                f.write(i)
+        with open(self.reparameterized_torsional_params_file, "r") as xml_tor:
+            non_zero_k_tor = [
+                shift_atom_indices(i, no_host_atoms)
+                for i in xml_tor
+                if 'k="0.0"' not in i
+            ]
+        patch_system_xml(
+            self.reparameterised_intermediate_system_xml_file,
+            self.reparameterised_intermediate_torsional_system_xml_file,
+            non_zero_k_tor,
+        )
 
     def write_torsional_reparams(self):
         """
@@ -12665,104 +13387,16 @@ class SystemGuestAmberSystem:
 
         no_host_atoms = get_num_host_atoms(self.host_pdb)
         with open(self.reparameterized_torsional_params_file, "r") as xml_tor:
-            xml_tor_lines = xml_tor.readlines()
-        xml_tor_lines_renum = []
-        # TODO: string formatting and clean up this code to be more concise
-        for i in xml_tor_lines:
-            i = i.replace(
-                "p1=" + '"' + str(int(re.findall("\d*\.?\d+", i)[2])) + '"',
-                "p1="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[2]) + no_host_atoms))
-                + '"',
-            )
-            i = i.replace(
-                "p2=" + '"' + str(int(re.findall("\d*\.?\d+", i)[4])) + '"',
-                "p2="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[4]) + no_host_atoms))
-                + '"',
-            )
-            i = i.replace(
-                "p3=" + '"' + str(int(re.findall("\d*\.?\d+", i)[6])) + '"',
-                "p3="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[6]) + no_host_atoms))
-                + '"',
-            )
-            i = i.replace(
-                "p4=" + '"' + str(int(re.findall("\d*\.?\d+", i)[8])) + '"',
-                "p4="
-                + '"'
-                + str(int(int(re.findall("\d*\.?\d+", i)[8]) + no_host_atoms))
-                + '"',
-            )
-            xml_tor_lines_renum.append(i)
-
-        non_zero_k_tor = []
-        for i in xml_tor_lines_renum:
-            to_find = "k=" + '"' + "0.0" + '"'
-            if to_find not in i:
-                non_zero_k_tor.append(i)
-        # print(non_zero_k_tor)
-        p1 = []
-        for i in range(len(non_zero_k_tor)):
-            p1.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[2]))
-        # print(p1)
-        p2 = []
-        for i in range(len(non_zero_k_tor)):
-            p2.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[4]))
-        # print(p2)
-        p3 = []
-        for i in range(len(non_zero_k_tor)):
-            p3.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[6]))
-        # print(p3)
-        p4 = []
-        for i in range(len(non_zero_k_tor)):
-            p4.append(int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[8]))
-        # print(p4)
-        periodicity = []
-        for i in range(len(non_zero_k_tor)):
-            periodicity.append(
-                int(re.findall("\d*\.?\d+", non_zero_k_tor[i])[9])
-            )
-        # print(periodicity)
-        xml_tor_reparams = open(self.reparameterised_system_xml_file, "r")
-        xml_tor_reparams_lines = xml_tor_reparams.readlines()
-        for j in range(len(xml_tor_reparams_lines)):
-            for i in range(len(non_zero_k_tor)):
-                to_find_tor = (
-                    "p1="
-                    + '"'
-                    + str(p1[i])
-                    + '"'
-                    + " "
-                    + "p2="
-                    + '"'
-                    + str(p2[i])
-                    + '"'
-                    + " "
-                    + "p3="
-                    + '"'
-                    + str(p3[i])
-                    + '"'
-                    + " "
-                    + "p4="
-                    + '"'
-                    + str(p4[i])
-                    + '"'
-                    + " "
-                    + "periodicity="
-                    + '"'
-                    + str(periodicity[i])
-                    + '"'
-                )
-                if to_find_tor in xml_tor_reparams_lines[j]:
-                    print(xml_tor_reparams_lines[j])
-                    xml_tor_reparams_lines[j] = non_zero_k_tor[i]
-        with open(self.reparameterised_torsional_system_xml_file, "w") as f:
-            for i in xml_tor_reparams_lines:
-                f.write(i)
+            non_zero_k_tor = [
+                shift_atom_indices(i, no_host_atoms)
+                for i in xml_tor
+                if 'k="0.0"' not in i
+            ]
+        patch_system_xml(
+            self.reparameterised_system_xml_file,
+            self.reparameterised_torsional_system_xml_file,
+            non_zero_k_tor,
+        )
 
     def save_amber_params_non_qm_charges(self):
 
@@ -13333,3 +13967,55 @@ class SystemGuestAmberSystem:
         df_energy_prmtop = df_energy_prmtop.set_index("Energy_term")
         df_compare = pd.concat([df_energy_xml, df_energy_prmtop], axis=1)
         print(df_compare)
+
+    def save_amber_params_from_system(self, qm_charges=True):
+
+        """
+        Saves amber generated topology files for the reparameterised
+        system without serializing it to a XML force field file.
+
+        The OpenMM System is created from the topology file and the QM
+        parameters, along with the reparameterized torsional parameters
+        of the ligand if available, are applied to its forces through
+        patch_system. The topology and coordinate files are then saved
+        straight from that System. This replaces the XML based steps
+        (generate_xml_from_prmtop, write_reparameterised_system_xml,
+        write_torsional_reparams and save_amber_params) once the QM
+        parameters have been written.
+
+        Parameters
+        ----------
+        qm_charges : bool, optional
+            Whether to apply the QM charges. If False, the files are
+            saved as prmtop_system_intermediate_params and
+            inpcrd_system_intermediate_params instead.
+
+        """
+
+        parm = parmed.load_file(self.prmtop_system, self.system_pdb)
+        system = parm.createSystem()
+        qm_params = QMParameterSet.load(self.guest_qm_params_file)
+        if os.path.isfile(self.reparameterized_torsional_params_file):
+            no_host_atoms = get_num_host_atoms(self.host_pdb)
+            with open(
+                self.reparameterized_torsional_params_file, "r"
+            ) as xml_tor:
+                non_zero_k_tor = [
+                    shift_atom_indices(i, no_host_atoms)
+                    for i in xml_tor
+                    if i.strip() and 'k="0.0"' not in i
+                ]
+            qm_params = QMParameterSet.concatenate(
+                [qm_params, QMParameterSet.from_lines(non_zero_k_tor)]
+            )
+        patch_system(system, qm_params, charges=qm_charges)
+        openmm_system = parmed.openmm.load_topology(parm.topology, system)
+        openmm_system.coordinates = parm.coordinates
+        if qm_charges:
+            prmtop_file = self.prmtop_system_params
+            inpcrd_file = self.inpcrd_system_params
+        else:
+            prmtop_file = self.prmtop_system_intermediate_params
+            inpcrd_file = self.inpcrd_system_intermediate_params
+        openmm_system.save(prmtop_file, overwrite=True)
+        openmm_system.save(inpcrd_file, overwrite=True)
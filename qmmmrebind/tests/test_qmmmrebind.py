@@ -5,7 +5,9 @@ import warnings
 
 warnings.filterwarnings("ignore")
 from .utils import get_data_filename
+import multiprocessing
 import numpy as np
+import simtk.openmm
 import qmmmrebind
 import pytest
 import sys
@@ -40,6 +42,99 @@ def test_find_word_in_file():
     assert ret[0][0] == 3
 
 
+def test_xml_parameter_key():
+    """Test if parameter lines are keyed independently of atom order"""
+    key = qmmmrebind.parameterize.xml_parameter_key
+    assert key('<Bond d="0.1" k="1.0" p1="5" p2="2"/>') == ("Bond", (2, 5))
+    assert key('<Angle a="2.0" k="1.0" p1="7" p2="2" p3="5"/>') == key(
+        '<Angle a="1.9" k="400" p1="5" p2="2" p3="7"/>'
+    )
+    assert key('<Angle a="2.0" k="1.0" p1="2" p2="7" p3="5"/>') != key(
+        '<Angle a="1.9" k="400" p1="5" p2="2" p3="7"/>'
+    )
+    assert key(
+        '<Torsion k="1" p1="4" p2="3" p3="2" p4="1" periodicity="2" '
+        'phase="0"/>'
+    ) == ("Torsion", (1, 2, 3, 4, 2))
+    assert key('<Constraint d="0.1" p1="5" p2="2"/>') is None
+
+
+def test_patch_system_xml():
+    """Test if bonds, angles and charges are patched in one pass"""
+    with open("test_patch_system.xml", "w") as f:
+        f.write(
+            "<System>\n"
+            '<Bond d="0.1" k="1.0" p1="1" p2="0"/>\n'
+            '<Angle a="2.0" k="1.0" p1="2" p2="1" p3="0"/>\n'
+            '<Particle eps=".5" q="0" sig=".3"/>\n'
+            '<Particle eps=".5" q="0" sig=".3"/>\n'
+            "</System>\n"
+        )
+    qm_params = qmmmrebind.parameterize.QMParameterSet(
+        bonds=[(0, 1, 0.15, 2000.0)],
+        angles=[(0, 1, 2, 1.9, 400.0)],
+        charges=[(1, -0.25, 0.0, 0.0)],
+    )
+    n_patched = qmmmrebind.parameterize.patch_system_xml(
+        "test_patch_system.xml",
+        "test_patch_system_reparameterised.xml",
+        qm_params.bond_lines() + qm_params.angle_lines(),
+        charges=qm_params.charges,
+    )
+    assert n_patched == 3
+    with open("test_patch_system_reparameterised.xml", "r") as f:
+        lines = f.readlines()
+    assert lines[1] == qm_params.bond_lines()[0]
+    assert lines[2] == qm_params.angle_lines()[0]
+    assert 'q="0"' in lines[3]
+    assert 'eps="0.5" q="-0.25" sig="0.3"' in lines[4]
+
+
+def test_patch_system():
+    """Test if QM parameters are applied to the forces of a System"""
+    from simtk import openmm
+
+    system = openmm.System()
+    bond_force = openmm.HarmonicBondForce()
+    torsion_force = openmm.PeriodicTorsionForce()
+    nonbonded_force = openmm.NonbondedForce()
+    for i in range(4):
+        system.addParticle(12.0)
+        nonbonded_force.addParticle(0.0, 0.3, 0.5)
+    bond_force.addBond(1, 0, 0.1, 1000.0)
+    torsion_force.addTorsion(3, 2, 1, 0, 2, 0.0, 1.0)
+    torsion_force.addTorsion(3, 2, 1, 0, 3, 0.0, 1.0)
+    for force in [bond_force, torsion_force, nonbonded_force]:
+        system.addForce(force)
+    qm_params = qmmmrebind.parameterize.QMParameterSet(
+        bonds=[(0, 1, 0.15, 2000.0)],
+        torsions=[(0, 1, 2, 3, 2, 0.0, 2.5)],
+        charges=[(2, -0.25, 0.0, 0.0)],
+    )
+    n_patched = qmmmrebind.parameterize.patch_system(system, qm_params)
+    assert n_patched == 3
+    p1, p2, d, k = bond_force.getBondParameters(0)
+    assert (p1, p2) == (1, 0)
+    assert d._value == 0.15 and k._value == 2000.0
+    assert torsion_force.getTorsionParameters(0)[6]._value == 2.5
+    assert torsion_force.getTorsionParameters(1)[6]._value == 1.0
+    q, sig, eps = nonbonded_force.getParticleParameters(2)
+    assert q._value == -0.25 and sig._value == 0.3
+
+
+def test_file_cache():
+    """Test if only the most recently used entries are kept"""
+    cache = qmmmrebind.parameterize.FileCache(max_size=2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache["a"] == 1
+    cache["c"] = 3
+    assert list(cache) == ["a", "c"]
+    assert cache.pop("a") == 1
+    cache.clear()
+    assert len(cache) == 0
+
+
 def test_get_vibrational_scaling():
     """Test if the vibrational scaling is retrieved correctly"""
     functional = "QCISD"
@@ -127,6 +222,79 @@ def test_get_qm_energies():
     assert qm_energies[0] == -376.541676037
 
 
+def test_fit_dihedral_params():
+    x = np.arange(-165.0, 181.0, 15.0)
+    k_array = np.array([0.5, 0.0, 1.2, 0.3])
+    delta_mm = np.sin(0.01 * x) ** 2
+    delta_qm = (
+        qmmmrebind.parameterize.dihedral_energy(x, *k_array) + delta_mm
+    )
+    for method in ["nnls", "lsq_linear"]:
+        fitted_k_array = qmmmrebind.parameterize.fit_dihedral_params(
+            x, delta_qm, delta_mm=delta_mm, method=method
+        )
+        assert np.allclose(fitted_k_array, k_array, atol=1e-6)
+    weighted_k_array = qmmmrebind.parameterize.fit_dihedral_params(
+        x, delta_qm, delta_mm=delta_mm, T=300.0
+    )
+    assert np.allclose(weighted_k_array, k_array, atol=1e-5)
+    with pytest.raises(ValueError):
+        qmmmrebind.parameterize.fit_dihedral_params(
+            x, delta_qm, delta_mm=delta_mm, method="L-BFGS-B"
+        )
+
+
+def test_get_dihedral_angles():
+    coordinates = np.array(
+        [
+            [[1.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 1.0, 0.0], [1.0, 1.0, 0.0]],
+            [[1.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 1.0, 1.0]],
+        ]
+    )
+    dihedral_angles = qmmmrebind.parameterize.get_dihedral_angles(
+        coordinates, np.array([[0, 1, 2, 3]])
+    )
+    assert dihedral_angles.shape == (2, 1)
+    assert np.allclose(np.abs(dihedral_angles[:, 0]), [0.0, 90.0])
+
+
+def test_fit_global_dihedral_params():
+    phi = np.radians(np.arange(-165.0, 181.0, 15.0))
+    coordinates = np.zeros((len(phi), 5, 3))
+    coordinates[:, 0] = [1.0, 0.0, 0.0]
+    coordinates[:, 2] = [0.0, 1.0, 0.0]
+    coordinates[:, 3, 0] = np.cos(phi)
+    coordinates[:, 3, 1] = 1.0
+    coordinates[:, 3, 2] = np.sin(phi)
+    coordinates[:, 4, 0] = np.cos(phi + 2.0)
+    coordinates[:, 4, 1] = 1.0
+    coordinates[:, 4, 2] = np.sin(phi + 2.0)
+    dihedrals = np.array([[0, 1, 2, 3], [0, 1, 2, 4]])
+    k_array = np.array([[0.5, 0.0, 1.2, 0.3], [0.2, 0.8, 0.0, 0.1]])
+    dihedral_angles = qmmmrebind.parameterize.get_dihedral_angles(
+        coordinates, dihedrals
+    )
+    delta_qm = sum(
+        qmmmrebind.parameterize.dihedral_energy(dihedral_angles[:, i], *k)
+        for i, k in enumerate(k_array)
+    )
+    scans = [
+        {
+            "atom_index": list(i),
+            "coordinates": coordinates,
+            "delta_qm": delta_qm,
+            "delta_mm": np.zeros(len(phi)),
+        }
+        for i in dihedrals
+    ]
+    (
+        fitted_dihedrals,
+        fitted_k_array,
+    ) = qmmmrebind.parameterize.fit_global_dihedral_params(scans)
+    assert np.array_equal(fitted_dihedrals, dihedrals)
+    assert np.allclose(fitted_k_array, k_array, atol=1e-3)
+
+
 def test_copy_guest_coordinates_file():
     source_ = get_data_filename("test_guest_coordinates.txt")
     destination_pwd = os.getcwd()
@@ -189,6 +357,40 @@ def test_force_angle_constant():
     #assert theta_0 == 119.9124090641625
 
 
+def test_sphere_sampled_angle_constant():
+    """Test if the analytic sphere average converges with the number of samples"""
+    u_AB = np.array([1.0, 0.0, 0.0])
+    eigenvalues = np.array([-300.0, -20.0, -10.0], dtype=complex)
+    eigenvectors = np.eye(3, dtype=complex)
+    k_theta = []
+    for n_samples in [360, 3600]:
+        k_theta_i, theta_0 = qmmmrebind.parameterize.sphere_sampled_angle_constant(
+            u_AB,
+            -u_AB,
+            1.1,
+            1.2,
+            eigenvalues,
+            eigenvectors,
+            eigenvalues,
+            eigenvectors,
+            sampling="analytic",
+            n_samples=n_samples,
+        )
+        k_theta.append(k_theta_i)
+    assert np.isclose(k_theta[0], k_theta[1], rtol=1e-4)
+    k_theta_grid, _ = qmmmrebind.parameterize.sphere_sampled_angle_constant(
+        u_AB,
+        -u_AB,
+        1.1,
+        1.2,
+        eigenvalues,
+        eigenvectors,
+        eigenvalues,
+        eigenvectors,
+    )
+    assert np.isfinite(k_theta_grid)
+
+
 def test_copy_guest_init_pdb():
     source_ = get_data_filename("test_guest_init_ii.pdb")
     destination_pwd = os.getcwd()
@@ -243,6 +445,27 @@ def test_generate_xml_from_charged_pdb_sdf():
             bond_lines.append(line)
     assert len(bond_lines) == 18
 
+def test_pdb_file():
+    pdb_file = get_data_filename("test_guest_init_ii.pdb")
+    pdb = qmmmrebind.parameterize.PdbFile.load(pdb_file)
+    assert qmmmrebind.parameterize.PdbFile.load(pdb_file) is pdb
+    assert len(pdb.records("ATOM")) == 18
+    assert pdb.atoms["atom_name"][16] == "HN21"
+    assert pdb.atoms["residue_name"][0] == "BEN"
+    assert np.shares_memory(pdb.coordinates, pdb.atoms)
+    assert pdb.coordinates.shape == (18, 3)
+    assert pdb.coordinates[0][0] == 25.897
+    atoms = pdb.atoms.copy()
+    atoms["xyz"] += 1.0
+    pdb.write("test_pdb_file.pdb", atoms[:2])
+    with open("test_pdb_file.pdb", "r") as f:
+        lines = f.readlines()
+    assert len(lines) == 3
+    assert lines[0][30:54] == "  26.897  36.473  24.918"
+    assert lines[0][12:16] == " C1 "
+    assert lines[2].startswith("END")
+
+
 def test_generate_mm_pdbs():
     qm_scan_file = "test_scan.xyz"
     template_pdb = "test_guest_init_ii.pdb"
@@ -265,7 +488,47 @@ def test_remove_mm_files():
     assert "plus*" not in os.listdir()
 
 
+def test_get_scan_coordinates():
+    qm_scan_file = "test_scan.xyz"
+    scan_coordinates = qmmmrebind.parameterize.get_scan_coordinates(
+        qm_scan_file=qm_scan_file
+    )
+    assert scan_coordinates.shape == (24, 18, 3)
+    assert scan_coordinates[0][0][0] == 0.1529192339
+    assert scan_coordinates[-1][-1][-1] != scan_coordinates[0][-1][-1]
+
+
 ##############################PrepareQMMM##############################
+def test_split_pdb():
+    init_pdb = get_data_filename("test_sample_system_trypsin_benzamidine.pdb")
+    complex_pdb = "test_split_complex.pdb"
+    solvent_pdb = "test_split_solvent.pdb"
+    num_atoms = qmmmrebind.parameterize.split_pdb(
+        init_pdb,
+        ligand_resname="BEN",
+        receptor_pdb=complex_pdb,
+        ligand_pdb=complex_pdb,
+        solvent_pdb=solvent_pdb,
+        ions_pdb=solvent_pdb,
+        hetatm_to_atom=True,
+    )
+    assert num_atoms == {complex_pdb: 3238, solvent_pdb: 19798}
+    with open(complex_pdb, "r") as f:
+        lines = f.readlines()
+    assert lines[-1] == "END\n"
+    assert all(line.startswith("ATOM  ") for line in lines[:-1])
+    assert all("BEN" in line for line in lines[3220:-1])
+    assert lines[3220][6:11] == " 3221"
+    assert lines[3220][22:26] == " 224"
+    with open(solvent_pdb, "r") as f:
+        lines = f.readlines()
+    assert lines[0].startswith("CRYST1")
+    assert lines[1][6:11] == "    1"
+    assert lines[1][17:20] == "Ca2"
+    assert lines[-2][22:26] == "4957"
+    assert not any("BEN" in line for line in lines)
+
+
 def test_clean_up():
     init_pdb = get_data_filename("test_sample_system_trypsin_benzamidine.pdb")
     cleaned_pdb = "test_system.pdb"
@@ -448,6 +711,195 @@ def test_get_qm_resids():
     assert len(lines) == 11
 
 
+def test_get_qm_resids_baseline():
+    """Test if the residues match the atom by atom distance search"""
+    guest_xyz = "test_guest_coord.txt"
+    host_pdb = "test_host.pdb"
+    residue_list = "test_residue_list.txt"
+    guest_coord_list = np.loadtxt(guest_xyz, ndmin=2)
+    df = qmmmrebind.parameterize.PdbFile.load(host_pdb).records("ATOM")
+    for distance in [3.0, 5.0, 8.0]:
+        # Baseline: host atoms strictly within the distance of any
+        # guest atom, residues in the order of their atom numbers
+        host_atom_list = sorted(
+            set(
+                atom_number
+                for reference_point in guest_coord_list
+                for atom_number in df["atom_number"][
+                    np.linalg.norm(df["xyz"] - reference_point, axis=1)
+                    < distance
+                ].tolist()
+            )
+        )
+        resid_num = []
+        for atom_number in host_atom_list:
+            for residue_number in df["residue_number"][
+                df["atom_number"] == atom_number
+            ].tolist():
+                if residue_number not in resid_num:
+                    resid_num.append(residue_number)
+        get_qm_resids_object = qmmmrebind.parameterize.PrepareQMMM(
+            init_pdb="",
+            cleaned_pdb="",
+            guest_init_pdb="",
+            host_pdb=host_pdb,
+            guest_resname="",
+            guest_pdb="",
+            guest_xyz=guest_xyz,
+            distance=distance,
+            residue_list=residue_list,
+            host_qm_atoms="",
+            host_mm_atoms="",
+            host_qm_pdb="",
+            host_mm_pdb="",
+            qm_pdb="",
+            mm_pdb="",
+            host_mm_region_I_atoms="",
+            host_mm_region_II_atoms="",
+            host_mm_region_I_pdb="",
+            host_mm_region_II_pdb="",
+            num_residues=2,
+        )
+        get_qm_resids_object.get_qm_resids()
+        assert np.loadtxt(residue_list, dtype=int, ndmin=1).tolist() == (
+            resid_num
+        )
+    # Restore the residues within 3 A used by the next tests
+    get_qm_resids_object.distance = 3.0
+    get_qm_resids_object.get_qm_resids()
+
+
+def test_get_qm_resids_from_trajectory():
+    init_pdb = get_data_filename("test_sample_system_trypsin_benzamidine.pdb")
+    host_pdb = "test_host.pdb"
+    trajectory_file = "test_trajectory.pdb"
+    residue_list = "test_trajectory_residue_list.txt"
+    with open(init_pdb, "r") as f:
+        atom_lines = [
+            line for line in f if line.startswith(("ATOM", "HETATM"))
+        ]
+    # Third frame with the ligand moved away from the receptor
+    moved_lines = [
+        line[:30] + "%8.3f" % (float(line[30:38]) + 100.0) + line[38:]
+        if line[17:20] == "BEN"
+        else line
+        for line in atom_lines
+    ]
+    with open(trajectory_file, "w") as f:
+        for i, lines in enumerate([atom_lines, atom_lines, moved_lines]):
+            f.write("MODEL     %4d\n" % (i + 1))
+            f.writelines(lines)
+            f.write("ENDMDL\n")
+        f.write("END\n")
+    frame_offsets = qmmmrebind.parameterize.get_trajectory_frame_offsets(
+        trajectory_file
+    )
+    assert len(frame_offsets) == 3
+    frames = qmmmrebind.parameterize.read_trajectory_frames(
+        trajectory_file, frame_offsets[1:]
+    )
+    assert frames.shape == (2, len(atom_lines), 3)
+    guest_index = [line[17:20] for line in atom_lines].index("BEN")
+    assert frames[1, guest_index, 0] - frames[0, guest_index, 0] == (
+        pytest.approx(100.0)
+    )
+    num_resids = []
+    for contact_frequency in [0.0, 0.5, 1.0]:
+        get_qm_resids_from_trajectory = qmmmrebind.parameterize.PrepareQMMM(
+            init_pdb=init_pdb,
+            host_pdb=host_pdb,
+            guest_resname="BEN",
+            distance=3.0,
+            residue_list=residue_list,
+            num_residues=2,
+            trajectory_file=trajectory_file,
+            contact_frequency=contact_frequency,
+            frames_per_chunk=2,
+            n_workers=2,
+        )
+        get_qm_resids_from_trajectory.get_qm_resids_from_trajectory()
+        num_resids.append(len(np.loadtxt(residue_list, ndmin=1)))
+    assert num_resids == [11, 11, 0]
+
+
+def test_get_basis_function_counts():
+    element_symbols = ["C"] * 6 + ["H"] * 6
+    basis_function_counts = {
+        "STO-3G": 36,
+        "6-31G": 66,
+        "6-31G*": 102,
+        "6-31G(d,p)": 120,
+        "6-31++G**": 150,
+    }
+    for basis_set, num_basis_functions in basis_function_counts.items():
+        counts = qmmmrebind.parameterize.get_basis_function_counts(
+            element_symbols, basis_set
+        )
+        assert counts.sum() == num_basis_functions
+    assert (
+        qmmmrebind.parameterize.get_basis_function_counts(
+            element_symbols, "def2-SVP"
+        )
+        is None
+    )
+
+
+def test_get_qm_resids_by_budget():
+    host_pdb = "test_host.pdb"
+    guest_pdb = "test_guest_init.pdb"
+    qm_residue_list = "test_qm_residue_list.txt"
+    get_qm_resids_by_budget = qmmmrebind.parameterize.PrepareQMMM(
+        init_pdb="",
+        host_pdb=host_pdb,
+        guest_pdb=guest_pdb,
+        guest_resname="BEN",
+        distance=3.0,
+        num_residues=2,
+        qm_atom_budget=120,
+        qm_residue_list=qm_residue_list,
+    )
+    get_qm_resids_by_budget.get_qm_resids_by_budget()
+    qm_resids = np.loadtxt(qm_residue_list, ndmin=1)
+    residue_numbers = qmmmrebind.parameterize.PdbFile.load(host_pdb).records(
+        "ATOM"
+    )["residue_number"]
+    num_qm_atoms = np.isin(residue_numbers, qm_resids).sum()
+    assert 0 < num_qm_atoms <= 120 - 18
+    qm_mask, mm_region_I_mask, mm_region_II_mask = (
+        get_qm_resids_by_budget.get_region_masks(residue_numbers)
+    )
+    assert qm_mask.sum() == num_qm_atoms
+    assert not (mm_region_I_mask & mm_region_II_mask).any()
+    assert (qm_mask | mm_region_I_mask | mm_region_II_mask).all()
+
+
+def test_get_qm_resids_by_budget_halogenated_guest():
+    """Test if a ligand with an element beyond Ar raises a ValueError"""
+    host_pdb = "test_host.pdb"
+    guest_pdb = "test_guest_init.pdb"
+    halogenated_guest_pdb = "test_guest_init_br.pdb"
+    pdb = qmmmrebind.parameterize.PdbFile.load(guest_pdb)
+    atoms = pdb.atoms.copy()
+    hydrogen = np.flatnonzero(
+        np.char.strip(atoms["element_symbol"].astype(str)) == "H"
+    )[0]
+    atoms["element_symbol"][hydrogen] = "BR"
+    pdb.write(halogenated_guest_pdb, atoms)
+    get_qm_resids_by_budget = qmmmrebind.parameterize.PrepareQMMM(
+        init_pdb="",
+        host_pdb=host_pdb,
+        guest_pdb=halogenated_guest_pdb,
+        guest_resname="BEN",
+        distance=3.0,
+        num_residues=2,
+        qm_basis_budget=1000,
+        basis_set="6-31G*",
+        qm_residue_list="test_qm_residue_list.txt",
+    )
+    with pytest.raises(ValueError, match="Br"):
+        get_qm_resids_by_budget.get_qm_resids_by_budget()
+
+
 def test_get_host_qm_mm_atoms():
     residue_list = "test_residue_list.txt"
     num_residues = 2
@@ -644,6 +1096,20 @@ def test_get_qm_mm_regions():
     assert len(lines_mm) == 3194
 
 
+def test_get_host_region_masks():
+    residue_numbers = np.array([1, 1, 2, 3, 3, 4, 5, 6, 6, 7])
+    (
+        qm_mask,
+        mm_region_I_mask,
+        mm_region_II_mask,
+    ) = qmmmrebind.parameterize.get_host_region_masks(
+        residue_numbers=residue_numbers, resid_num=[2, 4, 5], num_residues=2
+    )
+    assert list(residue_numbers[qm_mask]) == [3, 3, 4]
+    assert list(residue_numbers[mm_region_I_mask]) == [1, 1, 2]
+    assert list(residue_numbers[mm_region_II_mask]) == [5, 6, 6, 7]
+
+
 ##############################ParameterizeGuest##############################
 # drop in a fchk file here
 def test_copy_fchk_file():
@@ -655,6 +1121,81 @@ def test_copy_fchk_file():
     assert "test_guest_init_ii.fchk" in os.listdir()
 
 
+def test_fchk_file():
+    """Test if the sections of the formatted checkpoint file are read correctly"""
+    fchk = qmmmrebind.parameterize.FchkFile("test_guest_init_ii.fchk")
+    assert fchk["Number of atoms"] == 18
+    assert fchk["Atomic numbers"].dtype == np.int64
+    assert list(fchk["Atomic numbers"][:3]) == [6, 6, 6]
+    assert fchk["Current cartesian coordinates"].size == 54
+    hessian = fchk["Cartesian Force Constants"]
+    assert hessian.dtype == np.float64
+    assert hessian.size == 1485
+    assert hessian[0] == 6.50158117e-01
+    assert qmmmrebind.parameterize.FchkFile.load("test_guest_init_ii.fchk") is (
+        qmmmrebind.parameterize.FchkFile.load("test_guest_init_ii.fchk")
+    )
+
+
+def test_gaussian_log():
+    """Test if the last internal coordinates and ESP charges are read"""
+    log = qmmmrebind.parameterize.GaussianLog(
+        get_data_filename("test_guest_init_ii.log")
+    )
+    bonds, angles = log.get_internal_coordinates()
+    assert bonds.shape == (18, 2)
+    assert angles.shape == (27, 3)
+    assert bonds.min() == 0
+    charges = log.get_esp_charges()
+    assert charges.size == 18
+    assert list(charges["atom_number"][:2]) == [1, 2]
+    assert charges["element_symbol"][0] == "C"
+    assert charges["charge"][0] == -0.112647
+    assert qmmmrebind.parameterize.GaussianLog.load(
+        get_data_filename("test_guest_init_ii.log")
+    ) is qmmmrebind.parameterize.GaussianLog.load(
+        get_data_filename("test_guest_init_ii.log")
+    )
+
+
+def test_get_bonds_angles():
+    """Test if the bonds and angles match the internal coordinates of Gaussian"""
+    atoms = qmmmrebind.parameterize.PdbFile.load(
+        "test_guest_init_ii.pdb"
+    ).records("ATOM")
+    bond_list, angle_list = qmmmrebind.parameterize.get_bonds_angles(
+        atoms["element_symbol"], atoms["xyz"]
+    )
+    bonds, angles = qmmmrebind.parameterize.GaussianLog.load(
+        get_data_filename("test_guest_init_ii.log")
+    ).get_internal_coordinates()
+    assert np.array_equal(bond_list, bonds)
+    assert np.array_equal(angle_list, angles)
+
+
+def test_fit_esp_charges():
+    """Test if point charges are recovered from their electrostatic potential"""
+    atoms = qmmmrebind.parameterize.PdbFile.load(
+        "test_guest_init_ii.pdb"
+    ).records("ATOM")
+    points = qmmmrebind.parameterize.get_esp_fitting_points(
+        atoms["element_symbol"], atoms["xyz"]
+    )
+    distances = np.linalg.norm(
+        points[:, np.newaxis, :] - atoms["xyz"][np.newaxis, :, :], axis=-1
+    )
+    assert distances.min() > 1.4 * 1.2 - 1e-6
+    charges = np.linspace(-0.5, 0.5, len(atoms)) + 1.0 / len(atoms)
+    esp = qmmmrebind.parameterize.BOHRS_PER_ANGSTROM * (
+        charges / distances
+    ).sum(axis=1)
+    fitted_charges = qmmmrebind.parameterize.fit_esp_charges(
+        atoms["xyz"], points, esp, total_charge=1
+    )
+    assert np.allclose(fitted_charges, charges)
+    assert np.isclose(fitted_charges.sum(), 1.0)
+
+
 def test_get_xyz():
     guest_pdb = "test_guest_init_ii.pdb"
     coordinate_file = "test_guest_coordinates.txt"
@@ -770,6 +1311,34 @@ def test_get_hessian():
     assert hessian.size == 2916
 
 
+def test_unpack_hessian():
+    """Test if the packed lower triangle is expanded to a symmetric matrix"""
+    packed_hessian = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+    hessian = qmmmrebind.parameterize.unpack_hessian(packed_hessian)
+    assert np.array_equal(
+        hessian, [[1.0, 2.0, 4.0], [2.0, 3.0, 5.0], [4.0, 5.0, 6.0]]
+    )
+
+
+def test_load_hessian():
+    """Test if the cached hessian matches the hessian text file"""
+    hessian = qmmmrebind.parameterize.load_hessian("test_guest_init_ii.fchk")
+    assert isinstance(hessian, np.memmap)
+    assert np.allclose(hessian, np.loadtxt("test_guest_hessian.txt"))
+    assert "test_guest_init_ii_hessian.npy" in os.listdir()
+    # A rewrite of the fchk file within the same timestamp and with a
+    # different size invalidates the cache
+    stat = os.stat("test_guest_init_ii.fchk")
+    with open("test_guest_init_ii_hessian_stamp.txt", "w") as f:
+        f.write(str(stat.st_mtime_ns) + " " + str(stat.st_size + 1))
+    reloaded_hessian = qmmmrebind.parameterize.load_hessian(
+        "test_guest_init_ii.fchk"
+    )
+    assert np.allclose(reloaded_hessian, hessian)
+    with open("test_guest_init_ii_hessian_stamp.txt", "r") as f:
+        assert f.read() == str(stat.st_mtime_ns) + " " + str(stat.st_size)
+
+
 def test_get_atom_names():
     guest_pdb = "test_guest_init_ii.pdb"
     atom_names_file = "test_guest_atom_names.txt"
@@ -829,6 +1398,106 @@ def test_get_bond_angle_params():
     assert no_angles == angles
 
 
+def test_modified_seminario_method():
+    """Test if the batched Modified Seminario method matches the per-bond calculation"""
+    coords = np.loadtxt("test_guest_coordinates.txt")
+    hessian = np.loadtxt("test_guest_hessian.txt")
+    bond_list = np.loadtxt("test_guest_bond_list.txt", dtype=int)
+    angle_list = np.loadtxt("test_guest_angle_list.txt", dtype=int)
+    N = len(coords)
+    eigenvectors = np.empty((3, 3, N, N), dtype=complex)
+    eigenvalues = np.empty((N, N, 3), dtype=complex)
+    for i in range(0, N):
+        for j in range(0, N):
+            partial_hessian = hessian[
+                (i * 3) : ((i + 1) * 3), (j * 3) : ((j + 1) * 3)
+            ]
+            [a, b] = np.linalg.eig(partial_hessian)
+            eigenvalues[i, j, :] = a
+            eigenvectors[:, :, i, j] = b
+    k_b, bond_lengths, k_theta, theta_0 = qmmmrebind.parameterize.modified_seminario_method(
+        coords=coords,
+        hessian=hessian,
+        bond_list=bond_list,
+        angle_list=angle_list,
+        vibrational_scaling=1.0,
+    )
+    for i, (atom_A, atom_B) in enumerate(bond_list):
+        AB = qmmmrebind.parameterize.force_constant_bond(
+            atom_A, atom_B, eigenvalues, eigenvectors, coords
+        )
+        BA = qmmmrebind.parameterize.force_constant_bond(
+            atom_B, atom_A, eigenvalues, eigenvectors, coords
+        )
+        assert np.isclose(k_b[i], np.real((AB + BA) / 2))
+        assert np.isclose(
+            bond_lengths[i], np.linalg.norm(coords[atom_A] - coords[atom_B])
+        )
+    # Per-angle reference of the angle parameters
+    bond_length_matrix = np.linalg.norm(
+        coords[:, np.newaxis, :] - coords[np.newaxis, :, :], axis=-1
+    )
+    # Both orientations (A, C, angle) of the angles around each atom
+    central_atoms_angles = [[] for i in range(N)]
+    for j, (atom_A, atom_B, atom_C) in enumerate(angle_list):
+        central_atoms_angles[atom_B].append((atom_A, atom_C, j))
+        central_atoms_angles[atom_B].append((atom_C, atom_A, j))
+    scaling_factors_angles_list = [[] for i in range(len(angle_list))]
+    for atom_B in range(N):
+        for atom_A, atom_C, j in sorted(
+            central_atoms_angles[atom_B], key=lambda i: i[0]
+        ):
+            u_PA = qmmmrebind.parameterize.u_PA_from_angles(
+                atom_A, atom_B, atom_C, coords
+            )
+            contributions = [
+                abs(
+                    np.dot(
+                        u_PA,
+                        qmmmrebind.parameterize.u_PA_from_angles(
+                            other_A, atom_B, other_C, coords
+                        ),
+                    )
+                )
+                ** 2
+                for other_A, other_C, other_j in central_atoms_angles[atom_B]
+                if other_A == atom_A and (other_C, other_j) != (atom_C, j)
+            ]
+            scaling_factor = 1
+            if contributions:
+                scaling_factor = 1 + np.mean(contributions)
+            scaling_factors_angles_list[j].append(scaling_factor)
+    ref_k_theta = np.zeros(len(angle_list))
+    ref_theta_0 = np.zeros(len(angle_list))
+    for i, (atom_A, atom_B, atom_C) in enumerate(angle_list):
+        AB_k_theta, AB_theta_0 = qmmmrebind.parameterize.force_angle_constant(
+            atom_A,
+            atom_B,
+            atom_C,
+            bond_length_matrix,
+            eigenvalues,
+            eigenvectors,
+            coords,
+            scaling_factors_angles_list[i][0],
+            scaling_factors_angles_list[i][1],
+        )
+        BA_k_theta, BA_theta_0 = qmmmrebind.parameterize.force_angle_constant(
+            atom_C,
+            atom_B,
+            atom_A,
+            bond_length_matrix,
+            eigenvalues,
+            eigenvectors,
+            coords,
+            scaling_factors_angles_list[i][1],
+            scaling_factors_angles_list[i][0],
+        )
+        ref_k_theta[i] = np.real((AB_k_theta + BA_k_theta) / 2)
+        ref_theta_0[i] = np.real((AB_theta_0 + BA_theta_0) / 2)
+    np.testing.assert_allclose(k_theta, ref_k_theta, rtol=1e-10)
+    np.testing.assert_allclose(theta_0, ref_theta_0, rtol=1e-10)
+
+
 def test_get_charges():
     guest_pdb = "test_guest_init_ii.pdb"
     charge_parameter_file = "test_guest_charges.txt"
@@ -876,6 +1545,27 @@ def test_get_proper_dihedrals():
     assert len(lines) == 36
 
 
+def test_bonded_topology():
+    """Test if the proper dihedrals are enumerated from the bonds"""
+    # Carbon atoms of 1,2-dimethylcyclopropane (three-membered ring)
+    topology = qmmmrebind.parameterize.BondedTopology(
+        [[0, 1], [1, 2], [1, 3], [2, 3], [3, 4]]
+    )
+    assert list(topology.neighbors(1)) == [0, 2, 3]
+    assert list(topology.is_bonded([0, 2, 4], [1, 3, 0])) == [
+        True,
+        True,
+        False,
+    ]
+    assert topology.get_proper_dihedrals().tolist() == [
+        [0, 1, 2, 3],
+        [0, 1, 3, 2],
+        [0, 1, 3, 4],
+        [1, 2, 3, 4],
+        [2, 1, 3, 4],
+    ]
+
+
 ##############################PrepareGaussianHostGuest##############################
 # drop in a log file here
 def test_copy_log_file_host_guest():
@@ -935,6 +1625,88 @@ def test_get_qm_host_guest_charges():
     assert len(host_qm_charges) == 27
 
 
+def test_run_gaussian_jobs():
+    # cat echoes the input passed to Gaussian through the standard input
+    gaussian_jobs = []
+    for host_guest_input in [
+        "test_run_host_guest.com",
+        "test_run_host_guest_ii.com",
+    ]:
+        qmmmrebind.parameterize.copy_file(
+            source=get_data_filename("test_host_guest.com"),
+            destination=host_guest_input,
+        )
+        gaussian_jobs.append(
+            qmmmrebind.parameterize.PrepareGaussianHostGuest(
+                gauss_system_out_file=host_guest_input[:-4] + ".out",
+                fchk_system_out_file=host_guest_input[:-4] + "_fchk.out",
+                host_guest_input=host_guest_input,
+            )
+        )
+    return_codes = qmmmrebind.parameterize.run_gaussian_jobs(
+        gaussian_jobs, n_cores=5, gaussian_command="cat", formchk_command="true"
+    )
+    assert return_codes == [0, 0]
+    with open("test_run_host_guest.com", "r") as f:
+        input_lines = f.readlines()
+    with open("test_run_host_guest.log", "r") as f:
+        first_log_lines = f.readlines()
+    with open("test_run_host_guest_ii.log", "r") as f:
+        log_lines = f.readlines()
+    assert "%NProcShared = 12" in input_lines[2]
+    # The leftover core goes to the first calculation
+    assert first_log_lines[2].strip() == "%NProcShared = 3"
+    assert log_lines[2].strip() == "%NProcShared = 2"
+    assert log_lines[3:] == input_lines[3:]
+
+
+def test_qm_cache():
+    qm_cache = qmmmrebind.parameterize.QMCache(
+        cache_dir="test_qm_cache", max_size=1e-6
+    )
+    with open(get_data_filename("test_host_guest.com"), "r") as f:
+        input_lines = f.read().splitlines()
+    # Same calculation with other resources, title, spacing and noise
+    changed_lines = list(input_lines)
+    changed_lines[2] = "%NProcShared = 4"
+    changed_lines[5] = "Another title"
+    x = changed_lines[8].split()
+    x[2] = str(float(x[2]) + 1e-6)
+    changed_lines[8] = "   ".join(x)
+    other_basis_lines = [i.replace("6-31G", "6-31G*") for i in input_lines]
+    for input_file, lines in [
+        ("test_cache_host_guest.com", input_lines),
+        ("test_cache_host_guest_ii.com", changed_lines),
+        ("test_cache_host_guest_iii.com", other_basis_lines),
+    ]:
+        with open(input_file, "w") as f:
+            f.write("\n".join(lines) + "\n")
+    keys = [
+        qm_cache.get_key([i], program="gaussian")
+        for i in [
+            "test_cache_host_guest.com",
+            "test_cache_host_guest_ii.com",
+            "test_cache_host_guest_iii.com",
+        ]
+    ]
+    assert keys[0] == keys[1]
+    assert keys[0] != keys[2]
+    for i, key in enumerate([keys[0], keys[2]]):
+        with open("test_cache_result.log", "w") as f:
+            f.write("result " + str(i) + "\n" * 700)
+        qm_cache.save(key, {"log": "test_cache_result.log"})
+    # The least recently used entry is evicted beyond the maximum size
+    assert not qm_cache.load(keys[0], {"log": "test_cache_result.log"})
+    assert qm_cache.load(keys[2], {"log": "test_cache_result.log"})
+    with open("test_cache_result.log", "r") as f:
+        assert f.readline() == "result 1\n"
+    report = qm_cache.report()
+    assert report["entries"] == 1
+    assert report["hits"] == 1
+    assert report["misses"] == 1
+    assert report["evictions"] == 1
+
+
 ##############################ParameterizeHost##############################
 # drop in a fchk file here
 def test_copy_fchk_file_host():
@@ -1245,6 +2017,35 @@ def test_write_system_params():
     assert len(angle_lines) - 2 == 27
 
 
+def test_qm_parameter_set():
+    """Test if the QM parameters survive the text and binary files"""
+    system_qm_params_file = "test_guest_qm_params.txt"
+    qm_params = qmmmrebind.parameterize.QMParameterSet.read(
+        system_qm_params_file
+    )
+    assert qm_params.bonds.size == 18
+    assert qm_params.angles.size == 27
+    qm_params.save("test_guest_qm_params_copy.txt", binary=True)
+    with open(system_qm_params_file, "r") as f:
+        lines = f.readlines()
+    with open("test_guest_qm_params_copy.txt", "r") as f:
+        assert f.readlines() == lines
+    qmmmrebind.parameterize.QMParameterSet.cache.clear()
+    qm_params_npz = qmmmrebind.parameterize.QMParameterSet.load(
+        "test_guest_qm_params_copy.txt"
+    )
+    assert np.array_equal(qm_params_npz.angles, qm_params.angles)
+    qmmmrebind.parameterize.remove_bad_angle_params(
+        "test_guest_qm_params_copy.txt", angle=2.0, k_angle=500
+    )
+    angles = qmmmrebind.parameterize.QMParameterSet.load(
+        "test_guest_qm_params_copy.txt"
+    ).angles
+    assert angles.size == np.count_nonzero(
+        (qm_params.angles["a"] >= 2.0) & (qm_params.angles["k"] <= 500)
+    )
+
+
 def test_write_reparameterised_system_xml():
     system_qm_params_file = ("test_guest_qm_params.txt",)
     system_xml = "test_guest_init.xml"
@@ -1564,6 +2365,89 @@ def test_write_tor_params_txt():
     assert len(lines) == 65
 
 
+def test_torsion_table():
+    """Test if the dihedral angles to scan are selected from the torsions"""
+    torsion_lines = [
+        '<Torsion k="1.5" p1="0" p2="1" p3="2" p4="3" periodicity="1" phase="0"/>',
+        '<Torsion k="-0.5" p1="0" p2="1" p3="2" p4="3" periodicity="2" phase="3.141592653589793"/>',
+        '<Torsion k="0.2" p1="3" p2="2" p3="1" p4="0" periodicity="3" phase="0"/>',
+        '<Torsion k="0.1" p1="1" p2="0" p3="2" p4="4" periodicity="2" phase="0"/>',
+        '<Torsion k="0.3" p1="1" p2="2" p3="3" p4="5" periodicity="3" phase="0"/>',
+    ]
+    with open("test_torsion_table.xml", "w") as f:
+        f.write("<Torsions>\n" + "\n".join(torsion_lines) + "\n</Torsions>\n")
+    torsion_table = qmmmrebind.parameterize.TorsionTable.from_xml(
+        "test_torsion_table.xml"
+    )
+    assert list(torsion_table.torsions["k"]) == [1.5, -0.5, 0.2, 0.1, 0.3]
+    torsion_table.save("test_torsion_table.txt")
+    assert (
+        qmmmrebind.parameterize.TorsionTable.load("test_torsion_table.txt")
+        is torsion_table
+    )
+    assert torsion_table.get_dihedrals().tolist() == [
+        [1, 2, 3, 4],
+        [2, 1, 3, 5],
+        [2, 3, 4, 6],
+    ]
+    element_symbols = np.array(["", "C", "C", "C", "C", "O", "H"])
+    assert torsion_table.get_dihedrals(element_symbols).tolist() == [
+        [1, 2, 3, 4],
+        [2, 1, 3, 5],
+    ]
+    topology = qmmmrebind.parameterize.BondedTopology(
+        [[0, 1], [1, 2], [2, 3], [3, 5], [2, 4]]
+    )
+    assert torsion_table.get_dihedrals(
+        element_symbols, topology
+    ).tolist() == [[1, 2, 3, 4]]
+
+
+def test_torsion_table_from_system():
+    """Test if the torsions of an OpenMM System are read into the table"""
+    system = simtk.openmm.System()
+    for i in range(6):
+        system.addParticle(12.0)
+    force = simtk.openmm.PeriodicTorsionForce()
+    force.addTorsion(0, 1, 2, 3, 1, 0.0, 1.5)
+    force.addTorsion(3, 2, 1, 0, 3, 0.0, 0.2)
+    force.addTorsion(1, 2, 3, 5, 2, np.pi, 0.3)
+    system.addForce(force)
+    torsion_table = qmmmrebind.parameterize.TorsionTable.from_system(system)
+    assert list(torsion_table.torsions["k"]) == [1.5, 0.2, 0.3]
+    assert list(torsion_table.torsions["periodicity"]) == [1, 3, 2]
+    assert np.isclose(torsion_table.torsions["phase"][2], np.pi)
+    assert torsion_table.get_dihedrals().tolist() == [
+        [1, 2, 3, 4],
+        [2, 3, 4, 6],
+    ]
+
+
+def test_get_symmetry_classes():
+    molecule = qmmmrebind.parameterize.Molecule.from_smiles("OCCO")
+    symmetry_classes = qmmmrebind.parameterize.get_symmetry_classes(molecule)
+    assert symmetry_classes[0] == symmetry_classes[3]
+    assert symmetry_classes[1] == symmetry_classes[2]
+    assert symmetry_classes[0] != symmetry_classes[1]
+    # Toluene: methyl, ipso, ortho, meta, para, meta and ortho carbons
+    molecule = qmmmrebind.parameterize.Molecule.from_smiles("Cc1ccccc1")
+    symmetry_classes = qmmmrebind.parameterize.get_symmetry_classes(molecule)
+    assert symmetry_classes[2] == symmetry_classes[6]
+    assert symmetry_classes[3] == symmetry_classes[5]
+    assert len(set(symmetry_classes[:7].tolist())) == 5
+
+
+def test_group_equivalent_dihedrals():
+    dihedrals = np.array([[1, 2, 3, 4], [6, 2, 3, 4], [2, 3, 4, 5]])
+    groups = qmmmrebind.parameterize.group_equivalent_dihedrals(dihedrals)
+    assert [i.tolist() for i in groups] == [[[1, 2, 3, 4]], [[2, 3, 4, 5]]]
+    symmetry_classes = np.array([0, 1, 2, 1, 0, 3])
+    groups = qmmmrebind.parameterize.group_equivalent_dihedrals(
+        dihedrals, symmetry_classes
+    )
+    assert [i.tolist() for i in groups] == [[[1, 2, 3, 4], [2, 3, 4, 5]]]
+
+
 def test_copy_run_command():
     source_ = get_data_filename("test_run_command")
     destination_pwd = os.getcwd()
@@ -1638,7 +2522,159 @@ def test_create_non_H_bonded_torsion_drive_dir():
     assert len(os.listdir("./torsion_dir")) == 12
 
 
+def test_torsion_drive_sims_cores():
+    """Test if n_jobs * n_threads is checked against the available cores"""
+    n_cores = qmmmrebind.parameterize.get_num_cores()
+    torsion_drive_sims_object = qmmmrebind.parameterize.TorsionDriveSims(
+        n_jobs=1
+    )
+    assert torsion_drive_sims_object.n_threads is None
+    assert torsion_drive_sims_object.get_n_threads() == n_cores
+    # The inputs can be prepared on a machine with fewer cores
+    torsion_drive_sims_object = qmmmrebind.parameterize.TorsionDriveSims(
+        n_jobs=n_cores, n_threads=2
+    )
+    with pytest.raises(ValueError):
+        torsion_drive_sims_object.get_n_threads()
+
+
+def test_run_torsion_sim():
+    tor_dir = "test_torsion_sim_dir"
+    torsion_drive_run_file = "test_run_command"
+    torsion_sim_summary_file = "test_torsion_sim_summary.txt"
+    run_commands = ["touch scan.xyz", "exit 3", "echo"]
+    for i in range(len(run_commands)):
+        dir_name = os.path.join(tor_dir, "torsion_drive_" + str(i))
+        os.makedirs(dir_name, exist_ok=True)
+        with open(os.path.join(dir_name, torsion_drive_run_file), "w") as f:
+            f.write(run_commands[i] + "\n")
+    torsion_drive_sims_object = qmmmrebind.parameterize.TorsionDriveSims(
+        tor_dir=tor_dir,
+        torsion_drive_run_file=torsion_drive_run_file,
+        n_jobs=1,
+        n_threads=1,
+        torsion_sim_summary_file=torsion_sim_summary_file,
+    )
+    torsion_sim_status = torsion_drive_sims_object.run_torsion_sim()
+    assert [i[1] for i in torsion_sim_status] == [
+        "complete",
+        "failed",
+        "incomplete",
+    ]
+    with open(torsion_sim_summary_file, "r") as f:
+        lines = f.readlines()
+    assert lines[1] == "torsion_drive_1 failed 3\n"
+    torsion_sim_status = torsion_drive_sims_object.run_torsion_sim(
+        restart=True
+    )
+    assert torsion_sim_status[0][1] == "skipped"
+
+
+def test_run_torsion_sim_cache():
+    tor_dir = "test_torsion_cache_dir"
+    torsion_drive_run_file = "test_run_command"
+    psi_input_file = "test_torsion_drive_input.dat"
+    for i in range(2):
+        dir_name = os.path.join(tor_dir, "torsion_drive_" + str(i))
+        os.makedirs(dir_name, exist_ok=True)
+        with open(os.path.join(dir_name, torsion_drive_run_file), "w") as f:
+            f.write("echo " + str(i) + " > scan.xyz\n")
+        with open(os.path.join(dir_name, psi_input_file), "w") as f:
+            f.write("memory 50 GB\nmolecule {\n0 1\nH 0.0 0.0 0.0\n}\n")
+        with open(os.path.join(dir_name, "dihedrals.txt"), "w") as f:
+            f.write(" 1     2     3     4\n")
+    torsion_drive_sims_object = qmmmrebind.parameterize.TorsionDriveSims(
+        tor_dir=tor_dir,
+        psi_input_file=psi_input_file,
+        torsion_drive_run_file=torsion_drive_run_file,
+        n_jobs=1,
+        n_threads=1,
+        torsion_sim_summary_file="test_torsion_sim_summary.txt",
+        qm_cache=qmmmrebind.parameterize.QMCache(cache_dir="test_qm_cache"),
+    )
+    torsion_sim_status = torsion_drive_sims_object.run_torsion_sim()
+    assert [i[1] for i in torsion_sim_status] == ["complete", "complete"]
+    scan_file = os.path.join(tor_dir, "torsion_drive_1", "scan.xyz")
+    os.remove(scan_file)
+    torsion_sim_status = torsion_drive_sims_object.run_torsion_sim()
+    assert [i[1] for i in torsion_sim_status] == ["cached", "cached"]
+    with open(scan_file, "r") as f:
+        assert f.read() == "1\n"
+
+
+##############################TorsionDriveParams###########################
+def test_get_reparams_torsion_lines():
+    tor_dir = "test_torsion_params_dir"
+    for i in ["torsion_drive_10", "torsion_drive_2"]:
+        os.makedirs(os.path.join(tor_dir, i), exist_ok=True)
+    torsion_drive_params_object = qmmmrebind.parameterize.TorsionDriveParams(
+        tor_dir=tor_dir, n_workers=2,
+    )
+    torsional_lines = torsion_drive_params_object.get_reparams_torsion_lines()
+    assert torsional_lines == []
+    torsion_drive_params_object = qmmmrebind.parameterize.TorsionDriveParams(
+        tor_dir=tor_dir, global_fit=True,
+    )
+    torsional_lines = torsion_drive_params_object.get_reparams_torsion_lines()
+    assert torsional_lines == []
+
+
+def fake_prepare_torsion_drive_dir(**kwargs):
+    """Skips the preparation of the files of a torsiondrive directory"""
+
+
+def fake_get_tor_params(qm_scan_file, **kwargs):
+    """Returns torsional parameters numbered after the directory"""
+    dir_number = int(os.path.dirname(qm_scan_file).split("_")[-1])
+    return np.array([dir_number, 0.0, 0.0, 0.0])
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="the worker processes must inherit the patched functions",
+)
+def test_get_reparams_torsion_lines_workers(monkeypatch):
+    """Test if the fitted directories are merged in natural order"""
+    monkeypatch.setattr(
+        qmmmrebind.parameterize,
+        "prepare_torsion_drive_dir",
+        fake_prepare_torsion_drive_dir,
+    )
+    monkeypatch.setattr(
+        qmmmrebind.parameterize, "get_tor_params", fake_get_tor_params
+    )
+    tor_dir = "test_torsion_workers_dir"
+    dihedrals = {
+        "torsion_drive_10": [1, 2, 3, 4],
+        "torsion_drive_2": [2, 3, 4, 5],
+        "torsion_drive_5": [3, 4, 5, 6],
+    }
+    for i, dihedral in dihedrals.items():
+        dir_name = os.path.join(tor_dir, i)
+        os.makedirs(dir_name, exist_ok=True)
+        qmmmrebind.parameterize.write_dihedral_text_file(
+            os.path.join(dir_name, "dihedrals.txt"), np.array(dihedral)
+        )
+        # torsion_drive_5 has no scan file and is left out
+        if i != "torsion_drive_5":
+            open(os.path.join(dir_name, "scan.xyz"), "w").close()
+    torsional_lines = {}
+    for n_workers in [1, 2]:
+        torsion_drive_params_object = (
+            qmmmrebind.parameterize.TorsionDriveParams(
+                tor_dir=tor_dir, n_workers=n_workers,
+            )
+        )
+        torsional_lines[
+            n_workers
+        ] = torsion_drive_params_object.get_reparams_torsion_lines()
+    assert torsional_lines[1] == torsional_lines[2]
+    assert len(torsional_lines[1]) == 8
+    assert 'k="2.0" p1="1" p2="2" p3="3" p4="4"' in torsional_lines[1][0]
+    assert 'k="10.0" p1="0" p2="1" p3="2" p4="3"' in torsional_lines[1][4]
+
+
 ##############################RemoveTestFiles##############################
 def test_remove_files():
-    command = "rm -rf __pycache__ test_host_mm.txt test_guest_coord.txt test_host.pdb test_guest_init_ii.pdb test_host_qm.pdb test_guest_init.pdb test_host_qm.txt test_host_mm.pdb test_mm.pdb test_host_mm_region_ii.pdb test_qm.pdb test_host_mm_region_ii.txt test_residue_list.txt test_host_mm_region_i.pdb test_system.pdb test_host_mm_region_i.txt test_guest_bonds.txt test_guest_charges.txt test_guest_coordinates.txt test_guest_coords.xyz test_guest_hessian.txt test_guest_init_ii.fchk test_guest_init_ii.log test_guest_angle_list.txt test_guest_unprocessed_hessian.txt test_guest_angles.txt test_proper_dihedrals.txt test_guest_atom_names.txt test_guest_bond_list.txt test_host_qm_coordinates.txt test_host_qm_coords.xyz test_host_qm.fchk test_host_qm_unprocessed_hessian.txt test_host_qm_angle_list test_host_qm_bond_list.txt test_host_qm.log test_host_qm_angles.txt test_host_qm_atom_names.txt test_host_qm_bonds.txt test_host_qm_hessian.txt test_guest_qm_surround_charges.txt test_host_guest.com test_host_guest.log test_host_qm_surround_charges.txt test_guest_qm_atom_surround_charges.txt test_guest_init.sdf test_guest_init.xml test_guest.sdf test_guest_qm_params.txt test_guest_intermediate_reparameterised.xml test_guest_reparameterised.xml test_guest_xml_non_bonded_reparams.txt test_guest_xml_non_bonded.txt test_guest_non_params.inpcrd test_guest_non_params.prmtop test_guest_params.inpcrd test_guest_params.prmtop test_host.xml test_host_qm_params.txt test_host_intermediate_reparameterised.xml test_host_reparameterised.xml test_host_xml_non_bonded_reparams.txt test_host_xml_non_bonded.txt test_host_non_params.inpcrd test_host_non_params.prmtop test_host_params.inpcrd host_params.prmtop test_system_params.inpcrd test_system_params.prmtop test_torsion_drive_input.xyz test_torsion_drive_input.txt test_torsion_drive_input.pdb test_host_params.prmtop torsion_dir test_guest_torsion_xml.txt test_host_guest.fchk test_torsion_drive_input.dat test_scan.xyz test_run_command"
+    command = "rm -rf __pycache__ test_host_mm.txt test_guest_coord.txt test_host.pdb test_guest_init_ii.pdb test_host_qm.pdb test_guest_init.pdb test_host_qm.txt test_host_mm.pdb test_mm.pdb test_host_mm_region_ii.pdb test_qm.pdb test_host_mm_region_ii.txt test_residue_list.txt test_host_mm_region_i.pdb test_system.pdb test_host_mm_region_i.txt test_guest_bonds.txt test_guest_charges.txt test_guest_coordinates.txt test_guest_coords.xyz test_guest_hessian.txt test_guest_init_ii_hessian.npy test_guest_init_ii_hessian_stamp.txt test_guest_init_ii.fchk test_guest_init_ii.log test_guest_angle_list.txt test_guest_unprocessed_hessian.txt test_guest_angles.txt test_proper_dihedrals.txt test_guest_atom_names.txt test_guest_bond_list.txt test_host_qm_coordinates.txt test_host_qm_coords.xyz test_host_qm.fchk test_host_qm_unprocessed_hessian.txt test_host_qm_angle_list test_host_qm_bond_list.txt test_host_qm.log test_host_qm_angles.txt test_host_qm_atom_names.txt test_host_qm_bonds.txt test_host_qm_hessian.txt test_host_qm_hessian.npy test_host_qm_hessian_stamp.txt test_guest_qm_surround_charges.txt test_host_guest.com test_host_guest.log test_host_qm_surround_charges.txt test_guest_qm_atom_surround_charges.txt test_guest_init.sdf test_guest_init.xml test_guest.sdf test_guest_qm_params.txt test_guest_qm_params_copy.txt test_guest_qm_params_copy.npz test_patch_system.xml test_patch_system_reparameterised.xml test_guest_intermediate_reparameterised.xml test_guest_reparameterised.xml test_guest_xml_non_bonded_reparams.txt test_guest_xml_non_bonded.txt test_guest_non_params.inpcrd test_guest_non_params.prmtop test_guest_params.inpcrd test_guest_params.prmtop test_host.xml test_host_qm_params.txt test_host_intermediate_reparameterised.xml test_host_reparameterised.xml test_host_xml_non_bonded_reparams.txt test_host_xml_non_bonded.txt test_host_non_params.inpcrd test_host_non_params.prmtop test_host_params.inpcrd host_params.prmtop test_system_params.inpcrd test_system_params.prmtop test_torsion_drive_input.xyz test_torsion_drive_input.txt test_torsion_drive_input.pdb test_host_params.prmtop torsion_dir test_torsion_params_dir test_torsion_sim_dir test_torsion_sim_summary.txt test_pdb_file.pdb test_guest_torsion_xml.txt test_host_guest.fchk test_torsion_drive_input.dat test_scan.xyz test_run_command test_split_complex.pdb test_split_solvent.pdb test_trajectory.pdb test_trajectory_residue_list.txt test_qm_residue_list.txt test_run_host_guest.com test_run_host_guest.log test_run_host_guest.out test_run_host_guest_fchk.out test_run_host_guest_ii.com test_run_host_guest_ii.log test_run_host_guest_ii.out test_run_host_guest_ii_fchk.out test_qm_cache test_cache_host_guest.com test_cache_host_guest_ii.com test_cache_host_guest_iii.com test_cache_result.log test_torsion_cache_dir test_torsion_table.xml test_torsion_table.txt test_guest_init_br.pdb test_torsion_workers_dir"
     os.system(command)